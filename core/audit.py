@@ -1,16 +1,112 @@
+"""Audit trail (change_log) with a write-behind buffer.
+
+``log_change`` never commits on its own:
+  - when the caller has a write transaction open, the row joins it and is
+    committed (or rolled back) together with the change it describes;
+  - otherwise the event is queued in memory and a background thread writes
+    queued events in batches (by size or age) over its own connection.
+
+Readers of change_log call ``flush_audit_log()`` first so recent events are
+visible. The buffer is flushed at interpreter shutdown. A batch that fails
+on a transient error (database locked, disk I/O) goes back to the front of
+the buffer for the next tick, within AUDIT_BUFFER_MAX; events that cannot
+be queued, do not fit back or fail for good are counted in
+``audit_stats()["dropped"]``.
+"""
+import atexit
+import sqlite3
+import threading
 import time
+from collections import deque
 
+from .background import ensure_periodic
+from .config import AUDIT_BUFFER_MAX, AUDIT_FLUSH_SECONDS, AUDIT_FLUSH_SIZE, DATABASE
 from .db import get_db
 
+_INSERT_SQL = (
+    "INSERT INTO change_log (user_id, action, eleve_id, subject_id, details, created_at) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+_LOCK = threading.Lock()
+_FLUSH_LOCK = threading.Lock()
+_WAKE = threading.Event()
+_BUFFER = deque()
+_STATS = {"queued": 0, "joined": 0, "flushed": 0, "requeued": 0, "dropped": 0}
+
 
 def log_change(action: str, user_id: int, details: str = "", eleve_id: int | None = None, subject_id: int | None = None) -> None:
+    row = (user_id, action, eleve_id, subject_id, details, int(time.time()))
     try:
         db = get_db()
-        db.execute(
-            "INSERT INTO change_log (user_id, action, eleve_id, subject_id, details, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-            (user_id, action, eleve_id, subject_id, details, int(time.time())),
-        )
-        db.commit()
+        if db.in_transaction:
+            db.execute(_INSERT_SQL, row)
+            with _LOCK:
+                _STATS["joined"] += 1
+            return
     except Exception:
-        # Best-effort logging: never break user flow.
+        # No request context or a failed insert: fall back to the buffer.
         pass
+    _enqueue(row)
+
+
+def _enqueue(row) -> None:
+    with _LOCK:
+        if len(_BUFFER) >= AUDIT_BUFFER_MAX:
+            _STATS["dropped"] += 1
+            return
+        _BUFFER.append(row)
+        _STATS["queued"] += 1
+        size = len(_BUFFER)
+    ensure_periodic("audit-flusher", AUDIT_FLUSH_SECONDS, flush_audit_log, _WAKE)
+    if size >= AUDIT_FLUSH_SIZE:
+        _WAKE.set()
+
+
+def flush_audit_log() -> int:
+    """Write every buffered event in one transaction. Returns rows written."""
+    with _FLUSH_LOCK:
+        with _LOCK:
+            if not _BUFFER:
+                return 0
+            rows = list(_BUFFER)
+            _BUFFER.clear()
+        conn = None
+        try:
+            conn = sqlite3.connect(DATABASE, timeout=10)
+            conn.executemany(_INSERT_SQL, rows)
+            conn.commit()
+        except sqlite3.OperationalError:
+            _requeue(rows)
+            return 0
+        except Exception:
+            # Best-effort logging: never break user flow.
+            with _LOCK:
+                _STATS["dropped"] += len(rows)
+            return 0
+        finally:
+            if conn is not None:
+                conn.close()
+        with _LOCK:
+            _STATS["flushed"] += len(rows)
+        return len(rows)
+
+
+def _requeue(rows) -> None:
+    """Put a failed batch back ahead of newer events, oldest dropped first."""
+    with _LOCK:
+        room = max(0, AUDIT_BUFFER_MAX - len(_BUFFER))
+        kept = rows[len(rows) - room:] if room < len(rows) else rows
+        _BUFFER.extendleft(reversed(kept))
+        _STATS["requeued"] += len(kept)
+        _STATS["dropped"] += len(rows) - len(kept)
+
+
+def audit_stats() -> dict:
+    with _LOCK:
+        stats = dict(_STATS)
+        stats["buffered"] = len(_BUFFER)
+    return stats
+
+
+atexit.register(flush_audit_log)
@@ -1,8 +1,23 @@
+import atexit
+import sqlite3
+import threading
 import time
+from collections import OrderedDict, deque
 
 from flask import Request
 
-from .config import LOGIN_LOCK_SECONDS, LOGIN_MAX_ATTEMPTS, LOGIN_WINDOW_SECONDS
+from .background import ensure_periodic
+from .config import (
+    DATABASE,
+    LOGIN_ATTEMPTS_KEEP_SECONDS,
+    LOGIN_CLEANUP_SECONDS,
+    LOGIN_FLUSH_SECONDS,
+    LOGIN_LOCK_SECONDS,
+    LOGIN_MAX_ATTEMPTS,
+    LOGIN_PENDING_MAX,
+    LOGIN_TRACKED_KEYS,
+    LOGIN_WINDOW_SECONDS,
+)
 
 
 def get_client_ip(request: Request) -> str:
@@ -17,6 +32,109 @@ def get_client_ip(request: Request) -> str:
     return request.remote_addr or ""
 
 
+# ── In-memory throttle ───────────────────────────────────────────
+# Failures are tracked per (username, ip) in a sliding window held in
+# memory, so checking and recording an attempt never writes to disk.
+# Attempts are persisted to login_attempts in batches by a background
+# thread (for forensics) and old rows are purged on the same timer.
+# A key seen for the first time in this process is seeded from the
+# table, and a tracked key is seeded again once its last read is older
+# than one flush interval: failures handled by other workers reach the
+# table at their next flush, so every worker sees them within about
+# 2 x LOGIN_FLUSH_SECONDS. The refreshed window keeps whichever is larger,
+# the table plus this process's unflushed failures or what it held.
+# Only keys with failures in the window are kept, at most
+# LOGIN_TRACKED_KEYS of them (least recently used evicted: an evicted key
+# is seeded again from the table); at most LOGIN_PENDING_MAX attempts wait
+# to be persisted, the oldest are dropped beyond that.
+
+_LOCK = threading.Lock()
+_FAILURES: OrderedDict[tuple[str, str], "_Window"] = OrderedDict()
+_PENDING = deque(maxlen=LOGIN_PENDING_MAX)
+_LAST_CLEANUP = 0
+
+
+def _key(username: str, ip: str) -> tuple[str, str]:
+    return (username or "").lower(), ip or ""
+
+
+class _Window(deque):
+    """Failure timestamps of one key, with the time they were read from the table."""
+
+    def __init__(self, iterable=(), seeded_at: float = 0.0):
+        super().__init__(iterable)
+        self.seeded_at = seeded_at
+
+
+def _seed_window(db, key: tuple[str, str]) -> _Window:
+    window = _Window(seeded_at=time.time())
+    try:
+        rows = db.execute(
+            """
+            SELECT ts FROM login_attempts
+            WHERE username = ? AND ip = ? AND success = 0 AND ts >= ?
+            ORDER BY ts
+            """,
+            (key[0], key[1], int(time.time()) - LOGIN_WINDOW_SECONDS),
+        ).fetchall()
+        window.extend(int(r["ts"]) for r in rows)
+    except Exception:
+        pass
+    return window
+
+
+def _window(db, key: tuple[str, str]) -> _Window:
+    with _LOCK:
+        window = _FAILURES.get(key)
+        if window is not None:
+            _FAILURES.move_to_end(key)
+            if time.time() - window.seeded_at < LOGIN_FLUSH_SECONDS:
+                return window
+    seeded = _seed_window(db, key)
+    with _LOCK:
+        window = _FAILURES.get(key)
+        if window is None:
+            window = seeded
+            if window:
+                _remember(key, window)
+        else:
+            _merge(key, window, seeded)
+    return window
+
+
+def _merge(key: tuple[str, str], window: _Window, seeded: _Window) -> None:
+    """Refresh a tracked window from the table (caller holds _LOCK).
+
+    This process's failures still in _PENDING are not in the table yet;
+    those taken by a flush that has not committed are in neither, hence
+    keeping the held window when it is the larger one.
+    """
+    unflushed = [ts for ts, ip, username, success in _PENDING if not success and (username, ip) == key]
+    merged = sorted([*seeded, *unflushed])
+    if len(merged) >= len(window):
+        window.clear()
+        window.extend(merged)
+    window.seeded_at = seeded.seeded_at
+
+
+def _remember(key: tuple[str, str], window: _Window) -> None:
+    """Track ``window`` under ``key`` (caller holds _LOCK)."""
+    _FAILURES[key] = window
+    _FAILURES.move_to_end(key)
+    while len(_FAILURES) > LOGIN_TRACKED_KEYS:
+        _FAILURES.popitem(last=False)
+
+
+def _trim(key: tuple[str, str], window: _Window, now: int) -> None:
+    """Drop failures older than the window, and the key once it is empty
+    (caller holds _LOCK)."""
+    window_start = now - LOGIN_WINDOW_SECONDS
+    while window and window[0] < window_start:
+        window.popleft()
+    if not window and _FAILURES.get(key) is window:
+        del _FAILURES[key]
+
+
 def cleanup_old_login_attempts(db, keep_seconds: int = 7 * 24 * 3600) -> None:
     cutoff = int(time.time()) - keep_seconds
     db.execute("DELETE FROM login_attempts WHERE ts < ?", (cutoff,))
@@ -24,11 +142,60 @@ def cleanup_old_login_attempts(db, keep_seconds: int = 7 * 24 * 3600) -> None:
 
 
 def record_login_attempt(db, username: str, ip: str, success: bool) -> None:
-    db.execute(
-        "INSERT INTO login_attempts (ts, ip, username, success) VALUES (?, ?, ?, ?)",
-        (int(time.time()), ip, (username or "").lower(), 1 if success else 0),
-    )
-    db.commit()
+    now = int(time.time())
+    key = _key(username, ip)
+    window = _window(db, key)
+    with _LOCK:
+        if not success:
+            tracked = _FAILURES.get(key)
+            if tracked is None:
+                _remember(key, window)
+            else:
+                window = tracked
+            window.append(now)
+        _trim(key, window, now)
+        _PENDING.append((now, key[1], key[0], 1 if success else 0))
+    ensure_periodic("login-attempts-flusher", LOGIN_FLUSH_SECONDS, flush_login_attempts)
+
+
+def flush_login_attempts() -> int:
+    """Persist buffered attempts, drop expired windows and purge old rows."""
+    global _LAST_CLEANUP
+    now = int(time.time())
+    with _LOCK:
+        rows = list(_PENDING)
+        _PENDING.clear()
+        for key in [k for k, w in _FAILURES.items() if not w or w[-1] < now - LOGIN_WINDOW_SECONDS]:
+            del _FAILURES[key]
+        cleanup_due = now - _LAST_CLEANUP >= LOGIN_CLEANUP_SECONDS
+        if cleanup_due:
+            _LAST_CLEANUP = now
+    if not rows and not cleanup_due:
+        return 0
+    conn = None
+    try:
+        conn = sqlite3.connect(DATABASE, timeout=10)
+        if rows:
+            conn.executemany(
+                "INSERT INTO login_attempts (ts, ip, username, success) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+        if cleanup_due:
+            conn.execute(
+                "DELETE FROM login_attempts WHERE ts < ?",
+                (now - LOGIN_ATTEMPTS_KEEP_SECONDS,),
+            )
+        conn.commit()
+    except sqlite3.Error:
+        # Back to the front for the next tick (maxlen still bounds it):
+        # other workers seed their windows from these rows.
+        with _LOCK:
+            _PENDING.extendleft(reversed(rows))
+        return 0
+    finally:
+        if conn is not None:
+            conn.close()
+    return len(rows)
 
 
 def _fail_stats(db, username: str, ip: str) -> tuple[int, int]:
@@ -36,16 +203,11 @@ def _fail_stats(db, username: str, ip: str) -> tuple[int, int]:
     Returns (fail_count_in_window, last_fail_ts_in_window).
     """
     now = int(time.time())
-    window_start = now - LOGIN_WINDOW_SECONDS
-    row = db.execute(
-        """
-        SELECT COUNT(*) AS c, MAX(ts) AS last_ts
-        FROM login_attempts
-        WHERE username = ? AND ip = ? AND success = 0 AND ts >= ?
-        """,
-        ((username or "").lower(), ip, window_start),
-    ).fetchone()
-    return int(row["c"] or 0), int(row["last_ts"] or 0)
+    key = _key(username, ip)
+    window = _window(db, key)
+    with _LOCK:
+        _trim(key, window, now)
+        return len(window), (window[-1] if window else 0)
 
 
 def is_login_locked(db, username: str, ip: str) -> tuple[bool, int]:
@@ -69,3 +231,5 @@ def lock_message(seconds: int) -> str:
         return f"Trop de tentatives. Réessayez dans {s}s."
     return f"Trop de tentatives. Réessayez dans {m} min {s}s."
 
+
+atexit.register(flush_login_attempts)
@@ -0,0 +1,34 @@
+"""Per-process periodic background threads.
+
+Threads are started lazily and keyed by process id, so WSGI workers forked
+after import each get their own (threads do not survive a fork).
+"""
+import os
+import threading
+
+_LOCK = threading.Lock()
+_STARTED: dict[str, int] = {}
+
+
+def ensure_periodic(name: str, interval: float, func, wake: threading.Event | None = None) -> None:
+    """Run ``func()`` every ``interval`` seconds (or sooner when ``wake`` is set)."""
+    pid = os.getpid()
+    if _STARTED.get(name) == pid:
+        return
+    with _LOCK:
+        if _STARTED.get(name) == pid:
+            return
+        _STARTED[name] = pid
+    event = wake or threading.Event()
+
+    def loop():
+        while True:
+            event.wait(interval)
+            event.clear()
+            try:
+                func()
+            except Exception:
+                # A failing job must never kill its thread.
+                pass
+
+    threading.Thread(target=loop, name=name, daemon=True).start()
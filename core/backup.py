@@ -1,14 +1,30 @@
-﻿import json
+﻿import hashlib
+import json
 import os
 import shutil
 import sqlite3
 import tempfile
+import time
 import zipfile
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from io import BytesIO
+from typing import Callable
 
-from .config import DATABASE, UPLOAD_FOLDER
+from .config import BACKUP_DIR, BACKUP_PAGES_PER_STEP, DATABASE, RESTORE_DRAIN_SECONDS, UPLOAD_FOLDER
+from .data_version import GLOBAL_SCOPE
+from .db import drain_connections, init_schema
+
+# progress(stage, done, total) with stage in {"database", "uploads"}
+ProgressCallback = Callable[[str, int, int], None]
+
+MANIFEST_PATH = os.path.join(BACKUP_DIR, "uploads_manifest.json")
+MANIFEST_ARCNAME = "uploads_manifest.json"
+
+_CHUNK_SIZE = 256 * 1024
+_ZIP64_LIMIT = (1 << 31) - 1
+# Already-compressed formats: deflating them again only costs CPU.
+_STORED_EXTENSIONS = {".png", ".jpg", ".jpeg", ".pdf", ".docx", ".xlsx", ".pptx", ".zip"}
 
 
 @dataclass(frozen=True)
@@ -16,11 +32,23 @@ class RestoreResult:
     db_backup_path: str | None
     uploads_backup_path: str | None
     restored_files: int
+    unchanged_files: int = 0
+    removed_files: int = 0
+    swap_seconds: float = 0.0
 
 
-def _create_sqlite_snapshot(source_db: str, target_db: str) -> None:
+def _create_sqlite_snapshot(
+    source_db: str,
+    target_db: str,
+    pages: int = BACKUP_PAGES_PER_STEP,
+    progress: ProgressCallback | None = None,
+) -> None:
     """
     Create a consistent SQLite snapshot even when WAL is enabled.
+
+    The copy runs `pages` pages per step so writers are only blocked for the
+    duration of one step; SQLite restarts the copy by itself if the source
+    changes under it.
     """
     src = None
     dst = None
@@ -30,9 +58,14 @@ def _create_sqlite_snapshot(source_db: str, target_db: str) -> None:
         # Fallback for environments that do not support URI mode.
         src = sqlite3.connect(source_db)
 
+    def _step(status, remaining, total):
+        if progress is not None:
+            progress("database", total - remaining, total)
+
     try:
         dst = sqlite3.connect(target_db)
-        src.backup(dst)
+        src.backup(dst, pages=max(1, int(pages)), progress=_step, sleep=0.005)
+        _clear_sessions(dst)
     finally:
         try:
             if dst is not None:
@@ -42,125 +75,523 @@ def _create_sqlite_snapshot(source_db: str, target_db: str) -> None:
                 src.close()
 
 
+def _clear_sessions(conn) -> None:
+    """Login sessions are not data: archives neither carry nor restore them."""
+    try:
+        # Overwrite the freed pages too: session ids must not survive in them.
+        conn.execute("PRAGMA secure_delete = ON")
+        conn.execute("DELETE FROM sessions")
+        conn.commit()
+    except sqlite3.OperationalError:
+        pass
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_uploads_manifest() -> dict:
+    """Return the manifest saved with the last archive written to BACKUP_DIR.
+
+    Only a hash cache for scan_uploads (empty if none): the base of an
+    incremental archive is read from a kept archive, see _incremental_base.
+    """
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    files = data.get("files")
+    return files if isinstance(files, dict) else {}
+
+
+def _save_uploads_manifest(files: dict, created_at: str) -> None:
+    os.makedirs(os.path.dirname(MANIFEST_PATH), exist_ok=True)
+    tmp_path = f"{MANIFEST_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"created_at": created_at, "files": files}, f)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def _incremental_base() -> tuple[str | None, str | None, dict]:
+    """(file name, created_at, uploads manifest) of the newest full archive
+    still in BACKUP_DIR, or (None, None, {}) when there is none.
+
+    Downloaded archives are never a base: the server cannot know whether
+    the client kept them, while the archives in BACKUP_DIR are the ones
+    retention keeps.
+    """
+    best = (None, None, {})
+    try:
+        names = [n for n in os.listdir(BACKUP_DIR) if n.endswith(".zip")]
+    except OSError:
+        return best
+    for name in names:
+        try:
+            with zipfile.ZipFile(os.path.join(BACKUP_DIR, name)) as zf:
+                info = _read_zip_json(zf, "backup_info.json")
+                files = _read_zip_json(zf, MANIFEST_ARCNAME).get("files")
+        except (OSError, zipfile.BadZipFile):
+            continue
+        created_at = info.get("created_at")
+        if info.get("incremental") or not isinstance(files, dict) or not isinstance(created_at, str):
+            continue
+        if best[1] is None or created_at > best[1]:
+            best = (name, created_at, files)
+    return best
+
+
+def scan_uploads(previous: dict | None = None) -> tuple[dict, list[str]]:
+    """
+    Walk UPLOAD_FOLDER and return (manifest, changed).
+
+    Files whose size and mtime match `previous` reuse the recorded hash
+    without being read; the others are hashed and reported as changed only
+    if their content differs (or they are new).
+    """
+    previous = previous or {}
+    manifest: dict = {}
+    changed: list[str] = []
+    if not os.path.isdir(UPLOAD_FOLDER):
+        return manifest, changed
+
+    for root, _, files in os.walk(UPLOAD_FOLDER):
+        for name in files:
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, UPLOAD_FOLDER).replace(os.sep, "/")
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            prev = previous.get(rel)
+            if prev and prev.get("size") == st.st_size and prev.get("mtime_ns") == st.st_mtime_ns:
+                manifest[rel] = prev
+                continue
+            digest = _file_sha256(path)
+            manifest[rel] = {"sha256": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+            if not prev or prev.get("sha256") != digest:
+                changed.append(rel)
+    return manifest, changed
+
+
+class _ChunkSink:
+    """Write-only, unseekable file object; ZipFile then emits data descriptors."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        if data:
+            self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class BackupStream:
+    """
+    Iterable of ZIP chunks for a prepared backup.
+
+    The database snapshot is taken up front (so errors surface before any
+    byte is sent); files are then read and compressed chunk by chunk, so
+    memory use does not grow with the size of the uploads folder. An
+    incremental archive carries the uploads changed since the newest full
+    archive kept in BACKUP_DIR (all of them when there is none).
+    close() removes the temporary snapshot and is safe to call twice.
+    """
+
+    def __init__(self, incremental: bool = False, progress: ProgressCallback | None = None):
+        if not os.path.exists(DATABASE):
+            raise FileNotFoundError("Base de donnees introuvable.")
+
+        self.incremental = incremental
+        self.progress = progress
+        self.created_at = datetime.now(timezone.utc).isoformat()
+        self._tmpdir = tempfile.mkdtemp(prefix="edumaster_backup_")
+        self._snapshot_db = os.path.join(self._tmpdir, "ecole_multi.db")
+        try:
+            _create_sqlite_snapshot(DATABASE, self._snapshot_db, progress=progress)
+            if incremental:
+                self.base_archive, self.base_created_at, previous = _incremental_base()
+            else:
+                self.base_archive, self.base_created_at, previous = None, None, load_uploads_manifest()
+            self.manifest, changed = scan_uploads(previous)
+        except Exception:
+            self.close()
+            raise
+        self.uploads = sorted(changed) if incremental else sorted(self.manifest)
+
+    def __iter__(self):
+        try:
+            sink = _ChunkSink()
+            with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+                yield from self._write_file(zf, sink, self._snapshot_db, "ecole_multi.db")
+
+                total = len(self.uploads)
+                for i, rel in enumerate(self.uploads, start=1):
+                    src = os.path.join(UPLOAD_FOLDER, *rel.split("/"))
+                    if os.path.isfile(src):
+                        yield from self._write_file(zf, sink, src, f"uploads/{rel}")
+                    if self.progress is not None:
+                        self.progress("uploads", i, total)
+
+                info = {
+                    "created_at": self.created_at,
+                    "includes": ["ecole_multi.db", "uploads/"],
+                    "sqlite_snapshot": True,
+                    "incremental": self.incremental,
+                    "base_created_at": self.base_created_at,
+                    "base_archive": self.base_archive,
+                    "uploads_included": len(self.uploads),
+                    "uploads_total": len(self.manifest),
+                }
+                zf.writestr("backup_info.json", json.dumps(info, ensure_ascii=False, indent=2))
+                zf.writestr(MANIFEST_ARCNAME, json.dumps({"files": self.manifest}))
+            tail = sink.drain()
+            if tail:
+                yield tail
+        finally:
+            self.close()
+
+    @staticmethod
+    def _write_file(zf: zipfile.ZipFile, sink: _ChunkSink, src: str, arcname: str):
+        zinfo = zipfile.ZipInfo.from_file(src, arcname)
+        ext = os.path.splitext(arcname)[1].lower()
+        zinfo.compress_type = zipfile.ZIP_STORED if ext in _STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+        with open(src, "rb") as f, zf.open(zinfo, "w", force_zip64=zinfo.file_size > _ZIP64_LIMIT) as dest:
+            for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+                dest.write(chunk)
+                data = sink.drain()
+                if data:
+                    yield data
+
+    def close(self) -> None:
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+
+def write_backup_zip(dest_path: str, incremental: bool = False, progress: ProgressCallback | None = None) -> int:
+    """
+    Stream a backup archive to `dest_path` and return its size in bytes.
+
+    The archive is written to a `.part` file and renamed into place, so a
+    crash never leaves a truncated ZIP under the final name. Only archives
+    written into BACKUP_DIR save the uploads manifest (hash cache).
+    """
+    stream = BackupStream(incremental=incremental, progress=progress)
+    part_path = f"{dest_path}.part"
+    size = 0
+    try:
+        with open(part_path, "wb") as out:
+            for chunk in stream:
+                out.write(chunk)
+                size += len(chunk)
+        os.replace(part_path, dest_path)
+    finally:
+        stream.close()
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    if os.path.dirname(os.path.abspath(dest_path)) == os.path.abspath(BACKUP_DIR):
+        _save_uploads_manifest(stream.manifest, stream.created_at)
+    return size
+
+
 def create_backup_zip() -> BytesIO:
     """
     Create an in-memory ZIP backup with:
       - ecole_multi.db (consistent SQLite snapshot)
       - uploads/ (files only)
       - backup_info.json (metadata)
-    """
-    if not os.path.exists(DATABASE):
-        raise FileNotFoundError("Base de donnees introuvable.")
-
-    tmpdir = tempfile.mkdtemp(prefix="edumaster_backup_")
-    snapshot_db = os.path.join(tmpdir, "ecole_multi.db")
 
-    try:
-        _create_sqlite_snapshot(DATABASE, snapshot_db)
-
-        buf = BytesIO()
-        with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-            zf.write(snapshot_db, arcname="ecole_multi.db")
-
-            if os.path.isdir(UPLOAD_FOLDER):
-                for root, _, files in os.walk(UPLOAD_FOLDER):
-                    for name in files:
-                        src = os.path.join(root, name)
-                        rel = os.path.relpath(src, UPLOAD_FOLDER)
-                        zf.write(src, arcname=os.path.join("uploads", rel))
-
-            info = {
-                "created_at": datetime.now(timezone.utc).isoformat(),
-                "includes": ["ecole_multi.db", "uploads/"],
-                "sqlite_snapshot": True,
-            }
-            zf.writestr("backup_info.json", json.dumps(info, ensure_ascii=False, indent=2))
-
-        buf.seek(0)
-        return buf
-    finally:
-        shutil.rmtree(tmpdir, ignore_errors=True)
+    Buffers the whole archive; prefer BackupStream / write_backup_zip.
+    """
+    buf = BytesIO()
+    for chunk in BackupStream():
+        buf.write(chunk)
+    buf.seek(0)
+    return buf
 
 
-def restore_from_backup_zip(zip_path: str) -> RestoreResult:
+def restore_from_backup_zip(zip_path: str, drain_timeout: float | None = None) -> RestoreResult:
     """
-    Restore DATABASE and UPLOAD_FOLDER from a ZIP created by create_backup_zip().
+    Restore DATABASE and UPLOAD_FOLDER from a ZIP created by BackupStream.
     This function is intentionally conservative:
       - only accepts `ecole_multi.db` and paths under `uploads/`
       - prevents Zip Slip path traversal
-      - keeps backups of previous db/uploads with a timestamp suffix
+      - checks the snapshot with PRAGMA integrity_check before touching
+        anything live
+      - keeps the previous db and every replaced/removed upload with a
+        timestamp suffix
+
+    All the slow work (extraction, integrity check, schema upgrade,
+    hashing) happens before the swap. Uploads are diffed against the current content hashes and only
+    the files that differ are extracted. The swap itself drains request
+    connections (see core.db.drain_connections) and renames the staged files
+    into place, so the application is only held for a few renames.
+    Incremental archives only carry the uploads that changed; the restore is
+    refused if one they list is neither in the archive nor on disk. It is
+    also refused, before anything is replaced, when request connections are
+    still open at the end of the drain.
     """
     if not os.path.exists(zip_path):
         raise FileNotFoundError("Fichier zip introuvable.")
 
-    tmpdir = tempfile.mkdtemp(prefix="edumaster_restore_")
-    extracted_db = os.path.join(tmpdir, "ecole_multi.db")
-    extracted_uploads = os.path.join(tmpdir, "uploads")
-    restored_files = 0
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    os.makedirs(os.path.dirname(DATABASE), exist_ok=True)
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    # Staged next to their destination so the swap is a same-filesystem rename.
+    staged_db = f"{DATABASE}.restore_{stamp}"
+    staging_dir = f"{UPLOAD_FOLDER}.restore_{stamp}"
 
     try:
         with zipfile.ZipFile(zip_path, "r") as zf:
+            db_member = None
+            members = {}
             for member in zf.infolist():
                 name = member.filename.replace("\\", "/")
                 if name.endswith("/"):
                     continue
-
                 if name == "ecole_multi.db":
-                    dest = extracted_db
+                    db_member = member
                 elif name.startswith("uploads/"):
-                    dest = os.path.join(extracted_uploads, name[len("uploads/"):])
-                elif name == "backup_info.json":
-                    # metadata only
-                    continue
-                else:
-                    # unknown entry -> ignore (backward/forward compatibility)
-                    continue
+                    rel = name[len("uploads/"):]
+                    _safe_parts(rel)
+                    members[rel] = member
+                # backup_info.json, the manifest and unknown entries are not
+                # restored (backward/forward compatibility)
+
+            if db_member is None:
+                raise ValueError("Archive zip invalide: ecole_multi.db manquant.")
+            _extract_member(zf, db_member, staged_db)
+            _check_integrity(staged_db)
+            _prepare_snapshot(staged_db)
+
+            changed, unchanged, removed = _plan_uploads(zf, members)
+            for rel in changed:
+                _extract_member(zf, members[rel], os.path.join(staging_dir, *_safe_parts(rel)))
 
-                dest_dir = os.path.dirname(dest)
-                os.makedirs(dest_dir, exist_ok=True)
+        started = time.monotonic()
+        with drain_connections(drain_timeout if drain_timeout is not None else RESTORE_DRAIN_SECONDS) as remaining:
+            if remaining:
+                # Their writes would go to the replaced file and be lost.
+                raise RuntimeError(
+                    f"Restauration annulee: {remaining} connexion(s) encore ouverte(s), reessayez."
+                )
+            db_backup_path = _swap_database(staged_db, stamp)
+            uploads_backup_path = _swap_uploads(changed, removed, staging_dir, stamp)
+        swap_seconds = time.monotonic() - started
 
-                # Zip Slip protection
-                dest_real = os.path.realpath(dest)
-                tmp_real = os.path.realpath(tmpdir)
-                if not dest_real.startswith(tmp_real + os.sep):
-                    raise ValueError("Archive zip invalide (chemin dangereux).")
+        return RestoreResult(
+            db_backup_path=db_backup_path,
+            uploads_backup_path=uploads_backup_path,
+            restored_files=1 + len(changed),
+            unchanged_files=unchanged,
+            removed_files=len(removed),
+            swap_seconds=round(swap_seconds, 3),
+        )
+    finally:
+        for path in (staged_db, f"{staged_db}-wal", f"{staged_db}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+        shutil.rmtree(staging_dir, ignore_errors=True)
 
-                with zf.open(member, "r") as src, open(dest, "wb") as out:
-                    shutil.copyfileobj(src, out)
-                restored_files += 1
 
-        if not os.path.exists(extracted_db):
-            raise ValueError("Archive zip invalide: ecole_multi.db manquant.")
+def _global_version(conn) -> int:
+    try:
+        row = conn.execute("SELECT version FROM data_versions WHERE scope_id = ?", (GLOBAL_SCOPE,)).fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return int(row[0] or 0) if row else 0
 
-        # Prepare backups
-        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        db_backup_path = None
-        uploads_backup_path = None
 
-        os.makedirs(os.path.dirname(DATABASE), exist_ok=True)
-        os.makedirs(os.path.dirname(UPLOAD_FOLDER), exist_ok=True)
+def _prepare_snapshot(db_path: str) -> None:
+    """
+    Bring a staged snapshot to the current schema (an old backup lacks the
+    tables and columns added since) and move its global data version past
+    the live one, so no ETag or cached statistic from before the restore
+    can match the restored data. Sessions carried by older archives are
+    dropped.
+    """
+    live_version = 0
+    if os.path.exists(DATABASE):
+        live = sqlite3.connect(DATABASE)
+        try:
+            live_version = _global_version(live)
+        finally:
+            live.close()
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        init_schema(conn)
+        _clear_sessions(conn)
+        version = max(live_version, _global_version(conn)) + 1
+        conn.execute(
+            """
+            INSERT INTO data_versions (scope_id, version) VALUES (?, ?)
+            ON CONFLICT(scope_id) DO UPDATE SET version = excluded.version
+            """,
+            (GLOBAL_SCOPE, version),
+        )
+        conn.commit()
+    finally:
+        conn.close()
 
-        if os.path.exists(DATABASE):
-            db_backup_path = f"{DATABASE}.bak_{stamp}"
-            shutil.move(DATABASE, db_backup_path)
 
-        if os.path.isdir(UPLOAD_FOLDER):
-            uploads_backup_path = f"{UPLOAD_FOLDER}.bak_{stamp}"
-            shutil.move(UPLOAD_FOLDER, uploads_backup_path)
+def _safe_parts(rel: str) -> list[str]:
+    parts = rel.split("/")
+    if not rel or rel.startswith("/") or any(p in ("", ".", "..") for p in parts) or ":" in parts[0]:
+        raise ValueError("Archive zip invalide (chemin dangereux).")
+    return parts
 
-        # Restore DB
-        shutil.move(extracted_db, DATABASE)
 
-        # Restore uploads (if present in zip)
-        if os.path.isdir(extracted_uploads):
-            shutil.move(extracted_uploads, UPLOAD_FOLDER)
-        else:
-            os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+def _extract_member(zf: zipfile.ZipFile, member: zipfile.ZipInfo, dest: str) -> None:
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    with zf.open(member, "r") as src, open(dest, "wb") as out:
+        shutil.copyfileobj(src, out, _CHUNK_SIZE)
 
-        return RestoreResult(
-            db_backup_path=db_backup_path,
-            uploads_backup_path=uploads_backup_path,
-            restored_files=restored_files,
-        )
+
+def _check_integrity(db_path: str) -> None:
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = [r[0] for r in conn.execute("PRAGMA integrity_check").fetchall()]
+    except sqlite3.DatabaseError as exc:
+        raise ValueError(f"Archive zip invalide: base corrompue ({exc}).") from exc
     finally:
-        shutil.rmtree(tmpdir, ignore_errors=True)
+        conn.close()
+    if rows != ["ok"]:
+        raise ValueError(f"Archive zip invalide: base corrompue ({'; '.join(rows[:3])}).")
+
+
+def _member_sha256(zf: zipfile.ZipFile, member: zipfile.ZipInfo) -> str:
+    h = hashlib.sha256()
+    with zf.open(member, "r") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _plan_uploads(zf: zipfile.ZipFile, members: dict) -> tuple[list[str], int, list[str]]:
+    """
+    Compare the archive's uploads with the current folder by content hash.
+
+    Returns (files to extract, number already identical, files to remove).
+    Archives made before manifests existed are compared by size first and
+    only hashed when sizes match.
+    """
+    current, _ = scan_uploads(load_uploads_manifest())
+    archived = _read_zip_json(zf, MANIFEST_ARCNAME).get("files")
+    if not isinstance(archived, dict):
+        archived = {rel: None for rel in members}
+
+    changed, missing = [], []
+    unchanged = 0
+    for rel, entry in archived.items():
+        _safe_parts(rel)
+        have = current.get(rel)
+        if have is not None:
+            if entry is not None:
+                same = entry.get("sha256") == have["sha256"]
+            else:
+                member = members[rel]
+                same = member.file_size == have["size"] and _member_sha256(zf, member) == have["sha256"]
+            if same:
+                unchanged += 1
+                continue
+        if rel not in members:
+            missing.append(rel)
+            continue
+        changed.append(rel)
+    if missing:
+        raise ValueError(
+            f"Archive incrementale: {len(missing)} fichier(s) absent(s); restaurer d'abord la sauvegarde complete."
+        )
+    removed = [rel for rel in current if rel not in archived]
+    return changed, unchanged, removed
+
+
+def _swap_database(staged_db: str, stamp: str) -> str | None:
+    db_backup_path = None
+    if os.path.exists(DATABASE):
+        try:
+            conn = sqlite3.connect(DATABASE, timeout=5)
+            try:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            pass
+        db_backup_path = f"{DATABASE}.bak_{stamp}"
+        try:
+            os.link(DATABASE, db_backup_path)
+        except OSError:
+            shutil.copy2(DATABASE, db_backup_path)
+        wal = f"{DATABASE}-wal"
+        if os.path.exists(wal) and os.path.getsize(wal) > 0:
+            # Checkpoint could not finish (a reader elsewhere): keep the
+            # frames with the copy so it opens with them applied.
+            shutil.copy2(wal, f"{db_backup_path}-wal")
+
+    try:
+        os.replace(staged_db, DATABASE)
+    except OSError:
+        # Platforms that refuse to replace an open file (Windows): copy the
+        # pages into the live database through SQLite instead.
+        src = sqlite3.connect(staged_db)
+        dst = sqlite3.connect(DATABASE, timeout=30)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+        return db_backup_path
+
+    # The old file's WAL and index must not be applied to the new one;
+    # connections still open elsewhere keep their own descriptors.
+    for suffix in ("-wal", "-shm"):
+        try:
+            os.remove(f"{DATABASE}{suffix}")
+        except OSError:
+            pass
+    return db_backup_path
+
+
+def _swap_uploads(changed: list[str], removed: list[str], staging_dir: str, stamp: str) -> str | None:
+    backup_dir = f"{UPLOAD_FOLDER}.bak_{stamp}"
+    kept = 0
+
+    def _retire(parts):
+        nonlocal kept
+        current = os.path.join(UPLOAD_FOLDER, *parts)
+        if os.path.exists(current):
+            dest = os.path.join(backup_dir, *parts)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            os.replace(current, dest)
+            kept += 1
+
+    for rel in removed:
+        _retire(_safe_parts(rel))
+    for rel in changed:
+        parts = _safe_parts(rel)
+        _retire(parts)
+        dest = os.path.join(UPLOAD_FOLDER, *parts)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(os.path.join(staging_dir, *parts), dest)
+    return backup_dir if kept else None
+
+
+def _read_zip_json(zf: zipfile.ZipFile, name: str) -> dict:
+    try:
+        with zf.open(name, "r") as f:
+            data = json.load(f)
+    except (KeyError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
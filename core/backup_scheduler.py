@@ -0,0 +1,277 @@
+"""Scheduled backups: interval runs, verification, grandfather-father-son
+retention and duration/size metrics.
+
+The scheduler runs in its own process (scripts/run_backup.py), never inside
+web workers, so a single writer owns BACKUP_DIR. Every run streams a full
+archive to disk and verifies it by extracting its database and running
+``PRAGMA quick_check``. Only then are old archives pruned: an archive that
+fails verification is set aside as ``<name>.corrupt`` (the previous one is
+dropped) and retention does not run, so a bad archive can never push out
+the last good one. Run history lives in BACKUP_DIR/backup_status.json so
+the web process can report it.
+"""
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import datetime
+
+from .backup import write_backup_zip
+from .config import (
+    BACKUP_DIR,
+    BACKUP_INTERVAL_SECONDS,
+    BACKUP_KEEP_DAILY,
+    BACKUP_KEEP_MONTHLY,
+    BACKUP_KEEP_WEEKLY,
+)
+
+STATUS_PATH = os.path.join(BACKUP_DIR, "backup_status.json")
+STATUS_HISTORY = 50
+
+_NAME_RE = re.compile(r"^backup_(\d{8}_\d{6})\.zip$")
+_STAMP_FORMAT = "%Y%m%d_%H%M%S"
+_STATUS_LOCK = threading.Lock()
+
+
+def list_backups(backup_dir: str = BACKUP_DIR) -> list[tuple[str, datetime]]:
+    """Archives in `backup_dir` with the time encoded in their name, newest first."""
+    found = []
+    try:
+        names = os.listdir(backup_dir)
+    except OSError:
+        return found
+    for name in names:
+        match = _NAME_RE.match(name)
+        if not match:
+            continue
+        try:
+            stamp = datetime.strptime(match.group(1), _STAMP_FORMAT)
+        except ValueError:
+            continue
+        found.append((os.path.join(backup_dir, name), stamp))
+    found.sort(key=lambda item: item[1], reverse=True)
+    return found
+
+
+def select_retained(
+    stamps,
+    daily: int = BACKUP_KEEP_DAILY,
+    weekly: int = BACKUP_KEEP_WEEKLY,
+    monthly: int = BACKUP_KEEP_MONTHLY,
+) -> set:
+    """
+    Grandfather-father-son selection: the newest archive of each of the last
+    `daily` days, `weekly` ISO weeks and `monthly` months that have one.
+    The newest archive overall is always kept.
+    """
+    ordered = sorted(stamps, reverse=True)
+    keep = set(ordered[:1])
+    buckets = (
+        (daily, lambda d: d.date()),
+        (weekly, lambda d: d.isocalendar()[:2]),
+        (monthly, lambda d: (d.year, d.month)),
+    )
+    for count, key in buckets:
+        seen = set()
+        for stamp in ordered:
+            bucket = key(stamp)
+            if bucket in seen:
+                continue
+            if len(seen) >= count:
+                break
+            seen.add(bucket)
+            keep.add(stamp)
+    return keep
+
+
+def _unverified_names() -> set:
+    """Archives whose recorded verification did not pass (or never finished)."""
+    return {run.get("file") for run in load_status()["runs"] if not run.get("error") and run.get("verified") is not True}
+
+
+def apply_retention(backup_dir: str = BACKUP_DIR) -> list[str]:
+    """
+    Delete archives outside the retention policy; return the removed paths.
+
+    Only verified archives fill the daily/weekly/monthly slots. Archives
+    recorded as unverified are neither counted nor deleted; those older
+    than the recorded history were verified before being retained.
+    """
+    unverified = _unverified_names()
+    backups = [(path, stamp) for path, stamp in list_backups(backup_dir) if os.path.basename(path) not in unverified]
+    keep = select_retained([stamp for _, stamp in backups])
+    removed = []
+    for path, stamp in backups:
+        if stamp in keep:
+            continue
+        try:
+            os.remove(path)
+            removed.append(path)
+        except OSError:
+            pass
+    return removed
+
+
+def verify_backup(path: str) -> tuple[bool, str]:
+    """Extract the archived database (CRC-checked) and run PRAGMA quick_check."""
+    try:
+        with tempfile.TemporaryDirectory(prefix="edumaster_verify_") as tmpdir:
+            with zipfile.ZipFile(path, "r") as zf:
+                if "ecole_multi.db" not in zf.namelist():
+                    return False, "ecole_multi.db manquant"
+                zf.extract("ecole_multi.db", tmpdir)
+            conn = sqlite3.connect(os.path.join(tmpdir, "ecole_multi.db"))
+            try:
+                rows = [r[0] for r in conn.execute("PRAGMA quick_check").fetchall()]
+            finally:
+                conn.close()
+    except (OSError, zipfile.BadZipFile, sqlite3.DatabaseError) as exc:
+        return False, str(exc)
+    if rows == ["ok"]:
+        return True, "ok"
+    return False, "; ".join(rows[:5])
+
+
+def load_status() -> dict:
+    try:
+        with open(STATUS_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = {}
+    data.setdefault("runs", [])
+    return data
+
+
+def _update_run(file_name: str, **fields) -> None:
+    with _STATUS_LOCK:
+        data = load_status()
+        runs = data["runs"]
+        for run in runs:
+            if run.get("file") == file_name:
+                run.update(fields)
+                break
+        else:
+            runs.append({"file": file_name, **fields})
+        data["runs"] = runs[-STATUS_HISTORY:]
+        os.makedirs(os.path.dirname(STATUS_PATH), exist_ok=True)
+        tmp_path = f"{STATUS_PATH}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, STATUS_PATH)
+
+
+def _set_aside(path: str) -> None:
+    """Rename a corrupt archive out of the backup set, keeping only the latest."""
+    folder = os.path.dirname(path)
+    for name in os.listdir(folder):
+        if name.endswith(".zip.corrupt"):
+            try:
+                os.remove(os.path.join(folder, name))
+            except OSError:
+                pass
+    try:
+        os.replace(path, f"{path}.corrupt")
+    except OSError:
+        pass
+
+
+def run_backup_cycle(progress=None) -> dict:
+    """
+    Write one archive, verify it, then apply retention if it is sound.
+
+    Returns the run record: ``error`` when the archive could not be
+    written, ``verified`` False when it failed verification (and was set
+    aside; nothing was pruned).
+    """
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    started_at = datetime.now()
+    name = f"backup_{started_at.strftime(_STAMP_FORMAT)}.zip"
+    path = os.path.join(BACKUP_DIR, name)
+    started = time.monotonic()
+    try:
+        size = write_backup_zip(path, progress=progress)
+    except Exception as exc:
+        record = {
+            "started_at": started_at.isoformat(timespec="seconds"),
+            "duration_seconds": round(time.monotonic() - started, 3),
+            "size_bytes": 0,
+            "error": str(exc),
+        }
+        _update_run(name, **record)
+        return {"file": name, **record}
+
+    record = {
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "duration_seconds": round(time.monotonic() - started, 3),
+        "size_bytes": size,
+        "verified": None,
+        "removed": [],
+    }
+    # Recorded as unverified first, so retention skips it if the process
+    # dies during the check.
+    _update_run(name, **record)
+    verify_started = time.monotonic()
+    ok, detail = verify_backup(path)
+    record.update(verified=ok, verify_detail=detail, verify_seconds=round(time.monotonic() - verify_started, 3))
+    _update_run(name, **record)
+    if not ok:
+        _set_aside(path)
+        return {"file": name, **record}
+    record["removed"] = [os.path.basename(p) for p in apply_retention(BACKUP_DIR)]
+    _update_run(name, removed=record["removed"])
+    return {"file": name, **record}
+
+
+def seconds_until_due(interval: int = BACKUP_INTERVAL_SECONDS, now: float | None = None) -> float:
+    """Time left before the next run, based on the newest archive on disk."""
+    backups = list_backups()
+    if not backups:
+        return 0.0
+    now = time.time() if now is None else now
+    return max(0.0, backups[0][1].timestamp() + interval - now)
+
+
+def run_scheduler(
+    interval: int = BACKUP_INTERVAL_SECONDS,
+    stop: threading.Event | None = None,
+    on_run=None,
+) -> None:
+    """Run backups every `interval` seconds until `stop` is set."""
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        wait = seconds_until_due(interval)
+        if wait > 0:
+            stop.wait(min(wait, 60))
+            continue
+        record = run_backup_cycle()
+        if on_run is not None:
+            on_run(record)
+
+
+def backup_stats() -> dict:
+    """Summary of the last runs and of the archives on disk."""
+    runs = load_status()["runs"]
+    backups = list_backups()
+    total_bytes = 0
+    for path, _ in backups:
+        try:
+            total_bytes += os.path.getsize(path)
+        except OSError:
+            pass
+    completed = [r for r in runs if not r.get("error")]
+    last = completed[-1] if completed else {}
+    return {
+        "archives": len(backups),
+        "archives_bytes": total_bytes,
+        "runs": len(runs),
+        "failures": sum(1 for r in runs if r.get("error")),
+        "verify_failures": sum(1 for r in runs if r.get("verified") is False),
+        "last_started_at": last.get("started_at"),
+        "last_duration_seconds": last.get("duration_seconds"),
+        "last_size_bytes": last.get("size_bytes"),
+        "last_verified": last.get("verified"),
+    }
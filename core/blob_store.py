@@ -0,0 +1,109 @@
+"""
+Content-addressed storage for uploaded documents.
+
+Files live under UPLOAD_FOLDER as `blobs/<2 hex>/<sha256><ext>`, so the same
+content uploaded by many teachers is stored once. `documents.filename` holds
+that relative path; the rows pointing at a path are its references, and the
+file is removed when the last one goes. Legacy `uuid_name` files follow the
+same rule (they simply never have more than one reference).
+
+Both the write that adds a reference and the collection that removes a file
+run inside an IMMEDIATE transaction, so they are serialised by SQLite's
+write lock and a blob can never be collected while a new row is adopting it.
+"""
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+
+BLOB_DIR = "blobs"
+_CHUNK_SIZE = 256 * 1024
+
+
+@dataclass(frozen=True)
+class StagedBlob:
+    tmp_path: str
+    sha256: str
+    size: int
+    filename: str  # path relative to the uploads folder
+
+
+def blob_filename(sha256: str, ext: str) -> str:
+    return f"{BLOB_DIR}/{sha256[:2]}/{sha256}{ext.lower()}"
+
+
+def stage_blob(stream, folder: str, ext: str) -> StagedBlob:
+    """
+    Copy `stream` to a temporary file in `folder`, hashing while writing.
+
+    The temporary file lives next to the blobs so that publishing it is a
+    same-filesystem rename.
+    """
+    tmp_dir = os.path.join(folder, BLOB_DIR)
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".upload_", dir=tmp_dir)
+    h = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: stream.read(_CHUNK_SIZE), b""):
+                h.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except Exception:
+        discard_blob(tmp_path)
+        raise
+    digest = h.hexdigest()
+    return StagedBlob(tmp_path=tmp_path, sha256=digest, size=size, filename=blob_filename(digest, ext))
+
+
+def publish_blob(staged: StagedBlob, folder: str) -> bool:
+    """
+    Move a staged upload into place; return False if the content was
+    already stored (the temporary copy is then dropped).
+
+    Call it inside the transaction that inserts the referencing row.
+    """
+    dest = os.path.join(folder, *staged.filename.split("/"))
+    if os.path.exists(dest):
+        discard_blob(staged.tmp_path)
+        return False
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    os.replace(staged.tmp_path, dest)
+    return True
+
+
+def discard_blob(tmp_path: str) -> None:
+    try:
+        os.remove(tmp_path)
+    except OSError:
+        pass
+
+
+def release_blobs(db, folder: str, filenames) -> int:
+    """
+    Delete the files among `filenames` that no document references any more.
+
+    Call after the referencing rows have been deleted and committed.
+    Returns the number of files removed.
+    """
+    names = {name for name in filenames if name}
+    if not names:
+        return 0
+    removed = 0
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        for name in names:
+            if db.execute("SELECT 1 FROM documents WHERE filename = ? LIMIT 1", (name,)).fetchone():
+                continue
+            path = os.path.realpath(os.path.join(folder, *name.split("/")))
+            if not path.startswith(os.path.realpath(folder) + os.sep):
+                continue
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+    finally:
+        db.commit()
+    return removed
@@ -26,6 +26,121 @@ MAX_CONTENT_LENGTH = int(os.environ.get("MAX_CONTENT_LENGTH", 10 * 1024 * 1024))
 LOGIN_MAX_ATTEMPTS = int(os.environ.get("LOGIN_MAX_ATTEMPTS", 5))
 LOGIN_WINDOW_SECONDS = int(os.environ.get("LOGIN_WINDOW_SECONDS", 15 * 60))
 LOGIN_LOCK_SECONDS = int(os.environ.get("LOGIN_LOCK_SECONDS", 10 * 60))
+# Attempts are throttled in memory and persisted to login_attempts in batches.
+LOGIN_FLUSH_SECONDS = int(os.environ.get("LOGIN_FLUSH_SECONDS", 30))
+LOGIN_CLEANUP_SECONDS = int(os.environ.get("LOGIN_CLEANUP_SECONDS", 60 * 60))
+LOGIN_ATTEMPTS_KEEP_SECONDS = int(os.environ.get("LOGIN_ATTEMPTS_KEEP_SECONDS", 7 * 24 * 3600))
+# Memory bounds: failure windows kept (least recently used evicted, then
+# re-seeded from login_attempts) and attempts waiting to be persisted.
+LOGIN_TRACKED_KEYS = int(os.environ.get("LOGIN_TRACKED_KEYS", 10000))
+LOGIN_PENDING_MAX = int(os.environ.get("LOGIN_PENDING_MAX", 10000))
 
 # One-time admin-generated password reset links
 RESET_TOKEN_TTL_SECONDS = int(os.environ.get("RESET_TOKEN_TTL_SECONDS", 2 * 60 * 60))
+
+# Notification stream (SSE). Off by default: on a fixed pool of sync
+# workers (PythonAnywhere) every open tab would hold one worker for the
+# whole stream, so the badge polls /api/notifications/count every
+# NOTIFICATIONS_POLL_SECONDS instead. Enable it behind a threaded or async
+# server. Each connection is recycled after NOTIFICATIONS_STREAM_SECONDS;
+# the browser reconnects itself.
+NOTIFICATIONS_STREAM_ENABLED = os.environ.get("NOTIFICATIONS_STREAM", "0").strip().lower() in ("1", "true", "yes", "on")
+NOTIFICATIONS_POLL_SECONDS = int(os.environ.get("NOTIFICATIONS_POLL_SECONDS", 60))
+NOTIFICATIONS_STREAM_SECONDS = int(os.environ.get("NOTIFICATIONS_STREAM_SECONDS", 55))
+NOTIFICATIONS_KEEPALIVE_SECONDS = int(os.environ.get("NOTIFICATIONS_KEEPALIVE_SECONDS", 15))
+
+# Read notifications older than this are pruned (0 disables pruning).
+NOTIFICATIONS_RETENTION_DAYS = int(os.environ.get("NOTIFICATIONS_RETENTION_DAYS", 90))
+
+# Audit log (change_log) write-behind buffer
+AUDIT_FLUSH_SIZE = int(os.environ.get("AUDIT_FLUSH_SIZE", 50))
+AUDIT_FLUSH_SECONDS = float(os.environ.get("AUDIT_FLUSH_SECONDS", 2))
+AUDIT_BUFFER_MAX = int(os.environ.get("AUDIT_BUFFER_MAX", 10000))
+
+# Password hashing policy (werkzeug method string, e.g. "scrypt:16384:8:1"
+# or "pbkdf2:sha256:600000"). Hashes made with other parameters are
+# upgraded transparently on the next successful login.
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+
+# Session storage: "sqlite" (server-side, shared by all workers), "memory"
+# (server-side, single process only) or "cookie" (Flask signed cookie).
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "sqlite").strip().lower()
+SESSION_IDLE_SECONDS = int(os.environ.get("SESSION_IDLE_SECONDS", 7 * 24 * 3600))
+SESSION_CACHE_SIZE = int(os.environ.get("SESSION_CACHE_SIZE", 2048))
+
+# Backups: the uploads manifest (content hash + mtime per file) lives in
+# BACKUP_DIR so incremental archives only carry files changed since the
+# last completed backup. The SQLite snapshot copies this many pages per
+# step, letting writers commit between steps.
+BACKUP_DIR = os.environ.get("BACKUP_DIR", os.path.join(BASE_DIR, "backups"))
+BACKUP_PAGES_PER_STEP = int(os.environ.get("BACKUP_PAGES_PER_STEP", 1024))
+# Scheduled backups (scripts/run_backup.py): one archive every interval,
+# pruned with a grandfather-father-son policy (newest archive per day,
+# ISO week and month, for the given number of each).
+BACKUP_INTERVAL_SECONDS = int(os.environ.get("BACKUP_INTERVAL_SECONDS", 24 * 3600))
+BACKUP_KEEP_DAILY = int(os.environ.get("BACKUP_KEEP_DAILY", 7))
+BACKUP_KEEP_WEEKLY = int(os.environ.get("BACKUP_KEEP_WEEKLY", 4))
+BACKUP_KEEP_MONTHLY = int(os.environ.get("BACKUP_KEEP_MONTHLY", 12))
+
+# Restore: how long to wait for open request connections to finish before
+# swapping the database file in.
+RESTORE_DRAIN_SECONDS = float(os.environ.get("RESTORE_DRAIN_SECONDS", 10))
+
+# Stats page / PDF: number of histogram bins over 0..20 (overridable per
+# request with ?bins=) and how many computed results are kept in memory,
+# keyed by data version.
+STATS_HISTOGRAM_BINS = int(os.environ.get("STATS_HISTOGRAM_BINS", 10))
+STATS_CACHE_SIZE = int(os.environ.get("STATS_CACHE_SIZE", 128))
+
+# SQL instrumentation (core.sql_trace), off by default. When on, each
+# request reports its statement count and SQL time in a Server-Timing
+# header; requests spending more than SQL_SLOW_REQUEST_MS in SQL are
+# written to a rotating log with their statement shapes over
+# SQL_SLOW_QUERY_MS, and SQL_REPEAT_WARN > 0 also logs a warning when one
+# request runs the same statement shape more than that many times.
+SQL_TRACE_ENABLED = os.environ.get("SQL_TRACE", "0").strip().lower() in ("1", "true", "yes", "on")
+SQL_SLOW_REQUEST_MS = float(os.environ.get("SQL_SLOW_REQUEST_MS", 500))
+SQL_SLOW_QUERY_MS = float(os.environ.get("SQL_SLOW_QUERY_MS", 100))
+SQL_REPEAT_WARN = int(os.environ.get("SQL_REPEAT_WARN", 0))
+SQL_LOG_FILE = os.environ.get("SQL_LOG_FILE", os.path.join(BASE_DIR, "logs", "sql_slow.log"))
+SQL_LOG_MAX_BYTES = int(os.environ.get("SQL_LOG_MAX_BYTES", 5 * 1024 * 1024))
+SQL_LOG_BACKUPS = int(os.environ.get("SQL_LOG_BACKUPS", 5))
+
+# Metrics (/metrics, Prometheus text format): always served to admins, and
+# to loopback clients that did not come through a proxy (no
+# X-Forwarded-For) unless METRICS_ALLOW_LOCALHOST=0. METRICS_ENABLED=0
+# removes the endpoint and the per-request timing.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1").strip().lower() in ("1", "true", "yes", "on")
+METRICS_ALLOW_LOCALHOST = os.environ.get("METRICS_ALLOW_LOCALHOST", "1").strip().lower() in ("1", "true", "yes", "on")
+
+# Memory profiling (core.memory_profile), off by default. MEMORY_PROFILE=1
+# starts tracemalloc with this many frames per allocation, serves the
+# snapshot diff at /admin/memory and tracks the allocation peak of the
+# endpoints listed below. MEMORY_PROFILE_RECORD names a JSON-lines file
+# where requests are appended for scripts/replay_memory.py.
+MEMORY_PROFILE_ENABLED = os.environ.get("MEMORY_PROFILE", "0").strip().lower() in ("1", "true", "yes", "on")
+MEMORY_PROFILE_FRAMES = int(os.environ.get("MEMORY_PROFILE_FRAMES", 10))
+MEMORY_PROFILE_ENDPOINTS = [
+    e.strip()
+    for e in os.environ.get(
+        "MEMORY_PROFILE_ENDPOINTS",
+        "reports.export_excel,reports.export_list_pdf,reports.export_parents,reports.export_stats_pdf,"
+        "reports.bulletin_pdf,imports.import_excel,imports.import_excel_apply,imports.import_scan_pdf,"
+        "imports.remplir_bulletin_officiel,admin.admin_backup",
+    ).split(",")
+    if e.strip()
+]
+MEMORY_PROFILE_RECORD = os.environ.get("MEMORY_PROFILE_RECORD", "")
+
+# Request profiling (core.request_profiler), off unless PROFILE_ENABLED=1:
+# disabled, no hook is installed. Enabled, one request in
+# PROFILE_SAMPLE_EVERY (0: none) and every admin request carrying the
+# PROFILE_HEADER header is run under cProfile and a stack sampler; the
+# newest PROFILE_KEEP profiles are kept in PROFILE_DIR and listed at
+# /admin/profiles.
+PROFILE_ENABLED = os.environ.get("PROFILE_ENABLED", "0").strip().lower() in ("1", "true", "yes", "on")
+PROFILE_SAMPLE_EVERY = int(os.environ.get("PROFILE_SAMPLE_EVERY", 0))
+PROFILE_HEADER = os.environ.get("PROFILE_HEADER", "X-EduMaster-Profile")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(BASE_DIR, "profiles"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", 50))
+PROFILE_STACK_INTERVAL_MS = float(os.environ.get("PROFILE_STACK_INTERVAL_MS", 2))
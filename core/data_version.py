@@ -0,0 +1,64 @@
+"""Per-user data version counters.
+
+Every write path bumps the version of the user whose data changed (and
+admin-wide changes bump the global scope, id 0). Read-only pages derive
+their ETag from these counters, so an unchanged page can be answered with
+a 304 without running any grade query.
+"""
+import sqlite3
+
+GLOBAL_SCOPE = 0
+
+
+def bump_data_version(db, user_id=None) -> None:
+    """Increment the data version for ``user_id`` (global scope when None).
+
+    Does NOT commit: the bump joins the caller's write transaction so the
+    new version becomes visible together with the data it describes.
+    """
+    scope = GLOBAL_SCOPE if user_id is None else int(user_id)
+    try:
+        db.execute(
+            """
+            INSERT INTO data_versions (scope_id, version) VALUES (?, 1)
+            ON CONFLICT(scope_id) DO UPDATE SET version = version + 1
+            """,
+            (scope,),
+        )
+    except sqlite3.OperationalError:
+        # Table missing (migrations not applied yet): caching simply stays cold.
+        pass
+
+
+def bump_data_versions(db, user_ids) -> None:
+    """Bulk variant of bump_data_version for fan-out writes (no commit)."""
+    scopes = sorted({int(uid) for uid in user_ids})
+    if not scopes:
+        return
+    try:
+        db.executemany(
+            """
+            INSERT INTO data_versions (scope_id, version) VALUES (?, 1)
+            ON CONFLICT(scope_id) DO UPDATE SET version = version + 1
+            """,
+            [(scope,) for scope in scopes],
+        )
+    except sqlite3.OperationalError:
+        pass
+
+
+def get_data_version(db, user_id) -> tuple[int, int] | None:
+    """Return ``(global_version, user_version)`` for ``user_id``.
+
+    None when the counters cannot be read (table missing): writes are not
+    tracked then, so callers must skip any cache keyed on the version.
+    """
+    try:
+        rows = db.execute(
+            "SELECT scope_id, version FROM data_versions WHERE scope_id IN (?, ?)",
+            (GLOBAL_SCOPE, int(user_id)),
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return None
+    versions = {int(r["scope_id"]): int(r["version"] or 0) for r in rows}
+    return versions.get(GLOBAL_SCOPE, 0), versions.get(int(user_id), 0)
@@ -1,9 +1,12 @@
 import os
 import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from flask import g
-from werkzeug.security import generate_password_hash
-from .config import DATABASE
+from .config import DATABASE, RESTORE_DRAIN_SECONDS
+from .passwords import hash_password
+from .sql_trace import connection_factory
 
 def _current_school_year_label() -> str:
     now = datetime.now()
@@ -12,10 +15,88 @@ def _current_school_year_label() -> str:
     return f"{now.year - 1}/{now.year}"
 
 
+# Request connections are counted so a restore can drain them: while a
+# drain is in progress new connections wait (up to the drain timeout)
+# instead of opening a database that is about to be swapped.
+_GATE = threading.Condition()
+_ACTIVE = 0
+_DRAINING = False
+
+
+def _enter_gate(timeout=RESTORE_DRAIN_SECONDS):
+    global _ACTIVE
+    with _GATE:
+        if _DRAINING:
+            _GATE.wait_for(lambda: not _DRAINING, timeout=timeout)
+        _ACTIVE += 1
+
+
+def _leave_gate():
+    global _ACTIVE
+    with _GATE:
+        _ACTIVE = max(0, _ACTIVE - 1)
+        _GATE.notify_all()
+
+
+def connection_stats() -> dict:
+    """Request connections open in this process and whether a drain is on."""
+    with _GATE:
+        return {"active": _ACTIVE, "draining": _DRAINING}
+
+
+@contextmanager
+def drain_connections(timeout=RESTORE_DRAIN_SECONDS):
+    """
+    Hold new request connections back and wait for open ones to close.
+
+    Yields the number of connections still open when the timeout expired
+    (0 when fully drained). Only covers this process; other workers pick up
+    a swapped file on their next request since connections are per request.
+    """
+    global _DRAINING
+    with _GATE:
+        _DRAINING = True
+        _GATE.wait_for(lambda: _ACTIVE == 0, timeout=timeout)
+        remaining = _ACTIVE
+    try:
+        yield remaining
+    finally:
+        with _GATE:
+            _DRAINING = False
+            _GATE.notify_all()
+
+
+@contextmanager
+def short_connection():
+    """
+    A connection outside the request's get_db(), closed on exit. For code
+    that outlives the request handler (streamed responses): holding the
+    request connection there would keep a restore from draining.
+    """
+    _enter_gate()
+    try:
+        conn = sqlite3.connect(DATABASE, timeout=10, check_same_thread=False)
+    except Exception:
+        _leave_gate()
+        raise
+    conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+    finally:
+        conn.close()
+        _leave_gate()
+
+
 def get_db():
     db = getattr(g, "_database", None)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE, check_same_thread=False)
+        _enter_gate()
+        try:
+            db = sqlite3.connect(DATABASE, check_same_thread=False, factory=connection_factory())
+        except Exception:
+            _leave_gate()
+            raise
+        g._database = db
         db.row_factory = sqlite3.Row
         try:
             db.execute("PRAGMA foreign_keys = ON")
@@ -30,11 +111,19 @@ def close_db(exception=None):
     db = g.pop("_database", None)
     if db is not None:
         db.close()
+        _leave_gate()
 
 
 def init_db():
-    db = get_db()
+    init_schema(get_db())
+
+
+def init_schema(db):
+    """Create or upgrade every table of `db`, then run the migrations."""
     current_school_year = _current_school_year_label()
+    # Only effective on a brand-new file: lets archival give pages back
+    # with PRAGMA incremental_vacuum instead of a blocking full VACUUM.
+    db.execute("PRAGMA auto_vacuum = INCREMENTAL")
     db.execute('''CREATE TABLE IF NOT EXISTS users (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         username TEXT UNIQUE NOT NULL,
@@ -303,6 +392,6 @@ def bootstrap_admin():
     if not admin:
         db.execute(
             "INSERT INTO users (username, password, nom_affichage, is_admin, role) VALUES (?, ?, ?, ?, ?)",
-            (admin_user, generate_password_hash(admin_pass), admin_display or admin_user, 1, "admin")
+            (admin_user, hash_password(admin_pass), admin_display or admin_user, 1, "admin")
         )
         db.commit()
@@ -0,0 +1,84 @@
+"""HTTP conditional caching (ETag) for read-only, per-user pages.
+
+The ETag is derived from the data version counters (see core.data_version),
+the request URL and the bits of session state that are rendered into the
+page. When the client already holds the current representation, the view is
+not called at all and a 304 is returned.
+"""
+import hashlib
+import os
+from functools import wraps
+
+from flask import make_response, request, session
+
+from .config import BASE_DIR
+from .data_version import get_data_version
+from .db import get_db
+
+_ASSET_STAMP = None
+
+
+def _asset_stamp() -> str:
+    """Fingerprint of templates/static so a deploy invalidates cached pages."""
+    global _ASSET_STAMP
+    if _ASSET_STAMP is None:
+        latest = 0.0
+        for folder in ("templates", "static"):
+            root_dir = os.path.join(BASE_DIR, folder)
+            for root, dirs, files in os.walk(root_dir):
+                # Uploaded documents never affect rendered pages.
+                dirs[:] = [d for d in dirs if d != "uploads"]
+                for name in files:
+                    try:
+                        latest = max(latest, os.path.getmtime(os.path.join(root, name)))
+                    except OSError:
+                        pass
+        _ASSET_STAMP = str(int(latest))
+    return _ASSET_STAMP
+
+
+def compute_etag(user_id: int) -> str | None:
+    """ETag of the current page, None when the data version is unknown."""
+    versions = get_data_version(get_db(), user_id)
+    if versions is None:
+        return None
+    global_version, user_version = versions
+    parts = [
+        _asset_stamp(),
+        str(global_version),
+        str(user_version),
+        str(user_id),
+        str(session.get("role") or ""),
+        str(session.get("lang") or ""),
+        str(session.get("_csrf_token") or ""),
+        request.full_path,
+    ]
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def etag_cached(f):
+    """Answer with 304 when the page for the current data version is unchanged.
+
+    Must be placed below ``login_required`` so the session is authenticated.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        user_id = session.get("user_id")
+        if user_id is None or request.method not in ("GET", "HEAD") or session.get("_flashes"):
+            # Pending flash messages must be rendered, never answered by a 304.
+            return f(*args, **kwargs)
+
+        etag = compute_etag(user_id)
+        if etag is None:
+            return f(*args, **kwargs)
+        if etag in request.if_none_match:
+            response = make_response("", 304)
+        else:
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
+
+    return decorated_function
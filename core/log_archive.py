@@ -0,0 +1,182 @@
+"""Archival of change_log rows by school year.
+
+Rows older than the active school year are moved, in committed batches,
+into one archive table per closed year (``change_log_archive_YYYY_YYYY``)
+so the hot ``change_log`` table only holds the current year. Archives are
+registered in ``change_log_archives``; ``change_log_source()`` builds the
+FROM clause that transparently unions the archives a date range needs.
+"""
+import re
+import time
+from datetime import datetime
+
+_LABEL_RE = re.compile(r"^(\d{4})/(\d{4})$")
+_TABLE_RE = re.compile(r"^change_log_archive_\d{4}_\d{4}$")
+
+_COLUMNS = "id, user_id, action, eleve_id, subject_id, details, created_at"
+
+
+def school_year_bounds(label: str) -> tuple[int, int]:
+    """Return ``(start_ts, end_ts)`` for a 'YYYY/YYYY' label (Sept 1st to Sept 1st)."""
+    match = _LABEL_RE.match((label or "").strip())
+    if not match:
+        raise ValueError(f"Invalid school year label: {label!r}")
+    y1 = int(match.group(1))
+    return int(datetime(y1, 9, 1).timestamp()), int(datetime(y1 + 1, 9, 1).timestamp())
+
+
+def school_year_of(ts: int) -> str:
+    dt = datetime.fromtimestamp(int(ts))
+    if dt.month >= 9:
+        return f"{dt.year}/{dt.year + 1}"
+    return f"{dt.year - 1}/{dt.year}"
+
+
+def archive_table_name(label: str) -> str:
+    school_year_bounds(label)
+    return "change_log_archive_" + label.replace("/", "_")
+
+
+def _active_year(db) -> str:
+    row = db.execute(
+        "SELECT label FROM school_years WHERE COALESCE(is_active, 0) = 1 ORDER BY id LIMIT 1"
+    ).fetchone()
+    return row["label"] if row else school_year_of(int(time.time()))
+
+
+def _ensure_archive_table(db, table: str) -> None:
+    db.execute(f"""CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        action TEXT NOT NULL,
+        eleve_id INTEGER,
+        subject_id INTEGER,
+        details TEXT,
+        created_at INTEGER NOT NULL
+    )""")
+    db.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_user_time ON {table}(user_id, created_at)")
+
+
+def archive_change_log(db, batch_size: int = 500, vacuum_pages: int = 1000) -> dict:
+    """Move every change_log row older than the active school year to its archive.
+
+    Each batch is its own transaction so writers are only blocked briefly.
+    Returns ``{label: moved_rows}``.
+    """
+    active_start, _ = school_year_bounds(_active_year(db))
+    moved = {}
+    while True:
+        row = db.execute(
+            "SELECT MIN(created_at) AS ts FROM change_log WHERE created_at < ?",
+            (active_start,),
+        ).fetchone()
+        if not row or row["ts"] is None:
+            break
+        label = school_year_of(row["ts"])
+        start_ts, end_ts = school_year_bounds(label)
+        end_ts = min(end_ts, active_start)
+        table = archive_table_name(label)
+        _ensure_archive_table(db, table)
+        count = 0
+        while True:
+            ids = [
+                r["id"]
+                for r in db.execute(
+                    "SELECT id FROM change_log WHERE created_at >= ? AND created_at < ? ORDER BY id LIMIT ?",
+                    (start_ts, end_ts, batch_size),
+                ).fetchall()
+            ]
+            if not ids:
+                break
+            placeholders = ",".join("?" for _ in ids)
+            db.execute(
+                f"INSERT OR IGNORE INTO {table} ({_COLUMNS}) SELECT {_COLUMNS} FROM change_log WHERE id IN ({placeholders})",
+                ids,
+            )
+            db.execute(f"DELETE FROM change_log WHERE id IN ({placeholders})", ids)
+            db.commit()
+            count += len(ids)
+        _register_archive(db, label, table)
+        db.commit()
+        moved[label] = count
+
+    if moved:
+        incremental_vacuum(db, vacuum_pages)
+    return moved
+
+
+def _register_archive(db, label: str, table: str) -> None:
+    stats = db.execute(
+        f"SELECT COUNT(*) AS c, MIN(created_at) AS min_ts, MAX(created_at) AS max_ts FROM {table}"
+    ).fetchone()
+    db.execute(
+        """
+        INSERT INTO change_log_archives (school_year, table_name, row_count, min_ts, max_ts, archived_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(school_year) DO UPDATE SET
+            table_name=excluded.table_name,
+            row_count=excluded.row_count,
+            min_ts=excluded.min_ts,
+            max_ts=excluded.max_ts,
+            archived_at=excluded.archived_at
+        """,
+        (label, table, int(stats["c"] or 0), stats["min_ts"], stats["max_ts"], int(time.time())),
+    )
+
+
+def incremental_vacuum(db, pages: int = 1000) -> None:
+    """Give back up to ``pages`` free pages, only when auto_vacuum is INCREMENTAL.
+
+    New databases are created in that mode (see init_db); older files keep
+    their free pages for reuse until an offline VACUUM converts them.
+    """
+    row = db.execute("PRAGMA auto_vacuum").fetchone()
+    if row and int(row[0]) == 2:
+        db.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+
+
+def list_archives(db, from_ts: int | None = None, to_ts: int | None = None) -> list[str]:
+    """Archive tables whose rows may fall inside ``[from_ts, to_ts]``."""
+    rows = db.execute(
+        "SELECT table_name, min_ts, max_ts FROM change_log_archives ORDER BY school_year"
+    ).fetchall()
+    tables = []
+    for r in rows:
+        table = r["table_name"]
+        if not _TABLE_RE.match(table or ""):
+            continue
+        if from_ts is not None and r["max_ts"] is not None and int(r["max_ts"]) < from_ts:
+            continue
+        if to_ts is not None and r["min_ts"] is not None and int(r["min_ts"]) > to_ts:
+            continue
+        tables.append(table)
+    return tables
+
+
+def change_log_source(db, from_ts: int | None = None, to_ts: int | None = None) -> str:
+    """FROM expression for change_log, unioned with archives the range reaches.
+
+    Archives are only consulted when the range reaches before the oldest
+    row still in the hot table: a start date before it, or, with no start
+    date, an end date before it. The default history view never touches
+    them.
+    """
+    if from_ts is None and to_ts is None:
+        return "change_log"
+    row = db.execute("SELECT MIN(created_at) AS ts FROM change_log").fetchone()
+    hot_start = row["ts"] if row else None
+    reach = from_ts if from_ts is not None else to_ts
+    if hot_start is not None and reach >= int(hot_start):
+        return "change_log"
+    tables = list_archives(db, from_ts, to_ts)
+    if not tables:
+        return "change_log"
+    parts = [f"SELECT {_COLUMNS} FROM change_log"]
+    parts += [f"SELECT {_COLUMNS} FROM {t}" for t in tables]
+    return "(" + " UNION ALL ".join(parts) + ")"
+
+
+def delete_user_archives(db, user_id: int) -> None:
+    """Purge a user's archived rows (no commit, joins the caller's transaction)."""
+    for table in list_archives(db):
+        db.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
@@ -0,0 +1,203 @@
+"""Memory profiling with tracemalloc (opt-in with MEMORY_PROFILE=1).
+
+When enabled:
+  - ``/admin/memory`` (admins) lists the top allocation sites of a fresh
+    snapshot compared with the baseline snapshot (``?reset=1`` takes a new
+    baseline), plus the per-endpoint peaks below;
+  - requests to MEMORY_PROFILE_ENDPOINTS (exports, imports, backup) get
+    their allocation peak measured from the start of the request until the
+    response is closed, so streamed bodies are included;
+  - with MEMORY_PROFILE_RECORD set, every request is appended to that
+    JSON-lines file (method, path, form fields, names of uploaded files)
+    for scripts/replay_memory.py. Fields and parameters named like a
+    password or a token are left out (see core.security.is_secret_field).
+
+tracemalloc counts Python allocations of the whole process: concurrent
+requests add to each other's peaks, so measure on a quiet worker. Tracing
+slows allocations down noticeably; keep it off in normal operation.
+"""
+import json
+import linecache
+import logging
+import threading
+import time
+import tracemalloc
+
+from flask import abort, current_app, g, jsonify, request
+
+from .config import (
+    MEMORY_PROFILE_ENABLED,
+    MEMORY_PROFILE_ENDPOINTS,
+    MEMORY_PROFILE_FRAMES,
+    MEMORY_PROFILE_RECORD,
+)
+from .security import admin_required, is_secret_field, login_required, redacted_full_path
+
+logger = logging.getLogger("edumaster.memory")
+
+GROUPINGS = ("lineno", "filename", "traceback")
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    # Formatting tracebacks fills the line cache: not the app's memory.
+    tracemalloc.Filter(False, linecache.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+_LOCK = threading.Lock()
+_BASELINE = {"snapshot": None, "taken_at": None}
+_PEAKS: dict[str, dict] = {}
+
+
+def start_tracing(frames: int = MEMORY_PROFILE_FRAMES) -> None:
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(max(1, frames))
+
+
+def take_snapshot():
+    return tracemalloc.take_snapshot().filter_traces(_IGNORED)
+
+
+def top_sites(snapshot, baseline=None, group: str = "lineno", limit: int = 25) -> list[dict]:
+    """
+    Largest allocation sites of `snapshot`; compared with `baseline`, the
+    sites that grew the most (size_diff) first.
+    """
+    if group not in GROUPINGS:
+        group = "lineno"
+    if baseline is not None:
+        stats = snapshot.compare_to(baseline, group)
+    else:
+        stats = snapshot.statistics(group)
+    sites = []
+    for stat in stats[: max(1, limit)]:
+        frames = stat.traceback.format(limit=1 if group != "traceback" else None)
+        site = {
+            "site": frames[0].strip() if frames else "?",
+            "size_kib": round(stat.size / 1024, 1),
+            "count": stat.count,
+        }
+        if baseline is not None:
+            site["size_diff_kib"] = round(stat.size_diff / 1024, 1)
+            site["count_diff"] = stat.count_diff
+        if group == "traceback":
+            site["traceback"] = [line.strip() for line in frames if line.strip()]
+        sites.append(site)
+    return sites
+
+
+def endpoint_peaks() -> dict[str, dict]:
+    with _LOCK:
+        return {endpoint: dict(stats) for endpoint, stats in _PEAKS.items()}
+
+
+def _record_peak(endpoint: str, base: int) -> None:
+    if not tracemalloc.is_tracing():
+        return
+    current, peak = tracemalloc.get_traced_memory()
+    peak_kib = round(max(0, peak - base) / 1024, 1)
+    with _LOCK:
+        stats = _PEAKS.get(endpoint)
+        if stats is None:
+            stats = _PEAKS[endpoint] = {"requests": 0, "last_peak_kib": 0.0, "max_peak_kib": 0.0}
+        stats["requests"] += 1
+        stats["last_peak_kib"] = peak_kib
+        stats["max_peak_kib"] = max(stats["max_peak_kib"], peak_kib)
+    logger.info("%s peak %.1f KiB (traced now %.1f KiB)", endpoint, peak_kib, current / 1024)
+
+
+def _start_request():
+    if not current_app.config["MEMORY_PROFILE"] or not tracemalloc.is_tracing():
+        return
+    if request.endpoint in current_app.config["MEMORY_PROFILE_ENDPOINTS"]:
+        tracemalloc.reset_peak()
+        g._memory_base = tracemalloc.get_traced_memory()[0]
+
+
+def _finish_request(response):
+    base = g.get("_memory_base")
+    if base is not None:
+        endpoint = request.endpoint
+        if response.direct_passthrough:
+            # send_file bodies are built already, and werkzeug hands them to
+            # the server as is: close callbacks would never run.
+            _record_peak(endpoint, base)
+        else:
+            response.call_on_close(lambda: _record_peak(endpoint, base))
+    path = current_app.config.get("MEMORY_PROFILE_RECORD")
+    if path and current_app.config["MEMORY_PROFILE"] and request.endpoint not in ("static", "memory_profile"):
+        _append_recording(path)
+    return response
+
+
+def _append_recording(path: str) -> None:
+    entry = {
+        "method": request.method,
+        "path": redacted_full_path(),
+        "endpoint": request.endpoint,
+    }
+    if request.method == "POST":
+        entry["form"] = {
+            key: request.form.getlist(key) for key in request.form if not is_secret_field(key)
+        }
+        if request.files:
+            entry["files"] = {key: f.filename for key, f in request.files.items()}
+    line = json.dumps(entry, ensure_ascii=False)
+    try:
+        with _LOCK, open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError:
+        logger.warning("cannot append to %s", path)
+
+
+def load_recording(path: str) -> list[dict]:
+    """Requests recorded in `path` (one JSON object per line)."""
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    return entries
+
+
+@login_required
+@admin_required
+def memory_profile():
+    if not current_app.config["MEMORY_PROFILE"]:
+        abort(404)
+    start_tracing()
+    group = request.args.get("group", "lineno")
+    try:
+        limit = int(request.args.get("limit", 25))
+    except ValueError:
+        limit = 25
+    snapshot = take_snapshot()
+    with _LOCK:
+        baseline = _BASELINE["snapshot"]
+        if baseline is None or request.args.get("reset") == "1":
+            _BASELINE["snapshot"], _BASELINE["taken_at"] = snapshot, int(time.time())
+        taken_at = _BASELINE["taken_at"]
+    current, peak = tracemalloc.get_traced_memory()
+    return jsonify(
+        {
+            "traced_kib": round(current / 1024, 1),
+            "peak_kib": round(peak / 1024, 1),
+            "baseline_taken_at": taken_at,
+            "group": group if group in GROUPINGS else "lineno",
+            "sites": top_sites(snapshot, baseline, group, limit),
+            "endpoints": endpoint_peaks(),
+        }
+    )
+
+
+def init_memory_profile(app) -> None:
+    app.config.setdefault("MEMORY_PROFILE", MEMORY_PROFILE_ENABLED)
+    app.config.setdefault("MEMORY_PROFILE_ENDPOINTS", set(MEMORY_PROFILE_ENDPOINTS))
+    app.config.setdefault("MEMORY_PROFILE_RECORD", MEMORY_PROFILE_RECORD)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.add_url_rule("/admin/memory", "memory_profile", memory_profile)
+    if app.config["MEMORY_PROFILE"]:
+        start_tracing()
@@ -0,0 +1,299 @@
+"""Operational metrics served at /metrics in the Prometheus text format.
+
+No client library: counters and histograms live in this module and are
+rendered by hand (exposition format 0.0.4), so a local Prometheus can
+scrape the app on the plain Flask stack. Exposed:
+  - request latency histograms per blueprint, count/sum per endpoint (the
+    export and import routes included) and responses per status class;
+  - "database is locked/busy" errors (SQLite already waits up to the
+    connection timeout before raising them): unhandled ones at teardown,
+    and those the write routes catch, through ``count_db_error``;
+  - open request connections, WAL file size, the in-memory caches
+    registered with ``register_cache`` (hits, misses, size);
+  - background jobs wrapped in ``track_job`` (OCR scans): in progress,
+    durations and failures;
+  - the audit buffer, scheduled backups and, when SQL_TRACE is on, the SQL
+    totals per endpoint.
+
+Every series is per process: with several workers, each one answers
+/metrics with its own counters, so a scrape only sees the worker that
+served it. Sum over instances, or run a single worker when exact totals
+matter.
+
+Access: admins, or a loopback client that did not come through a proxy.
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, abort, current_app, g, request, session
+
+from .config import DATABASE, METRICS_ALLOW_LOCALHOST, METRICS_ENABLED
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_LOOPBACK = {"127.0.0.1", "::1"}
+
+_LOCK = threading.Lock()
+_CACHES: dict[str, object] = {}
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by one label value."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.series: dict[str, list] = {}
+
+    def observe(self, label: str, value: float) -> None:
+        entry = self.series.get(label)
+        if entry is None:
+            entry = self.series[label] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[0][i] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def snapshot(self) -> dict[str, tuple]:
+        return {label: (list(counts), total, n) for label, (counts, total, n) in self.series.items()}
+
+
+_REQUESTS = Histogram()
+_ENDPOINTS: dict[str, list] = {}  # endpoint -> [count, seconds]
+_STATUS: dict[str, int] = {}
+_DB_LOCKED = [0]
+_JOBS = Histogram()
+_JOBS_RUNNING: dict[str, int] = {}
+_JOBS_FAILED: dict[str, int] = {}
+
+
+def register_cache(name: str, stats) -> None:
+    """Expose a cache: `stats()` returns a dict with hits, misses and size."""
+    with _LOCK:
+        _CACHES[name] = stats
+
+
+@contextmanager
+def track_job(name: str):
+    """Count a job as in progress while the block runs, then time it."""
+    with _LOCK:
+        _JOBS_RUNNING[name] = _JOBS_RUNNING.get(name, 0) + 1
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        with _LOCK:
+            _JOBS_FAILED[name] = _JOBS_FAILED.get(name, 0) + 1
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        with _LOCK:
+            _JOBS_RUNNING[name] -= 1
+            _JOBS.observe(name, elapsed)
+
+
+def _start_timer():
+    g._metrics_started = time.perf_counter()
+
+
+def _observe(response):
+    started = g.get("_metrics_started")
+    if started is not None:
+        # Time to the response object; streamed bodies are not included.
+        elapsed = time.perf_counter() - started
+        endpoint = request.endpoint or "<unmatched>"
+        with _LOCK:
+            _REQUESTS.observe(request.blueprint or "app", elapsed)
+            entry = _ENDPOINTS.get(endpoint)
+            if entry is None:
+                entry = _ENDPOINTS[endpoint] = [0, 0.0]
+            entry[0] += 1
+            entry[1] += elapsed
+            status = f"{response.status_code // 100}xx"
+            _STATUS[status] = _STATUS.get(status, 0) + 1
+    return response
+
+
+def count_db_error(exc) -> None:
+    """Count ``exc`` if it is a "database is locked/busy" error.
+
+    For the except blocks that turn a failed write into a flash or a JSON
+    error: those never reach the teardown hook.
+    """
+    if isinstance(exc, sqlite3.OperationalError):
+        message = str(exc).lower()
+        if "locked" in message or "busy" in message:
+            with _LOCK:
+                _DB_LOCKED[0] += 1
+
+
+def _count_locked(exc=None):
+    count_db_error(exc)
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+class _Writer:
+    def __init__(self):
+        self.lines: list[str] = []
+
+    def family(self, name: str, kind: str, help_text: str) -> None:
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, value, **labels) -> None:
+        if value is None:
+            return
+        if labels:
+            pairs = ",".join(f'{k}="{_label(v)}"' for k, v in labels.items())
+            self.lines.append(f"{name}{{{pairs}}} {_number(value)}")
+        else:
+            self.lines.append(f"{name} {_number(value)}")
+
+    def histogram(self, name: str, help_text: str, label: str, snapshot: dict, buckets) -> None:
+        self.family(name, "histogram", help_text)
+        for value, (counts, total, n) in sorted(snapshot.items()):
+            for bound, count in zip(buckets, counts):
+                self.sample(f"{name}_bucket", count, **{label: value, "le": repr(bound)})
+            self.sample(f"{name}_bucket", n, **{label: value, "le": "+Inf"})
+            self.sample(f"{name}_sum", total, **{label: value})
+            self.sample(f"{name}_count", n, **{label: value})
+
+    def text(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def render_metrics() -> str:
+    from .audit import audit_stats
+    from .backup_scheduler import backup_stats
+    from .db import connection_stats
+    from .sql_trace import sql_endpoint_stats
+
+    with _LOCK:
+        requests = _REQUESTS.snapshot()
+        endpoints = {k: tuple(v) for k, v in _ENDPOINTS.items()}
+        statuses = dict(_STATUS)
+        locked = _DB_LOCKED[0]
+        jobs = _JOBS.snapshot()
+        running = dict(_JOBS_RUNNING)
+        failed = dict(_JOBS_FAILED)
+        caches = dict(_CACHES)
+
+    out = _Writer()
+    out.histogram(
+        "edumaster_request_duration_seconds", "Request latency by blueprint.", "blueprint", requests, _REQUESTS.buckets
+    )
+    out.family("edumaster_endpoint_requests_total", "counter", "Requests by endpoint.")
+    for endpoint, (count, _) in sorted(endpoints.items()):
+        out.sample("edumaster_endpoint_requests_total", count, endpoint=endpoint)
+    out.family("edumaster_endpoint_duration_seconds_total", "counter", "Time spent serving each endpoint.")
+    for endpoint, (_, seconds) in sorted(endpoints.items()):
+        out.sample("edumaster_endpoint_duration_seconds_total", seconds, endpoint=endpoint)
+    out.family("edumaster_responses_total", "counter", "Responses by status class.")
+    for status, count in sorted(statuses.items()):
+        out.sample("edumaster_responses_total", count, status=status)
+
+    out.family("edumaster_db_locked_errors_total", "counter", "Database is locked/busy errors in this process.")
+    out.sample("edumaster_db_locked_errors_total", locked)
+    conns = connection_stats()
+    out.family("edumaster_db_connections_active", "gauge", "Open request connections in this process.")
+    out.sample("edumaster_db_connections_active", conns["active"])
+    out.family("edumaster_db_draining", "gauge", "1 while a restore holds new connections back.")
+    out.sample("edumaster_db_draining", conns["draining"])
+    out.family("edumaster_db_file_bytes", "gauge", "Size of the database files.")
+    out.sample("edumaster_db_file_bytes", _file_size(DATABASE), file="main")
+    out.sample("edumaster_db_file_bytes", _file_size(DATABASE + "-wal"), file="wal")
+
+    cache_stats = {}
+    for name, stats in sorted(caches.items()):
+        try:
+            cache_stats[name] = stats()
+        except Exception:
+            continue
+    for name, kind, key, help_text in (
+        ("edumaster_cache_hits_total", "counter", "hits", "Cache hits."),
+        ("edumaster_cache_misses_total", "counter", "misses", "Cache misses."),
+        ("edumaster_cache_entries", "gauge", "size", "Entries held in the cache."),
+    ):
+        out.family(name, kind, help_text)
+        for cache, stats in cache_stats.items():
+            out.sample(name, stats.get(key), cache=cache)
+
+    out.histogram("edumaster_job_duration_seconds", "Background job durations.", "job", jobs, _JOBS.buckets)
+    out.family("edumaster_jobs_in_progress", "gauge", "Jobs currently running.")
+    for name, count in sorted(running.items()):
+        out.sample("edumaster_jobs_in_progress", count, job=name)
+    out.family("edumaster_job_failures_total", "counter", "Jobs that raised.")
+    for name, count in sorted(failed.items()):
+        out.sample("edumaster_job_failures_total", count, job=name)
+
+    audit = audit_stats()
+    out.family("edumaster_audit_events_total", "counter", "Audit events by outcome.")
+    for outcome in ("queued", "joined", "flushed", "requeued", "dropped"):
+        out.sample("edumaster_audit_events_total", audit.get(outcome, 0), outcome=outcome)
+    out.family("edumaster_audit_buffered", "gauge", "Audit events waiting to be written.")
+    out.sample("edumaster_audit_buffered", audit.get("buffered", 0))
+
+    backups = backup_stats()
+    out.family("edumaster_backup_archives", "gauge", "Backup archives on disk.")
+    out.sample("edumaster_backup_archives", backups["archives"])
+    out.family("edumaster_backup_archives_bytes", "gauge", "Total size of the backup archives.")
+    out.sample("edumaster_backup_archives_bytes", backups["archives_bytes"])
+    out.family("edumaster_backup_failures", "gauge", "Failed runs in the recorded backup history.")
+    out.sample("edumaster_backup_failures", backups["failures"])
+    out.family("edumaster_backup_last_duration_seconds", "gauge", "Duration of the last completed backup.")
+    out.sample("edumaster_backup_last_duration_seconds", backups["last_duration_seconds"])
+
+    sql = sql_endpoint_stats()
+    if sql:
+        out.family("edumaster_sql_statements_total", "counter", "SQL statements by endpoint (SQL_TRACE).")
+        for endpoint, stats in sorted(sql.items()):
+            out.sample("edumaster_sql_statements_total", stats["statements"], endpoint=endpoint)
+        out.family("edumaster_sql_duration_seconds_total", "counter", "SQL time by endpoint (SQL_TRACE).")
+        for endpoint, stats in sorted(sql.items()):
+            out.sample("edumaster_sql_duration_seconds_total", stats["sql_ms"] / 1000, endpoint=endpoint)
+    return out.text()
+
+
+def _allowed() -> bool:
+    if session.get("is_admin"):
+        return True
+    return (
+        current_app.config.get("METRICS_ALLOW_LOCALHOST", METRICS_ALLOW_LOCALHOST)
+        and request.remote_addr in _LOOPBACK
+        and "X-Forwarded-For" not in request.headers
+    )
+
+
+def metrics():
+    if not _allowed():
+        abort(403)
+    return Response(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def init_metrics(app) -> None:
+    if not METRICS_ENABLED:
+        return
+    app.before_request(_start_timer)
+    app.after_request(_observe)
+    app.teardown_request(_count_locked)
+    app.add_url_rule("/metrics", "metrics", metrics)
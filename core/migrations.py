@@ -64,10 +64,301 @@ def _migrate_to_v2(db):
     db.execute("CREATE INDEX IF NOT EXISTS idx_homework_user_year ON homework(user_id, school_year)")
 
 
+def _migrate_to_v3(db):
+    """Add per-user data version counters (HTTP ETag caching)."""
+    db.execute("""CREATE TABLE IF NOT EXISTS data_versions (
+        scope_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )""")
+
+
+def _migrate_to_v4(db):
+    """Add notification dedup keys and the index used by retention pruning."""
+    try:
+        db.execute("ALTER TABLE notifications ADD COLUMN dedup_key TEXT")
+    except sqlite3.OperationalError:
+        pass
+    db.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_notifications_user_dedup "
+        "ON notifications(user_id, dedup_key) WHERE dedup_key IS NOT NULL"
+    )
+    db.execute("CREATE INDEX IF NOT EXISTS idx_notifications_read_time ON notifications(is_read, created_at)")
+
+
+def _migrate_to_v5(db):
+    """Add the registry of per-school-year change_log archive tables."""
+    db.execute("""CREATE TABLE IF NOT EXISTS change_log_archives (
+        school_year TEXT PRIMARY KEY,
+        table_name TEXT NOT NULL,
+        row_count INTEGER DEFAULT 0,
+        min_ts INTEGER,
+        max_ts INTEGER,
+        archived_at INTEGER NOT NULL
+    )""")
+
+
+def _migrate_to_v6(db):
+    """Add the server-side session store."""
+    db.execute("""CREATE TABLE IF NOT EXISTS sessions (
+        sid TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        expires_at INTEGER NOT NULL,
+        version INTEGER NOT NULL DEFAULT 1
+    )""")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)")
+
+
+def _migrate_to_v7(db):
+    """Content-addressed documents: hash, original name, reference lookups."""
+    for column in ("content_hash", "original_name"):
+        try:
+            db.execute(f"ALTER TABLE documents ADD COLUMN {column} TEXT")
+        except sqlite3.OperationalError:
+            pass
+    db.execute("CREATE INDEX IF NOT EXISTS idx_documents_filename ON documents(filename)")
+
+
+def _migrate_to_v8(db):
+    """Distinct class names with student counts, kept current by triggers."""
+    db.execute("""CREATE TABLE IF NOT EXISTS class_names (
+        niveau TEXT PRIMARY KEY,
+        student_count INTEGER NOT NULL DEFAULT 0
+    )""")
+    db.execute("DELETE FROM class_names")
+    db.execute(
+        "INSERT INTO class_names (niveau, student_count) "
+        "SELECT niveau, COUNT(*) FROM eleves WHERE niveau IS NOT NULL GROUP BY niveau"
+    )
+    db.execute("""CREATE TRIGGER IF NOT EXISTS trg_class_names_insert AFTER INSERT ON eleves
+        WHEN NEW.niveau IS NOT NULL
+        BEGIN
+            INSERT INTO class_names (niveau, student_count) VALUES (NEW.niveau, 1)
+            ON CONFLICT(niveau) DO UPDATE SET student_count = student_count + 1;
+        END""")
+    db.execute("""CREATE TRIGGER IF NOT EXISTS trg_class_names_delete AFTER DELETE ON eleves
+        WHEN OLD.niveau IS NOT NULL
+        BEGIN
+            UPDATE class_names SET student_count = student_count - 1 WHERE niveau = OLD.niveau;
+            DELETE FROM class_names WHERE niveau = OLD.niveau AND student_count <= 0;
+        END""")
+    db.execute("""CREATE TRIGGER IF NOT EXISTS trg_class_names_update AFTER UPDATE OF niveau ON eleves
+        WHEN OLD.niveau IS NOT NEW.niveau
+        BEGIN
+            UPDATE class_names SET student_count = student_count - 1 WHERE niveau = OLD.niveau;
+            DELETE FROM class_names WHERE niveau = OLD.niveau AND student_count <= 0;
+            INSERT INTO class_names (niveau, student_count) SELECT NEW.niveau, 1 WHERE NEW.niveau IS NOT NULL
+            ON CONFLICT(niveau) DO UPDATE SET student_count = student_count + 1;
+        END""")
+    # Admin assignment panel pages one school year at a time.
+    db.execute("CREATE INDEX IF NOT EXISTS idx_assignments_year ON teacher_assignments(school_year)")
+
+
+# Per-grade moyenne of a notes row; NULL (not counted) when a part is missing.
+def _rollup_moyenne(alias):
+    return f"(({alias}.devoir + {alias}.activite) / 2.0 + {alias}.compo * 2.0) / 3.0"
+
+
+_ROLLUP_REBUILD = f"""
+INSERT INTO grade_rollups
+    (school_year, trimestre, subject_id, class_name, user_id, n, total, total_sq, min_moy, max_moy, passed)
+SELECT IFNULL(e.school_year, ''), n.trimestre, n.subject_id, e.niveau, n.user_id,
+       COUNT(*), SUM(m), SUM(m * m), MIN(m), MAX(m), SUM(m >= 10)
+FROM (SELECT *, {_rollup_moyenne("notes")} AS m FROM notes) n
+JOIN eleves e ON e.id = n.eleve_id
+WHERE n.m > 0 AND {{where}}
+GROUP BY IFNULL(e.school_year, ''), n.trimestre, n.subject_id, e.niveau, n.user_id
+"""
+
+
+def _rollup_add(row):
+    m = _rollup_moyenne(row)
+    return f"""
+            INSERT INTO grade_rollups
+                (school_year, trimestre, subject_id, class_name, user_id, n, total, total_sq, min_moy, max_moy, passed)
+            SELECT IFNULL(e.school_year, ''), {row}.trimestre, {row}.subject_id, e.niveau, {row}.user_id,
+                   1, {m}, {m} * {m}, {m}, {m}, {m} >= 10
+            FROM eleves e WHERE e.id = {row}.eleve_id AND {m} > 0
+            ON CONFLICT (school_year, trimestre, subject_id, class_name, user_id) DO UPDATE SET
+                n = n + 1,
+                total = total + excluded.total,
+                total_sq = total_sq + excluded.total_sq,
+                min_moy = MIN(min_moy, excluded.min_moy),
+                max_moy = MAX(max_moy, excluded.max_moy),
+                passed = passed + excluded.passed;"""
+
+
+def _rollup_remove(row):
+    m = _rollup_moyenne(row)
+    key = (
+        f"school_year = (SELECT IFNULL(school_year, '') FROM eleves WHERE id = {row}.eleve_id)"
+        f" AND trimestre = {row}.trimestre AND subject_id = {row}.subject_id"
+        f" AND class_name = (SELECT niveau FROM eleves WHERE id = {row}.eleve_id)"
+        f" AND user_id = {row}.user_id"
+    )
+    # min/max cannot be un-applied: rescan the group (one class of one
+    # teacher) only when the removed grade was one of its bounds.
+    group = (
+        f"SELECT {_rollup_moyenne('g')} AS m FROM notes g JOIN eleves ge ON ge.id = g.eleve_id"
+        f" WHERE g.user_id = {row}.user_id AND g.subject_id = {row}.subject_id"
+        f" AND g.trimestre = {row}.trimestre AND IFNULL(ge.school_year, '') = grade_rollups.school_year"
+        f" AND ge.niveau = grade_rollups.class_name"
+    )
+    return f"""
+            UPDATE grade_rollups SET
+                n = n - 1,
+                total = total - {m},
+                total_sq = total_sq - {m} * {m},
+                passed = passed - ({m} >= 10)
+            WHERE {key} AND {m} > 0;
+            DELETE FROM grade_rollups WHERE {key} AND n <= 0;
+            UPDATE grade_rollups SET
+                min_moy = (SELECT MIN(m) FROM ({group}) WHERE m > 0),
+                max_moy = (SELECT MAX(m) FROM ({group}) WHERE m > 0)
+            WHERE {key} AND {m} > 0 AND ({m} <= min_moy OR {m} >= max_moy);"""
+
+
+def _rollup_refresh(row):
+    year = f"IFNULL({row}.school_year, '')"
+    where = f"IFNULL(e.school_year, '') = {year} AND e.niveau = {row}.niveau AND e.user_id = {row}.user_id"
+    return f"""
+            DELETE FROM grade_rollups
+            WHERE school_year = {year} AND class_name = {row}.niveau AND user_id = {row}.user_id;
+            {_ROLLUP_REBUILD.format(where=where).strip()};"""
+
+
+def _migrate_to_v9(db):
+    """Cross-teacher grade rollups per (year, trimestre, subject, class, teacher).
+
+    Triggers keep them in step with every write to notes, and with class or
+    year changes and deletions of students.
+    """
+    db.execute("""CREATE TABLE IF NOT EXISTS grade_rollups (
+        school_year TEXT NOT NULL,
+        trimestre INTEGER NOT NULL,
+        subject_id INTEGER NOT NULL,
+        class_name TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        n INTEGER NOT NULL DEFAULT 0,
+        total REAL NOT NULL DEFAULT 0,
+        total_sq REAL NOT NULL DEFAULT 0,
+        min_moy REAL,
+        max_moy REAL,
+        passed INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (school_year, trimestre, subject_id, class_name, user_id)
+    ) WITHOUT ROWID""")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_grade_rollups_user ON grade_rollups(user_id, school_year)")
+    db.execute("DELETE FROM grade_rollups")
+    db.execute(_ROLLUP_REBUILD.format(where="1"))
+    watched = "devoir, activite, compo, trimestre, subject_id, user_id, eleve_id"
+    db.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_rollup_notes_insert AFTER INSERT ON notes
+        BEGIN{_rollup_add("NEW")}
+        END""")
+    db.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_rollup_notes_delete AFTER DELETE ON notes
+        BEGIN{_rollup_remove("OLD")}
+        END""")
+    db.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_rollup_notes_update AFTER UPDATE OF {watched} ON notes
+        BEGIN{_rollup_remove("OLD")}{_rollup_add("NEW")}
+        END""")
+    db.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_rollup_eleves_update AFTER UPDATE OF niveau, school_year ON eleves
+        WHEN OLD.niveau IS NOT NEW.niveau OR OLD.school_year IS NOT NEW.school_year
+        BEGIN{_rollup_refresh("OLD")}{_rollup_refresh("NEW")}
+        END""")
+    db.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_rollup_eleves_delete AFTER DELETE ON eleves
+        BEGIN{_rollup_refresh("OLD")}
+        END""")
+
+
+_BACKFILL_BATCH = 5000
+
+
+def _legacy_filled(t):
+    return (
+        f"(IFNULL(e.devoir_t{t}, 0) <> 0 OR IFNULL(e.activite_t{t}, 0) <> 0"
+        f" OR IFNULL(e.compo_t{t}, 0) <> 0 OR IFNULL(e.remarques_t{t}, '') <> '')"
+    )
+
+
+def _migrate_to_v10(db):
+    """Backfill the legacy eleves.*_tN grade columns into notes.
+
+    Reads used to fall back to those columns, for every subject of the
+    teacher, whenever notes had no row (or a NULL) for that trimester. The
+    same values are written as notes rows for each of the teacher's
+    subjects, so reads can use notes alone. Untouched legacy columns (all
+    zero, no remark) read as 0 either way and are skipped. Students are
+    processed by id range to keep each statement short. The columns stay
+    on eleves but are no longer read or written.
+    """
+    filled_any = " OR ".join(_legacy_filled(t) for t in (1, 2, 3))
+    # A teacher with legacy grades but no subject yet gets the one
+    # get_subjects() would create on first visit.
+    db.execute(f"""
+        INSERT OR IGNORE INTO subjects (user_id, name)
+        SELECT DISTINCT e.user_id, COALESCE(NULLIF(TRIM(u.default_subject), ''), 'Sciences')
+        FROM eleves e JOIN users u ON u.id = e.user_id
+        WHERE ({filled_any})
+          AND NOT EXISTS (SELECT 1 FROM subjects s WHERE s.user_id = e.user_id)
+    """)
+    last_id = db.execute("SELECT IFNULL(MAX(id), 0) FROM eleves").fetchone()[0]
+    for start in range(0, last_id, _BACKFILL_BATCH):
+        for t in (1, 2, 3):
+            db.execute(
+                f"""
+                INSERT INTO notes (user_id, eleve_id, subject_id, trimestre, activite, devoir, compo, remarques)
+                SELECT e.user_id, e.id, s.id, {t},
+                       IFNULL(e.activite_t{t}, 0), IFNULL(e.devoir_t{t}, 0),
+                       IFNULL(e.compo_t{t}, 0), IFNULL(e.remarques_t{t}, '')
+                FROM eleves e
+                JOIN subjects s ON s.user_id = e.user_id
+                WHERE e.id > ? AND e.id <= ? AND {_legacy_filled(t)}
+                ON CONFLICT(user_id, eleve_id, subject_id, trimestre) DO UPDATE SET
+                    activite = IFNULL(notes.activite, excluded.activite),
+                    devoir = IFNULL(notes.devoir, excluded.devoir),
+                    compo = IFNULL(notes.compo, excluded.compo),
+                    remarques = IFNULL(notes.remarques, excluded.remarques)
+                WHERE notes.activite IS NULL OR notes.devoir IS NULL
+                   OR notes.compo IS NULL OR notes.remarques IS NULL
+                """,
+                (start, start + _BACKFILL_BATCH),
+            )
+    # With eleves out of the grade expressions, the per-student notes
+    # lookup of the dashboard summaries can be answered from the index.
+    db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_notes_grades "
+        "ON notes(user_id, eleve_id, subject_id, trimestre, devoir, activite, compo)"
+    )
+
+
+def _migrate_to_v11(db):
+    """Per-row version on notes, for the cell-level grade saves.
+
+    Writers that bump row_version themselves skip the trigger; every other
+    update of a notes row gets it incremented by the trigger.
+    """
+    try:
+        db.execute("ALTER TABLE notes ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0")
+    except sqlite3.OperationalError:
+        pass
+    db.execute("""CREATE TRIGGER IF NOT EXISTS trg_notes_row_version AFTER UPDATE ON notes
+        WHEN NEW.row_version = OLD.row_version
+        BEGIN
+            UPDATE notes SET row_version = OLD.row_version + 1 WHERE id = NEW.id;
+        END""")
+
+
 # Ordered list of migrations
 _MIGRATIONS = [
     (1, _migrate_to_v1),
     (2, _migrate_to_v2),
+    (3, _migrate_to_v3),
+    (4, _migrate_to_v4),
+    (5, _migrate_to_v5),
+    (6, _migrate_to_v6),
+    (7, _migrate_to_v7),
+    (8, _migrate_to_v8),
+    (9, _migrate_to_v9),
+    (10, _migrate_to_v10),
+    (11, _migrate_to_v11),
 ]
 
 
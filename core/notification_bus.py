@@ -0,0 +1,86 @@
+"""In-process pub/sub for notification events and cached unread counters.
+
+Subscribers (one per open SSE stream) receive events pushed by
+``create_notification`` and the mark-as-read routes. Unread counters are
+stamped with the user's data version (see core.data_version): a counter is
+only trusted while the version in the database still matches, so writes
+made by another worker process simply force a recount.
+"""
+import queue
+import threading
+
+_LOCK = threading.Lock()
+_SUBSCRIBERS: dict[int, set[queue.Queue]] = {}
+_UNREAD: dict[int, tuple[int, int]] = {}
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def subscribe(user_id: int) -> queue.Queue:
+    q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    with _LOCK:
+        _SUBSCRIBERS.setdefault(int(user_id), set()).add(q)
+    return q
+
+
+def unsubscribe(user_id: int, q: queue.Queue) -> None:
+    with _LOCK:
+        subs = _SUBSCRIBERS.get(int(user_id))
+        if subs is None:
+            return
+        subs.discard(q)
+        if not subs:
+            _SUBSCRIBERS.pop(int(user_id), None)
+
+
+def subscriber_count() -> int:
+    with _LOCK:
+        return sum(len(s) for s in _SUBSCRIBERS.values())
+
+
+def subscribed_users() -> set[int]:
+    with _LOCK:
+        return {uid for uid, subs in _SUBSCRIBERS.items() if subs}
+
+
+def publish(user_id: int, event: str, data: dict) -> None:
+    """Push ``(event, data)`` to every open stream of ``user_id``.
+
+    Slow consumers whose queue is full miss the event; they resynchronise
+    on their next count check.
+    """
+    with _LOCK:
+        subs = list(_SUBSCRIBERS.get(int(user_id), ()))
+    for q in subs:
+        try:
+            q.put_nowait((event, data))
+        except queue.Full:
+            pass
+
+
+def get_cached_unread(user_id: int, version: int) -> int | None:
+    with _LOCK:
+        entry = _UNREAD.get(int(user_id))
+    if entry is None or entry[1] != version:
+        return None
+    return entry[0]
+
+
+def set_cached_unread(user_id: int, count: int, version: int) -> None:
+    with _LOCK:
+        _UNREAD[int(user_id)] = (max(0, int(count)), version)
+
+
+def adjust_cached_unread(user_id: int, delta: int, old_version: int, new_version: int) -> int | None:
+    """Apply ``delta`` if the counter was current at ``old_version``.
+
+    Returns the new count, or None when the counter had to be dropped.
+    """
+    with _LOCK:
+        entry = _UNREAD.get(int(user_id))
+        if entry is None or entry[1] != old_version:
+            _UNREAD.pop(int(user_id), None)
+            return None
+        count = max(0, entry[0] + int(delta))
+        _UNREAD[int(user_id)] = (count, new_version)
+        return count
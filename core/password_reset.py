@@ -1,10 +1,9 @@
 import time
 import uuid
 
-from werkzeug.security import generate_password_hash
-
 from .config import RESET_TOKEN_TTL_SECONDS
 from .db import get_db
+from .passwords import hash_password
 
 
 def create_reset_token(user_id: int) -> str:
@@ -46,7 +45,7 @@ def set_user_password(user_id: int, new_password: str) -> None:
     db = get_db()
     db.execute(
         "UPDATE users SET password = ? WHERE id = ?",
-        (generate_password_hash(new_password), user_id),
+        (hash_password(new_password), user_id),
     )
     db.commit()
 
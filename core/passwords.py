@@ -0,0 +1,37 @@
+"""Password hashing policy.
+
+All password hashes go through this module so the method and cost are set
+in one place (PASSWORD_HASH_METHOD). ``needs_rehash`` tells whether a stored
+hash was made with other parameters; login then re-hashes it with the
+current policy while the clear-text password is at hand.
+"""
+from functools import lru_cache
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from .config import PASSWORD_HASH_METHOD
+
+
+@lru_cache(maxsize=8)
+def _method_prefix(method: str) -> str:
+    # werkzeug expands defaults ("scrypt" -> "scrypt:32768:8:1"), so derive
+    # the canonical prefix from a real hash rather than parsing the setting.
+    return generate_password_hash("x", method=method).split("$", 1)[0]
+
+
+def hash_password(password: str, method: str | None = None) -> str:
+    return generate_password_hash(password, method=method or PASSWORD_HASH_METHOD)
+
+
+def verify_password(stored_hash: str, password: str) -> bool:
+    if not stored_hash:
+        return False
+    try:
+        return check_password_hash(stored_hash, password)
+    except (ValueError, TypeError):
+        return False
+
+
+def needs_rehash(stored_hash: str, method: str | None = None) -> bool:
+    prefix = (stored_hash or "").split("$", 1)[0]
+    return prefix != _method_prefix(method or PASSWORD_HASH_METHOD)
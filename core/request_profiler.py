@@ -0,0 +1,228 @@
+"""Sampled request profiling (opt-in with PROFILE_ENABLED=1).
+
+One request in PROFILE_SAMPLE_EVERY, and every admin request carrying the
+PROFILE_HEADER header, runs under cProfile while a sampler thread records
+the request thread's stack every PROFILE_STACK_INTERVAL_MS. Each profile
+is written to PROFILE_DIR as three files sharing an id:
+  - ``<id>.json``: method, path, endpoint, status, duration, SQL totals;
+  - ``<id>.prof``: the cProfile stats (pstats, snakeviz, ...);
+  - ``<id>.folded``: collapsed stacks ("a;b;c count" lines), the input of
+    flamegraph.pl, speedscope or inferno.
+Only the newest PROFILE_KEEP profiles are kept. /admin/profiles lists them
+slowest first with download links and a pstats text summary.
+
+Profiling stops when the response object is built: a streamed body is not
+included. Disabled, no hook or route is installed at all.
+"""
+import cProfile
+import io
+import itertools
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+
+from flask import abort, g, render_template, request, send_file, session
+
+from .config import (
+    PROFILE_DIR,
+    PROFILE_ENABLED,
+    PROFILE_HEADER,
+    PROFILE_KEEP,
+    PROFILE_SAMPLE_EVERY,
+    PROFILE_STACK_INTERVAL_MS,
+)
+from .security import admin_required, login_required, redacted_full_path
+
+DOWNLOADS = {
+    "prof": ("application/octet-stream", True),
+    "folded": ("text/plain; charset=utf-8", True),
+    "txt": ("text/plain; charset=utf-8", False),
+}
+_ID = re.compile(r"^\d+-\d+$")
+_COUNTER = itertools.count(1)
+_PRUNE_LOCK = threading.Lock()
+
+
+class StackSampler(threading.Thread):
+    """Collapsed stacks of one thread, sampled every `interval` seconds."""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stop = threading.Event()
+        self.stacks: dict[str, int] = {}
+        self.samples = 0
+
+    def run(self):
+        own = threading.get_ident()
+        while not self.stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None or self.thread_id == own:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            key = ";".join(reversed(names))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+
+def _reason():
+    if PROFILE_HEADER and request.headers.get(PROFILE_HEADER) and session.get("is_admin"):
+        return "header"
+    if PROFILE_SAMPLE_EVERY > 0 and next(_COUNTER) % PROFILE_SAMPLE_EVERY == 0:
+        return "sample"
+    return None
+
+
+def _start():
+    if request.endpoint == "static":
+        return
+    reason = _reason()
+    if reason is None:
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is active on this interpreter.
+        return
+    sampler = StackSampler(threading.get_ident(), PROFILE_STACK_INTERVAL_MS / 1000)
+    sampler.start()
+    g._profile = (profiler, sampler, reason, time.perf_counter())
+
+
+def _finish(response):
+    state = g.pop("_profile", None)
+    if state is None:
+        return response
+    profiler, sampler, reason, started = state
+    profiler.disable()
+    sampler.stop.set()
+    sampler.join()
+    duration_ms = (time.perf_counter() - started) * 1000
+    meta = {
+        "id": f"{time.time_ns()}-{os.getpid()}",
+        "created_at": int(time.time()),
+        "method": request.method,
+        "path": redacted_full_path(),
+        "endpoint": request.endpoint,
+        "status": response.status_code,
+        "duration_ms": round(duration_ms, 1),
+        "reason": reason,
+        "stack_samples": sampler.samples,
+    }
+    trace = getattr(g.get("_database"), "trace", None)
+    if trace is not None:
+        meta["sql_statements"] = trace.statements
+        meta["sql_ms"] = round(trace.seconds * 1000, 1)
+    try:
+        _save(meta, profiler, sampler.folded())
+    except OSError:
+        pass
+    return response
+
+
+def _path(profile_id: str, kind: str) -> str:
+    return os.path.join(PROFILE_DIR, f"{profile_id}.{kind}")
+
+
+def _save(meta: dict, profiler, folded: str) -> None:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile_id = meta["id"]
+    profiler.dump_stats(_path(profile_id, "prof"))
+    with open(_path(profile_id, "folded"), "w", encoding="utf-8") as f:
+        f.write(folded)
+    # Written last: a profile is listed only once its files are complete.
+    with open(_path(profile_id, "json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    _prune(PROFILE_KEEP)
+
+
+def _ids() -> list[str]:
+    try:
+        names = os.listdir(PROFILE_DIR)
+    except OSError:
+        return []
+    ids = [name[:-5] for name in names if name.endswith(".json") and _ID.match(name[:-5])]
+    return sorted(ids, key=lambda i: int(i.split("-")[0]))
+
+
+def _prune(keep: int) -> None:
+    with _PRUNE_LOCK:
+        ids = _ids()
+        for profile_id in ids[: max(0, len(ids) - max(1, keep))]:
+            for kind in ("json", "prof", "folded"):
+                try:
+                    os.remove(_path(profile_id, kind))
+                except OSError:
+                    pass
+
+
+def list_profiles() -> list[dict]:
+    """Saved profiles, slowest first."""
+    profiles = []
+    for profile_id in _ids():
+        try:
+            with open(_path(profile_id, "json"), "r", encoding="utf-8") as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    profiles.sort(key=lambda p: -p.get("duration_ms", 0))
+    return profiles
+
+
+def profile_summary(profile_id: str, limit: int = 40) -> str:
+    out = io.StringIO()
+    stats = pstats.Stats(_path(profile_id, "prof"), stream=out)
+    stats.strip_dirs().sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
+
+
+@login_required
+@admin_required
+def profiles_page():
+    profiles = list_profiles()
+    for item in profiles:
+        item["time"] = datetime.fromtimestamp(item["created_at"]).strftime("%Y-%m-%d %H:%M:%S")
+    return render_template(
+        "admin_profiles.html",
+        profiles=profiles,
+        sample_every=PROFILE_SAMPLE_EVERY,
+        header=PROFILE_HEADER,
+        keep=PROFILE_KEEP,
+    )
+
+
+@login_required
+@admin_required
+def profile_download(profile_id, kind):
+    if not _ID.match(profile_id) or kind not in DOWNLOADS or not os.path.exists(_path(profile_id, "json")):
+        abort(404)
+    mimetype, attachment = DOWNLOADS[kind]
+    if kind == "txt":
+        body = io.BytesIO(profile_summary(profile_id).encode("utf-8"))
+        return send_file(body, mimetype=mimetype, download_name=f"{profile_id}.txt")
+    return send_file(
+        _path(profile_id, kind), mimetype=mimetype, as_attachment=attachment, download_name=f"{profile_id}.{kind}"
+    )
+
+
+def init_request_profiler(app) -> None:
+    if not PROFILE_ENABLED:
+        return
+    app.before_request(_start)
+    app.after_request(_finish)
+    app.add_url_rule("/admin/profiles", "request_profiles", profiles_page)
+    app.add_url_rule("/admin/profiles/<profile_id>.<kind>", "request_profile_download", profile_download)
@@ -2,10 +2,12 @@ import base64
 import hashlib
 import json
 import os
+import re
 import secrets
 import uuid
 from datetime import datetime
 from functools import wraps
+from urllib.parse import urlencode
 
 from flask import session, request, redirect, abort, flash, url_for
 from markupsafe import Markup
@@ -166,6 +168,28 @@ def csrf_field():
     return Markup(f'<input type="hidden" name="csrf_token" value="{_get_csrf_token()}">')
 
 
+_SECRET_NAME = re.compile(r"pass|token|secret", re.IGNORECASE)
+
+
+def is_secret_field(name: str) -> bool:
+    """Form, query or URL parameter whose value must never be written out."""
+    return bool(_SECRET_NAME.search(name))
+
+
+def redacted_full_path() -> str:
+    """
+    request.full_path for logs and profiles: a route with a secret URL
+    parameter (/reset/<token>) is given as its rule, secret query values
+    are masked.
+    """
+    if request.url_rule is not None and any(is_secret_field(k) for k in (request.view_args or {})):
+        path = request.url_rule.rule
+    else:
+        path = request.path
+    args = [(k, "***" if is_secret_field(k) else v) for k, v in request.args.items(multi=True)]
+    return f"{path}?{urlencode(args)}" if args else path
+
+
 def csrf_protect():
     if request.method in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
         return
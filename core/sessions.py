@@ -0,0 +1,331 @@
+"""Server-side sessions: the cookie only carries a signed, opaque session id.
+
+Backends:
+  - ``SqliteSessionStore``: rows in the ``sessions`` table, shared by all
+    workers. Decoded payloads are cached per worker and revalidated with a
+    version number, so a cache hit costs one tiny primary-key lookup and no
+    payload transfer or decoding.
+  - ``MemorySessionStore``: a dict in the process (dev / single worker).
+
+Select with SESSION_BACKEND ("sqlite", "memory" or "cookie" for Flask's
+default signed-cookie sessions).
+
+Anonymous sessions (CSRF token, flashes before login) are never stored:
+they travel in a signed, timestamped cookie of their own ("p." prefix) and
+move to the store only once the session has a user_id, so /login traffic
+and bots cost no write.
+"""
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer, URLSafeTimedSerializer
+from werkzeug.datastructures import CallbackDict
+
+from .background import ensure_periodic
+from .config import DATABASE, SESSION_CACHE_SIZE, SESSION_IDLE_SECONDS
+from .metrics import register_cache
+
+logger = logging.getLogger("edumaster.sessions")
+
+_serializer = TaggedJSONSerializer()
+_PREAUTH_PREFIX = "p."
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.initial_user_id = (initial or {}).get("user_id")
+        self.preauth = False
+
+
+class MemorySessionStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}
+
+    def load(self, sid):
+        with self._lock:
+            entry = self._data.get(sid)
+            if entry is None:
+                return None
+            data, expires_at = entry
+            if expires_at < time.time():
+                self._data.pop(sid, None)
+                return None
+            data = dict(data)
+            data["__expires_at"] = expires_at
+            return data
+
+    def save(self, sid, data, expires_at):
+        with self._lock:
+            self._data[sid] = (dict(data), int(expires_at))
+        return True
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            for sid in [s for s, (_, exp) in self._data.items() if exp < now]:
+                del self._data[sid]
+
+
+class SqliteSessionStore:
+    def __init__(self, database=DATABASE, cache_size=SESSION_CACHE_SIZE):
+        self.database = database
+        self.cache_size = cache_size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._counts = {"hits": 0, "misses": 0}
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        try:
+            inode = os.stat(self.database).st_ino
+        except OSError:
+            inode = None
+        if conn is not None and self._local.inode != inode:
+            # The database file was swapped by a restore: reconnect, and
+            # forget cached payloads that belonged to the old file.
+            conn.close()
+            conn = None
+            with self._lock:
+                self._cache.clear()
+        if conn is None:
+            conn = sqlite3.connect(self.database, timeout=10, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            self._local.inode = inode
+        return conn
+
+    def _cache_get(self, sid):
+        with self._lock:
+            entry = self._cache.get(sid)
+            if entry is not None:
+                self._cache.move_to_end(sid)
+            return entry
+
+    def _cache_put(self, sid, version, data):
+        with self._lock:
+            self._cache[sid] = (version, dict(data))
+            self._cache.move_to_end(sid)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _cache_drop(self, sid):
+        with self._lock:
+            self._cache.pop(sid, None)
+
+    def load(self, sid):
+        cached = self._cache_get(sid)
+        cached_version = cached[0] if cached else -1
+        try:
+            row = self._conn().execute(
+                """
+                SELECT version, expires_at,
+                       CASE WHEN version = ? THEN NULL ELSE data END AS data
+                FROM sessions WHERE sid = ?
+                """,
+                (cached_version, sid),
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None or int(row["expires_at"]) < time.time():
+            self._cache_drop(sid)
+            return None
+        version = int(row["version"])
+        hit = bool(cached) and version == cached_version
+        with self._lock:
+            self._counts["hits" if hit else "misses"] += 1
+        if hit:
+            data = cached[1]
+        else:
+            try:
+                data = _serializer.loads(row["data"])
+            except Exception:
+                return None
+            self._cache_put(sid, version, data)
+        data = dict(data)
+        data["__expires_at"] = int(row["expires_at"])
+        return data
+
+    def save(self, sid, data, expires_at):
+        """Store the session; False when the database refused the write."""
+        payload = _serializer.dumps(dict(data))
+        conn = self._conn()
+        try:
+            conn.execute(
+                """
+                INSERT INTO sessions (sid, data, expires_at, version) VALUES (?, ?, ?, 1)
+                ON CONFLICT(sid) DO UPDATE SET
+                    data=excluded.data,
+                    expires_at=excluded.expires_at,
+                    version=sessions.version + 1
+                """,
+                (sid, payload, int(expires_at)),
+            )
+            row = conn.execute("SELECT version FROM sessions WHERE sid = ?", (sid,)).fetchone()
+            conn.commit()
+        except sqlite3.Error as exc:
+            # The view has committed already: a locked database must not
+            # turn its response into an error.
+            _rollback(conn)
+            self._cache_drop(sid)
+            logger.warning("session not saved: %s", exc)
+            return False
+        self._cache_put(sid, int(row["version"]), data)
+        return True
+
+    def delete(self, sid):
+        self._cache_drop(sid)
+        conn = self._conn()
+        try:
+            conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+            conn.commit()
+        except sqlite3.Error as exc:
+            # Left for purge_expired.
+            _rollback(conn)
+            logger.warning("session not deleted: %s", exc)
+
+    def cache_stats(self):
+        with self._lock:
+            return dict(self._counts, size=len(self._cache), capacity=self.cache_size)
+
+    def purge_expired(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM sessions WHERE expires_at < ?", (int(time.time()),))
+        conn.commit()
+
+
+def _rollback(conn):
+    try:
+        conn.rollback()
+    except sqlite3.Error:
+        pass
+
+
+class ServerSessionInterface(SessionInterface):
+    def __init__(self, store, idle_seconds=SESSION_IDLE_SECONDS):
+        self.store = store
+        self.idle_seconds = idle_seconds
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt="edumaster-session")
+
+    def _preauth_serializer(self, app):
+        return URLSafeTimedSerializer(app.secret_key, salt="edumaster-preauth", serializer=_serializer)
+
+    def _ttl(self, app, session):
+        if session.permanent:
+            return int(app.permanent_session_lifetime.total_seconds())
+        return self.idle_seconds
+
+    def open_session(self, app, request):
+        ensure_periodic("session-purge", 3600, self.store.purge_expired)
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie and cookie.startswith(_PREAUTH_PREFIX):
+            try:
+                data = self._preauth_serializer(app).loads(
+                    cookie[len(_PREAUTH_PREFIX):], max_age=self.idle_seconds
+                )
+            except BadSignature:
+                data = None
+            if isinstance(data, dict):
+                session = ServerSession(data, sid=secrets.token_urlsafe(32), new=True)
+                session.preauth = True
+                return session
+        elif cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode("ascii")
+            except (BadSignature, UnicodeDecodeError):
+                sid = None
+            if sid:
+                data = self.store.load(sid)
+                if data is not None:
+                    expires_at = data.pop("__expires_at", None)
+                    session = ServerSession(data, sid=sid)
+                    session.expires_at = expires_at
+                    return session
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if not session.new:
+                self.store.delete(session.sid)
+            if not session.new or session.preauth:
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if "user_id" not in session:
+            if not session.new:
+                # Stored session without its user any more (logout + flash).
+                self.store.delete(session.sid)
+            elif not session.modified:
+                return
+            value = _PREAUTH_PREFIX + self._preauth_serializer(app).dumps(dict(session))
+            self._set_cookie(app, session, response, value)
+            return
+
+        # Rotate the id whenever the authenticated user changes (login) so a
+        # session id planted before authentication is useless afterwards.
+        if not session.new and session.get("user_id") != session.initial_user_id:
+            self.store.delete(session.sid)
+            session.sid = secrets.token_urlsafe(32)
+            session.new = True
+
+        ttl = self._ttl(app, session)
+        now = int(time.time())
+        expires_at = getattr(session, "expires_at", None) or 0
+        # Sliding expiry is refreshed at most once per half TTL to avoid a
+        # write on every request.
+        if not (session.new or session.modified or expires_at - now < ttl // 2):
+            return
+
+        if not self.store.save(session.sid, session, now + ttl):
+            # A new id that was not stored would not open anything: keep
+            # the previous cookie (or none) rather than hand it out.
+            return
+        self._set_cookie(app, session, response, self._signer(app).sign(session.sid).decode("ascii"))
+
+    def _set_cookie(self, app, session, response, value):
+        response.vary.add("Cookie")
+        response.set_cookie(
+            self.get_cookie_name(app),
+            value,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=self.get_cookie_domain(app),
+            path=self.get_cookie_path(app),
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def init_sessions(app, backend: str) -> None:
+    if backend == "sqlite":
+        store = SqliteSessionStore()
+        register_cache("sessions", store.cache_stats)
+        app.session_interface = ServerSessionInterface(store)
+    elif backend == "memory":
+        app.session_interface = ServerSessionInterface(MemorySessionStore())
+    # "cookie": keep Flask's default signed-cookie sessions.
@@ -0,0 +1,281 @@
+"""Per-request SQL instrumentation (opt-in with SQL_TRACE=1).
+
+When enabled, request connections are opened with ``TracedConnection``:
+every execute / executemany / executescript is timed (fetches included) and
+recorded under a fingerprint of its SQL (literals and IN lists folded), so
+the per-row loops that issue one statement per student show up as one
+shape repeated N times. At the end of the request:
+  - a ``Server-Timing`` header carries the SQL time, statement count and
+    total app time (visible in the browser's network panel);
+  - requests spending more than SQL_SLOW_REQUEST_MS in SQL go to the
+    rotating log SQL_LOG_FILE, with the statement shapes that took more
+    than SQL_SLOW_QUERY_MS in total;
+  - with SQL_REPEAT_WARN > 0, a statement shape run more than that many
+    times in one request is logged as a warning;
+  - per-endpoint totals are kept in memory (``sql_endpoint_stats()``).
+
+``executemany`` counts as one statement: it is the batched form. Disabled,
+connections are plain ``sqlite3.Connection`` objects and nothing is added
+to the request path.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+from logging.handlers import RotatingFileHandler
+from sqlite3 import Connection, Cursor
+
+from flask import current_app, g, has_app_context, request
+
+from .config import (
+    SQL_LOG_BACKUPS,
+    SQL_LOG_FILE,
+    SQL_LOG_MAX_BYTES,
+    SQL_REPEAT_WARN,
+    SQL_SLOW_QUERY_MS,
+    SQL_SLOW_REQUEST_MS,
+    SQL_TRACE_ENABLED,
+)
+
+logger = logging.getLogger("edumaster.sql")
+
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+_LOCK = threading.Lock()
+_ENDPOINTS: dict[str, dict] = {}
+_LOG_READY = False
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql: str) -> str:
+    """Shape of a statement: whitespace collapsed, literals and IN lists as ?."""
+    shape = _SPACES.sub(" ", sql).strip()
+    shape = _STRINGS.sub("?", shape)
+    shape = _NUMBERS.sub("?", shape)
+    return _IN_LISTS.sub("(?, ...)", shape)
+
+
+class RequestTrace:
+    """Statements of one connection: shape -> [count, total seconds]."""
+
+    __slots__ = ("statements", "seconds", "shapes", "slow")
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        self.shapes: dict[str, list] = {}
+        self.slow: list[tuple[float, str]] = []
+
+    def record(self, sql: str, elapsed: float, new: bool = True) -> None:
+        shape = fingerprint(sql)
+        entry = self.shapes.get(shape)
+        if entry is None:
+            entry = self.shapes[shape] = [0, 0.0]
+        if new:
+            entry[0] += 1
+            self.statements += 1
+        entry[1] += elapsed
+        self.seconds += elapsed
+
+    def finish_slow(self, threshold_ms: float) -> None:
+        self.slow = sorted(
+            ((entry[1] * 1000, shape) for shape, entry in self.shapes.items() if entry[1] * 1000 >= threshold_ms),
+            reverse=True,
+        )
+
+    def repeated(self, limit: int) -> list[tuple[str, int]]:
+        """Shapes run more than `limit` times, most repeated first."""
+        found = [(shape, entry[0]) for shape, entry in self.shapes.items() if entry[0] > limit]
+        return sorted(found, key=lambda item: -item[1])
+
+
+class TracedCursor(Cursor):
+    """Cursor that charges execution and fetch time to its statement."""
+
+    _sql = None
+
+    def _charge(self, started: float, new: bool = False) -> None:
+        if self._sql is not None:
+            self.connection.trace.record(self._sql, time.perf_counter() - started, new)
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        self._sql = sql
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._charge(started, new=True)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        self._sql = sql
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._charge(started, new=True)
+
+    def executescript(self, sql_script):
+        started = time.perf_counter()
+        self._sql = "<script>"
+        try:
+            return super().executescript(sql_script)
+        finally:
+            self._charge(started, new=True)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._charge(started)
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self._charge(started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._charge(started)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            return super().__next__()
+        finally:
+            self._charge(started)
+
+
+class TracedConnection(Connection):
+    """sqlite3 connection whose statements are recorded in ``self.trace``."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.trace = RequestTrace()
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute & co. run the statement in C without going through
+    # the cursor's methods, so route them explicitly.
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def connection_factory():
+    """Factory for ``sqlite3.connect``: traced only when tracing is on."""
+    if has_app_context() and current_app.config.get("SQL_TRACE"):
+        return TracedConnection
+    return Connection
+
+
+def _setup_log(path: str) -> None:
+    global _LOG_READY
+    with _LOCK:
+        if _LOG_READY:
+            return
+        _LOG_READY = True
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        handler = RotatingFileHandler(path, maxBytes=SQL_LOG_MAX_BYTES, backupCount=SQL_LOG_BACKUPS, encoding="utf-8")
+    except OSError:
+        # Read-only install: the messages still reach any configured handler.
+        return
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    logger.addHandler(handler)
+    if logger.level == logging.NOTSET:
+        logger.setLevel(logging.INFO)
+
+
+def _start_timer():
+    if current_app.config["SQL_TRACE"]:
+        g._request_started = time.perf_counter()
+
+
+def _report(response):
+    db = g.get("_database")
+    trace = getattr(db, "trace", None)
+    if trace is None:
+        return response
+    config = current_app.config
+    sql_ms = trace.seconds * 1000
+    started = g.get("_request_started")
+    timings = [f'sql;dur={sql_ms:.1f};desc="{trace.statements} statements"']
+    if started is not None:
+        timings.append(f"app;dur={(time.perf_counter() - started) * 1000:.1f}")
+    response.headers.add("Server-Timing", ", ".join(timings))
+
+    # Unmatched URLs share one bucket so the table stays bounded.
+    endpoint = request.endpoint or "<unmatched>"
+    limit = config.get("SQL_REPEAT_WARN", 0)
+    repeated = trace.repeated(limit) if limit > 0 else []
+    for shape, count in repeated:
+        logger.warning("%s %s: %d executions of %s", request.method, endpoint, count, shape)
+    if sql_ms >= config.get("SQL_SLOW_REQUEST_MS", SQL_SLOW_REQUEST_MS):
+        trace.finish_slow(config.get("SQL_SLOW_QUERY_MS", SQL_SLOW_QUERY_MS))
+        logger.info(
+            "slow request %s %s: %.1f ms SQL, %d statements, %d shapes",
+            request.method, endpoint, sql_ms, trace.statements, len(trace.shapes),
+        )
+        for ms, shape in trace.slow:
+            logger.info("  %.1f ms x%d %s", ms, trace.shapes[shape][0], shape)
+
+    with _LOCK:
+        stats = _ENDPOINTS.get(endpoint)
+        if stats is None:
+            stats = _ENDPOINTS[endpoint] = {
+                "requests": 0, "statements": 0, "sql_ms": 0.0, "max_sql_ms": 0.0, "max_statements": 0, "repeat_warnings": 0,
+            }
+        stats["requests"] += 1
+        stats["statements"] += trace.statements
+        stats["sql_ms"] += sql_ms
+        stats["max_sql_ms"] = max(stats["max_sql_ms"], sql_ms)
+        stats["max_statements"] = max(stats["max_statements"], trace.statements)
+        stats["repeat_warnings"] += len(repeated)
+    return response
+
+
+def sql_endpoint_stats() -> dict[str, dict]:
+    """Per-endpoint totals since startup (requests, statements, SQL time)."""
+    with _LOCK:
+        return {
+            endpoint: dict(stats, sql_ms=round(stats["sql_ms"], 2), max_sql_ms=round(stats["max_sql_ms"], 2))
+            for endpoint, stats in _ENDPOINTS.items()
+        }
+
+
+def reset_sql_endpoint_stats() -> None:
+    with _LOCK:
+        _ENDPOINTS.clear()
+
+
+def init_sql_trace(app) -> None:
+    app.config.setdefault("SQL_TRACE", SQL_TRACE_ENABLED)
+    app.config.setdefault("SQL_SLOW_REQUEST_MS", SQL_SLOW_REQUEST_MS)
+    app.config.setdefault("SQL_SLOW_QUERY_MS", SQL_SLOW_QUERY_MS)
+    app.config.setdefault("SQL_REPEAT_WARN", SQL_REPEAT_WARN)
+    # Registered first: the timer starts before the other hooks and the
+    # report runs after every other after_request handler.
+    app.before_request(_start_timer)
+    app.after_request(_report)
+    if app.config["SQL_TRACE"]:
+        _setup_log(SQL_LOG_FILE)
@@ -0,0 +1,116 @@
+"""Static asset and upload serving: fingerprinted URLs, cache headers and
+the generated service worker.
+
+``url_for("static", filename=...)`` gets a ``v=<content hash>`` query
+argument; a request carrying the current hash is answered with a one-year
+``immutable`` Cache-Control. Content-addressed uploads (see core.blob_store)
+are immutable by construction. Everything else is revalidated with the
+ETag / Last-Modified that Flask's static handler already sends, which also
+answers HTTP Range requests (206) for large PDFs.
+
+The service worker is generated from ``static/sw.js`` and served at
+``/sw.js`` with the list of fingerprinted assets embedded, so the browser
+installs a new worker exactly when an asset changed and the worker only
+downloads the changed URLs. It is deliberately outside /static/: a web
+server mapping that folder (PythonAnywhere, see DEPLOY.md) would hand out
+the raw source, and a worker at the root controls the whole app without
+a Service-Worker-Allowed header.
+"""
+import hashlib
+import json
+import os
+
+from flask import current_app, request, url_for
+from werkzeug.security import safe_join
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_UNVERSIONED = {"sw.js"}
+_PRECACHE_DIRS = ("css", "js", "img")
+_PRECACHE_FILES = ("manifest.json",)
+_SW_SOURCE = "sw.js"
+_SW_MARKER = "/*__ASSET_MANIFEST__*/null"
+
+# path -> (mtime_ns, size, fingerprint)
+_FINGERPRINTS: dict[str, tuple[int, int, str]] = {}
+
+
+def _is_fingerprinted(filename: str) -> bool:
+    return not filename.startswith("uploads/") and filename not in _UNVERSIONED
+
+
+def fingerprint(static_folder: str, filename: str) -> str | None:
+    """Short content hash of a static file, recomputed only when it changes."""
+    path = safe_join(static_folder, filename)
+    if path is None:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    cached = _FINGERPRINTS.get(path)
+    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        return cached[2]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            h.update(chunk)
+    value = h.hexdigest()[:12]
+    _FINGERPRINTS[path] = (st.st_mtime_ns, st.st_size, value)
+    return value
+
+
+def _add_fingerprint(endpoint, values):
+    if endpoint != "static":
+        return
+    filename = values.get("filename")
+    if not filename or "v" in values or not _is_fingerprinted(filename):
+        return
+    value = fingerprint(current_app.static_folder, filename)
+    if value:
+        values["v"] = value
+
+
+def _static_cache_headers(response):
+    if request.endpoint != "static" or response.status_code not in (200, 206, 304):
+        return response
+    filename = (request.view_args or {}).get("filename", "")
+    version = request.args.get("v")
+    if filename.startswith("uploads/blobs/"):
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    elif version and version == fingerprint(current_app.static_folder, filename):
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    else:
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def asset_manifest() -> dict:
+    """Fingerprinted URLs the service worker pre-caches, plus their version."""
+    static_folder = current_app.static_folder
+    names = [name for name in _PRECACHE_FILES if os.path.isfile(os.path.join(static_folder, name))]
+    for folder in _PRECACHE_DIRS:
+        root_dir = os.path.join(static_folder, folder)
+        for root, _, files in os.walk(root_dir):
+            for name in files:
+                rel = os.path.relpath(os.path.join(root, name), static_folder)
+                names.append(rel.replace(os.sep, "/"))
+    assets = sorted(url_for("static", filename=name) for name in names)
+    version = hashlib.sha256("\n".join(assets).encode("utf-8")).hexdigest()[:12]
+    return {"version": version, "assets": assets}
+
+
+def service_worker():
+    with open(os.path.join(current_app.static_folder, _SW_SOURCE), "r", encoding="utf-8") as f:
+        source = f.read()
+    body = source.replace(_SW_MARKER, json.dumps(asset_manifest()), 1)
+    response = current_app.response_class(body, mimetype="application/javascript")
+    response.headers["Cache-Control"] = "no-cache"
+    response.set_etag(hashlib.sha1(body.encode("utf-8")).hexdigest())
+    return response.make_conditional(request)
+
+
+def init_static_assets(app) -> None:
+    app.url_defaults(_add_fingerprint)
+    app.after_request(_static_cache_headers)
+    app.add_url_rule(f"/{_SW_SOURCE}", "service_worker", service_worker)
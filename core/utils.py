@@ -44,19 +44,19 @@ def init_default_rules(user_id: int) -> None:
     db.commit()
 
 
-def get_appreciation_dynamique(moy: float, user_id: int) -> str:
+def get_appreciation_rules(user_id: int) -> list:
+    """(min_val, max_val, message) rules of `user_id`, ordered by min_val."""
     db = get_db()
-    rules = db.execute(
-        'SELECT * FROM appreciations WHERE user_id = ? ORDER BY min_val',
-        (user_id,),
-    ).fetchall()
+    query = 'SELECT min_val, max_val, message FROM appreciations WHERE user_id = ? ORDER BY min_val'
+    rules = db.execute(query, (user_id,)).fetchall()
     if not rules:
         init_default_rules(user_id)
-        rules = db.execute(
-            'SELECT * FROM appreciations WHERE user_id = ? ORDER BY min_val',
-            (user_id,),
-        ).fetchall()
-    for rule in rules:
-        if rule['min_val'] <= moy <= rule['max_val']:
-            return rule['message']
+        rules = db.execute(query, (user_id,)).fetchall()
+    return [(r['min_val'], r['max_val'], r['message']) for r in rules]
+
+
+def get_appreciation_dynamique(moy: float, user_id: int) -> str:
+    for min_val, max_val, message in get_appreciation_rules(user_id):
+        if min_val <= moy <= max_val:
+            return message
     return ""
@@ -2,10 +2,23 @@ import os
 
 from flask import Flask, render_template
 
-from core.config import BASE_DIR, MAX_CONTENT_LENGTH, UPLOAD_FOLDER
+from core.config import (
+    BASE_DIR,
+    MAX_CONTENT_LENGTH,
+    NOTIFICATIONS_POLL_SECONDS,
+    NOTIFICATIONS_STREAM_ENABLED,
+    SESSION_BACKEND,
+    UPLOAD_FOLDER,
+)
 from core.db import bootstrap_admin, close_db, init_db
 from core.i18n import get_lang, get_text_dir, tr
+from core.memory_profile import init_memory_profile
+from core.metrics import init_metrics
+from core.request_profiler import init_request_profiler
 from core.security import init_security
+from core.sessions import init_sessions
+from core.sql_trace import init_sql_trace
+from core.static_assets import init_static_assets
 
 
 def create_app() -> Flask:
@@ -21,6 +34,8 @@ def create_app() -> Flask:
     app.config["SESSION_COOKIE_HTTPONLY"] = True
     app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
     app.config["SESSION_COOKIE_SECURE"] = True
+    app.config["NOTIFICATIONS_STREAM"] = NOTIFICATIONS_STREAM_ENABLED
+    app.config["NOTIFICATIONS_POLL_SECONDS"] = NOTIFICATIONS_POLL_SECONDS
 
     app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY")
     if not app.config["SECRET_KEY"]:
@@ -28,7 +43,13 @@ def create_app() -> Flask:
         app.config["SECRET_KEY"] = os.urandom(32)
 
     # --- APP INIT ---
+    init_sql_trace(app)
+    init_metrics(app)
+    init_memory_profile(app)
+    init_request_profiler(app)
+    init_sessions(app, SESSION_BACKEND)
     init_security(app)
+    init_static_assets(app)
     app.teardown_appcontext(close_db)
 
     with app.app_context():
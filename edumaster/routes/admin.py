@@ -1,80 +1,162 @@
+import base64
+import json
 import os
 import re
 import secrets
 import tempfile
 from datetime import datetime
 
-from flask import Blueprint, abort, current_app, flash, redirect, render_template, request, send_file, session, url_for
-from werkzeug.security import generate_password_hash
+import numpy as np
 
-from core.audit import log_change
-from core.backup import create_backup_zip, restore_from_backup_zip
+from flask import Blueprint, Response, abort, current_app, flash, jsonify, redirect, render_template, request, session, url_for
+
+from core.audit import flush_audit_log, log_change
+from core.backup import BackupStream, restore_from_backup_zip
+from core.blob_store import release_blobs
+from core.data_version import bump_data_version
 from core.db import close_db, get_db
+from core.log_archive import delete_user_archives
+from core.metrics import count_db_error
 from core.password_reset import create_reset_token
+from core.passwords import hash_password
 from core.security import admin_required, login_required
 from core.utils import init_default_rules
+from edumaster.routes.notifications import create_notifications_bulk
+from edumaster.services.analytics import school_analytics
 from edumaster.services.common import get_active_school_year, list_school_years, resolve_school_year
+from edumaster.services.grading import ADMIS_THRESHOLD, compute_grades, note_array, note_expr
+from edumaster.services.school_year_clone import CLASS_MODES, clone_school_year
 
 bp = Blueprint("admin", __name__)
 
 
-def _normalize_class_name(value: str) -> str:
-    return (value or "").strip().upper()
+@bp.route("/admin")
+@login_required
+@admin_required
+def admin():
+    db = get_db()
+    school_years = list_school_years(db)
+    active_school_year = get_active_school_year(db)
+    # Tables are loaded page by page from the /admin/api/* endpoints.
+    available_classes = [
+        r["niveau"]
+        for r in db.execute("SELECT niveau FROM class_names ORDER BY niveau COLLATE NOCASE").fetchall()
+    ]
+    return render_template(
+        "admin.html",
+        school_years=school_years,
+        active_school_year=active_school_year,
+        available_classes=available_classes,
+        broadcast_key=secrets.token_hex(8),
+    )
 
 
-def _promote_class_name(value: str) -> str:
-    raw = _normalize_class_name(value)
-    match = re.match(r"^(\d+)(.*)$", raw)
-    if not match:
-        return raw
-    level = int(match.group(1))
-    suffix = match.group(2) or ""
-    return f"{level + 1}{suffix}"
+ADMIN_PAGE_SIZE = 50
+ADMIN_PAGE_MAX = 200
 
 
-@bp.route("/admin")
+def _page_limit() -> int:
+    limit = request.args.get("limit", type=int) or ADMIN_PAGE_SIZE
+    return max(1, min(limit, ADMIN_PAGE_MAX))
+
+
+def _encode_cursor(values) -> str:
+    raw = json.dumps(list(values), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(size: int):
+    """Keyset cursor from ?after=, or None for the first page (400 if malformed)."""
+    token = request.args.get("after")
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        abort(400)
+    if not isinstance(values, list) or len(values) != size:
+        abort(400)
+    return values
+
+
+def _page(rows, limit: int, key) -> dict:
+    """Fetch limit + 1 rows; the extra one only tells whether a next page exists."""
+    items = [dict(r) for r in rows[:limit]]
+    next_cursor = _encode_cursor(key(items[-1])) if len(rows) > limit else None
+    return {"items": items, "next": next_cursor}
+
+
+@bp.route("/admin/api/users")
 @login_required
 @admin_required
-def admin():
-    db = get_db()
-    users = db.execute(
-        """
+def admin_api_users():
+    limit = _page_limit()
+    cursor = _decode_cursor(2)
+    where, params = "", []
+    if cursor is not None:
+        where = "WHERE (COALESCE(is_admin, 0) < ? OR (COALESCE(is_admin, 0) = ? AND id > ?))"
+        params = [cursor[0], cursor[0], cursor[1]]
+    rows = get_db().execute(
+        f"""
         SELECT
             id,
             username,
             nom_affichage,
-            is_admin,
+            COALESCE(is_admin, 0) AS is_admin,
             COALESCE(role, CASE WHEN COALESCE(is_admin, 0) = 1 THEN 'admin' ELSE 'prof' END) AS role
         FROM users
-        ORDER BY is_admin DESC, id ASC
-        """
+        {where}
+        ORDER BY COALESCE(is_admin, 0) DESC, id ASC
+        LIMIT ?
+        """,
+        (*params, limit + 1),
     ).fetchall()
-    all_docs = db.execute(
-        """
-        SELECT d.id, d.titre, d.type_doc, d.filename, u.nom_affichage
+    page = _page(rows, limit, lambda item: (item["is_admin"], item["id"]))
+    page["current_user_id"] = session.get("user_id")
+    return jsonify(page)
+
+
+@bp.route("/admin/api/documents")
+@login_required
+@admin_required
+def admin_api_documents():
+    limit = _page_limit()
+    cursor = _decode_cursor(1)
+    where, params = "", []
+    if cursor is not None:
+        where = "WHERE d.id < ?"
+        params = [cursor[0]]
+    rows = get_db().execute(
+        f"""
+        SELECT d.id, d.titre, d.type_doc, d.filename, d.original_name, u.nom_affichage
         FROM documents d
         JOIN users u ON u.id = d.user_id
+        {where}
         ORDER BY d.id DESC
-        """
-    ).fetchall()
-    school_years = list_school_years(db)
-    active_school_year = get_active_school_year(db)
-    teacher_subjects = db.execute(
-        """
-        SELECT
-            u.id AS user_id,
-            u.username,
-            u.nom_affichage,
-            s.id AS subject_id,
-            s.name AS subject_name
-        FROM users u
-        JOIN subjects s ON s.user_id = u.id
-        WHERE COALESCE(u.is_admin, 0) = 0
-        ORDER BY u.nom_affichage COLLATE NOCASE, s.name COLLATE NOCASE
-        """
+        LIMIT ?
+        """,
+        (*params, limit + 1),
     ).fetchall()
-    assignments = db.execute(
-        """
+    return jsonify(_page(rows, limit, lambda item: (item["id"],)))
+
+
+@bp.route("/admin/api/assignments")
+@login_required
+@admin_required
+def admin_api_assignments():
+    db = get_db()
+    limit = _page_limit()
+    cursor = _decode_cursor(4)
+    school_year = resolve_school_year(db, request.args.get("school_year"), is_admin=True)
+    where, params = "", []
+    if cursor is not None:
+        where = (
+            "AND (u.nom_affichage COLLATE NOCASE, s.name COLLATE NOCASE, a.class_name COLLATE NOCASE, a.id)"
+            " > (?, ?, ?, ?)"
+        )
+        params = cursor
+    rows = db.execute(
+        f"""
         SELECT
             a.id,
             a.school_year,
@@ -85,24 +167,69 @@ def admin():
         FROM teacher_assignments a
         JOIN users u ON u.id = a.user_id
         JOIN subjects s ON s.id = a.subject_id
-        ORDER BY a.school_year DESC, u.nom_affichage COLLATE NOCASE, s.name COLLATE NOCASE, a.class_name COLLATE NOCASE
-        """
+        WHERE a.school_year = ? {where}
+        ORDER BY u.nom_affichage COLLATE NOCASE, s.name COLLATE NOCASE, a.class_name COLLATE NOCASE, a.id
+        LIMIT ?
+        """,
+        (school_year, *params, limit + 1),
     ).fetchall()
-    available_classes = [
-        r["niveau"]
-        for r in db.execute(
-            "SELECT DISTINCT niveau FROM eleves ORDER BY niveau COLLATE NOCASE"
-        ).fetchall()
-    ]
-    return render_template(
-        "admin.html",
-        users=users,
-        all_docs=all_docs,
-        school_years=school_years,
-        active_school_year=active_school_year,
-        teacher_subjects=teacher_subjects,
-        assignments=assignments,
-        available_classes=available_classes,
+    page = _page(
+        rows,
+        limit,
+        lambda item: (item["nom_affichage"], item["subject_name"], item["class_name"], item["id"]),
+    )
+    page["school_year"] = school_year
+    return jsonify(page)
+
+
+@bp.route("/admin/api/teacher_subjects")
+@login_required
+@admin_required
+def admin_api_teacher_subjects():
+    limit = _page_limit()
+    cursor = _decode_cursor(3)
+    where, params = "", []
+    if cursor is not None:
+        where = "AND (u.nom_affichage COLLATE NOCASE, s.name COLLATE NOCASE, s.id) > (?, ?, ?)"
+        params = cursor
+    rows = get_db().execute(
+        f"""
+        SELECT
+            u.id AS user_id,
+            u.username,
+            u.nom_affichage,
+            s.id AS subject_id,
+            s.name AS subject_name
+        FROM users u
+        JOIN subjects s ON s.user_id = u.id
+        WHERE COALESCE(u.is_admin, 0) = 0 {where}
+        ORDER BY u.nom_affichage COLLATE NOCASE, s.name COLLATE NOCASE, s.id
+        LIMIT ?
+        """,
+        (*params, limit + 1),
+    ).fetchall()
+    return jsonify(
+        _page(rows, limit, lambda item: (item["nom_affichage"], item["subject_name"], item["subject_id"]))
+    )
+
+
+@bp.route("/admin/api/analytics")
+@login_required
+@admin_required
+def admin_api_analytics():
+    db = get_db()
+    school_year = resolve_school_year(db, request.args.get("school_year"), is_admin=True)
+    trimestre = request.args.get("trimestre")
+    if trimestre not in ("1", "2", "3"):
+        trimestre = None
+    return jsonify(
+        school_analytics(
+            db,
+            school_year,
+            trimestre=trimestre,
+            subject=(request.args.get("subject") or "").strip() or None,
+            group_by=request.args.get("group_by", "teacher"),
+        )
     )
 
 
@@ -133,6 +260,7 @@ def admin_add_school_year():
         "INSERT OR IGNORE INTO school_years (label, is_active) VALUES (?, 0)",
         (label,),
     )
+    bump_data_version(db)
     db.commit()
     if before:
         flash("Annee scolaire deja existante.", "info")
@@ -151,6 +279,7 @@ def admin_activate_school_year(year_id: int):
         abort(404)
     db.execute("UPDATE school_years SET is_active = 0")
     db.execute("UPDATE school_years SET is_active = 1 WHERE id = ?", (year_id,))
+    bump_data_version(db)
     db.commit()
     flash(f"Annee active: {row['label']}", "success")
     return redirect(url_for("admin.admin"))
@@ -165,6 +294,7 @@ def admin_clone_school_year():
     copy_assignments = (request.form.get("copy_assignments") or "") == "1"
     class_mode = (request.form.get("class_mode") or "keep").strip().lower()
     activate_target = (request.form.get("activate_target") or "") == "1"
+    dry_run = (request.form.get("dry_run") or "") == "1"
 
     if not source_year or not target_year:
         flash("Source/cible manquante.", "warning")
@@ -172,14 +302,9 @@ def admin_clone_school_year():
     if source_year == target_year:
         flash("La source et la cible doivent etre differentes.", "warning")
         return redirect(url_for("admin.admin"))
-    if class_mode not in ("keep", "auto_promote"):
+    if class_mode not in CLASS_MODES:
         class_mode = "keep"
 
-    def map_class_name(name: str) -> str:
-        if class_mode == "auto_promote":
-            return _promote_class_name(name)
-        return _normalize_class_name(name)
-
     db = get_db()
     source_exists = db.execute(
         "SELECT id FROM school_years WHERE label = ?",
@@ -193,118 +318,31 @@ def admin_clone_school_year():
         flash("Annee source/cible introuvable.", "warning")
         return redirect(url_for("admin.admin"))
 
-    existing_rows = db.execute(
-        """
-        SELECT user_id, nom_complet, niveau
-        FROM eleves
-        WHERE school_year = ?
-        """,
-        (target_year,),
-    ).fetchall()
-    existing = {
-        (
-            int(r["user_id"]),
-            (r["nom_complet"] or "").strip().lower(),
-            _normalize_class_name(r["niveau"]),
-        )
-        for r in existing_rows
-    }
-
-    source_rows = db.execute(
-        """
-        SELECT user_id, nom_complet, niveau, parent_phone, parent_email
-        FROM eleves
-        WHERE school_year = ?
-        ORDER BY user_id, niveau COLLATE NOCASE, nom_complet COLLATE NOCASE
-        """,
-        (source_year,),
-    ).fetchall()
-
-    inserted = 0
-    skipped = 0
-    promoted = 0
-    for row in source_rows:
-        nom = (row["nom_complet"] or "").strip()
-        source_niveau = _normalize_class_name(row["niveau"])
-        target_niveau = map_class_name(source_niveau)
-        key = (int(row["user_id"]), nom.lower(), target_niveau)
-        if not nom or not target_niveau or key in existing:
-            skipped += 1
-            continue
-
-        db.execute(
-            """
-            INSERT INTO eleves (
-                user_id,
-                school_year,
-                nom_complet,
-                niveau,
-                parent_phone,
-                parent_email
-            ) VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (
-                int(row["user_id"]),
-                target_year,
-                nom,
-                target_niveau,
-                (row["parent_phone"] or "").strip(),
-                (row["parent_email"] or "").strip(),
-            ),
+    result = clone_school_year(
+        db,
+        source_year,
+        target_year,
+        class_mode=class_mode,
+        copy_assignments=copy_assignments,
+        dry_run=dry_run,
+    )
+    if dry_run:
+        db.rollback()
+        flash(
+            f"Simulation: {result.inserted} eleves seraient copies ({result.skipped} ignores, "
+            f"{result.promoted} promus), {result.assignments} affectations ajoutees.",
+            "info",
         )
-        inserted += 1
-        if target_niveau != source_niveau:
-            promoted += 1
-        existing.add(key)
-
-    new_assignments = 0
-    if copy_assignments:
-        existing_assignments_rows = db.execute(
-            """
-            SELECT user_id, subject_id, class_name
-            FROM teacher_assignments
-            WHERE school_year = ?
-            """,
-            (target_year,),
-        ).fetchall()
-        existing_assignments = {
-            (
-                int(r["user_id"]),
-                int(r["subject_id"]),
-                _normalize_class_name(r["class_name"]),
-            )
-            for r in existing_assignments_rows
-        }
-
-        src_assignments = db.execute(
-            """
-            SELECT user_id, subject_id, class_name
-            FROM teacher_assignments
-            WHERE school_year = ?
-            """,
-            (source_year,),
-        ).fetchall()
-        if src_assignments:
-            for row in src_assignments:
-                target_class = map_class_name(row["class_name"])
-                key = (int(row["user_id"]), int(row["subject_id"]), target_class)
-                if not target_class or key in existing_assignments:
-                    continue
-                db.execute(
-                    """
-                    INSERT INTO teacher_assignments (user_id, school_year, subject_id, class_name)
-                    VALUES (?, ?, ?, ?)
-                    """,
-                    (int(row["user_id"]), target_year, int(row["subject_id"]), target_class),
-                )
-                existing_assignments.add(key)
-                new_assignments += 1
+        return redirect(url_for("admin.admin"))
 
     if activate_target:
         db.execute("UPDATE school_years SET is_active = 0")
         db.execute("UPDATE school_years SET is_active = 1 WHERE label = ?", (target_year,))
 
+    bump_data_version(db)
     db.commit()
+    inserted, skipped, promoted = result.inserted, result.skipped, result.promoted
+    new_assignments = result.assignments
     log_change(
         "clone_school_year",
         session["user_id"],
@@ -383,6 +421,7 @@ def admin_add_assignment():
         """,
         (user_id, school_year, subject_id, class_name),
     )
+    bump_data_version(db)
     db.commit()
     if exists:
         flash("Affectation deja existante.", "info")
@@ -397,11 +436,38 @@ def admin_add_assignment():
 def admin_delete_assignment(assignment_id: int):
     db = get_db()
     db.execute("DELETE FROM teacher_assignments WHERE id = ?", (assignment_id,))
+    bump_data_version(db)
     db.commit()
     flash("Affectation supprimee.", "success")
     return redirect(url_for("admin.admin"))
 
 
+@bp.route("/admin/notify", methods=["POST"])
+@login_required
+@admin_required
+def admin_notify():
+    title = (request.form.get("title") or "").strip()
+    body = (request.form.get("body") or "").strip()
+    category = (request.form.get("category") or "info").strip().lower()
+    target = (request.form.get("target") or "profs").strip().lower()
+    dedup_key = (request.form.get("dedup_key") or "").strip() or None
+    if not title:
+        flash("Titre manquant.", "warning")
+        return redirect(url_for("admin.admin"))
+    if category not in ("info", "success", "warning", "danger"):
+        category = "info"
+
+    db = get_db()
+    query = "SELECT id FROM users"
+    if target != "all":
+        query += " WHERE COALESCE(is_admin, 0) = 0"
+    user_ids = [int(r["id"]) for r in db.execute(query).fetchall()]
+    sent = create_notifications_bulk(db, user_ids, title, body, category, dedup_key=dedup_key)
+    log_change("admin_notify", session["user_id"], details=f"{title} ({sent} destinataires)")
+    flash(f"Notification envoyee a {sent} utilisateur(s).", "success")
+    return redirect(url_for("admin.admin"))
+
+
 @bp.route("/admin/create_user", methods=["POST"])
 @login_required
 @admin_required
@@ -432,8 +498,9 @@ def admin_create_user():
 
     cur = db.execute(
         "INSERT INTO users (username, password, nom_affichage, is_admin, role, school_name, default_subject, lock_subject) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-        (username, generate_password_hash(password), display, is_admin, role, school_name, subject_name, lock_subject),
+        (username, hash_password(password), display, is_admin, role, school_name, subject_name, lock_subject),
     )
+    bump_data_version(db)
     db.commit()
     user_id = cur.lastrowid
     if subject_name:
@@ -470,6 +537,7 @@ def admin_toggle_role(user_id: int):
         "UPDATE users SET is_admin = ?, role = ?, lock_subject = ? WHERE id = ?",
         (new_role, role_value, 0 if role_value == "admin" else 1, user_id),
     )
+    bump_data_version(db)
     db.commit()
     role_label = "admin" if new_role == 1 else "prof"
     log_change("toggle_role", session["user_id"], details=f"{user['username']} -> {role_label}")
@@ -504,6 +572,7 @@ def admin_set_role(user_id: int):
         "UPDATE users SET role = ?, is_admin = ?, lock_subject = ? WHERE id = ?",
         (role, is_admin, lock_subject, user_id),
     )
+    bump_data_version(db)
     db.commit()
     log_change("set_role", session["user_id"], details=f"{user['username']} -> {role}")
     flash("Role mis a jour.", "success")
@@ -514,13 +583,19 @@ def admin_set_role(user_id: int):
 @login_required
 @admin_required
 def admin_backup():
-    buf = create_backup_zip()
+    flush_audit_log()
+    incremental = request.args.get("incremental") == "1"
+    try:
+        stream = BackupStream(incremental=incremental)
+    except Exception as e:
+        flash(f"Erreur sauvegarde: {e}", "danger")
+        return redirect(url_for("admin.admin"))
     stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    return send_file(
-        buf,
-        as_attachment=True,
-        download_name=f"edumaster_backup_{stamp}.zip",
+    kind = "incremental_" if incremental else ""
+    return Response(
+        stream,
         mimetype="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="edumaster_backup_{kind}{stamp}.zip"'},
     )
 
 
@@ -540,7 +615,8 @@ def admin_restore():
         close_db()
         result = restore_from_backup_zip(tmp_path)
         flash(
-            f"Restauration OK. Fichiers restaures: {result.restored_files}.",
+            f"Restauration OK. Fichiers restaures: {result.restored_files}, "
+            f"inchanges: {result.unchanged_files} (bascule en {result.swap_seconds:.2f}s).",
             "success",
         )
         if result.db_backup_path or result.uploads_backup_path:
@@ -573,7 +649,7 @@ def admin_reset_password(user_id: int):
     temp_password = "".join(secrets.choice(alphabet) for _ in range(10))
     db.execute(
         "UPDATE users SET password = ? WHERE id = ?",
-        (generate_password_hash(temp_password), user_id),
+        (hash_password(temp_password), user_id),
     )
     db.commit()
     log_change("admin_reset_password", session["user_id"], details=user["username"])
@@ -618,11 +694,14 @@ def admin_delete_user(user_id: int):
         (user_id,),
     ).fetchall()
     username = user["username"]
+    # Buffered events of this user must land before their rows are purged.
+    flush_audit_log()
 
     try:
         db.execute("BEGIN")
         db.execute("DELETE FROM notes WHERE user_id = ?", (user_id,))
         db.execute("DELETE FROM change_log WHERE user_id = ?", (user_id,))
+        delete_user_archives(db, user_id)
         db.execute("DELETE FROM timetable WHERE user_id = ?", (user_id,))
         db.execute("DELETE FROM documents WHERE user_id = ?", (user_id,))
         db.execute("DELETE FROM appreciations WHERE user_id = ?", (user_id,))
@@ -632,17 +711,15 @@ def admin_delete_user(user_id: int):
         db.execute("DELETE FROM password_reset_tokens WHERE user_id = ?", (user_id,))
         db.execute("DELETE FROM login_attempts WHERE username = ?", ((username or "").lower(),))
         db.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        bump_data_version(db)
         db.commit()
     except Exception as exc:
         db.rollback()
+        count_db_error(exc)
         flash(f"Suppression impossible: {exc}", "danger")
         return redirect(url_for("admin.admin"))
 
-    for d in docs:
-        try:
-            os.remove(os.path.join(current_app.config["UPLOAD_FOLDER"], d["filename"]))
-        except Exception:
-            pass
+    release_blobs(db, current_app.config["UPLOAD_FOLDER"], [d["filename"] for d in docs])
 
     log_change("delete_user", session["user_id"], details=username)
     flash(f"Utilisateur supprime: {user['username']}", "success")
@@ -663,11 +740,7 @@ def admin_delete_document(doc_id: int):
 
     db.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
     db.commit()
-
-    try:
-        os.remove(os.path.join(current_app.config["UPLOAD_FOLDER"], doc["filename"]))
-    except Exception:
-        pass
+    release_blobs(db, current_app.config["UPLOAD_FOLDER"], [doc["filename"]])
 
     log_change("admin_delete_document", session["user_id"], details=str(doc_id))
     flash("Document supprime.", "success")
@@ -721,16 +794,17 @@ def admin_voir_eleves(user_id: int):
         (user_id,),
     ).fetchone()
     subject_id = int(subject_row["id"]) if subject_row else -1
+    devoir_expr, activite_expr, compo_expr, remarques_expr, _ = note_expr(trim)
 
     query = f"""
         SELECT
             e.id,
             e.nom_complet,
             e.niveau,
-            COALESCE(n.devoir, e.devoir_t{trim}) AS devoir,
-            COALESCE(n.activite, e.activite_t{trim}) AS activite,
-            COALESCE(n.compo, e.compo_t{trim}) AS compo,
-            COALESCE(n.remarques, e.remarques_t{trim}) AS remarques
+            {devoir_expr} AS devoir,
+            {activite_expr} AS activite,
+            {compo_expr} AS compo,
+            {remarques_expr} AS remarques
         FROM eleves e
         LEFT JOIN notes n
           ON n.user_id = e.user_id
@@ -746,37 +820,35 @@ def admin_voir_eleves(user_id: int):
     query += " ORDER BY e.niveau, e.id"
 
     eleves_db = db.execute(query, params).fetchall()
-    eleves_list = []
-    admis, total_moy, count_saisis, notes = 0, 0, 0, []
-
-    for el in eleves_db:
-        d = float(el["devoir"] or 0)
-        a = float(el["activite"] or 0)
-        c = float(el["compo"] or 0)
-        moy = round(((d + a) / 2 + (c * 2)) / 3, 2)
-        if moy > 0:
-            count_saisis += 1
-            total_moy += moy
-            notes.append(moy)
-        if moy >= 10:
-            admis += 1
-        eleves_list.append(
-            {
-                "id": el["id"],
-                "nom_complet": el["nom_complet"],
-                "niveau": el["niveau"],
-                "remarques": el["remarques"] or "",
-                "devoir": d,
-                "activite": a,
-                "compo": c,
-                "moyenne": moy,
-            }
+    batch = compute_grades(
+        note_array([el["devoir"] for el in eleves_db]),
+        note_array([el["compo"] for el in eleves_db]),
+        activite=note_array([el["activite"] for el in eleves_db]),
+    )
+    moyennes = np.round(batch.moyenne, 2)
+    saisis = moyennes[moyennes > 0]
+    admis = int((moyennes >= ADMIS_THRESHOLD).sum())
+    eleves_list = [
+        {
+            "id": el["id"],
+            "nom_complet": el["nom_complet"],
+            "niveau": el["niveau"],
+            "remarques": el["remarques"] or "",
+            "devoir": d,
+            "activite": a,
+            "compo": c,
+            "moyenne": moy,
+        }
+        for el, d, a, c, moy in zip(
+            eleves_db, batch.devoir.tolist(), batch.activite.tolist(), batch.compo.tolist(), moyennes.tolist()
         )
+    ]
+    count_saisis = len(saisis)
 
     stats = {
-        "moyenne_generale": round(total_moy / count_saisis, 2) if count_saisis else 0,
-        "meilleure_note": max(notes) if notes else 0,
-        "pire_note": min(notes) if notes else 0,
+        "moyenne_generale": round(float(saisis.mean()), 2) if count_saisis else 0,
+        "meilleure_note": float(saisis.max()) if count_saisis else 0,
+        "pire_note": float(saisis.min()) if count_saisis else 0,
         "nb_admis": admis,
         "taux_reussite": round((admis / len(eleves_list)) * 100, 1) if eleves_list else 0,
         "nb_total": len(eleves_list),
@@ -1,10 +1,8 @@
 from datetime import datetime
 
 from flask import Blueprint, flash, redirect, render_template, request, session, url_for
-from werkzeug.security import check_password_hash, generate_password_hash
 
 from core.auth_security import (
-    cleanup_old_login_attempts,
     get_client_ip,
     is_login_locked,
     lock_message,
@@ -12,6 +10,7 @@ from core.auth_security import (
 )
 from core.db import get_db
 from core.password_reset import consume_reset_token, set_user_password
+from core.passwords import hash_password, needs_rehash, verify_password
 from core.security import login_required, verifier_validite_licence
 from core.utils import init_default_rules
 
@@ -41,7 +40,7 @@ def register():
         else:
             db.execute(
                 "INSERT INTO users (username, password, nom_affichage, role, school_name, default_subject, lock_subject) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (username, generate_password_hash(password), nom_affichage, "prof", school_name, subject_name, 1),
+                (username, hash_password(password), nom_affichage, "prof", school_name, subject_name, 1),
             )
             db.commit()
             user_id = db.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()[
@@ -66,7 +65,6 @@ def login():
 
     if request.method == "POST":
         db = get_db()
-        cleanup_old_login_attempts(db)
 
         username = (request.form.get("username") or "").strip()
         password = request.form.get("password") or ""
@@ -78,10 +76,16 @@ def login():
             return render_template("login.html")
 
         user = db.execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
-        ok = bool(user and check_password_hash(user["password"], password))
+        ok = bool(user and verify_password(user["password"], password))
         record_login_attempt(db, username, ip, success=ok)
 
         if ok:
+            if needs_rehash(user["password"]):
+                db.execute(
+                    "UPDATE users SET password = ? WHERE id = ?",
+                    (hash_password(password), user["id"]),
+                )
+                db.commit()
             role = user["role"] if "role" in user.keys() and user["role"] else ("admin" if int(user["is_admin"] or 0) == 1 else "prof")
             if role not in ("admin", "prof", "read_only"):
                 role = "admin" if int(user["is_admin"] or 0) == 1 else "prof"
@@ -155,7 +159,7 @@ def profile():
         new_password = request.form.get("new_password", "")
         confirm_password = request.form.get("confirm_password", "")
 
-        if not check_password_hash(user["password"], old_password):
+        if not verify_password(user["password"], old_password):
             flash("Ancien mot de passe incorrect", "danger")
         elif len(new_password) < 6:
             flash("Mot de passe trop court (min 6).", "danger")
@@ -164,7 +168,7 @@ def profile():
         else:
             db.execute(
                 "UPDATE users SET password = ? WHERE id = ?",
-                (generate_password_hash(new_password), user_id),
+                (hash_password(new_password), user_id),
             )
             db.commit()
             flash("Mot de passe modifie", "success")
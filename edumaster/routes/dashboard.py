@@ -3,8 +3,11 @@ import csv
 from io import BytesIO, StringIO
 from flask import Blueprint, render_template, request, session, redirect, url_for, flash, send_file
 
-from core.audit import log_change
+from core.audit import flush_audit_log, log_change
+from core.data_version import bump_data_version
 from core.db import get_db
+from core.http_cache import etag_cached
+from core.log_archive import change_log_source
 from core.security import login_required, write_required
 from core.utils import get_appreciation_dynamique
 
@@ -17,8 +20,9 @@ from edumaster.services.common import (
     select_subject_id,
 )
 from edumaster.services.filters import build_filters, build_history_filters
-from edumaster.services.grading import note_expr, split_activite_components
-from edumaster.services.stats_service import get_class_evolution, get_best_students_evolution
+from edumaster.services.dashboard_service import fetch_students_page
+from edumaster.services.grading import moyenne_expr, note_expr
+from edumaster.services.stats_service import get_best_students_evolution, get_class_evolution, get_distribution_stats
 
 bp = Blueprint("dashboard", __name__)
 
@@ -34,6 +38,7 @@ def set_lang(lang: str):
 
 @bp.route("/")
 @login_required
+@etag_cached
 def index():
     user_id = session["user_id"]
     trim = request.args.get("trimestre", "1")
@@ -64,7 +69,7 @@ def index():
             subject_id = int(allowed_subjects[0]["id"])
     subject_name = next(s["name"] for s in subjects if int(s["id"]) == subject_id)
 
-    devoir_expr, activite_expr, compo_expr, remarques_expr, moy_expr = note_expr(trim)
+    _, _, _, _, moy_expr = note_expr(trim)
     filters = build_filters(
         user_id,
         trim,
@@ -128,71 +133,9 @@ def index():
     pages = max(1, (total + per_page - 1) // per_page)
     if page > pages:
         page = pages
-    offset = (page - 1) * per_page
-
-    direction = "DESC" if order == "desc" else "ASC"
-    if sort == "name":
-        order_clause = f"e.nom_complet COLLATE NOCASE {direction}, e.id ASC"
-    elif sort == "moy":
-        order_clause = f"moyenne {direction}, e.nom_complet COLLATE NOCASE ASC, e.id ASC"
-    elif sort == "id":
-        order_clause = f"e.id {direction}"
-    else:
-        order_clause = f"e.niveau COLLATE NOCASE {direction}, e.id ASC"
-
-    rows = db.execute(
-        f"""
-        SELECT
-          e.id,
-          e.nom_complet,
-          e.niveau,
-          COALESCE(n.participation, 0) AS participation,
-          COALESCE(n.comportement, 0) AS comportement,
-          COALESCE(n.cahier, 0) AS cahier,
-          COALESCE(n.projet, 0) AS projet,
-          COALESCE(n.assiduite_outils, 0) AS assiduite_outils,
-          {devoir_expr} AS devoir,
-          {activite_expr} AS activite,
-          {compo_expr} AS compo,
-          {remarques_expr} AS remarques,
-          ROUND({moy_expr}, 2) AS moyenne
-        FROM eleves e
-        LEFT JOIN notes n ON n.user_id = e.user_id AND n.eleve_id = e.id AND n.subject_id = ? AND n.trimestre = ?
-        WHERE {where}
-        ORDER BY {order_clause}
-        LIMIT ? OFFSET ?
-        """,
-        join_params + params + [per_page, offset],
-    ).fetchall()
-
-    eleves_list = []
-    for r in rows:
-        p = float(r["participation"] or 0)
-        b = float(r["comportement"] or 0)
-        k = float(r["cahier"] or 0)
-        pr = float(r["projet"] or 0)
-        ao = float(r["assiduite_outils"] or 0)
-        activite_value = float(r["activite"] or 0)
-        if activite_value > 0 and p == 0 and b == 0 and k == 0 and pr == 0 and ao == 0:
-            p, b, k, pr, ao = split_activite_components(activite_value)
-
-        eleves_list.append(
-            {
-                "id": r["id"],
-                "nom_complet": r["nom_complet"],
-                "niveau": r["niveau"],
-                "remarques": r["remarques"],
-                "devoir": float(r["devoir"] or 0),
-                "activite": activite_value,
-                "compo": float(r["compo"] or 0),
-                "participation": p,
-                "comportement": b,
-                "cahier": k,
-                "projet": pr,
-                "assiduite_outils": ao,
-                "moyenne": float(r["moyenne"] or 0),
-            }
-        )
+    eleves_list = fetch_students_page(
+        db, user_id, trim, subject_id, where, params, sort, order, page, per_page
+    )
 
     nb_admis = int(stats_row["nb_admis"] or 0)
     nb_total = total
@@ -326,9 +269,9 @@ def index():
         progress_where += " AND e.nom_complet LIKE ?"
         progress_params.append(f"%{search}%")
 
-    m1 = "((COALESCE(n1.devoir, e.devoir_t1) + COALESCE(n1.activite, e.activite_t1))/2.0 + (COALESCE(n1.compo, e.compo_t1) * 2.0))/3.0"
-    m2 = "((COALESCE(n2.devoir, e.devoir_t2) + COALESCE(n2.activite, e.activite_t2))/2.0 + (COALESCE(n2.compo, e.compo_t2) * 2.0))/3.0"
-    m3 = "((COALESCE(n3.devoir, e.devoir_t3) + COALESCE(n3.activite, e.activite_t3))/2.0 + (COALESCE(n3.compo, e.compo_t3) * 2.0))/3.0"
+    m1 = moyenne_expr("n1")
+    m2 = moyenne_expr("n2")
+    m3 = moyenne_expr("n3")
 
     progress_rows = db.execute(
         f"""
@@ -404,24 +347,26 @@ def index():
 @login_required
 def history():
     user_id = session["user_id"]
+    flush_audit_log()
     db = get_db()
+    filters = build_history_filters(user_id, request.args)
+    where = filters["where"]
+    params = filters["params"]
+    source = change_log_source(db, filters["from_ts"], filters["to_ts"])
+
     actions = [
         r["action"]
         for r in db.execute(
-            "SELECT DISTINCT action FROM change_log WHERE user_id = ? ORDER BY action",
+            f"SELECT DISTINCT action FROM {source} l WHERE l.user_id = ? ORDER BY action",
             (user_id,),
         ).fetchall()
     ]
     subjects = get_subjects(db, user_id)
 
-    filters = build_history_filters(user_id, request.args)
-    where = filters["where"]
-    params = filters["params"]
-
     rows = db.execute(
         f"""
         SELECT l.*, e.nom_complet AS eleve_name, s.name AS subject_name
-        FROM change_log l
+        FROM {source} l
         LEFT JOIN eleves e ON e.id = l.eleve_id
         LEFT JOIN subjects s ON s.id = l.subject_id
         WHERE {where}
@@ -455,16 +400,18 @@ def history():
 @login_required
 def history_export():
     user_id = session["user_id"]
+    flush_audit_log()
     db = get_db()
 
     filters = build_history_filters(user_id, request.args)
     where = filters["where"]
     params = filters["params"]
+    source = change_log_source(db, filters["from_ts"], filters["to_ts"])
 
     rows = db.execute(
         f"""
         SELECT l.*, e.nom_complet AS eleve_name, s.name AS subject_name
-        FROM change_log l
+        FROM {source} l
         LEFT JOIN eleves e ON e.id = l.eleve_id
         LEFT JOIN subjects s ON s.id = l.subject_id
         WHERE {where}
@@ -535,18 +482,7 @@ def settings():
                 "UPDATE notes SET remarques = ? WHERE id = ?",
                 (get_appreciation_dynamique(moy, user_id), n["id"]),
             )
-
-        # Legacy recalcul (old columns)
-        for el in db.execute(
-            "SELECT * FROM eleves WHERE user_id = ?",
-            (user_id,),
-        ).fetchall():
-            for t in range(1, 4):
-                moy = ((el[f"devoir_t{t}"] + el[f"activite_t{t}"]) / 2 + (el[f"compo_t{t}"] * 2)) / 3
-                db.execute(
-                    f"UPDATE eleves SET remarques_t{t} = ? WHERE id = ?",
-                    (get_appreciation_dynamique(moy, user_id), el["id"]),
-                )
+        bump_data_version(db, user_id)
         db.commit()
         flash("Sauvegarde", "success")
 
@@ -658,6 +594,7 @@ def timetable():
 
 @bp.route("/stats")
 @login_required
+@etag_cached
 def stats():
     user_id = session["user_id"]
     db = get_db()
@@ -708,48 +645,15 @@ def stats():
     params = filters["params"]
     join_params = [subject_id, int(trim)]
 
-    stats_row = db.execute(
-        f"SELECT COUNT(*) AS nb_total, SUM(CASE WHEN {moy_expr} > 0 THEN 1 ELSE 0 END) AS nb_saisis, SUM(CASE WHEN {moy_expr} >= 10 THEN 1 ELSE 0 END) AS nb_admis, AVG(CASE WHEN {moy_expr} > 0 THEN {moy_expr} END) AS moyenne_generale, MAX(CASE WHEN {moy_expr} > 0 THEN {moy_expr} END) AS meilleure_note, MIN(CASE WHEN {moy_expr} > 0 THEN {moy_expr} END) AS pire_note FROM eleves e LEFT JOIN notes n ON n.user_id = e.user_id AND n.eleve_id = e.id AND n.subject_id = ? AND n.trimestre = ? WHERE {where}",
-        join_params + params,
-    ).fetchone()
-
-    total = int(stats_row["nb_total"] or 0)
-    nb_admis = int(stats_row["nb_admis"] or 0)
-
-    stats = {
-        "moyenne_generale": round(float(stats_row["moyenne_generale"] or 0), 2),
-        "meilleure_note": round(float(stats_row["meilleure_note"] or 0), 2),
-        "pire_note": round(float(stats_row["pire_note"] or 0), 2),
-        "nb_admis": nb_admis,
-        "taux_reussite": round((nb_admis / total) * 100, 1) if total else 0,
-        "nb_total": total,
-        "nb_saisis": int(stats_row["nb_saisis"] or 0),
-    }
-
-    class_rows = db.execute(
-        f"SELECT e.niveau, COUNT(*) AS total, AVG(CASE WHEN {moy_expr} > 0 THEN {moy_expr} END) AS avg_moy FROM eleves e LEFT JOIN notes n ON n.user_id = e.user_id AND n.eleve_id = e.id AND n.subject_id = ? AND n.trimestre = ? WHERE {where} GROUP BY e.niveau ORDER BY avg_moy DESC, e.niveau ASC",
-        join_params + params,
-    ).fetchall()
-    class_labels = [str(r["niveau"]) for r in class_rows]
-    class_avgs = [round(float(r["avg_moy"] or 0), 2) for r in class_rows]
-
-    dist_row = db.execute(
-        f"SELECT SUM(CASE WHEN {moy_expr} >= 10 THEN 1 ELSE 0 END) AS admis, SUM(CASE WHEN {moy_expr} > 0 AND {moy_expr} < 10 THEN 1 ELSE 0 END) AS echec, SUM(CASE WHEN {moy_expr} <= 0 THEN 1 ELSE 0 END) AS non_saisi FROM eleves e LEFT JOIN notes n ON n.user_id = e.user_id AND n.eleve_id = e.id AND n.subject_id = ? AND n.trimestre = ? WHERE {where}",
-        join_params + params,
-    ).fetchone()
-
-    dist_values = [
-        int(dist_row["admis"] or 0),
-        int(dist_row["echec"] or 0),
-        int(dist_row["non_saisi"] or 0),
-    ]
-
-    top_rows = db.execute(
-        f"SELECT e.nom_complet, e.niveau, ROUND({moy_expr}, 2) AS moyenne FROM eleves e LEFT JOIN notes n ON n.user_id = e.user_id AND n.eleve_id = e.id AND n.subject_id = ? AND n.trimestre = ? WHERE {where} ORDER BY moyenne DESC, e.nom_complet ASC LIMIT 10",
-        join_params + params,
-    ).fetchall()
-
-    top_eleves = [{"nom": r["nom_complet"], "niveau": r["niveau"], "moyenne": float(r["moyenne"] or 0)} for r in top_rows]
+    distribution = get_distribution_stats(
+        db, user_id, trim, subject_id, where, params, bins=request.args.get("bins", type=int)
+    )
+    stats = distribution["stats"]
+    class_labels = [c["niveau"] for c in distribution["classes"]]
+    class_avgs = [c["moyenne"] for c in distribution["classes"]]
+    dist = distribution["distribution"]
+    dist_values = [dist["admis"], dist["echec"], dist["non_saisi"]]
+    top_eleves = distribution["top"]
 
     risk_where = "e.user_id = ? AND e.school_year = ?"
     risk_params = [user_id, selected_school_year]
@@ -786,6 +690,8 @@ def stats():
     chart_data = {
         "classes": {"labels": class_labels, "values": class_avgs},
         "distribution": {"labels": ["Admis", "Echec", "Non saisi"], "values": dist_values},
+        "histogram": distribution["histogram"],
+        "components": distribution["components"],
     }
 
     evolution = get_class_evolution(user_id, subject_id, selected_school_year)
@@ -846,6 +752,7 @@ def subjects():
                     "INSERT INTO subjects (user_id, name) VALUES (?, ?)",
                     (user_id, name),
                 )
+                bump_data_version(db, user_id)
                 db.commit()
                 log_change("add_subject", user_id, details=name)
                 flash("Matiere ajoutee", "success")
@@ -881,6 +788,7 @@ def delete_subject(subject_id: int):
         "DELETE FROM subjects WHERE user_id = ? AND id = ?",
         (user_id, subject_id),
     )
+    bump_data_version(db, user_id)
     db.commit()
     log_change("delete_subject", user_id, details=str(subject_id), subject_id=subject_id)
     flash("Matiere supprimee", "success")
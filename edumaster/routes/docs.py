@@ -1,9 +1,9 @@
 import os
-import uuid
 
 from flask import Blueprint, current_app, flash, redirect, render_template, request, session, url_for
 from werkzeug.utils import secure_filename
 
+from core.blob_store import discard_blob, publish_blob, release_blobs, stage_blob
 from core.db import get_db
 from core.security import login_required, write_required
 from core.utils import is_allowed_upload
@@ -37,14 +37,23 @@ def upload():
         flash("Type de fichier non autorisé.", "danger")
         return redirect(url_for("docs.ressources"))
 
-    unique_name = f"{uuid.uuid4().hex}_{filename}"
-    f.save(os.path.join(current_app.config["UPLOAD_FOLDER"], unique_name))
-
-    get_db().execute(
-        "INSERT INTO documents (user_id, titre, type_doc, niveau, filename) VALUES (?, ?, ?, ?, ?)",
-        (session["user_id"], request.form["titre"], request.form["type_doc"], "Global", unique_name),
-    )
-    get_db().commit()
+    folder = current_app.config["UPLOAD_FOLDER"]
+    staged = stage_blob(f.stream, folder, os.path.splitext(filename)[1])
+    db = get_db()
+    try:
+        db.execute("BEGIN IMMEDIATE")
+        db.execute(
+            "INSERT INTO documents (user_id, titre, type_doc, niveau, filename, content_hash, original_name) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (session["user_id"], request.form["titre"], request.form["type_doc"], "Global",
+             staged.filename, staged.sha256, filename),
+        )
+        publish_blob(staged, folder)
+        db.commit()
+    except Exception:
+        db.rollback()
+        discard_blob(staged.tmp_path)
+        raise
     flash("Fichier envoyé.", "success")
     return redirect(url_for("docs.ressources"))
 
@@ -59,10 +68,7 @@ def supprimer_document(id: int):
         (id, session["user_id"]),
     ).fetchone()
     if doc:
-        try:
-            os.remove(os.path.join(current_app.config["UPLOAD_FOLDER"], doc["filename"]))
-        except Exception:
-            pass
         db.execute("DELETE FROM documents WHERE id = ?", (id,))
         db.commit()
+        release_blobs(db, current_app.config["UPLOAD_FOLDER"], [doc["filename"]])
     return redirect(url_for("docs.ressources"))
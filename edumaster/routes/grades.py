@@ -1,8 +1,13 @@
-from flask import Blueprint, request, session, redirect, url_for, flash
+import json
+
+import numpy as np
+from flask import Blueprint, request, session, redirect, url_for, flash, jsonify
 from core.audit import log_change
+from core.data_version import bump_data_version
 from core.db import get_db
+from core.metrics import count_db_error
 from core.security import login_required, write_required
-from core.utils import clean_note, get_appreciation_dynamique
+from core.utils import get_appreciation_rules
 from edumaster.services.common import (
     get_subjects,
     get_user_assignment_scope,
@@ -10,10 +15,20 @@ from edumaster.services.common import (
     resolve_school_year,
     select_subject_id,
 )
-from edumaster.services.grading import clean_component, split_activite_components, sum_activite_components, safe_list_get
+from edumaster.services.grading import (
+    COMPONENT_FIELDS,
+    appreciation_messages,
+    compute_grades,
+    note_array,
+    safe_list_get,
+)
 
 bp = Blueprint("grades", __name__)
 
+# Cells the grid can edit; activite is the sum of the components.
+PATCH_FIELDS = COMPONENT_FIELDS + ("devoir", "compo")
+PATCH_MAX_CHANGES = 5000
+
 @bp.route("/sauvegarder_tout", methods=["POST"])
 @login_required
 @write_required
@@ -50,61 +65,288 @@ def sauvegarder_tout():
 
     updated = 0
     try:
-        for i in range(len(ids)):
-            try:
-                row = db.execute(
-                    "SELECT niveau, school_year FROM eleves WHERE id = ? AND user_id = ?",
-                    (ids[i], user_id),
-                ).fetchone()
-                if not row:
-                    continue
-                if (row["school_year"] or "") != selected_school_year:
-                    continue
-                if scope["restricted"] and row["niveau"] not in scope["classes"]:
-                    continue
-
-                d = clean_note(safe_list_get(devs, i))
-                c = clean_note(safe_list_get(comps, i))
-                if use_components:
-                    p = clean_component(safe_list_get(participations, i), 3)
-                    b = clean_component(safe_list_get(comportements, i), 6)
-                    k = clean_component(safe_list_get(cahiers, i), 5)
-                    pr = clean_component(safe_list_get(projets, i), 4)
-                    ao = clean_component(safe_list_get(assiduites, i), 2)
-                else:
-                    p, b, k, pr, ao = split_activite_components(safe_list_get(acts, i))
-                a = sum_activite_components(p, b, k, pr, ao)
-                moy = ((d + a) / 2 + (c * 2)) / 3
-                rem = get_appreciation_dynamique(moy, user_id)
-                db.execute(
-                    """
-                    INSERT INTO notes (
-                        user_id, eleve_id, subject_id, trimestre,
-                        participation, comportement, cahier, projet, assiduite_outils,
-                        activite, devoir, compo, remarques
-                    )
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ON CONFLICT(user_id, eleve_id, subject_id, trimestre)
-                    DO UPDATE SET
-                        participation=excluded.participation,
-                        comportement=excluded.comportement,
-                        cahier=excluded.cahier,
-                        projet=excluded.projet,
-                        assiduite_outils=excluded.assiduite_outils,
-                        activite=excluded.activite,
-                        devoir=excluded.devoir,
-                        compo=excluded.compo,
-                        remarques=excluded.remarques
-                    """,
-                    (user_id, ids[i], subject_id, int(trim), p, b, k, pr, ao, a, d, c, rem),
+        eligible = {
+            str(r["id"])
+            for r in db.execute(
+                """
+                SELECT id, niveau FROM eleves
+                WHERE user_id = ? AND school_year = ?
+                  AND id IN (SELECT value FROM json_each(?))
+                """,
+                (user_id, selected_school_year, json.dumps(ids)),
+            ).fetchall()
+            if not scope["restricted"] or r["niveau"] in scope["classes"]
+        }
+        rows = [i for i, eleve_id in enumerate(ids) if eleve_id in eligible]
+
+        def column(values):
+            return note_array([safe_list_get(values, i) for i in rows])
+
+        components = None
+        if use_components:
+            components = np.column_stack(
+                [column(values) for values in (participations, comportements, cahiers, projets, assiduites)]
+            )
+        rules = get_appreciation_rules(user_id)
+        batch = compute_grades(
+            column(devs), column(comps), activite=column(acts), components=components, rules=rules
+        )
+        remarks = appreciation_messages(batch, rules)
+        db.executemany(
+            """
+            INSERT INTO notes (
+                user_id, eleve_id, subject_id, trimestre,
+                participation, comportement, cahier, projet, assiduite_outils,
+                activite, devoir, compo, remarques, row_version
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+            ON CONFLICT(user_id, eleve_id, subject_id, trimestre)
+            DO UPDATE SET
+                participation=excluded.participation,
+                comportement=excluded.comportement,
+                cahier=excluded.cahier,
+                projet=excluded.projet,
+                assiduite_outils=excluded.assiduite_outils,
+                activite=excluded.activite,
+                devoir=excluded.devoir,
+                compo=excluded.compo,
+                remarques=excluded.remarques,
+                row_version=notes.row_version + 1
+            """,
+            [
+                (user_id, ids[i], subject_id, int(trim), *comp, a, d, c, rem)
+                for i, comp, a, d, c, rem in zip(
+                    rows,
+                    batch.components.tolist(),
+                    batch.activite.tolist(),
+                    batch.devoir.tolist(),
+                    batch.compo.tolist(),
+                    remarks,
                 )
-                updated += 1
-            except Exception:
-                continue
-        db.commit()
+            ],
+        )
+        updated = len(rows)
         log_change("update_notes", user_id, details=f"{selected_school_year}: {updated} lignes", subject_id=subject_id)
+        bump_data_version(db, user_id)
+        db.commit()
         flash("Notes enregistrees.", "success")
-    except Exception:
+    except Exception as exc:
         db.rollback()
+        count_db_error(exc)
         flash("Erreur lors de l'enregistrement des notes.", "danger")
     return redirect(request.referrer or url_for("dashboard.index", trimestre=trim, school_year=selected_school_year))
+
+
+def _patch_error(message, status, **extra):
+    return jsonify({"error": message, **extra}), status
+
+
+def _parse_changes(changes):
+    """{eleve_id: {field: value}} and {eleve_id: row_version}, or None if malformed."""
+    cells, versions = {}, {}
+    for change in changes:
+        if not isinstance(change, dict) or change.get("field") not in PATCH_FIELDS:
+            return None
+        try:
+            eleve_id = int(change["eleve_id"])
+            version = int(change.get("row_version") or 0)
+        except (KeyError, TypeError, ValueError):
+            return None
+        # Every cell of a student must come from the same read of its row.
+        if versions.setdefault(eleve_id, version) != version:
+            return None
+        cells.setdefault(eleve_id, {})[change["field"]] = change.get("value")
+    return cells, versions
+
+
+def _current_grades(rows):
+    """Grades of the stored notes rows, as the grid shows them."""
+    stored = np.array(
+        [[r[f] or 0 for f in COMPONENT_FIELDS] for r in rows], dtype=float
+    ).reshape(-1, len(COMPONENT_FIELDS))
+    # Rows saved before the component split only carry the activite total.
+    stored[~stored.any(axis=1)] = np.nan
+    return compute_grades(
+        note_array([r["devoir"] for r in rows]),
+        note_array([r["compo"] for r in rows]),
+        activite=note_array([r["activite"] for r in rows]),
+        components=stored,
+    )
+
+
+def _conflicts(db, user_id, subject_id, trim, ids):
+    rows = db.execute(
+        """
+        SELECT eleve_id, participation, comportement, cahier, projet, assiduite_outils,
+               activite, devoir, compo, remarques, row_version
+        FROM notes
+        WHERE user_id = ? AND subject_id = ? AND trimestre = ?
+          AND eleve_id IN (SELECT value FROM json_each(?))
+        """,
+        (user_id, subject_id, int(trim), json.dumps(ids)),
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+@bp.route("/api/notes", methods=["PATCH"])
+@login_required
+@write_required
+def patch_notes():
+    """
+    Save only the edited cells of the grade grid.
+
+    JSON body: trimestre, subject, school_year and `changes`, a list of
+    {eleve_id, field, value, row_version}. row_version is the version of the
+    student's notes row the client read (0 when it had none). If any of
+    those rows changed since, nothing is written and the 409 response
+    carries their current values. Otherwise only the students named in
+    `changes` are graded and upserted, in one transaction.
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get("changes"), list):
+        return _patch_error("Requete invalide.", 400)
+    if len(payload["changes"]) > PATCH_MAX_CHANGES:
+        return _patch_error("Trop de modifications en une fois.", 413)
+    parsed = _parse_changes(payload["changes"])
+    if parsed is None:
+        return _patch_error("Modification invalide.", 400)
+    cells, versions = parsed
+
+    user_id = session["user_id"]
+    trim = parse_trim(payload.get("trimestre"))
+    db = get_db()
+    selected_school_year = resolve_school_year(
+        db,
+        str(payload.get("school_year") or ""),
+        is_admin=bool(session.get("is_admin")),
+    )
+    scope = (
+        {"restricted": False, "subject_ids": set(), "classes": set()}
+        if session.get("is_admin")
+        else get_user_assignment_scope(db, user_id, selected_school_year)
+    )
+    subjects = get_subjects(db, user_id)
+    subject_id = select_subject_id(subjects, payload.get("subject"))
+    if scope["restricted"] and subject_id not in scope["subject_ids"]:
+        return _patch_error("Matiere non autorisee pour ce compte.", 403)
+    if not cells:
+        return jsonify({"saved": 0, "rows": []})
+
+    ids = sorted(cells)
+    rows = [
+        r
+        for r in db.execute(
+            """
+            SELECT e.id, e.niveau,
+                   n.participation, n.comportement, n.cahier, n.projet, n.assiduite_outils,
+                   n.activite, n.devoir, n.compo, COALESCE(n.row_version, 0) AS row_version
+            FROM eleves e
+            LEFT JOIN notes n
+              ON n.user_id = e.user_id AND n.eleve_id = e.id AND n.subject_id = ? AND n.trimestre = ?
+            WHERE e.user_id = ? AND e.school_year = ?
+              AND e.id IN (SELECT value FROM json_each(?))
+            ORDER BY e.id
+            """,
+            (subject_id, int(trim), user_id, selected_school_year, json.dumps(ids)),
+        ).fetchall()
+        if not scope["restricted"] or r["niveau"] in scope["classes"]
+    ]
+    if len(rows) != len(ids):
+        found = {r["id"] for r in rows}
+        return _patch_error("Eleve introuvable.", 404, eleve_ids=[i for i in ids if i not in found])
+    stale = [r["id"] for r in rows if r["row_version"] != versions[r["id"]]]
+    if stale:
+        return _patch_error(
+            "Notes modifiees entre-temps: rechargez la page.",
+            409,
+            conflicts=_conflicts(db, user_id, subject_id, trim, stale),
+        )
+
+    current = _current_grades(rows)
+    devoir, compo = current.devoir.copy(), current.compo.copy()
+    components = current.components.copy()
+    for i, r in enumerate(rows):
+        for field, value in cells[r["id"]].items():
+            score = note_array([value])[0]
+            if field == "devoir":
+                devoir[i] = score
+            elif field == "compo":
+                compo[i] = score
+            else:
+                components[i, COMPONENT_FIELDS.index(field)] = score
+    rules = get_appreciation_rules(user_id)
+    batch = compute_grades(devoir, compo, components=components, rules=rules)
+    remarks = appreciation_messages(batch, rules)
+
+    try:
+        # The version check is repeated in the upsert itself, so a write that
+        # lands between the read above and this one is not overwritten.
+        cursor = db.executemany(
+            """
+            INSERT INTO notes (
+                user_id, eleve_id, subject_id, trimestre,
+                participation, comportement, cahier, projet, assiduite_outils,
+                activite, devoir, compo, remarques, row_version
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+            ON CONFLICT(user_id, eleve_id, subject_id, trimestre)
+            DO UPDATE SET
+                participation=excluded.participation,
+                comportement=excluded.comportement,
+                cahier=excluded.cahier,
+                projet=excluded.projet,
+                assiduite_outils=excluded.assiduite_outils,
+                activite=excluded.activite,
+                devoir=excluded.devoir,
+                compo=excluded.compo,
+                remarques=excluded.remarques,
+                row_version=notes.row_version + 1
+            WHERE notes.row_version = ?
+            """,
+            [
+                (user_id, r["id"], subject_id, int(trim), *comp, a, d, c, rem, r["row_version"])
+                for r, comp, a, d, c, rem in zip(
+                    rows,
+                    batch.components.tolist(),
+                    batch.activite.tolist(),
+                    batch.devoir.tolist(),
+                    batch.compo.tolist(),
+                    remarks,
+                )
+            ],
+        )
+        if cursor.rowcount != len(rows):
+            db.rollback()
+            return _patch_error(
+                "Notes modifiees entre-temps: rechargez la page.",
+                409,
+                conflicts=_conflicts(db, user_id, subject_id, trim, ids),
+            )
+        log_change(
+            "update_notes",
+            user_id,
+            details=f"{selected_school_year}: {len(rows)} lignes ({len(payload['changes'])} cellules)",
+            subject_id=subject_id,
+        )
+        bump_data_version(db, user_id)
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        count_db_error(exc)
+        return _patch_error("Erreur lors de l'enregistrement des notes.", 500)
+
+    return jsonify(
+        {
+            "saved": len(rows),
+            "rows": [
+                {
+                    "eleve_id": r["id"],
+                    "row_version": r["row_version"] + 1,
+                    "activite": a,
+                    "moyenne": round(m, 2),
+                    "remarques": rem,
+                }
+                for r, a, m, rem in zip(rows, batch.activite.tolist(), batch.moyenne.tolist(), remarks)
+            ],
+        }
+    )
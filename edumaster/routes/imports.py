@@ -1,6 +1,7 @@
 import os
 import json
 import uuid
+import numpy as np
 import pandas as pd
 import openpyxl
 from io import BytesIO
@@ -8,9 +9,11 @@ from datetime import datetime
 from flask import Blueprint, render_template, request, session, redirect, url_for, flash, send_file
 
 from core.audit import log_change
+from core.data_version import bump_data_version
 from core.db import get_db
+from core.metrics import count_db_error, track_job
 from core.security import login_required, write_required
-from core.utils import clean_note, get_appreciation_dynamique
+from core.utils import clean_note, get_appreciation_dynamique, get_appreciation_rules
 from edumaster.services.common import (
     get_subjects,
     get_user_assignment_scope,
@@ -18,7 +21,14 @@ from edumaster.services.common import (
     resolve_school_year,
     select_subject_id,
 )
-from edumaster.services.grading import clean_component, split_activite_components, sum_activite_components
+from edumaster.services.grading import (
+    COMPONENT_FIELDS,
+    appreciation_messages,
+    clean_component,
+    compute_grades,
+    note_array,
+    split_activite_components,
+)
 from edumaster.services.import_utils import (
     preview_dir, cleanup_import_previews, get_preview_meta, clear_preview_meta,
     prepare_import_dataframe, build_default_mapping, resolve_mapped_column, row_value
@@ -306,10 +316,8 @@ def import_excel_apply():
     updated = 0
     skipped_sheets = 0
     skipped_rows = 0
-    use_components = any(
-        mapping.get(k)
-        for k in ("participation", "comportement", "cahier", "projet", "assiduite_outils")
-    )
+    use_components = any(mapping.get(k) for k in COMPONENT_FIELDS)
+    rules = get_appreciation_rules(user_id)
 
     for sheet_name, raw_df in (all_sheets or {}).items():
         prepared, _, _ = prepare_import_dataframe(raw_df)
@@ -325,7 +333,27 @@ def import_excel_apply():
             skipped_sheets += 1
             continue
 
-        for _, row in prepared.iterrows():
+        def sheet_column(key):
+            column = resolved.get(key)
+            if not column or column not in prepared.columns:
+                return np.zeros(len(prepared))
+            return note_array([None if pd.isna(v) else v for v in prepared[column].tolist()])
+
+        # Grades of the whole sheet in one kernel call; rows pick theirs by position.
+        batch = compute_grades(
+            sheet_column("devoir"),
+            sheet_column("compo"),
+            activite=sheet_column("activite"),
+            components=np.column_stack([sheet_column(k) for k in COMPONENT_FIELDS]) if use_components else None,
+            rules=rules,
+        )
+        sheet_remarks = appreciation_messages(batch, rules)
+        sheet_components = batch.components.tolist()
+        sheet_activite = batch.activite.tolist()
+        sheet_devoir = batch.devoir.tolist()
+        sheet_compo = batch.compo.tolist()
+
+        for pos, (_, row) in enumerate(prepared.iterrows()):
             try:
                 if resolved.get("full_name"):
                     full = str(row_value(row, resolved["full_name"]) or "").strip()
@@ -348,23 +376,9 @@ def import_excel_apply():
                 phone = str(row_value(row, resolved.get("phone")) or "").strip()
                 email = str(row_value(row, resolved.get("email")) or "").strip()
 
-                d = clean_note(row_value(row, resolved.get("devoir")))
-                c = clean_note(row_value(row, resolved.get("compo")))
-
-                if use_components:
-                    p = clean_component(row_value(row, resolved.get("participation")), 3)
-                    b = clean_component(row_value(row, resolved.get("comportement")), 6)
-                    k = clean_component(row_value(row, resolved.get("cahier")), 5)
-                    pr = clean_component(row_value(row, resolved.get("projet")), 4)
-                    ao = clean_component(row_value(row, resolved.get("assiduite_outils")), 2)
-                else:
-                    p, b, k, pr, ao = split_activite_components(
-                        row_value(row, resolved.get("activite"))
-                    )
-                a = sum_activite_components(p, b, k, pr, ao)
-
-                moy = ((d + a) / 2 + (c * 2)) / 3
-                rem = get_appreciation_dynamique(moy, user_id)
+                p, b, k, pr, ao = sheet_components[pos]
+                a, d, c = sheet_activite[pos], sheet_devoir[pos], sheet_compo[pos]
+                rem = sheet_remarks[pos]
                 custom_rem = row_value(row, resolved.get("remarques"))
                 if custom_rem is not None and str(custom_rem).strip():
                     rem = str(custom_rem).strip()
@@ -404,8 +418,8 @@ def import_excel_apply():
                     updated += 1
                 else:
                     cur = db.execute(
-                        f"INSERT INTO eleves (user_id, school_year, nom_complet, niveau, remarques_t{trim}, devoir_t{trim}, activite_t{trim}, compo_t{trim}, parent_phone, parent_email) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                        (user_id, selected_school_year, full, niveau, rem, d, a, c, phone, email),
+                        "INSERT INTO eleves (user_id, school_year, nom_complet, niveau, parent_phone, parent_email) VALUES (?, ?, ?, ?, ?, ?)",
+                        (user_id, selected_school_year, full, niveau, phone, email),
                     )
                     eleve_id = cur.lastrowid
                     db.execute(
@@ -431,13 +445,11 @@ def import_excel_apply():
                         (user_id, eleve_id, subject_id, int(trim), p, b, k, pr, ao, a, d, c, rem),
                     )
                     inserted += 1
-            except Exception:
+            except Exception as exc:
+                count_db_error(exc)
                 skipped_rows += 1
                 continue
 
-    db.commit()
-    clear_preview_meta(meta)
-
     total = inserted + updated
     log_change(
         "import_excel",
@@ -445,6 +457,10 @@ def import_excel_apply():
         details=f"{selected_school_year}: {total} lignes (new {inserted}, upd {updated}, sheets {skipped_sheets}, rows {skipped_rows})",
         subject_id=subject_id,
     )
+    bump_data_version(db, user_id)
+    db.commit()
+    clear_preview_meta(meta)
+
     flash(
         f"Import termine: {total} lignes (nouveaux {inserted}, maj {updated}, onglets ignores {skipped_sheets}, lignes ignorees {skipped_rows})",
         "success",
@@ -496,12 +512,13 @@ def import_scan_pdf():
 
     try:
         file.save(pdf_path)
-        extracted_rows = extract_rows_from_scanned_pdf(
-            pdf_path,
-            trim=trim,
-            subject_name=subject_name,
-            school_year=selected_school_year,
-        )
+        with track_job("ocr_scan"):
+            extracted_rows = extract_rows_from_scanned_pdf(
+                pdf_path,
+                trim=trim,
+                subject_name=subject_name,
+                school_year=selected_school_year,
+            )
         student_rows = _scan_students_for_scope(db, user_id, selected_school_year, scope)
         preview_rows = _build_scan_preview_rows(extracted_rows, student_rows)
         if not preview_rows:
@@ -619,13 +636,9 @@ def import_scan_apply():
             continue
 
         current = db.execute(
-            f"""
+            """
             SELECT
                 e.id,
-                e.devoir_t{trim} AS e_devoir,
-                e.activite_t{trim} AS e_activite,
-                e.compo_t{trim} AS e_compo,
-                e.remarques_t{trim} AS e_remarques,
                 n.participation,
                 n.comportement,
                 n.cahier,
@@ -650,14 +663,11 @@ def import_scan_apply():
             skipped += 1
             continue
 
-        current_activite = current["n_activite"] if current["n_activite"] is not None else current["e_activite"]
-        current_devoir = current["n_devoir"] if current["n_devoir"] is not None else current["e_devoir"]
-        current_compo = current["n_compo"] if current["n_compo"] is not None else current["e_compo"]
-        current_remarques = current["n_remarques"] if current["n_remarques"] not in (None, "") else current["e_remarques"]
+        current_remarques = current["n_remarques"] or ""
 
-        final_activite = activite if activite is not None else clean_note(current_activite)
-        final_devoir = devoir if devoir is not None else clean_note(current_devoir)
-        final_compo = compo if compo is not None else clean_note(current_compo)
+        final_activite = activite if activite is not None else clean_note(current["n_activite"])
+        final_devoir = devoir if devoir is not None else clean_note(current["n_devoir"])
+        final_compo = compo if compo is not None else clean_note(current["n_compo"])
 
         if activite is not None:
             participation, comportement, cahier, projet, assiduite_outils = split_activite_components(final_activite)
@@ -681,22 +691,6 @@ def import_scan_apply():
         moyenne = ((final_devoir + final_activite) / 2 + (final_compo * 2)) / 3
         final_remarques = remarques or current_remarques or get_appreciation_dynamique(moyenne, user_id)
 
-        db.execute(
-            f"""
-            UPDATE eleves
-            SET remarques_t{trim} = ?, devoir_t{trim} = ?, activite_t{trim} = ?, compo_t{trim} = ?
-            WHERE id = ? AND user_id = ? AND school_year = ?
-            """,
-            (
-                final_remarques,
-                final_devoir,
-                final_activite,
-                final_compo,
-                eleve_id,
-                user_id,
-                selected_school_year,
-            ),
-        )
         db.execute(
             """
             INSERT INTO notes (
@@ -735,15 +729,16 @@ def import_scan_apply():
         )
         updated += 1
 
-    db.commit()
-    _clear_scan_preview_meta(meta)
-
     log_change(
         "import_scan_pdf",
         user_id,
         details=f"{selected_school_year}: {updated} lignes maj, {unmatched} non rapprochees, {skipped} ignorees",
         subject_id=subject_id,
     )
+    bump_data_version(db, user_id)
+    db.commit()
+    _clear_scan_preview_meta(meta)
+
     category = "success" if updated else "warning"
     flash(
         f"Import PDF termine: {updated} lignes mises a jour, {unmatched} non rapprochees, {skipped} ignorees.",
@@ -838,9 +833,9 @@ def remplir_bulletin_officiel():
                         )
                         full = f"{nom} {prenom}".strip()
                         el = db.execute(
-                            f"""
+                            """
                             SELECT
-                                e.*,
+                                e.id,
                                 n.activite AS n_activite,
                                 n.devoir AS n_devoir,
                                 n.compo AS n_compo,
@@ -857,26 +852,10 @@ def remplir_bulletin_officiel():
                             (subject_id, int(trim), full, user_id, selected_school_year),
                         ).fetchone()
                         if el:
-                            activite_val = (
-                                el["n_activite"]
-                                if el["n_activite"] is not None
-                                else el[f"activite_t{trim}"]
-                            )
-                            devoir_val = (
-                                el["n_devoir"]
-                                if el["n_devoir"] is not None
-                                else el[f"devoir_t{trim}"]
-                            )
-                            compo_val = (
-                                el["n_compo"]
-                                if el["n_compo"] is not None
-                                else el[f"compo_t{trim}"]
-                            )
-                            rem_val = (
-                                el["n_remarques"]
-                                if el["n_remarques"] not in (None, "")
-                                else el[f"remarques_t{trim}"]
-                            )
+                            activite_val = el["n_activite"] or 0
+                            devoir_val = el["n_devoir"] or 0
+                            compo_val = el["n_compo"] or 0
+                            rem_val = el["n_remarques"] or ""
                             if "act" in col_map:
                                 sheet.cell(row=r, column=col_map["act"]).value = activite_val
                             if "dev" in col_map:
@@ -1,12 +1,66 @@
-"""Notifications blueprint — CRUD + badge API for unread notifications."""
+"""Notifications blueprint — CRUD, badge API and SSE stream for unread notifications."""
+import json
+import queue
 import time
-from flask import Blueprint, render_template, request, session, redirect, url_for, flash, jsonify
-from core.db import get_db
+from flask import Blueprint, Response, current_app, render_template, request, session, redirect, url_for, flash, jsonify
+from core import notification_bus
+from core.config import (
+    NOTIFICATIONS_KEEPALIVE_SECONDS,
+    NOTIFICATIONS_RETENTION_DAYS,
+    NOTIFICATIONS_STREAM_SECONDS,
+)
+from core.data_version import bump_data_version, bump_data_versions, get_data_version
+from core.db import close_db, get_db, short_connection
+from core.http_cache import etag_cached
 from core.security import login_required, admin_required
 
 bp = Blueprint("notifications", __name__)
 
 
+def _unread_count(db, user_id):
+    """Unread count from the per-process counter, recounted only when stale."""
+    versions = get_data_version(db, user_id)
+    if versions is not None:
+        cached = notification_bus.get_cached_unread(user_id, versions[1])
+        if cached is not None:
+            return cached
+    row = db.execute(
+        "SELECT COUNT(*) AS c FROM notifications WHERE user_id = ? AND is_read = 0",
+        (user_id,),
+    ).fetchone()
+    count = int(row["c"] or 0)
+    if versions is not None:
+        notification_bus.set_cached_unread(user_id, count, versions[1])
+    return count
+
+
+def _commit_unread_change(db, user_id, delta=0, reset=False):
+    """Bump the data version, commit, then update the counter and notify streams."""
+    bump_data_version(db, user_id)
+    # The write lock is held since the first write, so no other writer can
+    # have bumped in between: the previous version is exactly version - 1.
+    versions = get_data_version(db, user_id)
+    db.commit()
+    if versions is None:
+        count = _unread_count(db, user_id)
+        notification_bus.publish(user_id, "count", {"count": count})
+        return count
+    version = versions[1]
+    if reset:
+        notification_bus.set_cached_unread(user_id, 0, version)
+        count = 0
+    else:
+        count = notification_bus.adjust_cached_unread(user_id, delta, version - 1, version)
+        if count is None:
+            count = _unread_count(db, user_id)
+    notification_bus.publish(user_id, "count", {"count": count})
+    return count
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 @bp.route("/notifications")
 @login_required
 def index():
@@ -33,11 +87,11 @@ def index():
 def mark_read(notif_id):
     user_id = session["user_id"]
     db = get_db()
-    db.execute(
-        "UPDATE notifications SET is_read = 1 WHERE id = ? AND user_id = ?",
+    cur = db.execute(
+        "UPDATE notifications SET is_read = 1 WHERE id = ? AND user_id = ? AND is_read = 0",
         (notif_id, user_id),
     )
-    db.commit()
+    _commit_unread_change(db, user_id, delta=-cur.rowcount)
     return redirect(url_for("notifications.index"))
 
 
@@ -50,27 +104,172 @@ def mark_all_read():
         "UPDATE notifications SET is_read = 1 WHERE user_id = ?",
         (user_id,),
     )
-    db.commit()
+    _commit_unread_change(db, user_id, reset=True)
     flash("Toutes les notifications marquees comme lues.", "success")
     return redirect(url_for("notifications.index"))
 
 
 @bp.route("/api/notifications/count")
 @login_required
+@etag_cached
 def unread_count():
     user_id = session["user_id"]
-    db = get_db()
-    row = db.execute(
-        "SELECT COUNT(*) AS c FROM notifications WHERE user_id = ? AND is_read = 0",
-        (user_id,),
-    ).fetchone()
-    return jsonify({"count": int(row["c"] or 0)})
+    return jsonify({"count": _unread_count(get_db(), user_id)})
 
 
-def create_notification(db, user_id, title, body="", category="info"):
-    """Helper to create a notification programmatically."""
-    db.execute(
-        "INSERT INTO notifications (user_id, title, body, category, created_at) VALUES (?, ?, ?, ?, ?)",
-        (user_id, title, body, category, int(time.time())),
+@bp.route("/api/notifications/stream")
+@login_required
+def stream():
+    """Server-Sent Events: pushes `count` and `notification` events.
+
+    Only with NOTIFICATIONS_STREAM on; otherwise 204, which tells
+    EventSource not to reconnect (the badge polls the count instead). The
+    connection is closed after NOTIFICATIONS_STREAM_SECONDS and the
+    browser reconnects (EventSource `retry`). Keepalive ticks also recheck
+    the counter to pick up writes made by other worker processes, which
+    the in-process bus cannot see; each check opens and closes its own
+    connection, so no database connection is held while the stream waits.
+    """
+    if not current_app.config["NOTIFICATIONS_STREAM"]:
+        return Response(status=204)
+    user_id = session["user_id"]
+    # The request connection (if a hook opened one) is not needed any more.
+    close_db()
+
+    def unread():
+        with short_connection() as db:
+            return _unread_count(db, user_id)
+
+    def generate():
+        q = notification_bus.subscribe(user_id)
+        try:
+            count = unread()
+            yield "retry: 5000\n" + _sse("count", {"count": count})
+            deadline = time.monotonic() + NOTIFICATIONS_STREAM_SECONDS
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event, data = q.get(timeout=min(remaining, NOTIFICATIONS_KEEPALIVE_SECONDS))
+                except queue.Empty:
+                    latest = unread()
+                    if latest != count:
+                        count = latest
+                        yield _sse("count", {"count": count})
+                    else:
+                        yield ": keepalive\n\n"
+                    continue
+                if event == "count":
+                    count = data.get("count", count)
+                yield _sse(event, data)
+        finally:
+            notification_bus.unsubscribe(user_id, q)
+
+    # No stream_with_context: the generator needs neither the request nor
+    # the app context, and keeping them would keep their teardown waiting.
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def create_notification(db, user_id, title, body="", category="info", dedup_key=None):
+    """Helper to create a notification programmatically.
+
+    With a ``dedup_key``, a second notification carrying the same key for the
+    same user is ignored. Returns the new id, or None when deduplicated.
+    """
+    created_at = int(time.time())
+    cur = db.execute(
+        "INSERT OR IGNORE INTO notifications (user_id, title, body, category, created_at, dedup_key) VALUES (?, ?, ?, ?, ?, ?)",
+        (user_id, title, body, category, created_at, dedup_key),
+    )
+    if not cur.rowcount:
+        db.commit()
+        return None
+    notif_id = cur.lastrowid
+    _commit_unread_change(db, user_id, delta=1)
+    notification_bus.publish(
+        user_id,
+        "notification",
+        {"id": notif_id, "title": title, "body": body, "category": category, "created_at": created_at},
+    )
+    return notif_id
+
+
+def create_notifications_bulk(db, user_ids, title, body="", category="info", dedup_key=None):
+    """Fan one notification out to many users in a single transaction.
+
+    Rows are written with one ``executemany`` and one commit, whatever the
+    number of recipients. ``dedup_key`` makes the call idempotent per user,
+    and only the users who actually received a row get their data version
+    bumped. Returns the number of notifications actually inserted.
+    """
+    targets = sorted({int(uid) for uid in user_ids})
+    if not targets:
+        return 0
+    if dedup_key is not None:
+        # Read before the insert: a concurrent fan-out with the same key
+        # can only make us bump a user too many, never one too few.
+        already = {
+            r["user_id"]
+            for r in db.execute(
+                "SELECT user_id FROM notifications WHERE dedup_key = ? AND user_id IN (SELECT value FROM json_each(?))",
+                (dedup_key, json.dumps(targets)),
+            ).fetchall()
+        }
+        targets = [uid for uid in targets if uid not in already]
+        if not targets:
+            return 0
+    created_at = int(time.time())
+    before = db.total_changes
+    db.executemany(
+        "INSERT OR IGNORE INTO notifications (user_id, title, body, category, created_at, dedup_key) VALUES (?, ?, ?, ?, ?, ?)",
+        [(uid, title, body, category, created_at, dedup_key) for uid in targets],
     )
+    inserted = db.total_changes - before
+    if inserted:
+        bump_data_versions(db, targets)
     db.commit()
+    if not inserted:
+        return 0
+
+    # Only users with an open stream in this process need a fresh count;
+    # everyone else recounts lazily since their data version moved.
+    payload = {"title": title, "body": body, "category": category, "created_at": created_at}
+    for uid in notification_bus.subscribed_users().intersection(targets):
+        notification_bus.publish(uid, "count", {"count": _unread_count(db, uid)})
+        notification_bus.publish(uid, "notification", payload)
+    return inserted
+
+
+def prune_read_notifications(db, older_than_days=NOTIFICATIONS_RETENTION_DAYS, batch_size=500):
+    """Delete read notifications older than ``older_than_days``, in batches.
+
+    Each batch commits on its own so the write lock is never held for long.
+    Returns the number of deleted rows.
+    """
+    if not older_than_days or older_than_days <= 0:
+        return 0
+    cutoff = int(time.time()) - int(older_than_days) * 24 * 3600
+    deleted = 0
+    while True:
+        cur = db.execute(
+            """
+            DELETE FROM notifications
+            WHERE id IN (
+                SELECT id FROM notifications
+                WHERE is_read = 1 AND created_at < ?
+                ORDER BY created_at
+                LIMIT ?
+            )
+            """,
+            (cutoff, batch_size),
+        )
+        db.commit()
+        deleted += max(0, cur.rowcount)
+        if cur.rowcount < batch_size:
+            break
+    return deleted
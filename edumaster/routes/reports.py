@@ -7,6 +7,7 @@ from flask import Blueprint, render_template, request, session, redirect, url_fo
 
 from core.config import BASE_DIR
 from core.db import get_db
+from core.http_cache import etag_cached
 from core.security import login_required
 from edumaster.services.common import (
     arabize,
@@ -19,11 +20,13 @@ from edumaster.services.common import (
 from edumaster.services.filters import build_filters
 from edumaster.services.grading import note_expr
 from edumaster.services.reports import build_bulletin_multisubject
+from edumaster.services.stats_service import get_distribution_stats
 
 bp = Blueprint("reports", __name__)
 
 @bp.route("/bulletin/<int:id>")
 @login_required
+@etag_cached
 def bulletin(id: int):
     user_id = session["user_id"]
     trim = parse_trim(request.args.get("trimestre", "1"))
@@ -740,43 +743,24 @@ def export_stats_pdf():
     devoir_expr, activite_expr, compo_expr, remarques_expr, moy_expr = note_expr(trim)
     filters = build_filters(user_id, trim, request.args, selected_school_year, moy_expr, allowed_classes=(assignment_scope["classes"] if assignment_scope["restricted"] else None))
     niveau = filters["niveau"]
-    search = filters["search"]
     where = filters["where"]
     params = filters["params"]
-    join_params = [subject_id, int(trim)]
-
-    # Fetch stats exactly like in dashboard.stats
-    stats_row = db.execute(
-        f"SELECT COUNT(*) AS nb_total, SUM(CASE WHEN {moy_expr} > 0 THEN 1 ELSE 0 END) AS nb_saisis, SUM(CASE WHEN {moy_expr} >= 10 THEN 1 ELSE 0 END) AS nb_admis, AVG(CASE WHEN {moy_expr} > 0 THEN {moy_expr} END) AS moyenne_generale, MAX(CASE WHEN {moy_expr} > 0 THEN {moy_expr} END) AS meilleure_note, MIN(CASE WHEN {moy_expr} > 0 THEN {moy_expr} END) AS pire_note FROM eleves e LEFT JOIN notes n ON n.user_id = e.user_id AND n.eleve_id = e.id AND n.subject_id = ? AND n.trimestre = ? WHERE {where}",
-        join_params + params,
-    ).fetchone()
-
-    total = int(stats_row["nb_total"] or 0)
-    nb_admis = int(stats_row["nb_admis"] or 0)
-    moyenne_generale = round(float(stats_row["moyenne_generale"] or 0), 2)
-    meilleure_note = round(float(stats_row["meilleure_note"] or 0), 2)
-    pire_note = round(float(stats_row["pire_note"] or 0), 2)
-    taux_reussite = round((nb_admis / total) * 100, 1) if total else 0
-
-    class_rows = db.execute(
-        f"SELECT e.niveau, COUNT(*) AS total, AVG(CASE WHEN {moy_expr} > 0 THEN {moy_expr} END) AS avg_moy FROM eleves e LEFT JOIN notes n ON n.user_id = e.user_id AND n.eleve_id = e.id AND n.subject_id = ? AND n.trimestre = ? WHERE {where} GROUP BY e.niveau ORDER BY avg_moy DESC, e.niveau ASC",
-        join_params + params,
-    ).fetchall()
-
-    dist_row = db.execute(
-        f"SELECT SUM(CASE WHEN {moy_expr} >= 10 THEN 1 ELSE 0 END) AS admis, SUM(CASE WHEN {moy_expr} > 0 AND {moy_expr} < 10 THEN 1 ELSE 0 END) AS echec, SUM(CASE WHEN {moy_expr} <= 0 THEN 1 ELSE 0 END) AS non_saisi FROM eleves e LEFT JOIN notes n ON n.user_id = e.user_id AND n.eleve_id = e.id AND n.subject_id = ? AND n.trimestre = ? WHERE {where}",
-        join_params + params,
-    ).fetchone()
 
-    top_rows = db.execute(
-        f"SELECT e.nom_complet, e.niveau, ROUND({moy_expr}, 2) AS moyenne FROM eleves e LEFT JOIN notes n ON n.user_id = e.user_id AND n.eleve_id = e.id AND n.subject_id = ? AND n.trimestre = ? WHERE {where} ORDER BY moyenne DESC, e.nom_complet ASC LIMIT 10",
-        join_params + params,
-    ).fetchall()
-    
-    risk_rows = db.execute(
-        f"SELECT e.nom_complet, e.niveau, ROUND({moy_expr}, 2) AS moyenne FROM eleves e LEFT JOIN notes n ON n.user_id = e.user_id AND n.eleve_id = e.id AND n.subject_id = ? AND n.trimestre = ? WHERE {where} AND {moy_expr} > 0 AND {moy_expr} < 10 ORDER BY moyenne ASC, e.nom_complet ASC LIMIT 10",
-        join_params + params,
-    ).fetchall()
+    # Same cached computation as dashboard.stats
+    distribution = get_distribution_stats(
+        db, user_id, trim, subject_id, where, params, bins=request.args.get("bins", type=int)
+    )
+    stats = distribution["stats"]
+    total = stats["nb_total"]
+    nb_admis = stats["nb_admis"]
+    moyenne_generale = stats["moyenne_generale"]
+    meilleure_note = stats["meilleure_note"]
+    pire_note = stats["pire_note"]
+    taux_reussite = stats["taux_reussite"]
+    class_rows = distribution["classes"]
+    dist_row = distribution["distribution"]
+    top_rows = distribution["top"]
+    risk_rows = distribution["risk"]
 
     font_name = "Helvetica"
     font_bold = "Helvetica-Bold"
@@ -829,10 +813,39 @@ def export_stats_pdf():
     ]))
     elements.append(Spacer(1, 20))
 
+    # Dispersion and histogram of the graded moyennes
+    disp_data = [
+        [arabize("الانحراف المعياري"), "Q1 / Q3", arabize("الوسيط")],
+        [str(stats["ecart_type"]), f"{stats['q1']} / {stats['q3']}", str(stats["mediane"])],
+    ]
+    t_disp = Table(disp_data, colWidths=[170, 170, 170])
+    t_disp.setStyle(TableStyle([
+        ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
+        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+        ('FONTNAME', (0,0), (-1,0), font_bold),
+        ('GRID', (0,0), (-1,-1), 1, colors.black),
+    ]))
+    histogram = distribution["histogram"]
+    hist_data = [list(reversed(histogram["labels"])), [str(c) for c in reversed(histogram["counts"])]]
+    t_hist = Table(hist_data, colWidths=[520 / max(1, len(histogram["labels"]))] * len(histogram["labels"]))
+    t_hist.setStyle(TableStyle([
+        ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
+        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+        ('FONTSIZE', (0,0), (-1,-1), 8),
+        ('GRID', (0,0), (-1,-1), 1, colors.black),
+    ]))
+    elements.append(KeepTogether([
+        Paragraph(arabize("تشتت المعدلات"), h2_style),
+        t_disp,
+        Spacer(1, 8),
+        t_hist,
+    ]))
+    elements.append(Spacer(1, 20))
+
     # Classes Stats
     class_data = [[arabize("المعدل"), arabize("العدد"), arabize("القسم")]]
     for r in class_rows:
-        class_data.append([str(round(float(r["avg_moy"] or 0), 2)), str(r["total"]), arabize(str(r["niveau"]))])
+        class_data.append([str(r["moyenne"]), str(r["total"]), arabize(str(r["niveau"]))])
     if len(class_data) > 1:
         t_class = Table(class_data, colWidths=[100, 100, 200])
         t_class.setStyle(TableStyle([
@@ -856,7 +869,7 @@ def export_stats_pdf():
     # Distribution Note
     dist_data = [
         [arabize("غير مدخل"), arabize("راسب (< 10)"), arabize("ناجح (>= 10)")],
-        [str(dist_row["non_saisi"] or 0), str(dist_row["echec"] or 0), str(dist_row["admis"] or 0)]
+        [str(dist_row["non_saisi"]), str(dist_row["echec"]), str(dist_row["admis"])]
     ]
     t_dist = Table(dist_data, colWidths=[150, 150, 150])
     t_dist.setStyle(TableStyle([
@@ -876,7 +889,7 @@ def export_stats_pdf():
     # Top Students
     top_data = [[arabize("المعدل"), arabize("القسم"), arabize("الاسم واللقب"), arabize("الرتبة")]]
     for i, r in enumerate(top_rows, 1):
-        top_data.append([str(float(r["moyenne"])), arabize(r["niveau"]), arabize(r["nom_complet"]), str(i)])
+        top_data.append([str(r["moyenne"]), arabize(r["niveau"]), arabize(r["nom"]), str(i)])
     if len(top_data) > 1:
         t_top = Table(top_data, colWidths=[80, 100, 250, 50])
         t_top.setStyle(TableStyle([
@@ -901,7 +914,7 @@ def export_stats_pdf():
     # Risk Students
     risk_data = [[arabize("المعدل"), arabize("القسم"), arabize("الاسم واللقب")]]
     for r in risk_rows:
-        risk_data.append([str(float(r["moyenne"])), arabize(r["niveau"]), arabize(r["nom_complet"])])
+        risk_data.append([str(r["moyenne"]), arabize(r["niveau"]), arabize(r["nom"])])
     if len(risk_data) > 1:
         t_risk = Table(risk_data, colWidths=[80, 100, 250])
         t_risk.setStyle(TableStyle([
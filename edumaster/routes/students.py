@@ -1,8 +1,10 @@
 from flask import Blueprint, request, session, redirect, url_for, flash
 from core.audit import log_change
+from core.data_version import bump_data_version
 from core.db import get_db
+from core.metrics import count_db_error
 from core.security import login_required, write_required
-from core.utils import clean_note, get_appreciation_dynamique
+from core.utils import get_appreciation_rules
 from edumaster.services.common import (
     get_subjects,
     get_user_assignment_scope,
@@ -10,7 +12,12 @@ from edumaster.services.common import (
     resolve_school_year,
     select_subject_id,
 )
-from edumaster.services.grading import clean_component, split_activite_components, sum_activite_components, trim_columns
+from edumaster.services.grading import (
+    COMPONENT_FIELDS,
+    appreciation_messages,
+    compute_grades,
+    note_array,
+)
 
 bp = Blueprint("students", __name__)
 
@@ -20,23 +27,18 @@ bp = Blueprint("students", __name__)
 def ajouter_eleve():
     user_id = session["user_id"]
     trim = parse_trim(request.form.get("trimestre_ajout", "1"))
-    d = clean_note(request.form.get("devoir"))
-    c = clean_note(request.form.get("compo"))
-    p_raw = (request.form.get("participation") or "").strip()
-    b_raw = (request.form.get("comportement") or "").strip()
-    k_raw = (request.form.get("cahier") or "").strip()
-    pr_raw = (request.form.get("projet") or "").strip()
-    ao_raw = (request.form.get("assiduite_outils") or "").strip()
-    if any([p_raw, b_raw, k_raw, pr_raw, ao_raw]):
-        p = clean_component(p_raw, 3)
-        b = clean_component(b_raw, 6)
-        k = clean_component(k_raw, 5)
-        pr = clean_component(pr_raw, 4)
-        ao = clean_component(ao_raw, 2)
-    else:
-        p, b, k, pr, ao = split_activite_components(request.form.get("activite"))
-    a = sum_activite_components(p, b, k, pr, ao)
-    moy = ((d + a) / 2 + (c * 2)) / 3
+    raw_components = [(request.form.get(field) or "").strip() for field in COMPONENT_FIELDS]
+    rules = get_appreciation_rules(user_id)
+    batch = compute_grades(
+        note_array([request.form.get("devoir")]),
+        note_array([request.form.get("compo")]),
+        activite=note_array([request.form.get("activite")]),
+        components=note_array(raw_components)[None, :] if any(raw_components) else None,
+        rules=rules,
+    )
+    p, b, k, pr, ao = batch.components[0].tolist()
+    a, d, c = float(batch.activite[0]), float(batch.devoir[0]), float(batch.compo[0])
+    appreciation = appreciation_messages(batch, rules)[0]
 
     parent_phone = (request.form.get("parent_phone") or "").strip()
     parent_email = (request.form.get("parent_email") or "").strip()
@@ -63,23 +65,15 @@ def ajouter_eleve():
             flash("Classe non autorisee pour ce compte.", "warning")
             return redirect(request.referrer or url_for("dashboard.index", trimestre=trim, school_year=selected_school_year))
 
-    # Use safe column mapping instead of f-string interpolation
-    cols = trim_columns(trim)
-
     try:
         cur = db.execute(
-            f"INSERT INTO eleves (user_id, school_year, nom_complet, niveau, "
-            f"{cols['remarques']}, {cols['devoir']}, {cols['activite']}, {cols['compo']}, "
-            f"parent_phone, parent_email) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            "INSERT INTO eleves (user_id, school_year, nom_complet, niveau, parent_phone, parent_email) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
             (
                 user_id,
                 selected_school_year,
                 request.form["nom_complet"],
                 niveau,
-                get_appreciation_dynamique(moy, user_id),
-                d,
-                a,
-                c,
                 parent_phone,
                 parent_email,
             ),
@@ -106,13 +100,15 @@ def ajouter_eleve():
                 compo=excluded.compo,
                 remarques=excluded.remarques
             """,
-            (user_id, eleve_id, subject_id, int(trim), p, b, k, pr, ao, a, d, c, get_appreciation_dynamique(moy, user_id)),
+            (user_id, eleve_id, subject_id, int(trim), p, b, k, pr, ao, a, d, c, appreciation),
         )
 
-        db.commit()
         log_change("add_student", user_id, details=request.form.get("nom_complet", ""), eleve_id=eleve_id, subject_id=subject_id)
-    except Exception:
+        bump_data_version(db, user_id)
+        db.commit()
+    except Exception as exc:
         db.rollback()
+        count_db_error(exc)
         flash("Erreur lors de l'ajout de l'eleve.", "danger")
 
     return redirect(request.referrer or url_for("dashboard.index", trimestre=trim, school_year=selected_school_year))
@@ -161,10 +157,12 @@ def supprimer_multi():
                 f"DELETE FROM eleves WHERE id IN ({del_placeholders}) AND user_id = ? AND school_year = ?",
                 allowed_ids + [user_id, selected_school_year],
             )
-            db.commit()
             log_change("delete_students", user_id, details=f"{len(allowed_ids)} eleves")
+            bump_data_version(db, user_id)
+            db.commit()
             flash(f"Supprimes ({len(allowed_ids)})", "success")
-        except Exception:
+        except Exception as exc:
             db.rollback()
+            count_db_error(exc)
             flash("Erreur lors de la suppression.", "danger")
     return redirect(request.referrer or url_for("dashboard.index", school_year=selected_school_year))
@@ -0,0 +1,89 @@
+"""School-wide grade analytics read from the grade_rollups table.
+
+grade_rollups holds one row per (school_year, trimestre, subject, class,
+teacher) with the count, sum, sum of squares, min, max and pass count of the
+graded moyennes (see migration v9; triggers keep it current). Any coarser
+grouping is a SUM over those rows, so comparing hundreds of teachers reads a
+few hundred rollup rows instead of every grade.
+"""
+import math
+
+# group_by -> (select columns, GROUP BY expression)
+GROUP_DIMENSIONS = {
+    "teacher": ("r.user_id, u.nom_affichage, u.username", "r.user_id"),
+    "class": ("r.class_name", "r.class_name"),
+    "subject": ("MIN(s.name) AS subject_name", "LOWER(TRIM(s.name))"),
+    "trimestre": ("r.trimestre", "r.trimestre"),
+}
+
+
+def _summary(n, total, total_sq, low, high, passed) -> dict:
+    n = int(n or 0)
+    if not n:
+        return {"n": 0, "moyenne": 0, "ecart_type": 0, "min": 0, "max": 0, "passed": 0, "taux_reussite": 0}
+    mean = total / n
+    variance = max(0.0, total_sq / n - mean * mean)
+    return {
+        "n": n,
+        "moyenne": round(mean, 2),
+        "ecart_type": round(math.sqrt(variance), 2),
+        "min": round(low, 2),
+        "max": round(high, 2),
+        "passed": int(passed),
+        "taux_reussite": round(int(passed) / n * 100, 1),
+    }
+
+
+def school_analytics(db, school_year, trimestre=None, subject=None, group_by="teacher") -> dict:
+    """
+    Graded moyennes of `school_year` grouped by teacher, class, subject
+    (by name, across teachers) or trimestre, best average first.
+    """
+    if group_by not in GROUP_DIMENSIONS:
+        group_by = "teacher"
+    columns, group_expr = GROUP_DIMENSIONS[group_by]
+    where = ["r.school_year = ?"]
+    params = [school_year]
+    if trimestre:
+        where.append("r.trimestre = ?")
+        params.append(int(trimestre))
+    if subject:
+        where.append("LOWER(TRIM(s.name)) = LOWER(TRIM(?))")
+        params.append(subject)
+    rows = db.execute(
+        f"""
+        SELECT {columns},
+               SUM(r.n) AS n, SUM(r.total) AS total, SUM(r.total_sq) AS total_sq,
+               MIN(r.min_moy) AS min_moy, MAX(r.max_moy) AS max_moy, SUM(r.passed) AS passed,
+               COUNT(*) AS rollup_rows
+        FROM grade_rollups r
+        JOIN users u ON u.id = r.user_id
+        JOIN subjects s ON s.id = r.subject_id
+        WHERE {" AND ".join(where)}
+        GROUP BY {group_expr}
+        """,
+        params,
+    ).fetchall()
+
+    items = []
+    overall = [0, 0.0, 0.0, None, None, 0]
+    for r in rows:
+        item = {k: r[k] for k in r.keys() if k not in ("n", "total", "total_sq", "min_moy", "max_moy", "passed")}
+        item.update(_summary(r["n"], r["total"], r["total_sq"], r["min_moy"], r["max_moy"], r["passed"]))
+        items.append(item)
+        overall[0] += int(r["n"] or 0)
+        overall[1] += r["total"] or 0.0
+        overall[2] += r["total_sq"] or 0.0
+        if r["min_moy"] is not None:
+            overall[3] = r["min_moy"] if overall[3] is None else min(overall[3], r["min_moy"])
+            overall[4] = r["max_moy"] if overall[4] is None else max(overall[4], r["max_moy"])
+        overall[5] += int(r["passed"] or 0)
+    items.sort(key=lambda item: (-item["moyenne"], -item["n"]))
+    return {
+        "school_year": school_year,
+        "trimestre": int(trimestre) if trimestre else None,
+        "subject": subject or None,
+        "group_by": group_by,
+        "overall": _summary(*overall),
+        "items": items,
+    }
@@ -44,11 +44,13 @@ def ensure_school_years(db):
         "SELECT id FROM school_years WHERE label = ?",
         (current_label,),
     ).fetchone()
-    db.execute(
-        "INSERT OR IGNORE INTO school_years (label, is_active) VALUES (?, 0)",
-        (current_label,),
-    )
+    # Only write when needed: even an ignored INSERT opens a write
+    # transaction that would hold the database lock until the request ends.
     if not existing_current:
+        db.execute(
+            "INSERT OR IGNORE INTO school_years (label, is_active) VALUES (?, 0)",
+            (current_label,),
+        )
         changed = True
     active = db.execute(
         "SELECT id, label FROM school_years WHERE COALESCE(is_active, 0) = 1 ORDER BY id LIMIT 1"
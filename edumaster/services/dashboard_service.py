@@ -1,6 +1,8 @@
 """Dashboard business logic extracted from routes/dashboard.py."""
 
-from edumaster.services.grading import note_expr, split_activite_components
+import numpy as np
+
+from edumaster.services.grading import COMPONENT_FIELDS, compute_grades, moyenne_expr, note_array, note_expr
 
 
 def compute_stats_summary(db, user_id, trim, subject_id, where, params):
@@ -68,7 +70,8 @@ def fetch_students_page(db, user_id, trim, subject_id, where, params,
           {activite_expr} AS activite,
           {compo_expr} AS compo,
           {remarques_expr} AS remarques,
-          ROUND({moy_expr}, 2) AS moyenne
+          ROUND({moy_expr}, 2) AS moyenne,
+          COALESCE(n.row_version, 0) AS row_version
         FROM eleves e
         LEFT JOIN notes n ON n.user_id = e.user_id AND n.eleve_id = e.id AND n.subject_id = ? AND n.trimestre = ?
         WHERE {where}
@@ -78,24 +81,27 @@ def fetch_students_page(db, user_id, trim, subject_id, where, params,
         join_params + params + [per_page, offset],
     ).fetchall()
 
-    eleves = []
-    for r in rows:
-        p = float(r["participation"] or 0)
-        b = float(r["comportement"] or 0)
-        k = float(r["cahier"] or 0)
-        pr = float(r["projet"] or 0)
-        ao = float(r["assiduite_outils"] or 0)
-        activite_value = float(r["activite"] or 0)
-        if activite_value > 0 and p == 0 and b == 0 and k == 0 and pr == 0 and ao == 0:
-            p, b, k, pr, ao = split_activite_components(activite_value)
+    activites = note_array([r["activite"] for r in rows])
+    components = np.array([[r[f] or 0 for f in COMPONENT_FIELDS] for r in rows], dtype=float).reshape(-1, 5)
+    # Rows saved before the component split only carry the activite total.
+    components[~components.any(axis=1)] = np.nan
+    batch = compute_grades(
+        note_array([r["devoir"] for r in rows]),
+        note_array([r["compo"] for r in rows]),
+        activite=activites,
+        components=components,
+    )
 
+    eleves = []
+    for r, comps, a in zip(rows, batch.components.tolist(), activites.tolist()):
+        p, b, k, pr, ao = comps
         eleves.append({
             "id": r["id"],
             "nom_complet": r["nom_complet"],
             "niveau": r["niveau"],
             "remarques": r["remarques"],
             "devoir": float(r["devoir"] or 0),
-            "activite": activite_value,
+            "activite": a,
             "compo": float(r["compo"] or 0),
             "participation": p,
             "comportement": b,
@@ -103,6 +109,7 @@ def fetch_students_page(db, user_id, trim, subject_id, where, params,
             "projet": pr,
             "assiduite_outils": ao,
             "moyenne": float(r["moyenne"] or 0),
+            "row_version": r["row_version"],
         })
     return eleves
 
@@ -202,9 +209,9 @@ def compute_chart_data(db, user_id, trim, subject_id, where, params,
     ]
 
     # Progression across trimesters
-    m1 = "((COALESCE(n1.devoir, e.devoir_t1) + COALESCE(n1.activite, e.activite_t1))/2.0 + (COALESCE(n1.compo, e.compo_t1) * 2.0))/3.0"
-    m2 = "((COALESCE(n2.devoir, e.devoir_t2) + COALESCE(n2.activite, e.activite_t2))/2.0 + (COALESCE(n2.compo, e.compo_t2) * 2.0))/3.0"
-    m3 = "((COALESCE(n3.devoir, e.devoir_t3) + COALESCE(n3.activite, e.activite_t3))/2.0 + (COALESCE(n3.compo, e.compo_t3) * 2.0))/3.0"
+    m1 = moyenne_expr("n1")
+    m2 = moyenne_expr("n2")
+    m3 = moyenne_expr("n3")
 
     progress_where = "e.user_id = ? AND e.school_year = ?"
     progress_params = [user_id, selected_school_year]
@@ -1,4 +1,4 @@
-from .grading import parse_float
+from .grading import moyenne_expr, parse_float
 from .import_utils import parse_date
 
 def build_filters(user_id, trim, args, school_year_label, moy_expr_override=None, allowed_classes=None):
@@ -15,11 +15,7 @@ def build_filters(user_id, trim, args, school_year_label, moy_expr_override=None
     if order not in ("asc", "desc"):
         order = "asc"
 
-    moy_expr = (
-        moy_expr_override
-        if moy_expr_override
-        else f"((devoir_t{trim} + activite_t{trim})/2.0 + (compo_t{trim}*2.0))/3.0"
-    )
+    moy_expr = moy_expr_override or moyenne_expr()
     where = "e.user_id = ? AND e.school_year = ?"
     params = [user_id, school_year_label]
 
@@ -86,6 +82,8 @@ def build_history_filters(user_id, args):
 
     where = "l.user_id = ?"
     params = [user_id]
+    from_ts = None
+    to_ts = None
 
     if action:
         where += " AND l.action = ?"
@@ -97,12 +95,14 @@ def build_history_filters(user_id, args):
         where += " AND (l.details LIKE ? OR e.nom_complet LIKE ?)"
         params.extend([f"%{q}%", f"%{q}%"])
     if date_from:
+        from_ts = int(date_from.timestamp())
         where += " AND l.created_at >= ?"
-        params.append(int(date_from.timestamp()))
+        params.append(from_ts)
     if date_to:
         end = date_to.replace(hour=23, minute=59, second=59)
+        to_ts = int(end.timestamp())
         where += " AND l.created_at <= ?"
-        params.append(int(end.timestamp()))
+        params.append(to_ts)
 
     return {
         "where": where,
@@ -112,4 +112,6 @@ def build_history_filters(user_id, args):
         "subject_id": subject_id,
         "date_from": date_from_raw,
         "date_to": date_to_raw,
+        "from_ts": from_ts,
+        "to_ts": to_ts,
     }
@@ -1,8 +1,13 @@
+from dataclasses import dataclass
+
+import numpy as np
+
 from core.utils import clean_note
 
 # ── Safe trimester column mapping ──────────────────────────────────
-# Whitelist of allowed trimester values → column name suffixes.
-# This prevents SQL injection via f-string interpolation.
+# Whitelist of allowed trimester values → legacy eleves column names.
+# Grades now live in notes only (migration v10 backfilled these columns);
+# the mapping stays for code that still inspects the old columns.
 _TRIM_COLS = {
     "1": {"devoir": "devoir_t1", "activite": "activite_t1", "compo": "compo_t1", "remarques": "remarques_t1"},
     "2": {"devoir": "devoir_t2", "activite": "activite_t2", "compo": "compo_t2", "remarques": "remarques_t2"},
@@ -66,12 +71,129 @@ def split_activite_components(total):
         remaining = round(max(0.0, remaining - take), 2)
     return tuple(values)
 
-def note_expr(trim):
-    """Build SQL expressions for a given trimester using safe column mapping."""
-    cols = trim_columns(trim)
-    devoir = f"COALESCE(n.devoir, e.{cols['devoir']})"
-    activite = f"COALESCE(n.activite, e.{cols['activite']})"
-    compo = f"COALESCE(n.compo, e.{cols['compo']})"
-    remarques = f"COALESCE(n.remarques, e.{cols['remarques']})"
-    moy_expr = f"(({devoir} + {activite})/2.0 + ({compo}*2.0))/3.0"
-    return devoir, activite, compo, remarques, moy_expr
+def moyenne_expr(alias="n"):
+    """SQL moyenne of the notes row `alias` (LEFT JOINed: no row reads as 0)."""
+    return (
+        f"((COALESCE({alias}.devoir, 0) + COALESCE({alias}.activite, 0))/2.0"
+        f" + (COALESCE({alias}.compo, 0)*2.0))/3.0"
+    )
+
+
+def note_expr(trim, alias="n"):
+    """Build SQL expressions for a given trimester, read from notes only.
+
+    `trim` is validated (ValueError otherwise); the trimester itself goes
+    in the notes join condition.
+    """
+    validated_trim(trim)
+    devoir = f"COALESCE({alias}.devoir, 0)"
+    activite = f"COALESCE({alias}.activite, 0)"
+    compo = f"COALESCE({alias}.compo, 0)"
+    remarques = f"COALESCE({alias}.remarques, '')"
+    return devoir, activite, compo, remarques, moyenne_expr(alias)
+
+
+# ── Vectorized grading kernel ──────────────────────────────────────
+# moyenne = ((devoir + activite) / 2 + compo * 2) / 3, computed for whole
+# columns at once. The scalar helpers above stay the reference semantics.
+COMPONENT_FIELDS = ("participation", "comportement", "cahier", "projet", "assiduite_outils")
+COMPONENT_CAPS = np.array([3.0, 6.0, 5.0, 4.0, 2.0])
+_COMPONENT_FLOORS = np.concatenate(([0.0], np.cumsum(COMPONENT_CAPS)[:-1]))
+ADMIS_THRESHOLD = 10.0
+
+
+def note_array(values, missing=0.0) -> np.ndarray:
+    """Column of raw inputs (form strings, cells, DB values) cleaned like
+    clean_note: comma decimals, clamped to [0, 20], garbage -> 0.
+    None/empty become `missing` (pass np.nan to keep them apart)."""
+    out = np.empty(len(values), dtype=float)
+    for i, value in enumerate(values):
+        if value is None or value == "":
+            out[i] = missing
+        elif isinstance(value, (int, float)):
+            out[i] = value
+        elif isinstance(value, str):
+            # float() already ignores surrounding whitespace; NaN/inf are
+            # folded by the clip below, as clean_note does.
+            try:
+                out[i] = float(value.replace(",", "."))
+            except ValueError:
+                out[i] = 0.0
+        else:
+            out[i] = clean_note(value)
+    present = ~np.isnan(out) if np.isnan(missing) else np.ones(len(out), dtype=bool)
+    out[present] = np.clip(np.nan_to_num(out[present], nan=0.0), 0.0, 20.0)
+    return out
+
+
+def split_activite_array(activite) -> np.ndarray:
+    """split_activite_components for a column: (n,) totals -> (n, 5) scores."""
+    total = np.clip(np.nan_to_num(np.asarray(activite, dtype=float), nan=0.0), 0.0, 20.0)
+    return np.round(np.clip(total[:, None] - _COMPONENT_FLOORS, 0.0, COMPONENT_CAPS), 2)
+
+
+@dataclass(frozen=True)
+class GradeBatch:
+    devoir: np.ndarray
+    compo: np.ndarray
+    activite: np.ndarray
+    components: np.ndarray  # (n, 5), COMPONENT_FIELDS order
+    moyenne: np.ndarray  # NaN where devoir or compo is missing
+    admis: np.ndarray
+    appreciation: np.ndarray  # index into the rules, -1 when none matches
+
+    def __len__(self) -> int:
+        return len(self.moyenne)
+
+
+def compute_grades(devoir, compo, activite=None, components=None, rules=()) -> GradeBatch:
+    """
+    Grade a whole column of students in one call.
+
+    `components` is an (n, 5) array of component scores, each capped to its
+    maximum; rows where every component is NaN (or all rows, when omitted)
+    are split from `activite` instead. `rules` is a sequence of
+    (min_val, max_val, ...) tuples ordered by min_val, as returned by
+    core.utils.get_appreciation_rules; the first matching rule wins.
+    """
+    devoir = np.asarray(devoir, dtype=float)
+    compo = np.asarray(compo, dtype=float)
+    n = len(devoir)
+    split = split_activite_array(np.zeros(n) if activite is None else activite)
+    if components is None:
+        comps = split
+    else:
+        comps = np.asarray(components, dtype=float).reshape(n, len(COMPONENT_FIELDS))
+        unset = np.isnan(comps).all(axis=1)
+        comps = np.round(np.minimum(np.nan_to_num(comps, nan=0.0), COMPONENT_CAPS), 2)
+        comps[unset] = split[unset]
+    act = np.round(comps.sum(axis=1), 2)
+    moyenne = ((devoir + act) / 2 + compo * 2) / 3
+    with np.errstate(invalid="ignore"):
+        admis = moyenne >= ADMIS_THRESHOLD
+    return GradeBatch(
+        devoir=devoir,
+        compo=compo,
+        activite=act,
+        components=comps,
+        moyenne=moyenne,
+        admis=admis,
+        appreciation=appreciation_index(moyenne, rules),
+    )
+
+
+def appreciation_index(moyenne, rules) -> np.ndarray:
+    moyenne = np.asarray(moyenne, dtype=float)
+    index = np.full(len(moyenne), -1, dtype=np.int64)
+    # Walk backwards so the first matching rule overwrites later ones.
+    for i in range(len(rules) - 1, -1, -1):
+        low, high = rules[i][0], rules[i][1]
+        with np.errstate(invalid="ignore"):
+            index[(moyenne >= low) & (moyenne <= high)] = i
+    return index
+
+
+def appreciation_messages(batch: GradeBatch, rules) -> list:
+    """Appreciation text per row; "" where no rule matches."""
+    messages = [rule[2] for rule in rules] + [""]
+    return [messages[i] for i in batch.appreciation.tolist()]
@@ -1,4 +1,4 @@
-from .grading import note_expr
+from .grading import moyenne_expr, note_expr
 
 def build_bulletin_multisubject(db, user_id: int, eleve_id: int, trim: str, school_year: str):
     eleve = db.execute(
@@ -72,7 +72,7 @@ def build_bulletin_multisubject(db, user_id: int, eleve_id: int, trim: str, scho
         f"""
         SELECT
             e.id,
-            AVG(((COALESCE(n.devoir, e.devoir_t{trim}) + COALESCE(n.activite, e.activite_t{trim}))/2.0 + (COALESCE(n.compo, e.compo_t{trim}) * 2.0))/3.0) AS moyenne_generale
+            AVG({moyenne_expr('n')}) AS moyenne_generale
         FROM eleves e
         JOIN subjects s ON s.user_id = e.user_id
         LEFT JOIN notes n
@@ -0,0 +1,229 @@
+"""Set-based copy of students and teacher assignments between school years.
+
+The copy is a handful of ``INSERT ... SELECT`` statements instead of one
+``execute`` per student. Name/class normalisation and class promotion run
+as SQLite functions registered on the connection, so they keep Python's
+Unicode ``strip``/``lower``/``upper`` semantics (accented and Arabic names
+dedup exactly as before). Keys already present in the target year are
+loaded into an indexed temp table and excluded with ``NOT EXISTS``;
+duplicates inside the source year keep their earliest row (lowest id).
+
+Planning happens in temp tables before the first write, so the write lock
+on the main database is only held for the final inserts, and a dry run
+reports the same counts without writing anything.
+"""
+import re
+import time
+from dataclasses import dataclass
+
+CLASS_MODES = ("keep", "auto_promote")
+
+
+def normalize_class_name(value: str) -> str:
+    return (value or "").strip().upper()
+
+
+def promote_class_name(value: str) -> str:
+    raw = normalize_class_name(value)
+    match = re.match(r"^(\d+)(.*)$", raw)
+    if not match:
+        return raw
+    level = int(match.group(1))
+    suffix = match.group(2) or ""
+    return f"{level + 1}{suffix}"
+
+
+def _map_class(value, mode):
+    if mode == "auto_promote":
+        return promote_class_name(value)
+    return normalize_class_name(value)
+
+
+def _register_functions(db) -> None:
+    db.create_function("edu_trim", 1, lambda v: (v or "").strip(), deterministic=True)
+    db.create_function("edu_name_key", 1, lambda v: (v or "").strip().lower(), deterministic=True)
+    db.create_function("edu_class", 1, normalize_class_name, deterministic=True)
+    db.create_function("edu_map_class", 2, _map_class, deterministic=True)
+
+
+@dataclass(frozen=True)
+class CloneResult:
+    source_students: int
+    inserted: int
+    skipped: int
+    promoted: int
+    assignments: int
+    dry_run: bool
+    # Time spent in the statements that write to the main database, i.e.
+    # how long the clone holds SQLite's write lock before the commit.
+    write_seconds: float = 0.0
+
+
+# Class names are few: normalise/promote each distinct value once.
+_PLAN_CLASSES = """
+INSERT INTO _clone_classes (raw, src, dst)
+SELECT raw, edu_class(raw), edu_map_class(raw, :mode)
+FROM (
+    SELECT DISTINCT niveau AS raw FROM eleves WHERE school_year IN (:source, :target)
+    UNION
+    SELECT DISTINCT class_name FROM teacher_assignments WHERE school_year IN (:source, :target)
+)
+"""
+
+# First row per (teacher, name, target class) in id order wins the key;
+# empty names and keys already in the target year are removed afterwards.
+_PLAN_STUDENTS = """
+INSERT OR IGNORE INTO _clone_students (user_id, nkey, niveau, id, nom, phone, email, promoted)
+SELECT
+    e.user_id,
+    edu_name_key(e.nom_complet),
+    c.dst,
+    e.id,
+    edu_trim(e.nom_complet),
+    edu_trim(e.parent_phone),
+    edu_trim(e.parent_email),
+    c.dst <> c.src
+FROM eleves e
+JOIN _clone_classes c ON c.raw = e.niveau
+WHERE e.school_year = :source AND c.dst <> ''
+ORDER BY e.id
+"""
+
+_PRUNE_STUDENTS = """
+DELETE FROM _clone_students
+WHERE nom = ''
+   OR EXISTS (
+       SELECT 1 FROM _clone_student_keys k
+       WHERE k.user_id = _clone_students.user_id
+         AND k.nkey = _clone_students.nkey
+         AND k.niveau = _clone_students.niveau
+   )
+"""
+
+_PLAN_ASSIGNMENTS = """
+CREATE TEMP TABLE _clone_assignments AS
+SELECT DISTINCT a.user_id, a.subject_id, c.dst AS class_name
+FROM teacher_assignments a
+JOIN _clone_classes c ON c.raw = a.class_name
+WHERE a.school_year = :source
+  AND c.dst <> ''
+  AND NOT EXISTS (
+      SELECT 1 FROM _clone_assignment_keys k
+      WHERE k.user_id = a.user_id AND k.subject_id = a.subject_id AND k.class_name = c.dst
+  )
+"""
+
+_TEMP_TABLES = (
+    "_clone_classes",
+    "_clone_students",
+    "_clone_student_keys",
+    "_clone_assignments",
+    "_clone_assignment_keys",
+)
+
+
+def _drop_temp_tables(db) -> None:
+    for name in _TEMP_TABLES:
+        db.execute(f"DROP TABLE IF EXISTS temp.{name}")
+
+
+def clone_school_year(
+    db,
+    source_year: str,
+    target_year: str,
+    class_mode: str = "keep",
+    copy_assignments: bool = True,
+    dry_run: bool = False,
+) -> CloneResult:
+    """
+    Copy the students (and optionally teacher assignments) of `source_year`
+    into `target_year`. Does not commit: the caller commits (or rolls back),
+    so the copy can share a transaction with other changes.
+    """
+    if class_mode not in CLASS_MODES:
+        class_mode = "keep"
+    params = {"source": source_year, "target": target_year, "mode": class_mode}
+    _register_functions(db)
+    _drop_temp_tables(db)
+    try:
+        db.execute("CREATE TEMP TABLE _clone_classes (raw TEXT PRIMARY KEY, src TEXT, dst TEXT) WITHOUT ROWID")
+        db.execute(_PLAN_CLASSES, params)
+        db.execute(
+            "CREATE TEMP TABLE _clone_student_keys ("
+            "user_id INTEGER, nkey TEXT, niveau TEXT, PRIMARY KEY (user_id, nkey, niveau)) WITHOUT ROWID"
+        )
+        db.execute(
+            """
+            INSERT OR IGNORE INTO _clone_student_keys (user_id, nkey, niveau)
+            SELECT e.user_id, edu_name_key(e.nom_complet), c.src
+            FROM eleves e JOIN _clone_classes c ON c.raw = e.niveau
+            WHERE e.school_year = :target
+            """,
+            params,
+        )
+        db.execute(
+            "CREATE TEMP TABLE _clone_students ("
+            "user_id INTEGER, nkey TEXT, niveau TEXT, id INTEGER, nom TEXT, phone TEXT, email TEXT, "
+            "promoted INTEGER, PRIMARY KEY (user_id, nkey, niveau)) WITHOUT ROWID"
+        )
+        db.execute(_PLAN_STUDENTS, params)
+        db.execute(_PRUNE_STUDENTS)
+
+        source_students = db.execute(
+            "SELECT COUNT(*) AS c FROM eleves WHERE school_year = ?", (source_year,)
+        ).fetchone()[0]
+        planned = db.execute(
+            "SELECT COUNT(*) AS c, COALESCE(SUM(promoted), 0) AS p FROM _clone_students"
+        ).fetchone()
+        inserted, promoted = int(planned[0]), int(planned[1])
+
+        assignments = 0
+        if copy_assignments:
+            db.execute(
+                "CREATE TEMP TABLE _clone_assignment_keys ("
+                "user_id INTEGER, subject_id INTEGER, class_name TEXT, "
+                "PRIMARY KEY (user_id, subject_id, class_name)) WITHOUT ROWID"
+            )
+            db.execute(
+                """
+                INSERT OR IGNORE INTO _clone_assignment_keys (user_id, subject_id, class_name)
+                SELECT a.user_id, a.subject_id, c.src
+                FROM teacher_assignments a JOIN _clone_classes c ON c.raw = a.class_name
+                WHERE a.school_year = :target
+                """,
+                params,
+            )
+            db.execute(_PLAN_ASSIGNMENTS, params)
+            assignments = db.execute("SELECT COUNT(*) FROM _clone_assignments").fetchone()[0]
+
+        write_seconds = 0.0
+        if not dry_run:
+            started = time.perf_counter()
+            db.execute(
+                """
+                INSERT INTO eleves (user_id, school_year, nom_complet, niveau, parent_phone, parent_email)
+                SELECT user_id, ?, nom, niveau, phone, email FROM _clone_students ORDER BY id
+                """,
+                (target_year,),
+            )
+            if copy_assignments:
+                db.execute(
+                    """
+                    INSERT OR IGNORE INTO teacher_assignments (user_id, school_year, subject_id, class_name)
+                    SELECT user_id, ?, subject_id, class_name FROM _clone_assignments
+                    """,
+                    (target_year,),
+                )
+            write_seconds = time.perf_counter() - started
+    finally:
+        _drop_temp_tables(db)
+
+    return CloneResult(
+        source_students=int(source_students),
+        inserted=inserted,
+        skipped=int(source_students) - inserted,
+        promoted=promoted,
+        assignments=int(assignments),
+        dry_run=dry_run,
+        write_seconds=round(write_seconds, 4),
+    )
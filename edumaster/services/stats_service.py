@@ -1,4 +1,26 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from core.config import STATS_CACHE_SIZE, STATS_HISTOGRAM_BINS
+from core.data_version import get_data_version
 from core.db import get_db
+from core.metrics import register_cache
+from edumaster.services.grading import COMPONENT_CAPS, COMPONENT_FIELDS, compute_grades, moyenne_expr, note_expr
+
+COMPONENT_LABELS = {
+    "participation": "Participation",
+    "comportement": "Comportement",
+    "cahier": "Cahier",
+    "projet": "Projet",
+    "assiduite_outils": "Assiduité / outils",
+}
+MAX_HISTOGRAM_BINS = 40
+
+_cache_lock = threading.Lock()
+_cache = OrderedDict()
+_cache_counts = {"hits": 0, "misses": 0}
 
 def get_class_evolution(user_id, subject_id, school_year):
     """
@@ -8,9 +30,9 @@ def get_class_evolution(user_id, subject_id, school_year):
     db = get_db()
     
     # Formules pour chaque trimestre
-    m1 = "((COALESCE(n1.devoir, e.devoir_t1) + COALESCE(n1.activite, e.activite_t1))/2.0 + (COALESCE(n1.compo, e.compo_t1) * 2.0))/3.0"
-    m2 = "((COALESCE(n2.devoir, e.devoir_t2) + COALESCE(n2.activite, e.activite_t2))/2.0 + (COALESCE(n2.compo, e.compo_t2) * 2.0))/3.0"
-    m3 = "((COALESCE(n3.devoir, e.devoir_t3) + COALESCE(n3.activite, e.activite_t3))/2.0 + (COALESCE(n3.compo, e.compo_t3) * 2.0))/3.0"
+    m1 = moyenne_expr("n1")
+    m2 = moyenne_expr("n2")
+    m3 = moyenne_expr("n3")
 
     rows = db.execute(
         f"""
@@ -45,9 +67,9 @@ def get_best_students_evolution(user_id, subject_id, school_year, limit=5):
     """
     db = get_db()
     
-    m1 = "((COALESCE(n1.devoir, e.devoir_t1) + COALESCE(n1.activite, e.activite_t1))/2.0 + (COALESCE(n1.compo, e.compo_t1) * 2.0))/3.0"
-    m2 = "((COALESCE(n2.devoir, e.devoir_t2) + COALESCE(n2.activite, e.activite_t2))/2.0 + (COALESCE(n2.compo, e.compo_t2) * 2.0))/3.0"
-    m3 = "((COALESCE(n3.devoir, e.devoir_t3) + COALESCE(n3.activite, e.activite_t3))/2.0 + (COALESCE(n3.compo, e.compo_t3) * 2.0))/3.0"
+    m1 = moyenne_expr("n1")
+    m2 = moyenne_expr("n2")
+    m3 = moyenne_expr("n3")
     
     # Moyenne annuelle (approximative si notes manquantes)
     m_annual = f"(COALESCE({m1},0) + COALESCE({m2},0) + COALESCE({m3},0)) / (CASE WHEN {m1}>0 THEN 1 ELSE 0 END + CASE WHEN {m2}>0 THEN 1 ELSE 0 END + CASE WHEN {m3}>0 THEN 1 ELSE 0 END)"
@@ -83,3 +105,180 @@ def get_best_students_evolution(user_id, subject_id, school_year, limit=5):
         }
         for r in rows
     ]
+
+
+def _histogram(values, bins, upper):
+    counts, edges = np.histogram(values, bins=bins, range=(0.0, upper))
+    edges = [round(float(e), 2) for e in edges]
+    return {
+        "edges": edges,
+        "counts": counts.tolist(),
+        "labels": [f"{edges[i]:g}-{edges[i + 1]:g}" for i in range(len(edges) - 1)],
+    }
+
+
+def _describe(values):
+    """Résumé d'une colonne (valeurs déjà filtrées); zéros si vide."""
+    if not len(values):
+        return {"moyenne": 0, "mediane": 0, "q1": 0, "q3": 0, "ecart_type": 0, "min": 0, "max": 0}
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    return {
+        "moyenne": round(float(values.mean()), 2),
+        "mediane": round(float(median), 2),
+        "q1": round(float(q1), 2),
+        "q3": round(float(q3), 2),
+        "ecart_type": round(float(values.std()), 2),
+        "min": round(float(values.min()), 2),
+        "max": round(float(values.max()), 2),
+    }
+
+
+def _ranked(order, names, niveaux, rounded, limit):
+    rounded = np.nan_to_num(rounded, nan=0.0)
+    return [
+        {"nom": names[i], "niveau": niveaux[i], "moyenne": float(rounded[i])}
+        for i in order[:limit].tolist()
+    ]
+
+
+def _compute_distribution(db, trim, subject_id, where, params, bins):
+    devoir_expr, activite_expr, compo_expr, _, moy_expr = note_expr(trim)
+    rows = db.execute(
+        f"""
+        SELECT
+          e.nom_complet,
+          e.niveau,
+          {moy_expr} AS moyenne,
+          {activite_expr} AS activite,
+          COALESCE(n.participation, 0) AS participation,
+          COALESCE(n.comportement, 0) AS comportement,
+          COALESCE(n.cahier, 0) AS cahier,
+          COALESCE(n.projet, 0) AS projet,
+          COALESCE(n.assiduite_outils, 0) AS assiduite_outils
+        FROM eleves e
+        LEFT JOIN notes n ON n.user_id = e.user_id AND n.eleve_id = e.id AND n.subject_id = ? AND n.trimestre = ?
+        WHERE {where}
+        """,
+        [subject_id, int(trim)] + list(params),
+    ).fetchall()
+
+    total = len(rows)
+    names = [r["nom_complet"] or "" for r in rows]
+    niveaux = [r["niveau"] for r in rows]
+    # NULL moyenne (a missing grade) is neither "saisi" nor "non saisi", as in SQL.
+    moy = np.array([np.nan if r["moyenne"] is None else r["moyenne"] for r in rows], dtype=float)
+    with np.errstate(invalid="ignore"):
+        saisi = moy > 0
+        admis = moy >= 10
+        non_saisi = moy <= 0
+    notes = moy[saisi]
+    nb_admis = int(admis.sum())
+    summary = _describe(notes)
+    stats = {
+        "moyenne_generale": summary["moyenne"],
+        "meilleure_note": summary["max"],
+        "pire_note": summary["min"],
+        "mediane": summary["mediane"],
+        "q1": summary["q1"],
+        "q3": summary["q3"],
+        "ecart_type": summary["ecart_type"],
+        "nb_admis": nb_admis,
+        "taux_reussite": round((nb_admis / total) * 100, 1) if total else 0,
+        "nb_total": total,
+        "nb_saisis": int(saisi.sum()),
+    }
+
+    # Per-class averages of the graded students, best first (empty classes last).
+    labels, inverse = np.unique(np.array([str(n) for n in niveaux], dtype=object), return_inverse=True)
+    class_total = np.bincount(inverse, minlength=len(labels))
+    class_count = np.bincount(inverse, weights=saisi, minlength=len(labels))
+    class_sum = np.bincount(inverse, weights=np.where(saisi, moy, 0.0), minlength=len(labels))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        class_avg = class_sum / class_count
+    class_order = np.lexsort((labels.astype(str), -np.nan_to_num(class_avg, nan=-np.inf)))
+    classes = [
+        {
+            "niveau": str(labels[i]),
+            "total": int(class_total[i]),
+            "moyenne": round(float(class_avg[i]), 2) if class_count[i] else 0,
+        }
+        for i in class_order.tolist()
+    ]
+
+    # Component scores of graded students; rows stored before the component
+    # split only carry the activite total and are split on the fly.
+    comps = np.array([[r[f] or 0 for f in COMPONENT_FIELDS] for r in rows], dtype=float).reshape(-1, 5)
+    comps[~comps.any(axis=1)] = np.nan
+    activite = np.array([r["activite"] or 0 for r in rows], dtype=float)
+    split = compute_grades(np.zeros(total), np.zeros(total), activite=activite, components=comps).components
+    graded = split[saisi]
+    components = []
+    for j, field in enumerate(COMPONENT_FIELDS):
+        cap = float(COMPONENT_CAPS[j])
+        column = graded[:, j]
+        components.append({
+            "field": field,
+            "label": COMPONENT_LABELS[field],
+            "cap": cap,
+            **_describe(column),
+            "histogram": _histogram(column, int(cap), cap),
+        })
+
+    rounded = np.round(moy, 2)
+    name_keys = np.array(names, dtype=str) if total else np.array([], dtype=str)
+    top_order = np.lexsort((name_keys, -np.nan_to_num(rounded, nan=-np.inf)))
+    risk_idx = np.flatnonzero(saisi & ~admis)
+    risk_order = risk_idx[np.lexsort((name_keys[risk_idx], rounded[risk_idx]))]
+
+    return {
+        "stats": stats,
+        "classes": classes,
+        "distribution": {
+            "admis": nb_admis,
+            "echec": int((saisi & ~admis).sum()),
+            "non_saisi": int(non_saisi.sum()),
+        },
+        "histogram": _histogram(notes, bins, 20.0),
+        "components": components,
+        "top": _ranked(top_order, names, niveaux, rounded, 10),
+        "risk": _ranked(risk_order, names, niveaux, rounded, 10),
+    }
+
+
+def get_distribution_stats(db, user_id, trim, subject_id, where, params, bins=None):
+    """
+    Statistiques du trimestre (résumé, médiane/quartiles/écart-type,
+    histogramme, répartition par composante, classes, top et élèves en
+    difficulté) calculées en un seul passage sur la colonne des moyennes.
+
+    Le résultat est mis en cache par version de données : la page /stats et
+    l'export PDF partagent le même calcul tant que rien n'a été modifié.
+    """
+    bins = max(1, min(int(bins or STATS_HISTOGRAM_BINS), MAX_HISTOGRAM_BINS))
+    versions = get_data_version(db, user_id)
+    if versions is None:
+        # Sans compteur de versions, rien ne signale une modification.
+        return _compute_distribution(db, trim, subject_id, where, params, bins)
+    key = (versions, int(user_id), str(trim), subject_id, where, tuple(params), bins)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            _cache_counts["hits"] += 1
+            return cached
+        _cache_counts["misses"] += 1
+    result = _compute_distribution(db, trim, subject_id, where, params, bins)
+    with _cache_lock:
+        _cache[key] = result
+        while len(_cache) > STATS_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
+
+
+def distribution_cache_stats():
+    """Hits, misses et taille du cache des statistiques de distribution."""
+    with _cache_lock:
+        return dict(_cache_counts, size=len(_cache), capacity=STATS_CACHE_SIZE)
+
+
+register_cache("distribution_stats", distribution_cache_stats)
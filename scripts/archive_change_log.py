@@ -0,0 +1,20 @@
+from pathlib import Path
+import sys
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+from core.audit import flush_audit_log
+from core.db import get_db
+from core.log_archive import archive_change_log
+from edumaster import create_app
+
+app = create_app()
+with app.app_context():
+    flush_audit_log()
+    moved = archive_change_log(get_db())
+
+if not moved:
+    print("Nothing to archive.")
+for label, count in sorted(moved.items()):
+    print(f"Archived {count} change_log rows for {label}")
@@ -0,0 +1,185 @@
+"""Benchmark the school-year clone: row-by-row baseline vs set-based engine.
+
+Usage:
+    python scripts/bench_clone_school_year.py
+    python scripts/bench_clone_school_year.py --sizes 10000 50000 --json
+
+Each run builds a scratch database with N students spread over teachers and
+classes (plus assignments and some students already present in the target
+year), then copies the year with class promotion. The baseline is the former
+per-student loop; both must end with identical rows. "lock" is the time from
+the first write to the commit, during which other writers wait.
+"""
+from pathlib import Path
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+from edumaster.services.school_year_clone import clone_school_year, normalize_class_name, promote_class_name
+
+SOURCE, TARGET = "2025/2026", "2026/2027"
+SCHEMA = """
+CREATE TABLE eleves (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    school_year TEXT DEFAULT '',
+    nom_complet TEXT NOT NULL,
+    niveau TEXT NOT NULL,
+    parent_phone TEXT DEFAULT '',
+    parent_email TEXT DEFAULT ''
+);
+CREATE INDEX idx_eleves_user_year_niveau ON eleves(user_id, school_year, niveau);
+CREATE TABLE teacher_assignments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    school_year TEXT NOT NULL,
+    subject_id INTEGER NOT NULL,
+    class_name TEXT NOT NULL,
+    UNIQUE(user_id, school_year, subject_id, class_name)
+);
+"""
+
+
+def build(path: str, students: int, seed: int = 7) -> None:
+    rng = random.Random(seed)
+    db = sqlite3.connect(path)
+    db.executescript(SCHEMA)
+    teachers = max(1, students // 300)
+    classes = [f"{level}AM{n}" for level in range(1, 5) for n in range(1, 6)]
+    rows = []
+    for i in range(students):
+        user_id = rng.randint(1, teachers)
+        rows.append((user_id, SOURCE, f" Eleve {i} Élève ", rng.choice(classes).lower(), "0550", ""))
+    db.executemany(
+        "INSERT INTO eleves (user_id, school_year, nom_complet, niveau, parent_phone, parent_email) VALUES (?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    # 5% already copied, to exercise the dedup path.
+    db.executemany(
+        "INSERT INTO eleves (user_id, school_year, nom_complet, niveau) VALUES (?, ?, ?, ?)",
+        [(r[0], TARGET, r[2].strip(), promote_class_name(r[3])) for r in rows[: students // 20]],
+    )
+    db.executemany(
+        "INSERT OR IGNORE INTO teacher_assignments (user_id, school_year, subject_id, class_name) VALUES (?, ?, ?, ?)",
+        [(t, SOURCE, s, c) for t in range(1, teachers + 1) for s in (1, 2) for c in rng.sample(classes, 3)],
+    )
+    db.commit()
+    db.close()
+
+
+def row_by_row(db) -> tuple[int, float]:
+    """The former admin_clone_school_year loop (students + assignments)."""
+    first_write = None
+    existing = {
+        (int(r[0]), (r[1] or "").strip().lower(), normalize_class_name(r[2]))
+        for r in db.execute("SELECT user_id, nom_complet, niveau FROM eleves WHERE school_year = ?", (TARGET,))
+    }
+    inserted = 0
+    for row in db.execute(
+        """SELECT user_id, nom_complet, niveau, parent_phone, parent_email FROM eleves WHERE school_year = ?
+           ORDER BY user_id, niveau COLLATE NOCASE, nom_complet COLLATE NOCASE""",
+        (SOURCE,),
+    ).fetchall():
+        nom = (row[1] or "").strip()
+        niveau = promote_class_name(row[2])
+        key = (int(row[0]), nom.lower(), niveau)
+        if not nom or not niveau or key in existing:
+            continue
+        if first_write is None:
+            first_write = time.perf_counter()
+        db.execute(
+            "INSERT INTO eleves (user_id, school_year, nom_complet, niveau, parent_phone, parent_email) VALUES (?, ?, ?, ?, ?, ?)",
+            (int(row[0]), TARGET, nom, niveau, (row[3] or "").strip(), (row[4] or "").strip()),
+        )
+        existing.add(key)
+        inserted += 1
+    existing_a = {
+        (int(r[0]), int(r[1]), normalize_class_name(r[2]))
+        for r in db.execute("SELECT user_id, subject_id, class_name FROM teacher_assignments WHERE school_year = ?", (TARGET,))
+    }
+    for row in db.execute(
+        "SELECT user_id, subject_id, class_name FROM teacher_assignments WHERE school_year = ?", (SOURCE,)
+    ).fetchall():
+        key = (int(row[0]), int(row[1]), promote_class_name(row[2]))
+        if not key[2] or key in existing_a:
+            continue
+        db.execute(
+            "INSERT INTO teacher_assignments (user_id, school_year, subject_id, class_name) VALUES (?, ?, ?, ?)",
+            (key[0], TARGET, key[1], key[2]),
+        )
+        existing_a.add(key)
+    lock_seconds = time.perf_counter() - first_write if first_write is not None else 0.0
+    db.commit()
+    return inserted, lock_seconds
+
+
+def set_based(db) -> tuple[int, float]:
+    result = clone_school_year(db, SOURCE, TARGET, class_mode="auto_promote", copy_assignments=True)
+    db.commit()
+    return result.inserted, result.write_seconds
+
+
+def snapshot(db) -> list:
+    return db.execute(
+        "SELECT user_id, nom_complet, niveau, parent_phone FROM eleves WHERE school_year = ? ORDER BY 1, 2, 3",
+        (TARGET,),
+    ).fetchall()
+
+
+def bench(students: int, repeat: int) -> dict:
+    result = {"students": students}
+    snapshots = {}
+    with tempfile.TemporaryDirectory(prefix="edumaster_bench_") as tmpdir:
+        for name, func in (("row_by_row", row_by_row), ("set_based", set_based)):
+            totals, locks = [], []
+            for i in range(repeat):
+                path = os.path.join(tmpdir, f"{name}_{i}.db")
+                build(path, students)
+                db = sqlite3.connect(path)
+                start = time.perf_counter()
+                inserted, lock_seconds = func(db)
+                totals.append(time.perf_counter() - start)
+                locks.append(lock_seconds)
+                result["inserted"] = inserted
+                snapshots[name] = snapshot(db)
+                dry = clone_school_year(db, SOURCE, TARGET, class_mode="auto_promote", dry_run=True)
+                db.rollback()
+                result[f"{name}_rerun_inserts"] = dry.inserted
+                db.close()
+            result[f"{name}_ms"] = round(min(totals) * 1000, 1)
+            result[f"{name}_write_lock_ms"] = round(min(locks) * 1000, 1)
+    result["identical"] = snapshots["row_by_row"] == snapshots["set_based"]
+    result["speedup"] = round(result["row_by_row_ms"] / result["set_based_ms"], 1) if result["set_based_ms"] else None
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10_000, 50_000])
+    parser.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    parser.add_argument("--json", action="store_true", help="machine-readable output")
+    args = parser.parse_args()
+
+    results = [bench(n, max(1, args.repeat)) for n in args.sizes]
+    if args.json:
+        print(json.dumps({"results": results}, indent=2))
+        return
+
+    print(f"{'students':>10}{'row-by-row ms':>15}{'(lock)':>9}{'set-based ms':>14}{'(lock)':>9}{'speedup':>9}{'identical':>11}")
+    for r in results:
+        print(
+            f"{r['students']:>10}{r['row_by_row_ms']:>15}{r['row_by_row_write_lock_ms']:>9}"
+            f"{r['set_based_ms']:>14}{r['set_based_write_lock_ms']:>9}{r['speedup']:>9}{str(r['identical']):>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Benchmark the grading kernel against the former per-row Python loop.
+
+Usage:
+    python scripts/bench_grading.py
+    python scripts/bench_grading.py --sizes 10000 100000 --json
+
+For N synthetic students (form-style strings, some with comma decimals or
+blank), the baseline runs clean_note / split_activite_components /
+sum_activite_components / the moyenne formula / the appreciation lookup once
+per row, as the routes used to. "kernel" grades already numeric columns
+(what the DB paths feed it); "kernel+parse" includes note_array on the raw
+strings (what the form and Excel paths feed it). Both must agree.
+"""
+from pathlib import Path
+import argparse
+import json
+import random
+import sys
+import time
+
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+from core.utils import clean_note
+from edumaster.services.grading import (
+    appreciation_messages,
+    compute_grades,
+    note_array,
+    split_activite_components,
+    sum_activite_components,
+)
+
+RULES = [
+    (0, 4.99, "r0"),
+    (5, 9.99, "r1"),
+    (10, 11.99, "r2"),
+    (12, 13.99, "r3"),
+    (14, 15.99, "r4"),
+    (16, 17.99, "r5"),
+    (18, 20, "r6"),
+]
+
+
+def make_columns(n: int, seed: int = 7):
+    rng = random.Random(seed)
+
+    def note():
+        roll = rng.random()
+        if roll < 0.05:
+            return ""
+        value = f"{rng.uniform(0, 20):.2f}"
+        return value.replace(".", ",") if roll < 0.3 else value
+
+    return [note() for _ in range(n)], [note() for _ in range(n)], [note() for _ in range(n)]
+
+
+def scalar_loop(devs, acts, comps):
+    out = []
+    for i in range(len(devs)):
+        d = clean_note(devs[i])
+        c = clean_note(comps[i])
+        p, b, k, pr, ao = split_activite_components(acts[i])
+        a = sum_activite_components(p, b, k, pr, ao)
+        moy = ((d + a) / 2 + (c * 2)) / 3
+        rem = ""
+        for low, high, message in RULES:
+            if low <= moy <= high:
+                rem = message
+                break
+        out.append((moy, rem))
+    return out
+
+
+def _best(fn, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench(n: int, repeat: int) -> dict:
+    devs, acts, comps = make_columns(n)
+    numeric = [note_array(col) for col in (devs, comps, acts)]
+
+    loop_s, expected = _best(lambda: scalar_loop(devs, acts, comps), repeat)
+
+    def kernel():
+        batch = compute_grades(numeric[0], numeric[1], activite=numeric[2], rules=RULES)
+        return batch, appreciation_messages(batch, RULES)
+
+    def kernel_parse():
+        batch = compute_grades(note_array(devs), note_array(comps), activite=note_array(acts), rules=RULES)
+        return batch, appreciation_messages(batch, RULES)
+
+    kernel_s, (batch, remarks) = _best(kernel, repeat)
+    parse_s, _ = _best(kernel_parse, repeat)
+
+    identical = bool(
+        np.allclose(batch.moyenne, [m for m, _ in expected], atol=1e-9)
+        and remarks == [r for _, r in expected]
+    )
+    return {
+        "rows": n,
+        "loop_ms": round(loop_s * 1000, 1),
+        "kernel_ms": round(kernel_s * 1000, 1),
+        "kernel_parse_ms": round(parse_s * 1000, 1),
+        "speedup": round(loop_s / kernel_s, 1) if kernel_s else None,
+        "speedup_with_parse": round(loop_s / parse_s, 1) if parse_s else None,
+        "identical": identical,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    parser.add_argument("--json", action="store_true", help="machine-readable output")
+    args = parser.parse_args()
+
+    results = [bench(n, max(1, args.repeat)) for n in args.sizes]
+    if args.json:
+        print(json.dumps({"results": results}, indent=2))
+        return
+
+    print(f"{'rows':>10}{'loop ms':>11}{'kernel ms':>11}{'+parse ms':>11}{'speedup':>9}{'(+parse)':>10}{'identical':>11}")
+    for r in results:
+        print(
+            f"{r['rows']:>10}{r['loop_ms']:>11}{r['kernel_ms']:>11}{r['kernel_parse_ms']:>11}"
+            f"{r['speedup']:>9}{r['speedup_with_parse']:>10}{str(r['identical']):>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
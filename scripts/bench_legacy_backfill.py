@@ -0,0 +1,217 @@
+"""Benchmark the dashboard grade queries before/after the legacy backfill.
+
+Usage:
+    python scripts/bench_legacy_backfill.py
+    python scripts/bench_legacy_backfill.py --sizes 20000 100000 --json
+
+Each run builds a scratch database with N students, a share of them graded
+only in the legacy eleves.*_tN columns and the rest in notes. "before" runs
+the dashboard queries (class summary, sorted first page, trimester
+progression) with the former COALESCE(n.x, e.x_tN) fallback; then
+migration v10 backfills notes and "after" runs them on notes alone. Both
+must return identical rows. Times are per teacher dashboard, summed over
+all teachers.
+"""
+from pathlib import Path
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+from core.migrations import _migrate_to_v10
+from edumaster.services.grading import moyenne_expr, note_expr
+
+YEAR = "2025/2026"
+LEGACY_SHARE = 0.3
+SCHEMA = """
+CREATE TABLE users (id INTEGER PRIMARY KEY, default_subject TEXT DEFAULT '');
+CREATE TABLE subjects (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, name TEXT NOT NULL, UNIQUE(user_id, name));
+CREATE TABLE eleves (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    school_year TEXT DEFAULT '',
+    nom_complet TEXT NOT NULL,
+    niveau TEXT NOT NULL,
+    remarques_t1 TEXT DEFAULT '', remarques_t2 TEXT DEFAULT '', remarques_t3 TEXT DEFAULT '',
+    devoir_t1 REAL DEFAULT 0, activite_t1 REAL DEFAULT 0, compo_t1 REAL DEFAULT 0,
+    devoir_t2 REAL DEFAULT 0, activite_t2 REAL DEFAULT 0, compo_t2 REAL DEFAULT 0,
+    devoir_t3 REAL DEFAULT 0, activite_t3 REAL DEFAULT 0, compo_t3 REAL DEFAULT 0,
+    parent_phone TEXT DEFAULT '',
+    parent_email TEXT DEFAULT ''
+);
+CREATE TABLE notes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL, eleve_id INTEGER NOT NULL, subject_id INTEGER NOT NULL, trimestre INTEGER NOT NULL,
+    participation REAL DEFAULT 0, comportement REAL DEFAULT 0, cahier REAL DEFAULT 0,
+    projet REAL DEFAULT 0, assiduite_outils REAL DEFAULT 0,
+    activite REAL DEFAULT 0, devoir REAL DEFAULT 0, compo REAL DEFAULT 0, remarques TEXT DEFAULT '',
+    UNIQUE(user_id, eleve_id, subject_id, trimestre)
+);
+CREATE INDEX idx_notes_user_subject_trim ON notes(user_id, subject_id, trimestre);
+CREATE INDEX idx_eleves_user_year_niveau ON eleves(user_id, school_year, niveau);
+"""
+
+
+def legacy_moyenne(alias, t):
+    return (
+        f"((COALESCE({alias}.devoir, e.devoir_t{t}) + COALESCE({alias}.activite, e.activite_t{t}))/2.0"
+        f" + (COALESCE({alias}.compo, e.compo_t{t}) * 2.0))/3.0"
+    )
+
+
+def legacy_note_expr(trim):
+    return (
+        f"COALESCE(n.devoir, e.devoir_t{trim})",
+        f"COALESCE(n.activite, e.activite_t{trim})",
+        f"COALESCE(n.compo, e.compo_t{trim})",
+        f"COALESCE(n.remarques, e.remarques_t{trim})",
+        legacy_moyenne("n", trim),
+    )
+
+
+def build(path: str, students: int, seed: int = 7) -> None:
+    rng = random.Random(seed)
+    db = sqlite3.connect(path)
+    db.executescript(SCHEMA)
+    teachers = max(1, students // 300)
+    classes = [f"{level}AM{n}" for level in range(1, 5) for n in range(1, 4)]
+    db.executemany("INSERT INTO users (id) VALUES (?)", [(t,) for t in range(1, teachers + 1)])
+    db.executemany(
+        "INSERT INTO subjects (user_id, name) VALUES (?, ?)",
+        [(t, name) for t in range(1, teachers + 1) for name in ("Sciences", "Physique")],
+    )
+    subject_of = {r[0]: r[1] for r in db.execute("SELECT user_id, MIN(id) FROM subjects GROUP BY user_id")}
+
+    def grade():
+        return round(rng.uniform(0, 20), 2)
+
+    notes = []
+    for i in range(students):
+        user_id = rng.randint(1, teachers)
+        legacy = rng.random() < LEGACY_SHARE
+        values = [grade() if legacy else 0 for _ in range(9)]
+        eleve_id = db.execute(
+            "INSERT INTO eleves (user_id, school_year, nom_complet, niveau, "
+            "devoir_t1, activite_t1, compo_t1, devoir_t2, activite_t2, compo_t2, devoir_t3, activite_t3, compo_t3) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (user_id, YEAR, f"Eleve {i}", rng.choice(classes), *values),
+        ).lastrowid
+        if not legacy:
+            for t in (1, 2, 3):
+                notes.append((user_id, eleve_id, subject_of[user_id], t, grade(), grade(), grade()))
+    db.executemany(
+        "INSERT INTO notes (user_id, eleve_id, subject_id, trimestre, activite, devoir, compo) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        notes,
+    )
+    db.commit()
+    db.close()
+
+
+def dashboard(db, exprs, progress, user_id, subject_id, trim="1") -> list:
+    """The summary, first page and progression queries of one dashboard."""
+    devoir, activite, compo, remarques, moy = exprs
+    join = "LEFT JOIN notes n ON n.user_id = e.user_id AND n.eleve_id = e.id AND n.subject_id = ? AND n.trimestre = ?"
+    where = "e.user_id = ? AND e.school_year = ?"
+    params = [subject_id, int(trim), user_id, YEAR]
+    out = list(db.execute(
+        f"""
+        SELECT COUNT(*), SUM(CASE WHEN {moy} >= 10 THEN 1 ELSE 0 END),
+               ROUND(AVG(CASE WHEN {moy} > 0 THEN {moy} END), 6)
+        FROM eleves e {join} WHERE {where}
+        """,
+        params,
+    ).fetchall())
+    out += db.execute(
+        f"""
+        SELECT e.id, {devoir}, {activite}, {compo}, {remarques}, ROUND({moy}, 2) AS moyenne
+        FROM eleves e {join} WHERE {where}
+        ORDER BY moyenne DESC, e.id LIMIT 50
+        """,
+        params,
+    ).fetchall()
+    m1, m2, m3 = progress
+    out += db.execute(
+        f"""
+        SELECT e.niveau,
+          ROUND(AVG(CASE WHEN {m1} > 0 THEN {m1} END), 6),
+          ROUND(AVG(CASE WHEN {m2} > 0 THEN {m2} END), 6),
+          ROUND(AVG(CASE WHEN {m3} > 0 THEN {m3} END), 6)
+        FROM eleves e
+        LEFT JOIN notes n1 ON n1.user_id = e.user_id AND n1.eleve_id = e.id AND n1.subject_id = ? AND n1.trimestre = 1
+        LEFT JOIN notes n2 ON n2.user_id = e.user_id AND n2.eleve_id = e.id AND n2.subject_id = ? AND n2.trimestre = 2
+        LEFT JOIN notes n3 ON n3.user_id = e.user_id AND n3.eleve_id = e.id AND n3.subject_id = ? AND n3.trimestre = 3
+        WHERE {where}
+        GROUP BY e.niveau ORDER BY e.niveau
+        """,
+        [subject_id] * 3 + [user_id, YEAR],
+    ).fetchall()
+    return out
+
+
+def run_all(db, exprs, progress, repeat) -> tuple[float, list]:
+    teachers = db.execute("SELECT user_id, MIN(id) FROM subjects GROUP BY user_id").fetchall()
+    best, rows = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = [dashboard(db, exprs, progress, u, s) for u, s in teachers]
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, rows
+
+
+def bench(students: int, repeat: int) -> dict:
+    with tempfile.TemporaryDirectory(prefix="edumaster_bench_") as tmpdir:
+        path = os.path.join(tmpdir, "backfill.db")
+        build(path, students)
+        db = sqlite3.connect(path)
+        before_s, before = run_all(
+            db, legacy_note_expr("1"), [legacy_moyenne(f"n{t}", t) for t in (1, 2, 3)], repeat
+        )
+        notes_before = db.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+        started = time.perf_counter()
+        _migrate_to_v10(db)
+        db.commit()
+        migrate_s = time.perf_counter() - started
+        notes_after = db.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+        after_s, after = run_all(db, note_expr("1"), [moyenne_expr(f"n{t}") for t in (1, 2, 3)], repeat)
+        db.close()
+    return {
+        "students": students,
+        "backfilled_rows": notes_after - notes_before,
+        "migration_ms": round(migrate_s * 1000, 1),
+        "before_ms": round(before_s * 1000, 1),
+        "after_ms": round(after_s * 1000, 1),
+        "speedup": round(before_s / after_s, 2) if after_s else None,
+        "identical": before == after,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[20_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    parser.add_argument("--json", action="store_true", help="machine-readable output")
+    args = parser.parse_args()
+
+    results = [bench(n, max(1, args.repeat)) for n in args.sizes]
+    if args.json:
+        print(json.dumps({"results": results}, indent=2))
+        return
+
+    print(f"{'students':>10}{'backfilled':>12}{'migrate ms':>12}{'before ms':>11}{'after ms':>10}{'speedup':>9}{'identical':>11}")
+    for r in results:
+        print(
+            f"{r['students']:>10}{r['backfilled_rows']:>12}{r['migration_ms']:>12}"
+            f"{r['before_ms']:>11}{r['after_ms']:>10}{r['speedup']:>9}{str(r['identical']):>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
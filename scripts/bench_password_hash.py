@@ -0,0 +1,75 @@
+"""Benchmark password hash settings: logins/second per CPU core.
+
+Usage:
+    python scripts/bench_password_hash.py
+    python scripts/bench_password_hash.py --methods pbkdf2:sha256:600000 scrypt:16384:8:1 --rounds 20 --json
+
+Each login verifies one hash, so verifications/second on a single thread is
+the login throughput of one core. Pick the strongest setting that keeps the
+morning peak (e.g. 80 teachers within a minute) well under your core count,
+then set PASSWORD_HASH_METHOD accordingly.
+"""
+from pathlib import Path
+import argparse
+import json
+import os
+import sys
+import time
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+from core.config import PASSWORD_HASH_METHOD
+from core.passwords import hash_password, verify_password
+
+DEFAULT_METHODS = [
+    "pbkdf2:sha256:260000",
+    "pbkdf2:sha256:600000",
+    "pbkdf2:sha256:1000000",
+    "scrypt:16384:8:1",
+    "scrypt:32768:8:1",
+    "scrypt:65536:8:1",
+]
+
+
+def bench(method: str, rounds: int) -> dict:
+    stored = hash_password("correct horse battery staple", method=method)
+    verify_password(stored, "correct horse battery staple")  # warm-up
+    start = time.perf_counter()
+    for _ in range(rounds):
+        verify_password(stored, "correct horse battery staple")
+    elapsed = time.perf_counter() - start
+    per_login = elapsed / rounds
+    result = {
+        "method": method,
+        "ms_per_login": round(per_login * 1000, 2),
+        "logins_per_sec_per_core": round(1 / per_login, 1) if per_login else None,
+    }
+    if method.startswith("scrypt:"):
+        n, r = (int(x) for x in method.split(":")[1:3])
+        result["memory_mib"] = round(128 * n * r / (1024 * 1024), 1)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--methods", nargs="+", default=DEFAULT_METHODS)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="machine-readable output")
+    args = parser.parse_args()
+
+    results = [bench(m, max(1, args.rounds)) for m in args.methods]
+    if args.json:
+        print(json.dumps({"cores": os.cpu_count(), "current": PASSWORD_HASH_METHOD, "results": results}, indent=2))
+        return
+
+    print(f"CPU cores: {os.cpu_count()} | current policy: {PASSWORD_HASH_METHOD}")
+    print(f"{'method':<24}{'ms/login':>10}{'logins/s/core':>16}{'MiB':>8}")
+    for r in results:
+        mem = r.get("memory_mib", "")
+        marker = " *" if r["method"] == PASSWORD_HASH_METHOD else ""
+        print(f"{r['method']:<24}{r['ms_per_login']:>10}{r['logins_per_sec_per_core']:>16}{mem:>8}{marker}")
+
+
+if __name__ == "__main__":
+    main()
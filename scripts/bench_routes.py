@@ -0,0 +1,360 @@
+"""End-to-end route benchmark on synthetic schools of several sizes.
+
+Usage:
+    python scripts/bench_routes.py
+    python scripts/bench_routes.py --scales small medium --repeat 30 --output bench_routes.json
+    python scripts/bench_routes.py --json
+
+Each scale runs in its own process on a scratch database filled by
+scripts/synthetic_school.py, logged in as one of its teachers through the
+Flask test client. Every route is requested --repeat times and reported
+with p50/p95/max latency, the latency of the first (cold) request, the
+SQL statements issued per request (median, counted by core.sql_trace's
+TracedConnection: executemany counts once, trigger sub-statements not at
+all) and the peak Python memory allocated while serving one request
+(tracemalloc, measured in a separate pass so it does not skew latency).
+/sauvegarder_tout saves one class with fresh grades on every call;
+/import_excel_apply re-imports one class from a generated workbook, its
+preview upload (/import_excel) is not timed. Both writes are checked
+after each request (no error flash, and the saved grade read back for
+/sauvegarder_tout): a write that silently failed aborts the run instead
+of being reported as fast.
+
+The licence check is bypassed: it depends on the machine, not the data.
+The report is JSON (--json prints it, --output writes it) so successive
+runs can be compared.
+"""
+from pathlib import Path
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from io import BytesIO
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+SCALES = {
+    "small": {"teachers": 3, "classes": 3, "students": 25, "subjects": 1},
+    "medium": {"teachers": 15, "classes": 4, "students": 35, "subjects": 2},
+    "large": {"teachers": 40, "classes": 6, "students": 40, "subjects": 2},
+}
+CSRF = "bench-csrf"
+
+
+def _percentile(values, q):
+    import numpy as np
+
+    return round(float(np.percentile(values, q)), 2) if values else None
+
+
+def _workbook(students) -> bytes:
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    sheet = wb.active
+    sheet.append(["Nom complet", "Classe", "Devoir", "Activite", "Compo"])
+    for i, (name, niveau) in enumerate(students):
+        sheet.append([name, niveau, 8 + i % 12, 10 + i % 9, 7 + i % 13])
+    out = BytesIO()
+    wb.save(out)
+    return out.getvalue()
+
+
+def _make_routes(app, client, teacher, db_rows):
+    """name -> (setup, request, check): `setup` (or None) runs untimed before
+    each `request`, which issues the measured request and returns the
+    response; `check` (or None) then raises if the request had no effect."""
+    import random
+
+    from core.db import get_db
+
+    rng = random.Random(11)
+    subject_id = teacher["subject_ids"][0]
+    school_year = teacher["school_year"]
+    first_class = teacher["classes"][0]
+    class_rows = [r for r in db_rows if r["niveau"] == first_class]
+    ids = [str(r["id"]) for r in db_rows]
+    state = {"bulletin": 0}
+    workbook = _workbook([(r["nom_complet"], r["niveau"]) for r in class_rows])
+
+    def bulletin():
+        state["bulletin"] = (state["bulletin"] + 1) % len(ids)
+        return client.get(f"/bulletin_pdf/{ids[state['bulletin']]}?trimestre=1")
+
+    def flashes():
+        # Popped so they do not pile up in the session across repeats.
+        with client.session_transaction() as sess:
+            return sess.pop("_flashes", [])
+
+    def check_flashes(route, response):
+        errors = [message for category, message in flashes() if category == "danger"]
+        if response.status_code != 302 or errors:
+            raise RuntimeError(f"{route} failed ({response.status_code}): {'; '.join(errors)}")
+
+    def save():
+        devoir = [f"{rng.uniform(0, 20):.2f}" for _ in class_rows]
+        state["devoir"] = float(devoir[0])
+        data = {
+            "csrf_token": CSRF,
+            "trimestre_save": "1",
+            "subject": str(subject_id),
+            "school_year": school_year,
+            "id_eleve": [str(r["id"]) for r in class_rows],
+            "devoir": devoir,
+            "activite": [f"{rng.uniform(0, 20):.2f}" for _ in class_rows],
+            "compo": [f"{rng.uniform(0, 20):.2f}" for _ in class_rows],
+        }
+        return client.post("/sauvegarder_tout", data=data)
+
+    def check_save(response):
+        check_flashes("sauvegarder_tout", response)
+        with app.app_context():
+            row = get_db().execute(
+                "SELECT devoir FROM notes WHERE eleve_id = ? AND subject_id = ? AND trimestre = 1",
+                (class_rows[0]["id"], subject_id),
+            ).fetchone()
+        if row is None or abs(float(row["devoir"]) - state["devoir"]) > 0.01:
+            raise RuntimeError("sauvegarder_tout: the grades were not written")
+
+    def import_preview():
+        preview = client.post(
+            "/import_excel",
+            data={
+                "csrf_token": CSRF,
+                "trimestre_import": "1",
+                "subject": str(subject_id),
+                "school_year": school_year,
+                "fichier_excel": (BytesIO(workbook), "classe.xlsx"),
+            },
+            content_type="multipart/form-data",
+        )
+        preview.get_data()
+        with client.session_transaction() as sess:
+            token = (sess.get("import_preview") or {}).get("token", "")
+        state["import_form"] = {
+            "csrf_token": CSRF,
+            "token": token,
+            "map_full_name": "Nom complet",
+            "map_classe": "Classe",
+            "map_devoir": "Devoir",
+            "map_activite": "Activite",
+            "map_compo": "Compo",
+        }
+
+    query = f"trimestre=1&subject={subject_id}&school_year={school_year}"
+    return {
+        "dashboard": (None, lambda: client.get(f"/?{query}"), None),
+        "stats": (None, lambda: client.get(f"/stats?{query}"), None),
+        "export_excel": (None, lambda: client.get(f"/export_excel?{query}"), None),
+        "export_list_pdf": (None, lambda: client.get(f"/export_list_pdf?{query}"), None),
+        "bulletin_pdf": (None, bulletin, None),
+        "sauvegarder_tout": (None, save, check_save),
+        "import_excel_apply": (
+            import_preview,
+            lambda: client.post("/import_excel_apply", data=state["import_form"]),
+            lambda response: check_flashes("import_excel_apply", response),
+        ),
+    }
+
+
+def _timed(setup, send, check):
+    """Run `setup` untimed, time `send`, then `check` the response untimed;
+    returns (seconds, status, bytes)."""
+    if setup is not None:
+        setup()
+    started = time.perf_counter()
+    response = send()
+    body = response.get_data()
+    elapsed = time.perf_counter() - started
+    if check is not None:
+        check(response)
+    return elapsed, response.status_code, len(body)
+
+
+def run_scale(name: str, repeat: int) -> dict:
+    """Worker side: build the scale's database and measure every route."""
+    config = SCALES[name]
+    tmpdir = tempfile.mkdtemp(prefix="edumaster_bench_routes_")
+    # core.config reads these at import time, hence the late imports.
+    os.environ["DATABASE_PATH"] = os.path.join(tmpdir, "school.db")
+    os.environ["BACKUP_DIR"] = os.path.join(tmpdir, "backups")
+    os.environ.setdefault("SECRET_KEY", "bench-secret")
+
+    import core.security
+    from flask import g
+
+    from core.db import get_db
+    from edumaster import create_app
+    from synthetic_school import DEFAULT_PASSWORD, generate_school
+
+    core.security.verifier_validite_licence = lambda: (True, "bench")
+    app = create_app()
+    app.config["TESTING"] = True
+    # Request connections become TracedConnection (see connection_factory).
+    app.config["SQL_TRACE"] = True
+
+    started = time.perf_counter()
+    with app.app_context():
+        db = get_db()
+        summary = generate_school(db, seed=7, **config)
+        teacher = dict(summary["teachers"][0], school_year=summary["school_year"])
+        db_rows = db.execute(
+            "SELECT id, nom_complet, niveau FROM eleves WHERE user_id = ? ORDER BY id", (teacher["user_id"],)
+        ).fetchall()
+        db_rows = [dict(r) for r in db_rows]
+    generate_seconds = time.perf_counter() - started
+
+    statements = {"count": 0}
+
+    @app.before_request
+    def _reset_statements():
+        statements["count"] = 0
+
+    @app.after_request
+    def _count_statements(response):
+        trace = getattr(g.get("_database"), "trace", None)
+        if trace is not None:
+            statements["count"] = trace.statements
+        return response
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["_csrf_token"] = CSRF
+    login = client.post(
+        "/login", data={"username": teacher["username"], "password": DEFAULT_PASSWORD, "csrf_token": CSRF}
+    )
+    if login.status_code not in (200, 302):
+        raise RuntimeError(f"login failed: {login.status_code}")
+
+    routes = _make_routes(app, client, teacher, db_rows)
+    results = {}
+    for route, (setup, send, check) in routes.items():
+        times, counts, statuses, sizes = [], [], set(), []
+        for _ in range(repeat):
+            elapsed, status, size = _timed(setup, send, check)
+            times.append(elapsed * 1000)
+            counts.append(statements["count"])
+            statuses.add(status)
+            sizes.append(size)
+        counts.sort()
+        results[route] = {
+            "requests": repeat,
+            "status": sorted(statuses),
+            "cold_ms": round(times[0], 2),
+            "p50_ms": _percentile(times, 50),
+            "p95_ms": _percentile(times, 95),
+            "max_ms": round(max(times), 2),
+            "queries": counts[len(counts) // 2],
+            "response_bytes": sizes[-1],
+        }
+
+    tracemalloc.start()
+    for route, (setup, send, check) in routes.items():
+        if setup is not None:
+            setup()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        response = send()
+        response.get_data()
+        results[route]["peak_kib"] = round((tracemalloc.get_traced_memory()[1] - baseline) / 1024, 1)
+        if check is not None:
+            check(response)
+    tracemalloc.stop()
+
+    report = {
+        "scale": name,
+        **config,
+        "school_students": summary["students"],
+        "school_notes": summary["notes"],
+        "teacher_students": len(db_rows),
+        "generate_seconds": round(generate_seconds, 2),
+        "routes": results,
+    }
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    try:
+        import resource
+
+        report["max_rss_kib"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:  # Windows
+        pass
+    return report
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True, timeout=10
+        )
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=list(SCALES))
+    parser.add_argument("--repeat", type=int, default=20, help="requests per route")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--worker", choices=list(SCALES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    repeat = max(1, args.repeat)
+
+    if args.worker:
+        report = run_scale(args.worker, repeat)
+        # Last line of stdout; the app may print before it.
+        print("\n" + json.dumps(report))
+        return
+
+    scales = []
+    for name in args.scales:
+        proc = subprocess.run(
+            [sys.executable, __file__, "--worker", name, "--repeat", str(repeat)],
+            capture_output=True,
+            text=True,
+            cwd=BASE_DIR,
+        )
+        if proc.returncode != 0:
+            sys.stderr.write(proc.stderr)
+            raise SystemExit(f"scale {name} failed")
+        scales.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    report = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "scales": scales,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    for scale in scales:
+        print(
+            f"\n{scale['scale']}: {scale['teachers']} teachers, {scale['school_students']} students, "
+            f"{scale['school_notes']} notes (measured teacher: {scale['teacher_students']} students)"
+        )
+        print(f"{'route':<20}{'status':>8}{'cold ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'queries':>9}{'peak KiB':>10}")
+        for route, r in scale["routes"].items():
+            status = ",".join(str(s) for s in r["status"])
+            print(
+                f"{route:<20}{status:>8}{r['cold_ms']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}"
+                f"{r['queries']:>9}{r['peak_kib']:>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+from pathlib import Path
+import os
+import re
+import sys
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+from core.blob_store import BLOB_DIR, discard_blob, publish_blob, release_blobs, stage_blob
+from core.db import get_db
+from edumaster import create_app
+
+# Legacy uploads were saved as "<uuid hex>_<secure filename>".
+LEGACY_NAME = re.compile(r"^[0-9a-f]{32}_(.+)$")
+
+app = create_app()
+with app.app_context():
+    db = get_db()
+    folder = app.config["UPLOAD_FOLDER"]
+    legacy = [
+        r["filename"]
+        for r in db.execute(
+            "SELECT DISTINCT filename FROM documents WHERE content_hash IS NULL AND filename NOT LIKE ?",
+            (f"{BLOB_DIR}/%",),
+        ).fetchall()
+    ]
+    converted = missing = 0
+    before = after = 0
+    for name in legacy:
+        path = os.path.join(folder, name)
+        if not os.path.isfile(path):
+            missing += 1
+            continue
+        before += os.path.getsize(path)
+        with open(path, "rb") as f:
+            staged = stage_blob(f, folder, os.path.splitext(name)[1])
+        match = LEGACY_NAME.match(name)
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute(
+                "UPDATE documents SET filename = ?, content_hash = ?, original_name = COALESCE(original_name, ?) "
+                "WHERE filename = ?",
+                (staged.filename, staged.sha256, match.group(1) if match else name, name),
+            )
+            if publish_blob(staged, folder):
+                after += staged.size
+            db.commit()
+        except Exception:
+            db.rollback()
+            discard_blob(staged.tmp_path)
+            raise
+        release_blobs(db, folder, [name])
+        converted += 1
+
+print(f"Converted {converted} legacy files ({missing} missing on disk).")
+print(f"Disk use for converted files: {before} -> {after} bytes")
@@ -0,0 +1,15 @@
+from pathlib import Path
+import sys
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+from core.db import get_db
+from edumaster import create_app
+from edumaster.routes.notifications import prune_read_notifications
+
+app = create_app()
+with app.app_context():
+    removed = prune_read_notifications(get_db())
+
+print(f"Notifications pruned: {removed}")
@@ -0,0 +1,257 @@
+"""Replay a request mix under tracemalloc and report the top allocation sites.
+
+Usage:
+    python scripts/replay_memory.py
+    python scripts/replay_memory.py --record requests.jsonl --db ecole_multi.db --user-id 3
+    python scripts/replay_memory.py --repeat 3 --top 15 --group traceback --json
+
+The mix is either a file recorded by the app (MEMORY_PROFILE=1 with
+MEMORY_PROFILE_RECORD=<file>, see core.memory_profile) or, without
+--record, the export routes and a backup download. Requests run through the
+Flask test client on a scratch copy of --db (or on a synthetic school from
+scripts/synthetic_school.py), in a session of --user-id; --admin flags the
+session as admin so admin routes in the mix are allowed. Recorded uploads
+cannot be replayed and are skipped.
+
+For every request the peak of traced memory is measured, and a sampler
+thread snapshots the heap each time it grows 20% past its previous high,
+so the reported sites are those alive near the peak (compared with the heap before the
+request). The sites still allocated after the whole replay are reported
+too, to spot memory that is never given back. Latencies are measured
+under tracing and only comparable with each other.
+"""
+from pathlib import Path
+import argparse
+import gc
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+CSRF = "replay-csrf"
+
+
+class PeakSampler(threading.Thread):
+    """Snapshot the heap each time traced memory grows 20% past its high."""
+
+    def __init__(self, interval: float, take_snapshot):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.take_snapshot = take_snapshot
+        self.stop = threading.Event()
+        self.best = 0
+        self.snapshot = None
+
+    def run(self):
+        while not self.stop.wait(self.interval):
+            current = tracemalloc.get_traced_memory()[0]
+            if current > self.best * 1.2:
+                self.best = current
+                self.snapshot = self.take_snapshot()
+
+
+def default_mix(subject_id, school_year, eleve_id, admin: bool) -> list[dict]:
+    query = f"trimestre=1&subject={subject_id}&school_year={school_year}"
+    mix = [
+        {"method": "GET", "path": f"/?{query}"},
+        {"method": "GET", "path": f"/stats?{query}"},
+        {"method": "GET", "path": f"/export_excel?{query}"},
+        {"method": "GET", "path": f"/export_list_pdf?{query}"},
+        {"method": "GET", "path": f"/export_parents?{query}"},
+        {"method": "GET", "path": f"/export_stats_pdf?{query}"},
+        {"method": "GET", "path": f"/bulletin_pdf/{eleve_id}?trimestre=1"},
+    ]
+    if admin:
+        mix.append({"method": "GET", "path": "/admin/backup"})
+    return mix
+
+
+def _copy_database(source: str, target: str) -> None:
+    # The backup API copies a consistent state even with a live WAL.
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+def _send(client, entry):
+    method = entry.get("method", "GET").upper()
+    if method == "GET":
+        return client.get(entry["path"])
+    form = dict(entry.get("form") or {})
+    form["csrf_token"] = CSRF
+    return client.open(entry["path"], method=method, data=form)
+
+
+def replay(args) -> dict:
+    tmpdir = tempfile.mkdtemp(prefix="edumaster_replay_")
+    # core.config reads these at import time, hence the late imports.
+    os.environ["DATABASE_PATH"] = os.path.join(tmpdir, "replay.db")
+    os.environ["BACKUP_DIR"] = os.path.join(tmpdir, "backups")
+    os.environ.setdefault("SECRET_KEY", "replay-secret")
+    os.environ["MEMORY_PROFILE"] = "0"
+    if args.db:
+        _copy_database(args.db, os.environ["DATABASE_PATH"])
+
+    import core.security
+    from core.db import get_db
+    from core.memory_profile import load_recording, take_snapshot, top_sites
+    from edumaster import create_app
+
+    core.security.verifier_validite_licence = lambda: (True, "replay")
+    app = create_app()
+    app.config["TESTING"] = True
+
+    with app.app_context():
+        db = get_db()
+        user_id = args.user_id
+        if not args.db:
+            from synthetic_school import generate_school
+
+            summary = generate_school(db, teachers=3, classes=args.classes, students=args.students, seed=7)
+            user_id = user_id or summary["teachers"][0]["user_id"]
+        if user_id is None:
+            raise SystemExit("--user-id is required with --db")
+        user = db.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+        if user is None:
+            raise SystemExit(f"no user {user_id}")
+        user = dict(user)
+        subject = db.execute("SELECT id FROM subjects WHERE user_id = ? ORDER BY id LIMIT 1", (user_id,)).fetchone()
+        eleve = db.execute("SELECT id, school_year FROM eleves WHERE user_id = ? ORDER BY id LIMIT 1", (user_id,)).fetchone()
+
+    admin = args.admin or bool(user.get("is_admin"))
+    if args.record:
+        mix = load_recording(args.record)
+    else:
+        if subject is None or eleve is None:
+            raise SystemExit("the user has no subject or no student: pass a --record file")
+        mix = default_mix(subject["id"], eleve["school_year"], eleve["id"], admin)
+    skipped = [e for e in mix if e.get("files")]
+    mix = [e for e in mix if not e.get("files")]
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["_csrf_token"] = CSRF
+        sess["user_id"] = user["id"]
+        sess["nom_affichage"] = user["nom_affichage"]
+        sess["is_admin"] = 1 if admin else 0
+        sess["role"] = "admin" if admin else (user.get("role") or "prof")
+        sess["school_name"] = user.get("school_name") or ""
+        sess["lock_subject"] = user.get("lock_subject") or 0
+        sess["default_subject"] = user.get("default_subject") or ""
+        sess["can_edit"] = 0 if user.get("role") == "read_only" else 1
+
+    tracemalloc.start(args.frames)
+    gc.collect()
+    start_snapshot = take_snapshot()
+    runs = {}
+    for _ in range(args.repeat):
+        for entry in mix:
+            gc.collect()
+            before = take_snapshot()
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            sampler = PeakSampler(args.sample_ms / 1000, take_snapshot)
+            sampler.best = base
+            sampler.start()
+            started = time.perf_counter()
+            response = _send(client, entry)
+            size = len(response.get_data())
+            elapsed = time.perf_counter() - started
+            response.close()
+            sampler.stop.set()
+            sampler.join()
+            peak = tracemalloc.get_traced_memory()[1] - base
+
+            key = f"{entry.get('method', 'GET').upper()} {entry.get('endpoint') or entry['path'].split('?')[0]}"
+            run = runs.setdefault(key, {"requests": 0, "status": set(), "peaks": [], "ms": [], "sites": [], "best": -1})
+            run["requests"] += 1
+            run["status"].add(response.status_code)
+            run["peaks"].append(peak / 1024)
+            run["ms"].append(elapsed * 1000)
+            run["bytes"] = size
+            if peak > run["best"] and sampler.snapshot is not None:
+                run["best"] = peak
+                run["sites"] = top_sites(sampler.snapshot, before, args.group, args.top)
+    gc.collect()
+    retained = top_sites(take_snapshot(), start_snapshot, args.group, args.top)
+    tracemalloc.stop()
+    shutil.rmtree(tmpdir, ignore_errors=True)
+
+    routes = {}
+    for key, run in runs.items():
+        routes[key] = {
+            "requests": run["requests"],
+            "status": sorted(run["status"]),
+            "median_ms": round(statistics.median(run["ms"]), 1),
+            "median_peak_kib": round(statistics.median(run["peaks"]), 1),
+            "max_peak_kib": round(max(run["peaks"]), 1),
+            "response_bytes": run["bytes"],
+            "sites_at_peak": [s for s in run["sites"] if s.get("size_diff_kib", 0) > 0],
+        }
+    return {
+        "requests": len(mix) * args.repeat,
+        "skipped_uploads": len(skipped),
+        "group": args.group,
+        "routes": routes,
+        "retained": [s for s in retained if s.get("size_diff_kib", 0) > 0],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--record", help="JSON-lines request file (MEMORY_PROFILE_RECORD)")
+    parser.add_argument("--db", help="database to copy and replay against (default: synthetic school)")
+    parser.add_argument("--user-id", type=int, help="session user (required with --db)")
+    parser.add_argument("--admin", action="store_true", help="flag the session as admin")
+    parser.add_argument("--classes", type=int, default=4, help="synthetic school: classes per teacher")
+    parser.add_argument("--students", type=int, default=35, help="synthetic school: students per class")
+    parser.add_argument("--repeat", type=int, default=1, help="replays of the whole mix")
+    parser.add_argument("--top", type=int, default=10, help="allocation sites per route")
+    parser.add_argument("--group", choices=("lineno", "filename", "traceback"), default="lineno")
+    parser.add_argument("--frames", type=int, help="tracemalloc frames per allocation (default 1, 15 for traceback)")
+    parser.add_argument("--sample-ms", type=float, default=20, help="heap sampling interval")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+    args.repeat = max(1, args.repeat)
+    if args.frames is None:
+        # More frames make every snapshot slower; only tracebacks need them.
+        args.frames = 15 if args.group == "traceback" else 1
+    if not args.db:
+        args.admin = True
+
+    report = replay(args)
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+
+    print(f"{report['requests']} requests replayed, {report['skipped_uploads']} uploads skipped")
+    print(f"{'route':<36}{'status':>8}{'ms':>9}{'peak KiB':>11}{'max KiB':>10}")
+    for key, r in sorted(report["routes"].items(), key=lambda item: -item[1]["max_peak_kib"]):
+        status = ",".join(str(s) for s in r["status"])
+        print(f"{key:<36}{status:>8}{r['median_ms']:>9}{r['median_peak_kib']:>11}{r['max_peak_kib']:>10}")
+    for key, r in sorted(report["routes"].items(), key=lambda item: -item[1]["max_peak_kib"]):
+        if r["sites_at_peak"]:
+            print(f"\n{key} — allocated near the peak:")
+            for site in r["sites_at_peak"]:
+                print(f"  {site['size_diff_kib']:>10} KiB  {site['count_diff']:>7}  {site['site']}")
+    if report["retained"]:
+        print("\nStill allocated after the replay:")
+        for site in report["retained"]:
+            print(f"  {site['size_diff_kib']:>10} KiB  {site['count_diff']:>7}  {site['site']}")
+
+
+if __name__ == "__main__":
+    main()
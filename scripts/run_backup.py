@@ -1,24 +1,44 @@
-﻿from pathlib import Path
+from pathlib import Path
+import argparse
 import sys
-from datetime import datetime
 
 BASE_DIR = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(BASE_DIR))
 
-from core.backup import create_backup_zip
+from core.backup_scheduler import backup_stats, run_backup_cycle, run_scheduler
+from core.config import BACKUP_DIR, BACKUP_INTERVAL_SECONDS
 
-BACKUP_DIR = BASE_DIR / "backups"
-BACKUP_DIR.mkdir(parents=True, exist_ok=True)
+parser = argparse.ArgumentParser(description=f"Scheduled backups into {BACKUP_DIR}.")
+parser.add_argument("--once", action="store_true", help="run a single backup (for cron) and exit")
+parser.add_argument("--interval", type=int, default=BACKUP_INTERVAL_SECONDS, help="seconds between backups")
+parser.add_argument("--stats", action="store_true", help="print backup metrics and exit")
+args = parser.parse_args()
 
-stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-zip_path = BACKUP_DIR / f"backup_{stamp}.zip"
 
-buf = create_backup_zip()
-with open(zip_path, "wb") as f:
-    f.write(buf.getbuffer())
+def report(record):
+    if record.get("error"):
+        print(f"Backup failed: {record['file']}: {record['error']}", flush=True)
+        return
+    if not record.get("verified"):
+        print(f"Backup FAILED verification, set aside: {record['file']}: {record.get('verify_detail')}", flush=True)
+        return
+    print(
+        f"Backup created: {record['file']} ({record['size_bytes']} bytes in {record['duration_seconds']}s)"
+        + (f", pruned {len(record['removed'])}" if record["removed"] else ""),
+        flush=True,
+    )
 
-backups = sorted(BACKUP_DIR.glob("backup_*.zip"), key=lambda p: p.stat().st_mtime, reverse=True)
-for old in backups[10:]:
-    old.unlink()
 
-print(f"Backup created: {zip_path}")
+if args.stats:
+    for key, value in backup_stats().items():
+        print(f"{key}: {value}")
+elif args.once:
+    record = run_backup_cycle()
+    report(record)
+    sys.exit(0 if record.get("verified") else 1)
+else:
+    print(f"Backup scheduler started (every {args.interval}s, Ctrl+C to stop).", flush=True)
+    try:
+        run_scheduler(args.interval, on_run=report)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,206 @@
+"""Generate a synthetic school: teachers, subjects, classes, students and notes.
+
+Usage:
+    python scripts/synthetic_school.py --db /tmp/school.db
+    python scripts/synthetic_school.py --db /tmp/school.db --teachers 40 --classes 5 --students 35
+
+Teachers get their subjects, class assignments for the active school year,
+students with French or Arabic names and parent contacts, and three
+trimesters of notes (components, devoir, compo and the appreciation of
+their default rules) for every subject. Everything goes through the app's
+own schema, migrations and triggers, so the database is what a real school
+would have after a year of use. Teachers log in as bench_prof_<n> with
+the --password given.
+"""
+from pathlib import Path
+import argparse
+import json
+import os
+import random
+import sys
+
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+FRENCH_FIRST = [
+    "Lucas", "Emma", "Hugo", "Chloé", "Louis", "Léa", "Jules", "Manon", "Adam", "Inès",
+    "Nathan", "Camille", "Théo", "Sarah", "Yanis", "Lina", "Rayan", "Jade", "Noé", "Élise",
+]
+FRENCH_LAST = [
+    "Martin", "Bernard", "Dubois", "Thomas", "Robert", "Richard", "Petit", "Durand", "Leroy", "Moreau",
+    "Simon", "Laurent", "Lefèvre", "Michel", "Garcia", "David", "Bertrand", "Roux", "Vincent", "Fournier",
+]
+ARABIC_FIRST = [
+    "محمد", "أمين", "ياسين", "عبد الرحمن", "إسحاق", "يوسف", "أنس", "رياض", "سليم", "وليد",
+    "فاطمة", "مريم", "أسماء", "خديجة", "سارة", "نور الهدى", "آية", "إيمان", "هبة", "رانيا",
+]
+ARABIC_LAST = [
+    "بن علي", "بوزيد", "حمادي", "بلقاسم", "زروقي", "مرابط", "شريف", "بن يوسف", "قاسمي", "عمراني",
+    "بوعلام", "سعيدي", "حداد", "بلعيد", "منصوري", "براهيمي", "لعربي", "بن عمر", "خليفي", "تومي",
+]
+SUBJECTS = ["Sciences", "Physique", "Mathématiques", "Français", "Arabe", "Histoire-Géographie"]
+DEFAULT_PASSWORD = "bench-password-1"
+
+
+def class_names(count: int) -> list[str]:
+    """`count` distinct class names in the 1AM1, 1AM2, ... 4AM9 style."""
+    names = []
+    level, group = 1, 1
+    while len(names) < count:
+        names.append(f"{level}AM{group}")
+        level += 1
+        if level > 4:
+            level, group = 1, group + 1
+    return names
+
+
+def student_name(rng: random.Random, arabic_share: float) -> str:
+    if rng.random() < arabic_share:
+        return f"{rng.choice(ARABIC_LAST)} {rng.choice(ARABIC_FIRST)}"
+    return f"{rng.choice(FRENCH_LAST).upper()} {rng.choice(FRENCH_FIRST)}"
+
+
+def generate_school(
+    db,
+    teachers: int = 10,
+    classes: int = 4,
+    students: int = 30,
+    subjects: int = 1,
+    arabic_share: float = 0.5,
+    seed: int = 7,
+    password: str = DEFAULT_PASSWORD,
+) -> dict:
+    """
+    Fill `db` (an app connection, inside an app context) with `teachers`
+    teachers of `classes` classes of `students` students each, graded in
+    `subjects` subjects over three trimesters. Commits; returns a summary.
+    """
+    from werkzeug.security import generate_password_hash
+
+    from core.utils import get_appreciation_rules
+    from edumaster.services.common import get_active_school_year
+    from edumaster.services.grading import appreciation_messages, compute_grades
+
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    school_year = get_active_school_year(db)
+    # One hash for everyone: scrypt per teacher would dominate generation.
+    password_hash = generate_password_hash(password)
+    pool = class_names(max(classes * 3, 12))
+    subject_names = SUBJECTS[: max(1, min(subjects, len(SUBJECTS)))]
+    first = db.execute("SELECT IFNULL(MAX(id), 0) FROM users").fetchone()[0] + 1
+
+    summary = {"school_year": school_year, "teachers": [], "students": 0, "notes": 0}
+    for n in range(first, first + teachers):
+        username = f"bench_prof_{n}"
+        user_id = db.execute(
+            "INSERT INTO users (username, password, nom_affichage, role, school_name, default_subject, lock_subject) "
+            "VALUES (?, ?, ?, 'prof', ?, ?, 0)",
+            (username, password_hash, f"Prof {rng.choice(FRENCH_LAST)}", "Lycée Synthétique", subject_names[0]),
+        ).lastrowid
+        subject_ids = [
+            db.execute("INSERT INTO subjects (user_id, name) VALUES (?, ?)", (user_id, name)).lastrowid
+            for name in subject_names
+        ]
+        teacher_classes = rng.sample(pool, classes)
+        db.executemany(
+            "INSERT OR IGNORE INTO teacher_assignments (user_id, school_year, subject_id, class_name) VALUES (?, ?, ?, ?)",
+            [(user_id, school_year, s, c) for s in subject_ids for c in teacher_classes],
+        )
+        eleve_ids = []
+        for niveau in teacher_classes:
+            for _ in range(students):
+                eleve_ids.append(db.execute(
+                    "INSERT INTO eleves (user_id, school_year, nom_complet, niveau, parent_phone, parent_email) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        user_id,
+                        school_year,
+                        student_name(rng, arabic_share),
+                        niveau,
+                        f"05{rng.randint(10_000_000, 99_999_999)}",
+                        "" if rng.random() < 0.6 else f"parent{rng.randint(1, 99999)}@example.com",
+                    ),
+                ).lastrowid)
+
+        rules = get_appreciation_rules(user_id)
+        count = len(eleve_ids)
+        rows = []
+        for subject_id in subject_ids:
+            for trim in (1, 2, 3):
+                # Per-student level plus noise, so classes have a spread.
+                level = np_rng.normal(11.5, 3.0, count)
+                devoir = np.clip(np.round(level + np_rng.normal(0, 2.0, count), 2), 0, 20)
+                compo = np.clip(np.round(level + np_rng.normal(0, 2.5, count), 2), 0, 20)
+                components = np.round(
+                    np_rng.uniform(0.3, 1.0, (count, 5)) * np.array([3.0, 6.0, 5.0, 4.0, 2.0]), 2
+                )
+                batch = compute_grades(devoir, compo, components=components, rules=rules)
+                remarks = appreciation_messages(batch, rules)
+                rows.extend(
+                    (user_id, eleve_id, subject_id, trim, *comp, a, d, c, rem)
+                    for eleve_id, comp, a, d, c, rem in zip(
+                        eleve_ids,
+                        batch.components.tolist(),
+                        batch.activite.tolist(),
+                        batch.devoir.tolist(),
+                        batch.compo.tolist(),
+                        remarks,
+                    )
+                )
+        db.executemany(
+            """
+            INSERT INTO notes (
+                user_id, eleve_id, subject_id, trimestre,
+                participation, comportement, cahier, projet, assiduite_outils,
+                activite, devoir, compo, remarques
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows,
+        )
+        summary["teachers"].append(
+            {"user_id": user_id, "username": username, "subject_ids": subject_ids, "classes": teacher_classes}
+        )
+        summary["students"] += count
+        summary["notes"] += len(rows)
+    db.commit()
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", required=True, help="SQLite file to create or extend")
+    parser.add_argument("--teachers", type=int, default=10)
+    parser.add_argument("--classes", type=int, default=4, help="classes per teacher")
+    parser.add_argument("--students", type=int, default=30, help="students per class")
+    parser.add_argument("--subjects", type=int, default=1, help="subjects per teacher")
+    parser.add_argument("--arabic-share", type=float, default=0.5, help="share of Arabic names")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--password", default=DEFAULT_PASSWORD)
+    args = parser.parse_args()
+
+    # core.config reads the path at import time.
+    os.environ["DATABASE_PATH"] = os.path.abspath(args.db)
+    from core.db import get_db
+    from edumaster import create_app
+
+    app = create_app()
+    with app.app_context():
+        summary = generate_school(
+            get_db(),
+            teachers=args.teachers,
+            classes=args.classes,
+            students=args.students,
+            subjects=args.subjects,
+            arabic_share=args.arabic_share,
+            seed=args.seed,
+            password=args.password,
+        )
+    print(json.dumps({k: v for k, v in summary.items() if k != "teachers"} | {"teachers": len(summary["teachers"])}))
+
+
+if __name__ == "__main__":
+    main()
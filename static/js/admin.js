@@ -0,0 +1,184 @@
+/**
+ * Admin console: tables are loaded page by page from /admin/api/* (keyset
+ * pagination) and the teacher/subject list only when the select is used.
+ */
+(function () {
+    const config = window.adminConsole || {};
+
+    function esc(value) {
+        return String(value == null ? '' : value)
+            .replace(/&/g, '&amp;')
+            .replace(/</g, '&lt;')
+            .replace(/>/g, '&gt;')
+            .replace(/"/g, '&quot;')
+            .replace(/'/g, '&#39;');
+    }
+
+    function postForm(action, inner, confirmText, extraClass) {
+        const onsubmit = confirmText ? ` onsubmit="return confirm(${esc(JSON.stringify(confirmText))})"` : '';
+        return `<form action="${esc(action)}" method="POST" style="display:inline;" class="${extraClass || ''}"${onsubmit}>` +
+            `<input type="hidden" name="csrf_token" value="${esc(config.csrfToken)}">${inner}</form>`;
+    }
+
+    const ROLE_BADGES = {
+        admin: '<span class="badge bg-danger">Admin</span>',
+        read_only: '<span class="badge bg-secondary">Lecture seule</span>',
+        prof: '<span class="badge bg-primary">Prof</span>'
+    };
+
+    function roleSelect(role) {
+        const options = [['prof', 'Prof'], ['read_only', 'Lecture seule'], ['admin', 'Admin']];
+        return '<select name="role" class="form-select form-select-sm d-inline-block" style="width: 145px;">' +
+            options.map(([value, label]) =>
+                `<option value="${value}"${value === role ? ' selected' : ''}>${label}</option>`).join('') +
+            '</select>';
+    }
+
+    const renderers = {
+        users(user, page) {
+            let actions = '<span class="text-muted">Compte courant</span>';
+            if (user.id !== page.current_user_id) {
+                const year = encodeURIComponent(config.activeSchoolYear || '');
+                actions = `<a href="/admin/voir_eleves/${user.id}?school_year=${year}" class="btn btn-info btn-sm text-white">Voir classe</a> `;
+                if (user.role !== 'admin') {
+                    actions += postForm(`/admin/reset_password/${user.id}`,
+                        '<button type="submit" class="btn btn-warning btn-sm">Reset mdp</button>',
+                        'Generer un mot de passe temporaire ?') + ' ';
+                }
+                actions += postForm(`/admin/reset_link/${user.id}`,
+                    '<button type="submit" class="btn btn-outline-secondary btn-sm">Lien reset</button>') + ' ';
+                actions += postForm(`/admin/set_role/${user.id}`,
+                    roleSelect(user.role) + ' <button type="submit" class="btn btn-outline-primary btn-sm">Appliquer role</button>',
+                    null, 'ms-1');
+                if (user.role !== 'admin') {
+                    actions += ' ' + postForm(`/admin/delete_user/${user.id}`,
+                        '<button type="submit" class="btn btn-danger btn-sm">Supprimer</button>',
+                        'Supprimer ce compte et ses donnees ?');
+                }
+            }
+            return `<tr><td>${user.id}</td><td class="fw-bold">${esc(user.username)}</td>` +
+                `<td>${esc(user.nom_affichage)}</td><td>${ROLE_BADGES[user.role] || ROLE_BADGES.prof}</td>` +
+                `<td class="text-end">${actions}</td></tr>`;
+        },
+        documents(doc) {
+            return `<tr><td>${esc(doc.nom_affichage)}</td>` +
+                `<td>${esc(doc.titre)} <span class="badge bg-secondary">${esc(doc.type_doc)}</span></td>` +
+                `<td>${esc(doc.original_name || doc.filename)}</td><td class="text-end">` +
+                `<a href="/static/uploads/${esc(doc.filename)}" class="btn btn-sm btn-outline-primary" target="_blank">Voir</a> ` +
+                postForm(`/admin/delete_document/${doc.id}`,
+                    '<button type="submit" class="btn btn-sm btn-outline-danger">Supprimer</button>',
+                    'Supprimer ce document ?') +
+                '</td></tr>';
+        },
+        assignments(a) {
+            return `<tr><td>${esc(a.school_year)}</td>` +
+                `<td>${esc(a.nom_affichage)} <span class="text-muted small">(${esc(a.username)})</span></td>` +
+                `<td>${esc(a.subject_name)}</td><td><span class="badge bg-secondary">${esc(a.class_name)}</span></td>` +
+                '<td class="text-end">' +
+                postForm(`/admin/assignment/delete/${a.id}`,
+                    '<button type="submit" class="btn btn-outline-danger btn-sm">Supprimer</button>',
+                    'Supprimer cette affectation ?') +
+                '</td></tr>';
+        }
+    };
+
+    function pageUrl(endpoint, params) {
+        const url = new URL(endpoint, window.location.origin);
+        Object.entries(params).forEach(([key, value]) => {
+            if (value) url.searchParams.set(key, value);
+        });
+        return url;
+    }
+
+    async function fetchPage(endpoint, params) {
+        const response = await fetch(pageUrl(endpoint, params), {
+            credentials: 'same-origin',
+            headers: { 'Accept': 'application/json' }
+        });
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        return response.json();
+    }
+
+    function setupPanel(tbody) {
+        const name = tbody.dataset.panel;
+        const render = renderers[name];
+        const moreButton = document.querySelector(`[data-more="${name}"]`);
+        const filter = document.querySelector(`[data-panel-filter="${name}"]`);
+        const state = { next: null, loading: false };
+
+        function message(text, cls) {
+            tbody.innerHTML = `<tr><td colspan="${tbody.dataset.colspan}" class="text-center ${cls}">${esc(text)}</td></tr>`;
+        }
+
+        async function load(reset) {
+            if (state.loading) return;
+            state.loading = true;
+            if (reset) {
+                state.next = null;
+                message('Chargement...', 'text-muted');
+            }
+            try {
+                const page = await fetchPage(tbody.dataset.endpoint, {
+                    after: state.next,
+                    school_year: filter ? filter.value : null
+                });
+                const rows = page.items.map((item) => render(item, page)).join('');
+                if (reset) tbody.innerHTML = rows;
+                else tbody.insertAdjacentHTML('beforeend', rows);
+                if (reset && !page.items.length) message(tbody.dataset.empty, 'text-muted');
+                state.next = page.next;
+                if (moreButton) moreButton.classList.toggle('d-none', !state.next);
+            } catch (err) {
+                if (reset) message('Erreur de chargement.', 'text-danger');
+            } finally {
+                state.loading = false;
+            }
+        }
+
+        if (moreButton) moreButton.addEventListener('click', () => load(false));
+        if (filter) filter.addEventListener('change', () => load(true));
+
+        // Panels below the fold are only fetched when they scroll into view.
+        if ('IntersectionObserver' in window) {
+            const observer = new IntersectionObserver((entries) => {
+                if (entries.some((entry) => entry.isIntersecting)) {
+                    observer.disconnect();
+                    load(true);
+                }
+            }, { rootMargin: '200px' });
+            observer.observe(tbody.closest('table') || tbody);
+        } else {
+            load(true);
+        }
+    }
+
+    function setupTeacherSubjects(select) {
+        let loaded = false;
+        async function loadAll() {
+            if (loaded) return;
+            loaded = true;
+            let after = null;
+            try {
+                do {
+                    const page = await fetchPage(select.dataset.endpoint, { after: after, limit: 200 });
+                    page.items.forEach((ts) => {
+                        const option = document.createElement('option');
+                        option.value = `${ts.user_id}|${ts.subject_id}`;
+                        option.textContent = `${ts.nom_affichage} (${ts.username}) - ${ts.subject_name}`;
+                        select.appendChild(option);
+                    });
+                    after = page.next;
+                } while (after);
+            } catch (err) {
+                loaded = false;
+            }
+        }
+        ['focus', 'mousedown', 'touchstart'].forEach((evt) => select.addEventListener(evt, loadAll));
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('tbody[data-panel]').forEach(setupPanel);
+        const teacherSelect = document.querySelector('select[name="teacher_subject"][data-endpoint]');
+        if (teacherSelect) setupTeacherSubjects(teacherSelect);
+    });
+})();
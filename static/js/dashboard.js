@@ -74,6 +74,7 @@ document.addEventListener('DOMContentLoaded', function () {
 
     calculAddActivite();
     initDeleteMode();
+    initDeltaSave();
 });
 
 function toNum(value) {
@@ -127,6 +128,193 @@ function calculLive(id) {
     }
 }
 
+// Cells edited since the last save, per student: { eleveId: { field: input } }.
+// Only those are sent to the PATCH endpoint; the full form post stays as
+// the fallback when the endpoint cannot be reached.
+var dirtyCells = {};
+var GRID_FIELDS = ['participation', 'comportement', 'cahier', 'projet', 'assiduite_outils', 'devoir', 'compo'];
+var GRID_INPUT_PREFIX = {
+    participation: 'part_', comportement: 'comport_', cahier: 'cah_', projet: 'proj_',
+    assiduite_outils: 'ao_', devoir: 'dev_', compo: 'comp_'
+};
+var COMPONENT_NAMES = GRID_FIELDS.slice(0, 5);
+
+function initDeltaSave() {
+    var form = document.getElementById('formSaveAll');
+    if (!form || !form.dataset.patchUrl || !window.fetch) return;
+
+    form.addEventListener('input', function (event) {
+        var input = event.target;
+        if (GRID_FIELDS.indexOf(input.name) === -1 || input.readOnly) return;
+        var id = input.id.split('_').pop();
+        if (!dirtyCells[id]) dirtyCells[id] = {};
+        dirtyCells[id][input.name] = input;
+        input.classList.remove('is-invalid');
+        input.removeAttribute('title');
+    });
+
+    form.addEventListener('submit', function (event) {
+        event.preventDefault();
+        saveDirtyCells(form);
+    });
+}
+
+function setSaveStatus(text, cls) {
+    var status = document.getElementById('saveStatus');
+    if (!status) return;
+    status.textContent = text;
+    status.className = 'small align-self-center me-1 ' + cls;
+}
+
+function restoreDirtyCells(pending) {
+    // Cells edited again while the request was in flight are kept as they are.
+    Object.keys(pending).forEach(function (id) {
+        if (!dirtyCells[id]) dirtyCells[id] = {};
+        Object.keys(pending[id]).forEach(function (field) {
+            if (!dirtyCells[id][field]) dirtyCells[id][field] = pending[id][field];
+        });
+    });
+}
+
+function applySavedRow(form, item) {
+    var id = item.eleve_id;
+    var row = form.querySelector('tr[data-eleve-id="' + id + '"]');
+    if (row) row.dataset.rowVersion = item.row_version;
+
+    var activite = item.activite.toFixed(2);
+    var actInput = document.getElementById('act_' + id);
+    var actDisplay = document.getElementById('act_display_' + id);
+    if (actInput) actInput.value = activite;
+    if (actDisplay) actDisplay.innerText = activite;
+
+    var moySpan = document.getElementById('moy_' + id);
+    if (moySpan) {
+        moySpan.innerText = item.moyenne.toFixed(2);
+        moySpan.className = item.moyenne < 10 ? 'text-danger' : 'text-success';
+    }
+    var remarks = document.getElementById('rem_' + id);
+    if (remarks) remarks.textContent = item.remarques;
+}
+
+function applyConflict(form, current, pending) {
+    // Someone saved this student since the page was loaded: take the new
+    // version and the cells the user did not touch, and flag the edited
+    // cells whose stored value differs. They stay dirty: saving again
+    // keeps the user's values on purpose.
+    var id = current.eleve_id;
+    var row = form.querySelector('tr[data-eleve-id="' + id + '"]');
+    if (row) row.dataset.rowVersion = current.row_version;
+    var edited = pending[id] || {};
+    // Rows saved before the component split only carry the activite total.
+    var hasComponents = COMPONENT_NAMES.some(function (field) { return toNum(current[field]) > 0; });
+    var flagged = 0;
+    GRID_FIELDS.forEach(function (field) {
+        var input = document.getElementById(GRID_INPUT_PREFIX[field] + id);
+        if (!input || (!hasComponents && COMPONENT_NAMES.indexOf(field) !== -1)) return;
+        var stored = toNum(current[field]);
+        if (edited[field]) {
+            if (toNum(input.value) !== stored) {
+                input.classList.add('is-invalid');
+                input.title = 'Valeur enregistree entre-temps: ' + stored;
+                flagged++;
+            }
+        } else {
+            input.value = stored;
+        }
+    });
+    calculLive(id);
+    var remarks = document.getElementById('rem_' + id);
+    if (remarks) remarks.textContent = current.remarques || '';
+    return flagged;
+}
+
+function saveDirtyCells(form) {
+    var ids = Object.keys(dirtyCells);
+    if (!ids.length) {
+        setSaveStatus('Aucune modification.', 'text-muted');
+        return;
+    }
+
+    var changes = [];
+    ids.forEach(function (id) {
+        var row = form.querySelector('tr[data-eleve-id="' + id + '"]');
+        var version = row ? parseInt(row.dataset.rowVersion, 10) || 0 : 0;
+        Object.keys(dirtyCells[id]).forEach(function (field) {
+            changes.push({
+                eleve_id: parseInt(id, 10),
+                field: field,
+                value: dirtyCells[id][field].value,
+                row_version: version
+            });
+        });
+    });
+    var pending = dirtyCells;
+    dirtyCells = {};
+    setSaveStatus('Enregistrement...', 'text-muted');
+
+    fetch(form.dataset.patchUrl, {
+        method: 'PATCH',
+        credentials: 'same-origin',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'application/json',
+            'X-CSRF-Token': form.elements.csrf_token.value
+        },
+        body: JSON.stringify({
+            trimestre: form.elements.trimestre_save.value,
+            subject: form.elements.subject.value,
+            school_year: form.elements.school_year.value,
+            changes: changes
+        })
+    }).then(function (response) {
+        var type = response.headers.get('Content-Type') || '';
+        if (type.indexOf('application/json') === -1 || response.status === 405) {
+            // The endpoint is not there (older server) or answered with a
+            // page (login redirect, read-only refusal): nothing was saved,
+            // the classic form post takes over.
+            restoreDirtyCells(pending);
+            form.submit();
+            return null;
+        }
+        return response.json().then(function (data) {
+            return { status: response.status, data: data };
+        });
+    }, function () {
+        // Network error: the full form post would skip the version check.
+        restoreDirtyCells(pending);
+        setSaveStatus('Serveur injoignable: modifications gardees, reessayez.', 'text-danger');
+        return null;
+    }).then(function (result) {
+        if (!result) return;
+        if (result.status === 409) {
+            restoreDirtyCells(pending);
+            var flagged = 0;
+            (result.data.conflicts || []).forEach(function (current) {
+                flagged += applyConflict(form, current, pending);
+            });
+            setSaveStatus(
+                'Notes modifiees entre-temps' + (flagged ? ' (cases en rouge)' : '') +
+                ': Sauver de nouveau pour garder vos valeurs.',
+                'text-danger'
+            );
+            return;
+        }
+        if (result.status !== 200) {
+            restoreDirtyCells(pending);
+            setSaveStatus(result.data.error || 'Erreur lors de l\'enregistrement.', 'text-danger');
+            return;
+        }
+        result.data.rows.forEach(function (item) {
+            applySavedRow(form, item);
+        });
+        var saved = result.data.saved;
+        setSaveStatus(saved === 1 ? '1 eleve enregistre.' : saved + ' eleves enregistres.', 'text-success');
+    }).catch(function () {
+        // Saved, but the grid could not be refreshed: never post it again.
+        setSaveStatus('Enregistre. Rechargez la page pour mettre a jour l\'affichage.', 'text-warning');
+    });
+}
+
 function calculAddActivite() {
     var fields = document.querySelectorAll('#addStudentModal .activite-part');
     var caps = [3, 6, 5, 4, 2];
@@ -1,35 +1,57 @@
-const CACHE_NAME = 'edu-v3';
-const STATIC_ASSETS = [
-    '/',
-    '/static/css/style.css',
-    '/static/js/app.js',
-    '/static/manifest.json',
+// Filled in by the server (core/static_assets.py): fingerprinted URLs of
+// the app's own assets. A new list means a new worker, which only
+// downloads the URLs it does not already hold.
+const ASSET_MANIFEST = /*__ASSET_MANIFEST__*/null || { version: 'dev', assets: [] };
+const ASSET_CACHE = 'edu-assets';
+const PAGE_CACHE = 'edu-pages-v1';
+const CDN_ASSETS = [
     'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
     'https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap',
 ];
 
-// Install: pre-cache static assets
+// Install: pre-cache only the assets missing from the cache
 self.addEventListener('install', (event) => {
-    event.waitUntil(
-        caches.open(CACHE_NAME).then((cache) => cache.addAll(STATIC_ASSETS))
-    );
+    event.waitUntil(precache());
     self.skipWaiting();
 });
 
-// Activate: clean old caches
+// Activate: clean old caches and fingerprinted entries no longer listed
 self.addEventListener('activate', (event) => {
     event.waitUntil(
-        caches.keys().then((names) =>
-            Promise.all(
-                names
-                    .filter((name) => name !== CACHE_NAME)
-                    .map((name) => caches.delete(name))
+        caches.keys()
+            .then((names) =>
+                Promise.all(
+                    names
+                        .filter((name) => name !== ASSET_CACHE && name !== PAGE_CACHE)
+                        .map((name) => caches.delete(name))
+                )
             )
-        )
+            .then(pruneAssets)
     );
     self.clients.claim();
 });
 
+async function precache() {
+    const cache = await caches.open(ASSET_CACHE);
+    const present = new Set((await cache.keys()).map((request) => request.url));
+    const wanted = ASSET_MANIFEST.assets.concat(CDN_ASSETS);
+    const missing = wanted.filter((url) => !present.has(new URL(url, self.location.origin).href));
+    await cache.addAll(missing);
+    const pages = await caches.open(PAGE_CACHE);
+    await pages.add('/').catch(() => null);
+}
+
+async function pruneAssets() {
+    const cache = await caches.open(ASSET_CACHE);
+    const listed = new Set(ASSET_MANIFEST.assets.map((url) => new URL(url, self.location.origin).href));
+    const requests = await cache.keys();
+    await Promise.all(
+        requests
+            .filter((request) => new URL(request.url).searchParams.has('v') && !listed.has(request.url))
+            .map((request) => cache.delete(request))
+    );
+}
+
 // Fetch: strategy selection based on request type
 self.addEventListener('fetch', (event) => {
     const url = new URL(event.request.url);
@@ -43,7 +65,13 @@ self.addEventListener('fetch', (event) => {
         return;
     }
 
-    // Static assets: Stale-while-revalidate
+    // Fingerprinted assets never change: cache-first
+    if (url.pathname.startsWith('/static/') && url.searchParams.has('v')) {
+        event.respondWith(cacheFirst(event.request));
+        return;
+    }
+
+    // Other static assets: Stale-while-revalidate
     if (
         url.pathname.startsWith('/static/') ||
         url.hostname.includes('cdn.jsdelivr.net') ||
@@ -66,8 +94,19 @@ self.addEventListener('fetch', (event) => {
 
 // ─── Strategies ────────────────────────────────────────────────
 
+async function cacheFirst(request) {
+    const cache = await caches.open(ASSET_CACHE);
+    const cachedResponse = await cache.match(request);
+    if (cachedResponse) return cachedResponse;
+    const networkResponse = await fetch(request);
+    if (networkResponse.ok) {
+        cache.put(request, networkResponse.clone());
+    }
+    return networkResponse;
+}
+
 async function staleWhileRevalidate(request) {
-    const cache = await caches.open(CACHE_NAME);
+    const cache = await caches.open(ASSET_CACHE);
     const cachedResponse = await cache.match(request);
 
     // Start network fetch in background
@@ -88,7 +127,7 @@ async function networkFirst(request) {
     try {
         const networkResponse = await fetch(request);
         if (networkResponse.ok) {
-            const cache = await caches.open(CACHE_NAME);
+            const cache = await caches.open(PAGE_CACHE);
             cache.put(request, networkResponse.clone());
         }
         return networkResponse;
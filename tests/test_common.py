@@ -30,3 +30,186 @@ class TestSchoolYear:
     def test_january(self):
         dt = datetime(2026, 1, 1)
         assert school_year(dt) == "2025/2026"
+
+
+class TestBackupRetention:
+    def test_grandfather_father_son(self):
+        from datetime import timedelta
+
+        from core.backup_scheduler import select_retained
+
+        start = datetime(2026, 1, 1, 2, 0)
+        stamps = [start + timedelta(hours=12 * i) for i in range(120)]  # two per day, 60 days
+        keep = select_retained(stamps, daily=3, weekly=2, monthly=2)
+
+        newest = max(stamps)
+        assert newest in keep
+        days = sorted({d.date() for d in keep}, reverse=True)
+        assert days[:3] == [newest.date() - timedelta(days=i) for i in range(3)]
+        # One archive per retained day, week and month: never more than 3 + 2 + 2.
+        assert len(keep) <= 7
+        # Monthly: the newest archive of February survives, January is gone.
+        assert max(d for d in stamps if d.month == 2) in keep
+        assert all(d.month != 1 for d in keep)
+
+    def test_verify_detects_corruption(self, tmp_path):
+        import sqlite3
+        import zipfile
+
+        from core.backup_scheduler import verify_backup
+
+        db_path = tmp_path / "ecole_multi.db"
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE t (x)")
+        conn.commit()
+        conn.close()
+        good = tmp_path / "good.zip"
+        with zipfile.ZipFile(good, "w") as zf:
+            zf.write(db_path, "ecole_multi.db")
+        assert verify_backup(str(good)) == (True, "ok")
+
+        bad = tmp_path / "bad.zip"
+        with zipfile.ZipFile(bad, "w") as zf:
+            zf.writestr("ecole_multi.db", b"not a database" * 100)
+        assert verify_backup(str(bad))[0] is False
+
+
+    def test_failed_verification_prunes_nothing(self, tmp_path, monkeypatch):
+        from datetime import timedelta
+
+        import core.backup_scheduler as scheduler
+
+        monkeypatch.setattr(scheduler, "BACKUP_DIR", str(tmp_path))
+        monkeypatch.setattr(scheduler, "STATUS_PATH", str(tmp_path / "backup_status.json"))
+        # One old daily archive that the policy would drop once a newer one counts.
+        old = datetime.now() - timedelta(days=400)
+        old_name = f"backup_{old.strftime('%Y%m%d_%H%M%S')}.zip"
+        (tmp_path / old_name).write_bytes(b"old")
+        monkeypatch.setattr(scheduler, "select_retained", lambda stamps: set(sorted(stamps)[-1:]))
+
+        def write(path, progress=None):
+            with open(path, "wb") as f:
+                f.write(b"zip")
+            return 3
+
+        monkeypatch.setattr(scheduler, "write_backup_zip", write)
+        monkeypatch.setattr(scheduler, "verify_backup", lambda path: (False, "corrupt"))
+        record = scheduler.run_backup_cycle()
+        assert record["verified"] is False and record["removed"] == []
+        assert (tmp_path / old_name).exists()
+        assert (tmp_path / f"{record['file']}.corrupt").exists()
+        assert [p for p, _ in scheduler.list_backups(str(tmp_path))] == [str(tmp_path / old_name)]
+
+        monkeypatch.setattr(scheduler, "verify_backup", lambda path: (True, "ok"))
+        record = scheduler.run_backup_cycle()
+        assert record["verified"] is True and record["removed"] == [old_name]
+
+    def test_unverified_archives_do_not_take_slots(self, tmp_path, monkeypatch):
+        import core.backup_scheduler as scheduler
+
+        monkeypatch.setattr(scheduler, "STATUS_PATH", str(tmp_path / "backup_status.json"))
+        names = ["backup_20260101_020000.zip", "backup_20260102_020000.zip"]
+        for name in names:
+            (tmp_path / name).write_bytes(b"x")
+        scheduler._update_run(names[1], verified=None)
+        monkeypatch.setattr(scheduler, "select_retained", lambda stamps: set(stamps))
+        assert scheduler.apply_retention(str(tmp_path)) == []
+        seen = []
+        monkeypatch.setattr(scheduler, "select_retained", lambda stamps: seen.extend(stamps) or set())
+        scheduler.apply_retention(str(tmp_path))
+        assert len(seen) == 1 and (tmp_path / names[1]).exists()
+
+
+class TestSchoolYearClone:
+    @staticmethod
+    def _db():
+        import sqlite3
+
+        db = sqlite3.connect(":memory:")
+        db.executescript(
+            """
+            CREATE TABLE eleves (id INTEGER PRIMARY KEY, user_id INTEGER, school_year TEXT, nom_complet TEXT,
+                                 niveau TEXT, parent_phone TEXT DEFAULT '', parent_email TEXT DEFAULT '');
+            CREATE TABLE teacher_assignments (id INTEGER PRIMARY KEY, user_id INTEGER, school_year TEXT,
+                                              subject_id INTEGER, class_name TEXT,
+                                              UNIQUE(user_id, school_year, subject_id, class_name));
+            """
+        )
+        db.executemany(
+            "INSERT INTO eleves (user_id, school_year, nom_complet, niveau, parent_phone) VALUES (?, ?, ?, ?, ?)",
+            [
+                (1, "A", " Élodie ", "1am1", " 055 "),
+                (1, "A", "ÉLODIE", "1AM1 ", ""),  # same key after normalisation
+                (1, "A", "Karim", "3AM2", ""),
+                (1, "A", "   ", "1AM1", ""),  # empty name
+                (1, "B", "karim", "4am2", ""),  # already in target
+            ],
+        )
+        db.execute("INSERT INTO teacher_assignments (user_id, school_year, subject_id, class_name) VALUES (1, 'A', 7, '1am1')")
+        db.commit()
+        return db
+
+    def test_promote_and_dedup(self):
+        from edumaster.services.school_year_clone import clone_school_year
+
+        db = self._db()
+        result = clone_school_year(db, "A", "B", class_mode="auto_promote")
+        db.commit()
+        assert (result.inserted, result.skipped, result.promoted, result.assignments) == (1, 3, 1, 1)
+        rows = db.execute("SELECT nom_complet, niveau, parent_phone FROM eleves WHERE school_year = 'B' ORDER BY id").fetchall()
+        assert rows == [("karim", "4am2", ""), ("Élodie", "2AM1", "055")]
+        assert db.execute("SELECT class_name FROM teacher_assignments WHERE school_year = 'B'").fetchall() == [("2AM1",)]
+
+    def test_dry_run_writes_nothing(self):
+        from edumaster.services.school_year_clone import clone_school_year
+
+        db = self._db()
+        result = clone_school_year(db, "A", "B", class_mode="keep", dry_run=True)
+        db.rollback()
+        assert result.dry_run and result.inserted == 2
+        assert db.execute("SELECT COUNT(*) FROM eleves WHERE school_year = 'B'").fetchone()[0] == 1
+        assert clone_school_year(db, "A", "B", class_mode="keep").inserted == 2
+
+
+class TestEnsureSchoolYears:
+    def test_existing_year_does_not_open_a_write_transaction(self):
+        import sqlite3
+
+        from edumaster.services.common import ensure_school_years
+
+        db = sqlite3.connect(":memory:")
+        db.row_factory = sqlite3.Row
+        label = ensure_school_years(db)
+        assert not db.in_transaction
+        assert ensure_school_years(db) == label
+        # A pending write here would hold the lock until the request ends.
+        assert not db.in_transaction
+
+
+class TestSqlTrace:
+    def test_fingerprint_folds_literals_and_in_lists(self):
+        from core.sql_trace import fingerprint
+
+        assert fingerprint("SELECT  devoir_t1 FROM eleves\n WHERE id = 12 AND nom = 'O''Neil'") == (
+            "SELECT devoir_t1 FROM eleves WHERE id = ? AND nom = ?"
+        )
+        assert fingerprint("DELETE FROM notes WHERE id IN (?, ?,?)") == "DELETE FROM notes WHERE id IN (?, ...)"
+
+    def test_traced_connection_counts_shapes(self):
+        import sqlite3
+
+        from core.sql_trace import TracedConnection
+
+        db = sqlite3.connect(":memory:", factory=TracedConnection)
+        db.execute("CREATE TABLE t (id INTEGER, v TEXT)")
+        db.executemany("INSERT INTO t VALUES (?, ?)", [(i, str(i)) for i in range(10)])
+        for i in range(5):
+            db.execute(f"SELECT v FROM t WHERE id = {i}").fetchone()
+        rows = [r for r in db.execute("SELECT * FROM t")]
+        assert len(rows) == 10
+        trace = db.trace
+        # executemany is one statement; the loop is one shape run 5 times.
+        assert trace.statements == 1 + 1 + 5 + 1
+        assert trace.repeated(3) == [("SELECT v FROM t WHERE id = ?", 5)]
+        assert trace.repeated(5) == []
+        assert trace.seconds > 0
@@ -109,10 +109,11 @@ class TestNoteExpr:
         result = note_expr("1")
         assert len(result) == 5
 
-    def test_contains_safe_columns(self):
-        devoir, _, _, _, _ = note_expr("2")
-        assert "devoir_t2" in devoir
-        assert "devoir_t{" not in devoir
+    def test_reads_notes_only(self):
+        devoir, _, _, remarques, moy = note_expr("2")
+        assert devoir == "COALESCE(n.devoir, 0)"
+        assert remarques == "COALESCE(n.remarques, '')"
+        assert "_t2" not in moy and "e." not in moy
 
     def test_invalid_raises(self):
         with pytest.raises(ValueError):
@@ -136,3 +137,45 @@ class TestParseFloat:
 
     def test_empty(self):
         assert parse_float("") is None
+
+
+class TestGradingKernel:
+    @staticmethod
+    def _scalar_moyenne(devoir, activite, compo):
+        d, c = clean_note(devoir), clean_note(compo)
+        a = sum_activite_components(*split_activite_components(activite))
+        return ((d + a) / 2 + (c * 2)) / 3
+
+    def test_matches_scalar_formula(self):
+        import numpy as np
+
+        from edumaster.services.grading import compute_grades, note_array
+
+        rows = [("12", "14,5", "9"), ("", None, "25"), ("abc", "20", "-3"), ("7.25", "3.1", "11")]
+        batch = compute_grades(
+            note_array([r[0] for r in rows]),
+            note_array([r[2] for r in rows]),
+            activite=note_array([r[1] for r in rows]),
+        )
+        expected = [self._scalar_moyenne(*r) for r in rows]
+        assert np.allclose(batch.moyenne, expected)
+        assert batch.components.tolist()[0] == list(split_activite_components("14,5"))
+        assert batch.admis.tolist() == [m >= 10 for m in expected]
+
+    def test_components_are_capped_and_unset_rows_split(self):
+        import numpy as np
+
+        from edumaster.services.grading import compute_grades
+
+        components = np.array([[5, 6, 1, 0, 9], [np.nan] * 5])
+        batch = compute_grades([10, 10], [10, 10], activite=[0, 4], components=components)
+        assert batch.components.tolist() == [[3.0, 6.0, 1.0, 0.0, 2.0], [3.0, 1.0, 0.0, 0.0, 0.0]]
+        assert batch.activite.tolist() == [12.0, 4.0]
+
+    def test_appreciation_first_matching_rule(self):
+        from edumaster.services.grading import appreciation_messages, compute_grades
+
+        rules = [(0, 9.99, "low"), (10, 20, "high"), (10, 20, "shadowed")]
+        batch = compute_grades([0, 20, float("nan")], [0, 20, 10], rules=rules)
+        assert batch.appreciation.tolist() == [0, 1, -1]
+        assert appreciation_messages(batch, rules) == ["low", "high", ""]
@@ -1,4 +1,7 @@
 """Integration tests for main application routes."""
+import json
+import uuid
+
 import pytest
 
 
@@ -35,3 +38,1039 @@ class TestRoutes:
     def test_set_lang_fr(self, auth_client):
         response = auth_client.get("/lang/fr", follow_redirects=False)
         assert response.status_code == 302
+
+
+class TestConditionalCaching:
+    def test_dashboard_returns_304_when_unchanged(self, auth_client):
+        first = auth_client.get("/")
+        assert first.status_code == 200
+        etag = first.headers.get("ETag")
+        assert etag
+        second = auth_client.get("/", headers={"If-None-Match": etag})
+        assert second.status_code == 304
+
+    def test_write_invalidates_etag(self, auth_client):
+        etag = auth_client.get("/api/notifications/count").headers.get("ETag")
+        auth_client.post("/notifications/read-all", data={"csrf_token": "test-csrf"})
+        auth_client.get("/notifications")  # consume the flash message
+        response = auth_client.get("/api/notifications/count", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers.get("ETag") != etag
+
+    def test_unknown_data_version_disables_caching(self, auth_client, monkeypatch):
+        import sqlite3
+
+        from core import data_version
+
+        etag = auth_client.get("/").headers.get("ETag")
+        conn = sqlite3.connect(":memory:")
+        conn.row_factory = sqlite3.Row
+        assert data_version.get_data_version(conn, 1) is None
+        monkeypatch.setattr("core.http_cache.get_data_version", lambda db, user_id: None)
+        response = auth_client.get("/", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert "ETag" not in response.headers
+
+
+class TestNotificationStream:
+    def test_stream_is_off_by_default(self, auth_client):
+        assert auth_client.get("/api/notifications/stream").status_code == 204
+        page = auth_client.get("/").get_data(as_text=True)
+        assert "EventSource" not in page and "setInterval" in page
+
+    def test_stream_sends_initial_count_without_holding_a_connection(self, app, auth_client):
+        from core.db import connection_stats
+
+        app.config["NOTIFICATIONS_STREAM"] = True
+        response = auth_client.get("/api/notifications/stream", buffered=False)
+        assert response.status_code == 200
+        assert response.mimetype == "text/event-stream"
+        first = next(iter(response.response))
+        active = connection_stats()["active"]
+        response.close()
+        assert active == 0
+        if isinstance(first, bytes):
+            first = first.decode("utf-8")
+        assert "event: count" in first
+        assert '"count": 0' in first
+
+    def test_create_notification_updates_count(self, app, auth_client):
+        from core.db import get_db
+        from edumaster.routes.notifications import create_notification
+
+        before = auth_client.get("/api/notifications/count").get_json()["count"]
+        with app.app_context():
+            db = get_db()
+            user = db.execute("SELECT id FROM users WHERE username = 'testprof'").fetchone()
+            create_notification(db, user["id"], "Bienvenue")
+        response = auth_client.get("/api/notifications/count")
+        assert response.get_json() == {"count": before + 1}
+
+
+class TestNotificationFanOut:
+    def test_bulk_insert_is_deduplicated(self, db):
+        from edumaster.routes.notifications import create_notifications_bulk
+
+        for name in ("prof_a", "prof_b"):
+            db.execute(
+                "INSERT OR IGNORE INTO users (username, password, nom_affichage) VALUES (?, 'x', ?)",
+                (name, name),
+            )
+        db.commit()
+        ids = [r["id"] for r in db.execute("SELECT id FROM users").fetchall()]
+        key = uuid.uuid4().hex
+        assert create_notifications_bulk(db, ids, "Reunion", dedup_key=key) == len(ids)
+        assert create_notifications_bulk(db, ids, "Reunion", dedup_key=key) == 0
+
+    def test_bulk_only_bumps_recipients(self, db):
+        from core.data_version import get_data_version
+        from edumaster.routes.notifications import create_notifications_bulk
+
+        ids = [r["id"] for r in db.execute("SELECT id FROM users ORDER BY id LIMIT 2").fetchall()]
+        key = uuid.uuid4().hex
+        assert create_notifications_bulk(db, ids[:1], "Conseil", dedup_key=key) == 1
+        before = {uid: get_data_version(db, uid)[1] for uid in ids}
+        assert create_notifications_bulk(db, ids, "Conseil", dedup_key=key) == 1
+        after = {uid: get_data_version(db, uid)[1] for uid in ids}
+        assert after[ids[0]] == before[ids[0]]
+        assert after[ids[1]] == before[ids[1]] + 1
+
+    def test_prune_only_removes_old_read_rows(self, db):
+        from edumaster.routes.notifications import prune_read_notifications
+
+        cur = db.execute(
+            "INSERT INTO users (username, password, nom_affichage) VALUES (?, 'x', 'p')",
+            (uuid.uuid4().hex,),
+        )
+        uid = cur.lastrowid
+        db.executemany(
+            "INSERT INTO notifications (user_id, title, is_read, created_at) VALUES (?, 't', ?, ?)",
+            [(uid, 1, 0), (uid, 1, 0), (uid, 0, 0), (uid, 1, 2_000_000_000)],
+        )
+        db.commit()
+        assert prune_read_notifications(db, older_than_days=30, batch_size=1) == 2
+        remaining = db.execute("SELECT COUNT(*) AS c FROM notifications WHERE user_id = ?", (uid,)).fetchone()
+        assert remaining["c"] == 2
+
+
+class TestAuditLog:
+    def test_buffered_event_visible_in_history(self, app, auth_client):
+        from core.audit import log_change
+
+        action = f"test_{uuid.uuid4().hex[:8]}"
+        with app.app_context():
+            from core.db import get_db
+            user = get_db().execute("SELECT id FROM users WHERE username = 'testprof'").fetchone()
+            log_change(action, user["id"], details="buffered")
+        response = auth_client.get("/history")
+        assert action.encode() in response.data
+
+    def test_joins_open_transaction(self, db):
+        from core.audit import log_change
+
+        action = f"test_{uuid.uuid4().hex[:8]}"
+        db.execute("INSERT INTO subjects (user_id, name) VALUES (1, ?)", (action,))
+        log_change(action, 1)
+        db.rollback()
+        row = db.execute("SELECT 1 FROM change_log WHERE action = ?", (action,)).fetchone()
+        assert row is None
+
+    def test_failed_flush_is_retried(self, app, tmp_path, monkeypatch):
+        from core import audit
+        from core.db import get_db
+
+        action = f"test_{uuid.uuid4().hex[:8]}"
+        requeued = audit.audit_stats()["requeued"]
+        with monkeypatch.context() as patch:
+            patch.setattr(audit, "DATABASE", str(tmp_path / "missing" / "db.sqlite"))
+            audit.log_change(action, 1)
+            assert audit.flush_audit_log() == 0
+        assert audit.audit_stats()["requeued"] > requeued
+
+        audit.flush_audit_log()
+        with app.app_context():
+            row = get_db().execute("SELECT 1 FROM change_log WHERE action = ?", (action,)).fetchone()
+        assert row is not None
+
+
+class TestChangeLogArchive:
+    def test_old_rows_are_archived_and_still_searchable(self, app, auth_client):
+        from datetime import datetime
+
+        from core.db import get_db
+        from core.log_archive import archive_change_log
+
+        action = f"old_{uuid.uuid4().hex[:8]}"
+        old_ts = int(datetime(2019, 10, 1).timestamp())
+        with app.app_context():
+            db = get_db()
+            user = db.execute("SELECT id FROM users WHERE username = 'testprof'").fetchone()
+            db.execute(
+                "INSERT INTO change_log (user_id, action, details, created_at) VALUES (?, ?, '', ?)",
+                (user["id"], action, old_ts),
+            )
+            db.commit()
+            moved = archive_change_log(db)
+            assert moved.get("2019/2020", 0) >= 1
+            hot = db.execute("SELECT 1 FROM change_log WHERE action = ?", (action,)).fetchone()
+            assert hot is None
+
+        assert action.encode() not in auth_client.get("/history").data
+        response = auth_client.get("/history?from=2019-09-15&to=2019-12-31")
+        assert action.encode() in response.data
+        assert action.encode() in auth_client.get("/history?to=2019-12-31").data
+
+
+class TestStreamingBackup:
+    @pytest.fixture()
+    def uploads(self, app, tmp_path, monkeypatch):
+        import core.backup
+
+        folder = tmp_path / "uploads"
+        (folder / "docs").mkdir(parents=True)
+        (folder / "docs" / "a.pdf").write_bytes(b"a" * 1000)
+        (folder / "b.txt").write_text("b")
+        monkeypatch.setattr(core.backup, "UPLOAD_FOLDER", str(folder))
+        monkeypatch.setattr(core.backup, "BACKUP_DIR", str(tmp_path))
+        monkeypatch.setattr(core.backup, "MANIFEST_PATH", str(tmp_path / "manifest.json"))
+        return folder
+
+    @staticmethod
+    def _names(path):
+        import zipfile
+
+        with zipfile.ZipFile(path) as zf:
+            assert zf.testzip() is None
+            return {n for n in zf.namelist() if n.startswith("uploads/")}
+
+    def test_incremental_only_carries_changed_uploads(self, uploads, tmp_path):
+        import os
+
+        from core.backup import write_backup_zip
+
+        full = tmp_path / "full.zip"
+        steps = []
+        write_backup_zip(str(full), progress=lambda stage, done, total: steps.append(stage))
+        assert self._names(full) == {"uploads/docs/a.pdf", "uploads/b.txt"}
+        assert "database" in steps
+
+        # Touched but identical content is not re-sent.
+        os.utime(uploads / "b.txt", ns=(1, 1))
+        (uploads / "c.txt").write_text("c")
+        incr = tmp_path / "incr.zip"
+        write_backup_zip(str(incr), incremental=True)
+        assert self._names(incr) == {"uploads/c.txt"}
+
+    def test_admin_download_is_streamed(self, auth_client, uploads):
+        import io
+        import zipfile
+
+        with auth_client.session_transaction() as sess:
+            sess["is_admin"] = 1
+        response = auth_client.get("/admin/backup")
+        assert response.status_code == 200
+        assert response.is_streamed
+        with zipfile.ZipFile(io.BytesIO(response.data)) as zf:
+            assert "ecole_multi.db" in zf.namelist()
+
+    def test_downloads_do_not_move_the_incremental_base(self, auth_client, uploads, tmp_path):
+        import io
+        import json
+        import zipfile
+
+        from core.backup import write_backup_zip
+
+        write_backup_zip(str(tmp_path / "backup_full.zip"))
+        (uploads / "c.txt").write_text("c")
+        with auth_client.session_transaction() as sess:
+            sess["is_admin"] = 1
+        assert auth_client.get("/admin/backup").status_code == 200
+        download = auth_client.get("/admin/backup?incremental=1")
+        with zipfile.ZipFile(io.BytesIO(download.data)) as zf:
+            assert {n for n in zf.namelist() if n.startswith("uploads/")} == {"uploads/c.txt"}
+            assert json.loads(zf.read("backup_info.json"))["base_archive"] == "backup_full.zip"
+
+        (tmp_path / "out").mkdir()
+        incr = tmp_path / "out" / "incr.zip"
+        write_backup_zip(str(incr), incremental=True)
+        assert self._names(incr) == {"uploads/c.txt"}
+
+
+class TestDocumentBlobs:
+    def test_identical_uploads_share_one_blob(self, app, auth_client, tmp_path):
+        import io
+        import os
+
+        from core.db import get_db
+
+        app.config["UPLOAD_FOLDER"] = str(tmp_path)
+        content = uuid.uuid4().bytes * 100
+        titre = f"doc_{uuid.uuid4().hex[:8]}"
+        for _ in range(2):
+            auth_client.post("/upload", data={
+                "titre": titre,
+                "type_doc": "Cours",
+                "csrf_token": "test-csrf",
+                "fichier": (io.BytesIO(content), "circulaire.pdf"),
+            }, content_type="multipart/form-data")
+
+        with app.app_context():
+            rows = get_db().execute(
+                "SELECT id, filename, original_name FROM documents WHERE titre = ? ORDER BY id", (titre,)
+            ).fetchall()
+        assert len(rows) == 2
+        assert rows[0]["filename"] == rows[1]["filename"]
+        assert rows[0]["original_name"] == "circulaire.pdf"
+        blob = os.path.join(str(tmp_path), rows[0]["filename"])
+        assert os.path.isfile(blob)
+
+        auth_client.post(f"/supprimer_document/{rows[0]['id']}", data={"csrf_token": "test-csrf"})
+        assert os.path.isfile(blob)
+        auth_client.post(f"/supprimer_document/{rows[1]['id']}", data={"csrf_token": "test-csrf"})
+        assert not os.path.exists(blob)
+
+
+class TestStaticAssets:
+    def test_fingerprinted_url_is_immutable(self, client):
+        import re
+
+        html = client.get("/login").data.decode()
+        match = re.search(r'/static/css/style\.css\?v=([0-9a-f]+)', html)
+        assert match
+        response = client.get(match.group(0))
+        assert "immutable" in response.headers["Cache-Control"]
+
+        plain = client.get("/static/css/style.css")
+        assert plain.headers["Cache-Control"] == "no-cache"
+        etag = plain.headers["ETag"]
+        assert client.get("/static/css/style.css", headers={"If-None-Match": etag}).status_code == 304
+
+    def test_upload_blobs_support_range(self, app, client):
+        import os
+
+        folder = os.path.join(app.static_folder, "uploads", "blobs", "zz")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{uuid.uuid4().hex}.pdf")
+        with open(path, "wb") as f:
+            f.write(b"0123456789" * 100)
+        try:
+            url = "/static/uploads/blobs/zz/" + os.path.basename(path)
+            response = client.get(url, headers={"Range": "bytes=10-19"})
+            assert response.status_code == 206
+            assert response.data == b"0123456789"
+            assert "immutable" in response.headers["Cache-Control"]
+            assert response.headers.get("ETag")
+        finally:
+            os.remove(path)
+            if not os.listdir(folder):
+                os.rmdir(folder)
+
+    def test_service_worker_embeds_asset_manifest(self, client):
+        response = client.get("/sw.js")
+        assert response.status_code == 200
+        assert response.mimetype == "application/javascript"
+        body = response.data.decode()
+        assert "/*__ASSET_MANIFEST__*/" not in body
+        assert "/static/css/style.css?v=" in body
+        assert 'register("/sw.js"' in client.get("/login").get_data(as_text=True)
+        assert client.get("/sw.js", headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+
+class TestRestore:
+    @pytest.fixture()
+    def live(self, tmp_path, monkeypatch):
+        import sqlite3
+
+        import core.backup
+
+        db_path = tmp_path / "live.db"
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE t (x)")
+        conn.execute("INSERT INTO t VALUES ('before')")
+        conn.commit()
+        conn.close()
+        uploads = tmp_path / "uploads"
+        uploads.mkdir()
+        (uploads / "a.txt").write_text("a1")
+        (uploads / "same.txt").write_text("same")
+        monkeypatch.setattr(core.backup, "DATABASE", str(db_path))
+        monkeypatch.setattr(core.backup, "UPLOAD_FOLDER", str(uploads))
+        monkeypatch.setattr(core.backup, "MANIFEST_PATH", str(tmp_path / "manifest.json"))
+        return db_path, uploads
+
+    def test_swap_only_restores_changed_uploads(self, live, tmp_path):
+        import sqlite3
+
+        from core.backup import restore_from_backup_zip, write_backup_zip
+
+        db_path, uploads = live
+        archive = tmp_path / "backup.zip"
+        write_backup_zip(str(archive))
+
+        conn = sqlite3.connect(db_path)
+        conn.execute("UPDATE t SET x = 'after'")
+        conn.commit()
+        conn.close()
+        (uploads / "a.txt").write_text("a2")
+        (uploads / "extra.txt").write_text("x")
+
+        result = restore_from_backup_zip(str(archive), drain_timeout=1)
+        assert result.unchanged_files == 1
+        assert result.restored_files == 2  # database + a.txt
+        assert result.removed_files == 1
+        assert (uploads / "a.txt").read_text() == "a1"
+        assert not (uploads / "extra.txt").exists()
+        conn = sqlite3.connect(db_path)
+        assert conn.execute("SELECT x FROM t").fetchone()[0] == "before"
+        conn.close()
+        assert sqlite3.connect(result.db_backup_path).execute("SELECT x FROM t").fetchone()[0] == "after"
+
+    def test_old_snapshot_is_migrated_and_versions_move_on(self, live, tmp_path):
+        import sqlite3
+
+        from core.backup import restore_from_backup_zip, write_backup_zip
+
+        db_path, _ = live
+        archive = tmp_path / "backup.zip"
+        write_backup_zip(str(archive))
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE data_versions (scope_id INTEGER PRIMARY KEY, version INTEGER)")
+        conn.execute("INSERT INTO data_versions VALUES (0, 7)")
+        conn.commit()
+        conn.close()
+
+        restore_from_backup_zip(str(archive), drain_timeout=1)
+        conn = sqlite3.connect(db_path)
+        tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert {"sessions", "grade_rollups", "data_versions"} <= tables
+        assert "row_version" in {r[1] for r in conn.execute("PRAGMA table_info(notes)")}
+        assert conn.execute("SELECT version FROM data_versions WHERE scope_id = 0").fetchone()[0] == 8
+        assert conn.execute("SELECT x FROM t").fetchone()[0] == "before"
+        conn.close()
+
+    def test_sessions_are_left_out_of_backups(self, live, tmp_path):
+        import sqlite3
+
+        from core.backup import restore_from_backup_zip, write_backup_zip
+
+        db_path, _ = live
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE sessions (sid TEXT PRIMARY KEY, data TEXT, expires_at INTEGER, version INTEGER)")
+        conn.execute("INSERT INTO sessions VALUES ('old-sid', '{}', 9999999999, 1)")
+        conn.commit()
+        conn.close()
+        archive = tmp_path / "backup.zip"
+        write_backup_zip(str(archive))
+        restore_from_backup_zip(str(archive), drain_timeout=1)
+        conn = sqlite3.connect(db_path)
+        assert conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] == 0
+        conn.close()
+
+    def test_open_connections_abort_the_swap(self, live, tmp_path, monkeypatch):
+        from contextlib import contextmanager
+
+        import core.backup
+        from core.backup import restore_from_backup_zip, write_backup_zip
+
+        @contextmanager
+        def busy(timeout):
+            yield 1
+
+        db_path, _ = live
+        archive = tmp_path / "backup.zip"
+        write_backup_zip(str(archive))
+        before = db_path.read_bytes()
+        monkeypatch.setattr(core.backup, "drain_connections", busy)
+        with pytest.raises(RuntimeError):
+            restore_from_backup_zip(str(archive), drain_timeout=1)
+        assert db_path.read_bytes() == before
+
+    def test_corrupt_snapshot_leaves_live_data(self, live, tmp_path):
+        import zipfile
+
+        from core.backup import restore_from_backup_zip
+
+        db_path, _ = live
+        before = db_path.read_bytes()
+        archive = tmp_path / "bad.zip"
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("ecole_multi.db", b"SQLite format 3\x00" + b"\x00" * 200)
+        with pytest.raises(ValueError):
+            restore_from_backup_zip(str(archive), drain_timeout=1)
+        assert db_path.read_bytes() == before
+
+
+class TestAdminPanels:
+    @pytest.fixture()
+    def admin_client(self, auth_client):
+        with auth_client.session_transaction() as sess:
+            sess["is_admin"] = 1
+        return auth_client
+
+    def _walk(self, client, url):
+        items, after, pages = [], None, 0
+        while True:
+            resp = client.get(url + (f"&after={after}" if after else ""))
+            assert resp.status_code == 200
+            page = resp.get_json()
+            items.extend(page["items"])
+            pages += 1
+            after = page["next"]
+            if not after:
+                return items, pages
+
+    def test_documents_keyset_pages_cover_everything_once(self, app, admin_client):
+        from core.db import get_db
+
+        tag = uuid.uuid4().hex[:8]
+        with app.app_context():
+            db = get_db()
+            user_id = db.execute("SELECT id FROM users WHERE username = 'testprof'").fetchone()[0]
+            db.executemany(
+                "INSERT INTO documents (user_id, titre, type_doc, niveau, filename) VALUES (?, ?, 'cours', '1AS', ?)",
+                [(user_id, f"{tag}-{i}", f"{tag}-{i}.pdf") for i in range(7)],
+            )
+            db.commit()
+            total = db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+        items, pages = self._walk(admin_client, "/admin/api/documents?limit=3")
+        ids = [item["id"] for item in items]
+        assert len(ids) == total == len(set(ids))
+        assert ids == sorted(ids, reverse=True)
+        assert pages == -(-total // 3)
+
+    def test_users_page_is_ordered_admins_first(self, admin_client):
+        items, _ = self._walk(admin_client, "/admin/api/users?limit=2")
+        keys = [(-item["is_admin"], item["id"]) for item in items]
+        assert keys == sorted(keys)
+        assert any(item["username"] == "testprof" for item in items)
+
+    def test_api_requires_admin_and_valid_cursor(self, auth_client):
+        assert auth_client.get("/admin/api/users").status_code in (302, 403)
+        with auth_client.session_transaction() as sess:
+            sess["is_admin"] = 1
+        assert auth_client.get("/admin/api/users?after=not-a-cursor").status_code == 400
+        assert auth_client.get("/admin").status_code == 200
+
+    def test_class_names_follow_student_writes(self, app):
+        from core.db import get_db
+
+        tag = uuid.uuid4().hex[:6].upper()
+        with app.app_context():
+            db = get_db()
+            user_id = db.execute("SELECT id FROM users WHERE username = 'testprof'").fetchone()[0]
+
+            def count(niveau):
+                row = db.execute("SELECT student_count FROM class_names WHERE niveau = ?", (niveau,)).fetchone()
+                return row[0] if row else None
+
+            db.executemany(
+                "INSERT INTO eleves (user_id, school_year, nom_complet, niveau) VALUES (?, '2025/2026', ?, ?)",
+                [(user_id, "A", f"1{tag}"), (user_id, "B", f"1{tag}")],
+            )
+            assert count(f"1{tag}") == 2
+            db.execute("UPDATE eleves SET niveau = ? WHERE nom_complet = 'A' AND niveau = ?", (f"2{tag}", f"1{tag}"))
+            assert (count(f"1{tag}"), count(f"2{tag}")) == (1, 1)
+            db.execute("DELETE FROM eleves WHERE niveau IN (?, ?)", (f"1{tag}", f"2{tag}"))
+            assert count(f"1{tag}") is None and count(f"2{tag}") is None
+            db.commit()
+
+
+class TestGradeWrites:
+    def _notes(self, app, name):
+        from core.db import get_db
+
+        with app.app_context():
+            return get_db().execute(
+                """
+                SELECT e.id, n.participation, n.comportement, n.cahier, n.projet, n.assiduite_outils,
+                       n.activite, n.devoir, n.compo, n.remarques
+                FROM eleves e JOIN notes n ON n.eleve_id = e.id
+                WHERE e.nom_complet = ?
+                """,
+                (name,),
+            ).fetchone()
+
+    def test_add_then_bulk_save_go_through_the_kernel(self, app, auth_client):
+        name = f"Eleve {uuid.uuid4().hex[:8]}"
+        auth_client.post("/ajouter_eleve", data={
+            "csrf_token": "test-csrf",
+            "trimestre_ajout": "1",
+            "nom_complet": name,
+            "niveau": "1AS1",
+            "devoir": "12",
+            "activite": "14",
+            "compo": "9",
+        })
+        row = self._notes(app, name)
+        assert row is not None
+        assert [row[k] for k in ("participation", "comportement", "cahier", "projet", "assiduite_outils")] == [
+            3.0, 6.0, 5.0, 0.0, 0.0
+        ]
+        assert (row["activite"], row["devoir"], row["compo"]) == (14.0, 12.0, 9.0)
+        assert row["remarques"] == "نتائج متوسطة"  # moyenne 10.33
+
+        auth_client.post("/sauvegarder_tout", data={
+            "csrf_token": "test-csrf",
+            "trimestre_save": "1",
+            "id_eleve": [str(row["id"]), "999999999"],
+            "devoir": ["18", "10"],
+            "activite": ["25", "10"],
+            "compo": ["19,5", "10"],
+        })
+        row = self._notes(app, name)
+        assert (row["activite"], row["devoir"], row["compo"]) == (20.0, 18.0, 19.5)
+        assert row["remarques"] == "ممتاز"
+
+
+class TestDeltaGradeSave:
+    def _add(self, auth_client, name, devoir="12", compo="9"):
+        auth_client.post("/ajouter_eleve", data={
+            "csrf_token": "test-csrf",
+            "trimestre_ajout": "1",
+            "nom_complet": name,
+            "niveau": "1AS1",
+            "devoir": devoir,
+            "activite": "14",
+            "compo": compo,
+        })
+
+    def _notes(self, app, *names):
+        from core.db import get_db
+
+        with app.app_context():
+            rows = get_db().execute(
+                """
+                SELECT e.id, e.nom_complet, n.participation, n.activite, n.devoir, n.compo,
+                       n.remarques, n.row_version
+                FROM eleves e JOIN notes n ON n.eleve_id = e.id AND n.trimestre = 1
+                WHERE e.nom_complet IN (SELECT value FROM json_each(?))
+                """,
+                (json.dumps(names),),
+            ).fetchall()
+        return {r["nom_complet"]: dict(r) for r in rows}
+
+    def _patch(self, client, changes, **body):
+        return client.patch(
+            "/api/notes",
+            json={"trimestre": "1", "changes": changes, **body},
+            headers={"X-CSRF-Token": "test-csrf"},
+        )
+
+    def test_only_changed_rows_are_written(self, app, auth_client):
+        names = [f"Eleve {uuid.uuid4().hex[:8]}" for _ in range(3)]
+        for name in names:
+            self._add(auth_client, name)
+        before = self._notes(app, *names)
+        edited = before[names[0]]
+
+        response = self._patch(auth_client, [
+            {"eleve_id": edited["id"], "field": "devoir", "value": "18", "row_version": edited["row_version"]},
+            {"eleve_id": edited["id"], "field": "compo", "value": "19,5", "row_version": edited["row_version"]},
+            {"eleve_id": edited["id"], "field": "participation", "value": "1", "row_version": edited["row_version"]},
+        ])
+        assert response.status_code == 200
+        body = response.get_json()
+        assert body["saved"] == 1
+        [row] = body["rows"]
+        # Components split from activite 14 (3, 6, 5, 0, 0), participation set to 1.
+        assert row["activite"] == 12.0
+        assert row["moyenne"] == round(((18 + 12) / 2 + 19.5 * 2) / 3, 2)
+        assert row["row_version"] == edited["row_version"] + 1
+
+        after = self._notes(app, *names)
+        assert after[names[0]]["devoir"] == 18.0
+        assert after[names[0]]["participation"] == 1.0
+        assert after[names[0]]["remarques"] == row["remarques"]
+        assert after[names[0]]["row_version"] == row["row_version"]
+        for name in names[1:]:
+            assert after[name] == before[name]
+
+    def test_stale_row_version_is_rejected(self, app, auth_client):
+        name = f"Eleve {uuid.uuid4().hex[:8]}"
+        self._add(auth_client, name)
+        row = self._notes(app, name)[name]
+        first = self._patch(auth_client, [
+            {"eleve_id": row["id"], "field": "devoir", "value": "15", "row_version": row["row_version"]},
+        ])
+        assert first.status_code == 200
+
+        second = self._patch(auth_client, [
+            {"eleve_id": row["id"], "field": "devoir", "value": "4", "row_version": row["row_version"]},
+        ])
+        assert second.status_code == 409
+        [conflict] = second.get_json()["conflicts"]
+        assert conflict["devoir"] == 15.0
+        assert conflict["row_version"] == first.get_json()["rows"][0]["row_version"]
+        assert self._notes(app, name)[name]["devoir"] == 15.0
+
+    def test_other_writers_bump_the_version(self, app, auth_client):
+        name = f"Eleve {uuid.uuid4().hex[:8]}"
+        self._add(auth_client, name)
+        row = self._notes(app, name)[name]
+        from core.db import get_db
+
+        with app.app_context():
+            db = get_db()
+            db.execute("UPDATE notes SET remarques = 'x' WHERE eleve_id = ?", (row["id"],))
+            db.commit()
+        assert self._notes(app, name)[name]["row_version"] == row["row_version"] + 1
+
+    def test_invalid_changes_are_refused(self, auth_client):
+        assert self._patch(auth_client, [{"eleve_id": 1, "field": "remarques", "value": "x"}]).status_code == 400
+        assert self._patch(auth_client, [{"eleve_id": 999999999, "field": "devoir", "value": "1"}]).status_code == 404
+        response = auth_client.patch("/api/notes", json={"changes": []})
+        assert response.status_code == 400  # no CSRF header
+
+
+class TestDistributionStats:
+    def test_matches_sql_aggregates_and_is_cached_per_version(self, app, auth_client):
+        import statistics
+
+        from core.data_version import bump_data_version
+        from core.db import get_db
+        from edumaster.services.stats_service import get_distribution_stats
+
+        year = f"S-{uuid.uuid4().hex[:6]}"
+        grades = [(12, 14, 9), (18, 20, 19), (4, 3, 2), (0, 0, 0), (10, 10, 10)]
+        with app.app_context():
+            db = get_db()
+            user_id = db.execute("SELECT id FROM users WHERE username = 'testprof'").fetchone()[0]
+            subject_id = db.execute("SELECT id FROM subjects WHERE user_id = ?", (user_id,)).fetchone()[0]
+            for i, (d, a, c) in enumerate(grades):
+                cur = db.execute(
+                    "INSERT INTO eleves (user_id, school_year, nom_complet, niveau) VALUES (?, ?, ?, ?)",
+                    (user_id, year, f"E{i}", "A" if i % 2 else "B"),
+                )
+                db.execute(
+                    "INSERT INTO notes (user_id, eleve_id, subject_id, trimestre, activite, devoir, compo) "
+                    "VALUES (?, ?, ?, 1, ?, ?, ?)",
+                    (user_id, cur.lastrowid, subject_id, a, d, c),
+                )
+            db.commit()
+
+            where, params = "e.user_id = ? AND e.school_year = ?", [user_id, year]
+            result = get_distribution_stats(db, user_id, "1", subject_id, where, params, bins=4)
+            moys = [((d + a) / 2 + c * 2) / 3 for d, a, c in grades]
+            graded = [m for m in moys if m > 0]
+            stats = result["stats"]
+            assert stats["nb_total"] == 5 and stats["nb_saisis"] == 4
+            assert stats["nb_admis"] == sum(m >= 10 for m in moys)
+            assert stats["moyenne_generale"] == round(sum(graded) / len(graded), 2)
+            assert stats["mediane"] == round(statistics.median(graded), 2)
+            assert stats["ecart_type"] == round(statistics.pstdev(graded), 2)
+            assert result["histogram"]["counts"] == [1, 0, 2, 1]
+            assert result["distribution"] == {"admis": 3, "echec": 1, "non_saisi": 1}
+            assert [t["nom"] for t in result["top"][:2]] == ["E1", "E0"]
+            participation = result["components"][0]
+            assert participation["field"] == "participation" and participation["max"] == 3.0
+
+            assert get_distribution_stats(db, user_id, "1", subject_id, where, params, bins=4) is result
+            bump_data_version(db, user_id)
+            db.commit()
+            assert get_distribution_stats(db, user_id, "1", subject_id, where, params, bins=4) is not result
+
+    def test_stats_page_and_pdf_render(self, auth_client):
+        assert auth_client.get("/stats?bins=5").status_code == 200
+        response = auth_client.get("/export_stats_pdf")
+        assert response.status_code == 200
+        assert response.data.startswith(b"%PDF")
+
+
+class TestGradeRollups:
+    REBUILD = """
+        SELECT IFNULL(e.school_year, ''), n.trimestre, n.subject_id, e.niveau, n.user_id,
+               COUNT(*), ROUND(SUM(m), 6), ROUND(SUM(m * m), 6), ROUND(MIN(m), 6), ROUND(MAX(m), 6), SUM(m >= 10)
+        FROM (SELECT *, ((devoir + activite) / 2.0 + compo * 2.0) / 3.0 AS m FROM notes) n
+        JOIN eleves e ON e.id = n.eleve_id
+        WHERE n.m > 0 AND e.school_year = ?
+        GROUP BY 1, 2, 3, 4, 5 ORDER BY 1, 2, 3, 4, 5
+    """
+    ROLLUPS = """
+        SELECT school_year, trimestre, subject_id, class_name, user_id,
+               n, ROUND(total, 6), ROUND(total_sq, 6), ROUND(min_moy, 6), ROUND(max_moy, 6), passed
+        FROM grade_rollups WHERE school_year = ? ORDER BY 1, 2, 3, 4, 5
+    """
+
+    def _assert_in_sync(self, db, year):
+        expected = [tuple(r) for r in db.execute(self.REBUILD, (year,)).fetchall()]
+        assert [tuple(r) for r in db.execute(self.ROLLUPS, (year,)).fetchall()] == expected
+        return expected
+
+    def test_triggers_track_every_kind_of_write(self, app, auth_client):
+        from core.db import get_db
+
+        year = f"R-{uuid.uuid4().hex[:6]}"
+        with app.app_context():
+            db = get_db()
+            user_id = db.execute("SELECT id FROM users WHERE username = 'testprof'").fetchone()[0]
+            subject_id = db.execute("SELECT id FROM subjects WHERE user_id = ?", (user_id,)).fetchone()[0]
+            ids = []
+            for i, niveau in enumerate(["A", "A", "A", "B"]):
+                ids.append(db.execute(
+                    "INSERT INTO eleves (user_id, school_year, nom_complet, niveau) VALUES (?, ?, ?, ?)",
+                    (user_id, year, f"R{i}", niveau),
+                ).lastrowid)
+            upsert = """
+                INSERT INTO notes (user_id, eleve_id, subject_id, trimestre, activite, devoir, compo)
+                VALUES (?, ?, ?, 1, ?, ?, ?)
+                ON CONFLICT(user_id, eleve_id, subject_id, trimestre)
+                DO UPDATE SET activite = excluded.activite, devoir = excluded.devoir, compo = excluded.compo
+            """
+            for eleve_id, note in zip(ids, [12, 18, 6, 15]):
+                db.execute(upsert, (user_id, eleve_id, subject_id, note, note, note))
+            rows = self._assert_in_sync(db, year)
+            assert [(r[3], r[5], r[9]) for r in rows] == [("A", 3, 18.0), ("B", 1, 15.0)]
+
+            db.execute(upsert, (user_id, ids[1], subject_id, 9, 9, 9))  # the max goes away
+            db.execute(upsert, (user_id, ids[2], subject_id, 0, 0, 0))  # no longer graded
+            self._assert_in_sync(db, year)
+            db.execute("UPDATE eleves SET niveau = 'B' WHERE id = ?", (ids[0],))
+            self._assert_in_sync(db, year)
+            db.execute("DELETE FROM notes WHERE eleve_id IN (?, ?)", (ids[0], ids[3]))
+            db.execute("DELETE FROM eleves WHERE id = ?", (ids[0],))
+            rows = self._assert_in_sync(db, year)
+            assert [(r[3], r[5]) for r in rows] == [("A", 1)]
+            db.commit()
+
+    def test_analytics_endpoint_groups_rollups(self, app, auth_client):
+        from core.db import get_db
+
+        with auth_client.session_transaction() as sess:
+            sess["is_admin"] = 1
+        with app.app_context():
+            db = get_db()
+            year = db.execute("SELECT label FROM school_years WHERE is_active = 1").fetchone()[0]
+            user_id = db.execute("SELECT id FROM users WHERE username = 'testprof'").fetchone()[0]
+            subject_id = db.execute("SELECT id FROM subjects WHERE user_id = ?", (user_id,)).fetchone()[0]
+            eleve_id = db.execute(
+                "INSERT INTO eleves (user_id, school_year, nom_complet, niveau) VALUES (?, ?, ?, 'AN1')",
+                (user_id, year, f"AN {uuid.uuid4().hex[:6]}"),
+            ).lastrowid
+            db.execute(
+                "INSERT INTO notes (user_id, eleve_id, subject_id, trimestre, activite, devoir, compo) "
+                "VALUES (?, ?, ?, 2, 14, 14, 14)",
+                (user_id, eleve_id, subject_id),
+            )
+            db.commit()
+
+        data = auth_client.get("/admin/api/analytics?group_by=class&trimestre=2").get_json()
+        assert data["group_by"] == "class" and data["trimestre"] == 2
+        row = next(item for item in data["items"] if item["class_name"] == "AN1")
+        assert row["n"] >= 1 and row["max"] == 14.0
+        teachers = auth_client.get("/admin/api/analytics").get_json()["items"]
+        assert any(item["username"] == "testprof" for item in teachers)
+
+
+class TestLegacyGradeBackfill:
+    def test_backfill_moves_legacy_columns_into_notes(self, app, auth_client):
+        from core.db import get_db
+        from core.migrations import _migrate_to_v10
+
+        name = f"Legacy {uuid.uuid4().hex[:6]}"
+        with app.app_context():
+            db = get_db()
+            year = db.execute("SELECT label FROM school_years WHERE is_active = 1").fetchone()[0]
+            user_id = db.execute("SELECT id FROM users WHERE username = 'testprof'").fetchone()[0]
+            subject_id = db.execute("SELECT id FROM subjects WHERE user_id = ?", (user_id,)).fetchone()[0]
+            legacy_id = db.execute(
+                "INSERT INTO eleves (user_id, school_year, nom_complet, niveau, devoir_t2, activite_t2, compo_t2, remarques_t2) "
+                "VALUES (?, ?, ?, 'LG1', 12, 14, 16, 'Bien')",
+                (user_id, year, name),
+            ).lastrowid
+            # An existing notes row wins over the legacy columns, NULLs excepted.
+            partial_id = db.execute(
+                "INSERT INTO eleves (user_id, school_year, nom_complet, niveau, devoir_t1, compo_t1) "
+                "VALUES (?, ?, ?, 'LG1', 8, 9)",
+                (user_id, year, f"{name} bis"),
+            ).lastrowid
+            db.execute(
+                "INSERT INTO notes (user_id, eleve_id, subject_id, trimestre, activite, devoir, compo) "
+                "VALUES (?, ?, ?, 1, 11, NULL, 13)",
+                (user_id, partial_id, subject_id),
+            )
+            _migrate_to_v10(db)
+            _migrate_to_v10(db)  # idempotent
+            db.commit()
+
+            rows = db.execute(
+                "SELECT eleve_id, trimestre, devoir, activite, compo, remarques FROM notes "
+                "WHERE eleve_id IN (?, ?) AND subject_id = ? ORDER BY eleve_id, trimestre",
+                (legacy_id, partial_id, subject_id),
+            ).fetchall()
+            assert [tuple(r) for r in rows] == [
+                (legacy_id, 2, 12.0, 14.0, 16.0, "Bien"),
+                (partial_id, 1, 8.0, 11.0, 13.0, ""),
+            ]
+
+        html = auth_client.get(f"/?trimestre=2&school_year={year}&recherche={name}").get_data(as_text=True)
+        assert "Bien" in html
+
+
+class TestSqlTrace:
+    def test_server_timing_and_endpoint_stats(self, app, auth_client):
+        from core.sql_trace import sql_endpoint_stats
+
+        assert "Server-Timing" not in auth_client.get("/").headers
+
+        app.config["SQL_TRACE"] = True
+        response = auth_client.get("/")
+        assert response.status_code == 200
+        timing = response.headers["Server-Timing"]
+        assert timing.startswith("sql;dur=") and "statements" in timing and "app;dur=" in timing
+        stats = sql_endpoint_stats()["dashboard.index"]
+        assert stats["requests"] >= 1 and stats["statements"] > 0
+
+
+class TestMetrics:
+    REMOTE = {"REMOTE_ADDR": "10.0.0.5"}
+
+    @staticmethod
+    def _parse(text):
+        """Minimal Prometheus text parser: {(name, labels): value}."""
+        import re
+
+        sample = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?:[a-zA-Z_]+="(?:[^"\\]|\\.)*",?)*\})? (\S+)$')
+        types, samples = {}, {}
+        for line in text.splitlines():
+            if line.startswith("# TYPE "):
+                _, _, name, kind = line.split(" ")
+                types[name] = kind
+            elif line and not line.startswith("#"):
+                match = sample.match(line)
+                assert match, line
+                name, labels, value = match.groups()
+                family = re.sub(r"_(bucket|sum|count)$", "", name) if name not in types else name
+                assert family in types, name
+                samples[(name, labels or "")] = float(value)
+        return samples
+
+    def test_access_is_limited_to_admins_and_loopback(self, client, auth_client):
+        assert client.get("/metrics", environ_base=self.REMOTE).status_code == 403
+        assert client.get("/metrics", headers={"X-Forwarded-For": "203.0.113.9"}).status_code == 403
+        assert auth_client.get("/metrics", environ_base=self.REMOTE).status_code == 403
+        with auth_client.session_transaction() as sess:
+            sess["is_admin"] = 1
+        assert auth_client.get("/metrics", environ_base=self.REMOTE).status_code == 200
+
+    def test_exposition_format(self, client, auth_client):
+        auth_client.get("/")
+        auth_client.get("/stats")
+        auth_client.get("/stats")
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.content_type.startswith("text/plain; version=0.0.4")
+        samples = self._parse(response.get_data(as_text=True))
+        assert samples[("edumaster_request_duration_seconds_count", '{blueprint="dashboard"}')] >= 3
+        assert samples[("edumaster_request_duration_seconds_bucket", '{blueprint="dashboard",le="+Inf"}')] >= 3
+        assert samples[("edumaster_endpoint_requests_total", '{endpoint="dashboard.stats"}')] >= 2
+        assert samples[("edumaster_cache_hits_total", '{cache="distribution_stats"}')] >= 1
+        assert ("edumaster_db_file_bytes", '{file="wal"}') in samples
+        assert ("edumaster_audit_buffered", "") in samples
+
+    def test_locked_errors_caught_by_routes_are_counted(self, client, auth_client, monkeypatch):
+        import sqlite3
+
+        key = ("edumaster_db_locked_errors_total", "")
+        before = self._parse(client.get("/metrics").get_data(as_text=True))[key]
+
+        def locked(db, user_id=None):
+            raise sqlite3.OperationalError("database is locked")
+
+        monkeypatch.setattr("edumaster.routes.students.bump_data_version", locked)
+        response = auth_client.post("/ajouter_eleve", data={
+            "csrf_token": "test-csrf",
+            "trimestre_ajout": "1",
+            "nom_complet": f"Eleve {uuid.uuid4().hex[:8]}",
+            "niveau": "1AS1",
+        })
+        assert response.status_code == 302
+        after = self._parse(client.get("/metrics").get_data(as_text=True))[key]
+        assert after == before + 1
+
+
+class TestMemoryProfile:
+    def test_disabled_by_default(self, auth_client):
+        with auth_client.session_transaction() as sess:
+            sess["is_admin"] = 1
+        assert auth_client.get("/admin/memory").status_code == 404
+
+    def test_snapshot_diff_peaks_and_recording(self, app, auth_client, tmp_path):
+        import tracemalloc
+
+        from core.memory_profile import load_recording
+
+        record = tmp_path / "requests.jsonl"
+        app.config.update(MEMORY_PROFILE=True, MEMORY_PROFILE_RECORD=str(record))
+        with auth_client.session_transaction() as sess:
+            sess["is_admin"] = 1
+        try:
+            first = auth_client.get("/admin/memory").get_json()
+            assert first["sites"] and "size_diff_kib" not in first["sites"][0]
+            assert auth_client.get("/export_excel?trimestre=1").status_code == 200
+            auth_client.post("/reset/s3cr3t-token?token=abc", data={
+                "csrf_token": "test-csrf",
+                "password": "hunter22",
+                "password_confirm": "hunter22",
+            })
+            data = auth_client.get("/admin/memory?limit=5&reset=1").get_json()
+        finally:
+            tracemalloc.stop()
+        assert len(data["sites"]) <= 5 and "size_diff_kib" in data["sites"][0]
+        peaks = data["endpoints"]["reports.export_excel"]
+        assert peaks["requests"] == 1 and peaks["max_peak_kib"] > 0
+        entries = load_recording(record)
+        assert [e["endpoint"] for e in entries] == ["reports.export_excel", "auth.reset_password"]
+        assert entries[0]["path"] == "/export_excel?trimestre=1"
+        # Neither the reset token nor the new password is written out.
+        assert entries[1]["path"] == "/reset/<token>?token=%2A%2A%2A"
+        assert entries[1]["form"] == {}
+        assert "hunter22" not in record.read_text() and "s3cr3t" not in record.read_text()
+
+
+class TestRequestProfiler:
+    def test_disabled_installs_nothing(self, app):
+        from core import request_profiler
+
+        assert request_profiler._start not in app.before_request_funcs.get(None, [])
+        assert "request_profiles" not in app.view_functions
+
+    def test_header_profiles_ring_and_downloads(self, app, auth_client, tmp_path, monkeypatch):
+        from core import request_profiler
+        from edumaster import create_app
+
+        monkeypatch.setattr(request_profiler, "PROFILE_ENABLED", True)
+        monkeypatch.setattr(request_profiler, "PROFILE_SAMPLE_EVERY", 0)
+        monkeypatch.setattr(request_profiler, "PROFILE_DIR", str(tmp_path))
+        monkeypatch.setattr(request_profiler, "PROFILE_KEEP", 2)
+        profiled_app = create_app()
+        profiled_app.config["TESTING"] = True
+        client = profiled_app.test_client()
+        with client.session_transaction() as sess:
+            sess["user_id"] = 1
+            sess["is_admin"] = 1
+        header = {request_profiler.PROFILE_HEADER: "1"}
+
+        client.get("/")
+        assert request_profiler.list_profiles() == []
+        for _ in range(3):
+            assert client.get("/stats", headers=header).status_code == 200
+        profiles = request_profiler.list_profiles()
+        assert len(profiles) == 2 and len(list(tmp_path.iterdir())) == 6
+        assert profiles[0]["endpoint"] == "dashboard.stats" and profiles[0]["reason"] == "header"
+
+        page = client.get("/admin/profiles").get_data(as_text=True)
+        assert "GET /stats" in page
+        profile_id = profiles[0]["id"]
+        summary = client.get(f"/admin/profiles/{profile_id}.txt").get_data(as_text=True)
+        assert "cumulative" in summary
+        prof = client.get(f"/admin/profiles/{profile_id}.prof")
+        assert prof.status_code == 200 and "attachment" in prof.headers["Content-Disposition"]
+        assert client.get(f"/admin/profiles/{profile_id}.folded").status_code == 200
+        assert client.get("/admin/profiles/../x.prof").status_code == 404
+
+        # The header is ignored for non-admins.
+        with client.session_transaction() as sess:
+            sess["is_admin"] = 0
+        client.get("/stats", headers=header)
+        assert [p["id"] for p in request_profiler.list_profiles()] == [p["id"] for p in profiles]
@@ -37,3 +37,149 @@ class TestProtectedRoutes:
     def test_dashboard_accessible_when_logged_in(self, auth_client):
         response = auth_client.get("/")
         assert response.status_code == 200
+
+
+class TestLoginThrottle:
+    def test_lockout_without_synchronous_writes(self, client, db):
+        import uuid
+
+        from core.auth_security import flush_login_attempts
+        from core.config import LOGIN_MAX_ATTEMPTS
+
+        username = f"ghost_{uuid.uuid4().hex[:8]}"
+        with client.session_transaction() as sess:
+            sess["_csrf_token"] = "test"
+        for _ in range(LOGIN_MAX_ATTEMPTS + 1):
+            response = client.post("/login", data={
+                "username": username,
+                "password": "wrong",
+                "csrf_token": "test",
+            })
+        assert "Trop de tentatives".encode() in response.data
+        count_sql = "SELECT COUNT(*) AS c FROM login_attempts WHERE username = ?"
+        assert db.execute(count_sql, (username,)).fetchone()["c"] == 0
+
+        flush_login_attempts()
+        assert db.execute(count_sql, (username,)).fetchone()["c"] == LOGIN_MAX_ATTEMPTS
+
+    def test_failures_from_other_workers_are_picked_up(self, db, monkeypatch):
+        import time
+        import uuid
+
+        from core import auth_security
+        from core.config import LOGIN_MAX_ATTEMPTS
+
+        monkeypatch.setattr(auth_security, "_FAILURES", auth_security.OrderedDict())
+        username, ip = f"worker_{uuid.uuid4().hex[:8]}", "10.0.0.2"
+        auth_security.record_login_attempt(db, username, ip, False)
+        assert auth_security.is_login_locked(db, username, ip) == (False, 0)
+
+        # Another worker flushed its failures for the same key.
+        now = int(time.time())
+        db.executemany(
+            "INSERT INTO login_attempts (ts, ip, username, success) VALUES (?, ?, ?, 0)",
+            [(now, ip, username)] * LOGIN_MAX_ATTEMPTS,
+        )
+        db.commit()
+        assert auth_security.is_login_locked(db, username, ip) == (False, 0)
+        auth_security._FAILURES[(username, ip)].seeded_at -= auth_security.LOGIN_FLUSH_SECONDS
+        locked, _ = auth_security.is_login_locked(db, username, ip)
+        assert locked
+
+    def test_failed_flush_is_retried(self, db, tmp_path, monkeypatch):
+        import uuid
+
+        from core import auth_security
+
+        username = f"retry_{uuid.uuid4().hex[:8]}"
+        count_sql = "SELECT COUNT(*) AS c FROM login_attempts WHERE username = ?"
+        with monkeypatch.context() as patch:
+            patch.setattr(auth_security, "DATABASE", str(tmp_path / "missing" / "db.sqlite"))
+            auth_security.record_login_attempt(db, username, "10.0.0.3", False)
+            assert auth_security.flush_login_attempts() == 0
+        assert any(row[2] == username for row in auth_security._PENDING)
+
+        auth_security.flush_login_attempts()
+        assert db.execute(count_sql, (username,)).fetchone()["c"] == 1
+
+    def test_tracked_keys_are_bounded(self, db, monkeypatch):
+        import uuid
+
+        from core import auth_security
+
+        monkeypatch.setattr(auth_security, "_FAILURES", auth_security.OrderedDict())
+        monkeypatch.setattr(auth_security, "LOGIN_TRACKED_KEYS", 2)
+        prefix = f"spray_{uuid.uuid4().hex[:8]}"
+        auth_security.record_login_attempt(db, f"{prefix}_ok", "10.0.0.1", True)
+        assert auth_security.is_login_locked(db, f"{prefix}_unknown", "10.0.0.1") == (False, 0)
+        assert not auth_security._FAILURES
+        for i in range(3):
+            auth_security.record_login_attempt(db, f"{prefix}_{i}", "10.0.0.1", False)
+        assert list(auth_security._FAILURES) == [(f"{prefix}_1", "10.0.0.1"), (f"{prefix}_2", "10.0.0.1")]
+
+
+class TestPasswordPolicy:
+    def test_login_rehashes_outdated_hash(self, client, db):
+        import uuid
+
+        from core.passwords import hash_password, needs_rehash
+
+        username = f"legacy_{uuid.uuid4().hex[:8]}"
+        db.execute(
+            "INSERT INTO users (username, password, nom_affichage) VALUES (?, ?, ?)",
+            (username, hash_password("secret123", method="pbkdf2:sha256:1000"), username),
+        )
+        db.commit()
+        with client.session_transaction() as sess:
+            sess["_csrf_token"] = "test"
+        client.post("/login", data={"username": username, "password": "secret123", "csrf_token": "test"})
+        stored = db.execute("SELECT password FROM users WHERE username = ?", (username,)).fetchone()["password"]
+        assert not needs_rehash(stored)
+
+
+class TestServerSessions:
+    def test_cookie_holds_only_signed_session_id(self, auth_client, db):
+        cookie = auth_client.get_cookie("session")
+        assert cookie is not None
+        sid, _, signature = cookie.value.rpartition(".")
+        assert sid and signature
+        row = db.execute("SELECT data FROM sessions WHERE sid = ?", (sid,)).fetchone()
+        assert row is not None
+        assert "user_id" in row["data"]
+        assert "user_id" not in cookie.value
+
+    def test_tampered_cookie_is_rejected(self, auth_client):
+        cookie = auth_client.get_cookie("session")
+        auth_client.set_cookie("session", cookie.value + "x")
+        response = auth_client.get("/")
+        assert response.status_code == 302
+
+    def test_logout_deletes_server_row(self, auth_client, db):
+        sid = auth_client.get_cookie("session").value.rpartition(".")[0]
+        auth_client.get("/logout")
+        row = db.execute("SELECT 1 FROM sessions WHERE sid = ?", (sid,)).fetchone()
+        assert row is None
+        assert auth_client.get("/").status_code == 302
+
+    def test_anonymous_sessions_are_not_stored(self, app, db):
+        count = db.execute("SELECT COUNT(*) AS c FROM sessions").fetchone()["c"]
+        for _ in range(3):
+            client = app.test_client()
+            assert client.get("/login").status_code == 200
+            cookie = client.get_cookie("session")
+            assert cookie is not None and cookie.value.startswith("p.")
+            client.post("/login", data={"username": "nobody", "password": "x", "csrf_token": "forged"})
+        assert db.execute("SELECT COUNT(*) AS c FROM sessions").fetchone()["c"] == count
+
+    def test_anonymous_state_carries_into_login(self, auth_client, db):
+        # auth_client set its CSRF token before logging in.
+        sid = auth_client.get_cookie("session").value.rpartition(".")[0]
+        row = db.execute("SELECT data FROM sessions WHERE sid = ?", (sid,)).fetchone()
+        assert "test-csrf" in row["data"]
+
+    def test_store_write_failure_does_not_raise(self, tmp_path):
+        from core.sessions import SqliteSessionStore
+
+        store = SqliteSessionStore(database=str(tmp_path / "empty.db"))
+        assert store.save("sid", {"user_id": 1}, 2**31) is False
+        assert store.load("sid") is None